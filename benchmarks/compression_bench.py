@@ -0,0 +1,75 @@
+"""
+Benchmark comparing the size ratio and CPU cost of the registered compressors, on representative
+JSON payloads of about 100 KB.
+
+Run it from the repository's root with:
+    python -m benchmarks.compression_bench
+"""
+import random
+import string
+import timeit
+
+from navi.codecs import get_codec
+from navi.compression import get_compressor
+
+NUMBER = 20
+COMPRESSORS = ("zlib", "bz2", "lzma")
+
+
+def events_payload(count: int = 400) -> dict:
+    """Builds a batch of similar events, with repeated keys and values, like most messages."""
+    rng = random.Random(0)
+
+    return {
+        "events": [
+            {
+                "id": index,
+                "type": rng.choice(["created", "updated", "deleted"]),
+                "user": {"id": rng.randint(1, 1000), "name": f"user-{rng.randint(1, 1000)}"},
+                "tags": rng.sample(["billing", "orders", "shipping", "stock", "users"], 2),
+                "amount": round(rng.uniform(0, 1000), 2),
+            }
+            for index in range(count)
+        ]
+    }
+
+
+def random_payload(size: int = 100 * 1024) -> dict:
+    """Builds a payload of random text, the worst case for compression."""
+    rng = random.Random(0)
+
+    return {"data": "".join(rng.choice(string.ascii_letters) for _ in range(size))}
+
+
+def main():
+    """Prints the size ratio, and compression and decompression times, of each compressor on each
+    payload."""
+    codec = get_codec("json")
+    payloads = {"events": events_payload(), "random": random_payload()}
+
+    for payload_name, payload in payloads.items():
+        body = codec.encode(payload)
+        body = body.encode() if isinstance(body, str) else bytes(body)
+        print(f"{payload_name} ({len(body) / 1024:.1f} KB):")
+
+        for name in COMPRESSORS:
+            compressor = get_compressor(name)
+            compressed = compressor.compress(body)
+            compress_time = timeit.timeit(
+                lambda compressor=compressor, body=body: compressor.compress(body), number=NUMBER
+            )
+            decompress_time = timeit.timeit(
+                lambda compressor=compressor, compressed=compressed: (
+                    compressor.decompress(compressed)
+                ),
+                number=NUMBER,
+            )
+
+            print(
+                f"{name:>8}: ratio {len(body) / len(compressed):6.2f}x; "
+                f"compress {compress_time / NUMBER * 1e3:7.2f} ms; "
+                f"decompress {decompress_time / NUMBER * 1e3:7.2f} ms"
+            )
+
+if __name__ == "__main__":
+    main()
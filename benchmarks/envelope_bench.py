@@ -0,0 +1,45 @@
+"""
+Micro-benchmark comparing the per-message cost of building message properties the way
+NaviPublisher used to, against NaviEnvelopeFactory.
+
+Run it from the repository's root with:
+    python -m benchmarks.envelope_bench
+"""
+import socket
+import timeit
+from datetime import datetime
+from uuid import uuid4
+
+from pika import BasicProperties
+
+from navi.envelope import NaviEnvelopeFactory
+
+NUMBER = 20000
+
+
+def legacy_properties() -> BasicProperties:
+    """Builds message properties as NaviPublisher._build_message_properties used to."""
+    headers = {
+        "message_id": str(uuid4()),
+        "published_at": str(datetime.utcnow()),
+        "from_host": socket.getfqdn(),
+    }
+
+    return BasicProperties(headers=headers)
+
+
+def main():
+    factory = NaviEnvelopeFactory()
+    results = {
+        "legacy": timeit.timeit(legacy_properties, number=NUMBER),
+        "envelope_factory": timeit.timeit(factory.build, number=NUMBER),
+    }
+
+    for name, elapsed in results.items():
+        print(f"{name:>18}: {elapsed / NUMBER * 1e6:8.2f} us/message")
+
+    print(f"{'speedup':>18}: {results['legacy'] / results['envelope_factory']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
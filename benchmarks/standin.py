@@ -0,0 +1,124 @@
+"""
+A local stand-in for pika's BlockingConnection, so publishing can be benchmarked without a broker.
+
+It implements the subset of BlockingConnection and BlockingChannel that NaviConnectionPool and
+NaviConfirmChannel use: published messages are counted and dropped, and, in publisher confirms
+mode, acked with a `multiple` ack whenever the connection's I/O is processed, like a broker
+keeping up with the publisher. An optional round-trip delay is slept on each of those.
+"""
+import time
+from typing import Callable, List, Optional
+
+from pika import BasicProperties, ConnectionParameters
+from pika.frame import Method
+from pika.spec import Basic
+
+
+class StandInIOLoop:
+    """The ioloop of a StandInConnection, whose timers never fire, as I/O never blocks."""
+
+    def call_later(self, delay: float, callback: Callable) -> object:  # pylint:disable = W0613
+        """Returns a timer handle, without ever calling `callback`."""
+        return object()
+
+    def remove_timeout(self, timer: object):
+        """Cancels a timer, which never fires anyway."""
+
+
+class StandInChannelImpl:
+    """The asynchronous channel behind a StandInChannel, which NaviConfirmChannel drives."""
+
+    def __init__(self, connection: "StandInConnection"):
+        self._connection = connection
+        self._on_confirmation: Optional[Callable[[Method], None]] = None
+        self._delivery_tag = 0
+        self._confirmed_tag = 0
+
+    def confirm_delivery(self, ack_nack_callback: Callable, callback: Callable = None):
+        """Enables publisher confirms, calling `ack_nack_callback` with each confirmation."""
+        self._on_confirmation = ack_nack_callback
+
+        if callback is not None:
+            callback(None)
+
+    def basic_publish(
+            self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties = None
+    ):  # pylint:disable = W0613
+        """Counts and drops a published message, to be confirmed by `confirm_pending`."""
+        self._connection.published += 1
+        self._delivery_tag += 1
+
+    def confirm_pending(self):
+        """Acks every message published since the last confirmation, with a single ack."""
+        if self._on_confirmation is not None and self._confirmed_tag < self._delivery_tag:
+            self._confirmed_tag = self._delivery_tag
+            self._on_confirmation(
+                Method(1, Basic.Ack(delivery_tag=self._confirmed_tag, multiple=True))
+            )
+
+
+class StandInChannel:
+    """A stand-in for pika's BlockingChannel."""
+
+    is_open = True
+
+    def __init__(self, connection: "StandInConnection"):
+        self.connection = connection
+        self._impl = StandInChannelImpl(connection)
+
+    def exchange_declare(self, exchange: str, exchange_type: str = None, durable: bool = False):
+        """Declares an exchange, which is a no-op."""
+
+    def basic_publish(
+            self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties = None
+    ):
+        """Counts and drops a published message."""
+        self._impl.basic_publish(exchange, routing_key, body, properties)
+
+
+class StandInConnection:
+    """A stand-in for pika's BlockingConnection, to be used as a NaviConnectionPool's
+    connection factory.
+
+    Attributes:
+        published: The number of messages published through the connection's channels.
+    """
+
+    is_open = True
+
+    def __init__(
+            self, connection_parameters: ConnectionParameters = None, round_trip: float = 0
+    ):  # pylint:disable = W0613
+        """Initializes a StandInConnection.
+
+        Args:
+            connection_parameters: Ignored, for compatibility with BlockingConnection.
+            round_trip: The number of seconds to sleep whenever I/O is processed, simulating the
+                network's round trip. Defaults to 0.
+        """
+        self._round_trip = round_trip
+        self._channels: List[StandInChannel] = []
+        self._impl = self
+        self.ioloop = StandInIOLoop()
+        self.published = 0
+
+    def channel(self) -> StandInChannel:
+        """Opens a new StandInChannel."""
+        channel = StandInChannel(self)
+        self._channels.append(channel)
+
+        return channel
+
+    def process_data_events(self, time_limit: float = 0):  # pylint:disable = W0613
+        """Processes the connection's I/O, confirming the messages published so far."""
+        self._flush_output()
+
+    def _flush_output(self, *waiters: Callable[[], bool]):  # pylint:disable = W0613
+        if self._round_trip:
+            time.sleep(self._round_trip)
+
+        for channel in self._channels:
+            channel._impl.confirm_pending()  # pylint:disable = protected-access
+
+    def close(self):
+        """Closes the connection, which is a no-op."""
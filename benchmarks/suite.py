@@ -0,0 +1,322 @@
+"""
+Benchmark suite measuring Navi's hot paths, without a broker: publishing goes through a local
+stand-in connection (see `benchmarks.standin`), and deliveries are fed to a listener directly.
+
+It measures:
+    publish: `navi.publish` and `NaviPublisher.publish` throughput and latency percentiles.
+    publish_many: `NaviPublisher.publish_many` per-message throughput, with publisher confirms.
+    handle_delivery: `NaviListener.handle_delivery` per-message overhead, eager and lazy.
+    encode, decode: Each installed codec's serialization cost.
+    build_properties: The cost of building a message's properties and headers.
+each one across payload sizes where it matters.
+
+Run it from the repository's root with:
+    python -m benchmarks.suite [--quick] [--output results.json] [--baseline previous.json]
+
+Results are printed as a table, and written as JSON to `--output`, to be tracked across releases.
+With `--baseline`, each benchmark's throughput is compared with the one in a previous results file.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from benchmarks.standin import StandInConnection
+from navi import config, publish
+from navi.base import NaviBase
+from navi.codecs import get_codec
+from navi.envelope import get_envelope_factory
+from navi.exceptions import NaviCodecException
+from navi.listener import NaviListener
+from navi.pool import get_pool
+from navi.publisher import NaviPublisher
+
+PAYLOAD_SIZES = (128, 1024, 16 * 1024, 128 * 1024)
+BATCH_SIZE = 100
+
+
+def payload(size: int) -> Dict[str, Any]:
+    """Builds a message whose JSON serialization is about `size` bytes long."""
+    return {"id": 1, "type": "benchmark", "data": "x" * max(size - 40, 0)}
+
+
+def measure(name: str, operation: Callable[[], Any], number: int, **params: Any) -> Dict:
+    """Calls `operation` `number` times, after a warm-up, timing each call.
+
+    Args:
+        name: The benchmark's name.
+        operation: The callable to measure.
+        number: The number of calls to time.
+        **params: The benchmark's parameters, reported with its results.
+
+    Returns:
+        The benchmark's results: operations per second, and the mean, p50 and p99 latencies, in
+        microseconds.
+    """
+    for _ in range(min(number, 100)):
+        operation()
+
+    timings = []
+    clock = time.perf_counter_ns
+
+    for _ in range(number):
+        started = clock()
+        operation()
+        timings.append(clock() - started)
+
+    timings.sort()
+    total = sum(timings)
+
+    return {
+        "name": name,
+        "params": params,
+        "number": number,
+        "ops_per_sec": number / (total / 1e9) if total else float("inf"),
+        "mean_us": total / number / 1e3,
+        "p50_us": timings[int(number * 0.50)] / 1e3,
+        "p99_us": timings[min(int(number * 0.99), number - 1)] / 1e3,
+    }
+
+
+def per_message(result: Dict, count: int) -> Dict:
+    """Converts the results of an operation handling `count` messages to per-message ones."""
+    result["ops_per_sec"] *= count
+    result["mean_us"] /= count
+    result["p50_us"] /= count
+    result["p99_us"] /= count
+    result["params"]["messages_per_op"] = count
+
+    return result
+
+
+def bench_publish(number: int) -> List[Dict]:
+    """Measures `navi.publish` and `NaviPublisher.publish`, through the stand-in connection."""
+    publisher = NaviPublisher(routing_key="benchmark")
+    results = []
+
+    for size in PAYLOAD_SIZES:
+        message = payload(size)
+        results.append(
+            measure(
+                "navi.publish",
+                lambda message=message: publish("benchmark", message),
+                number,
+                size=size,
+            )
+        )
+        results.append(
+            measure(
+                "NaviPublisher.publish",
+                lambda message=message: publisher.publish(message),
+                number,
+                size=size,
+            )
+        )
+
+    return results
+
+
+def bench_publish_many(number: int) -> List[Dict]:
+    """Measures `NaviPublisher.publish_many`, with publisher confirms, per message."""
+    publisher = NaviPublisher(routing_key="benchmark")
+    results = []
+
+    for size in PAYLOAD_SIZES:
+        messages = [payload(size)] * BATCH_SIZE
+        result = measure(
+            "NaviPublisher.publish_many",
+            lambda messages=messages: publisher.publish_many(messages),
+            max(number // BATCH_SIZE, 10),
+            size=size,
+        )
+        results.append(per_message(result, BATCH_SIZE))
+
+    return results
+
+
+def bench_handle_delivery(number: int) -> List[Dict]:
+    """Measures `NaviListener.handle_delivery` with a no-op callback, eager and lazy."""
+    codec = get_codec("json")
+    method = SimpleNamespace(delivery_tag=1)
+    results = []
+
+    for lazy_delivery in (False, True):
+        listener = NaviListener(
+            queue_name="benchmark",
+            routing_key="benchmark",
+            callback=lambda *args: None,
+            lazy_delivery=lazy_delivery,
+        )
+
+        for size in PAYLOAD_SIZES:
+            body = codec.encode(payload(size))
+            properties = get_envelope_factory().build(codec.content_type)
+            results.append(
+                measure(
+                    "NaviListener.handle_delivery",
+                    lambda listener=listener, properties=properties, body=body: (
+                        listener.handle_delivery(None, method, properties, body)
+                    ),
+                    number,
+                    size=size,
+                    lazy_delivery=lazy_delivery,
+                )
+            )
+
+    return results
+
+
+def bench_codecs(number: int) -> List[Dict]:
+    """Measures each installed codec's serialization and deserialization."""
+    results = []
+
+    for name in ("json", "msgpack"):
+        try:
+            codec = get_codec(name)
+
+        except NaviCodecException:
+            continue
+
+        for size in PAYLOAD_SIZES:
+            message = payload(size)
+            body = codec.encode(message)
+            results.append(
+                measure(
+                    "encode",
+                    lambda codec=codec, message=message: codec.encode(message),
+                    number,
+                    codec=name,
+                    size=size,
+                )
+            )
+            results.append(
+                measure(
+                    "decode",
+                    lambda codec=codec, body=body: codec.decode(body),
+                    number,
+                    codec=name,
+                    size=size,
+                )
+            )
+
+    return results
+
+
+def bench_properties(number: int) -> List[Dict]:
+    """Measures building a message's properties and headers."""
+    factory = get_envelope_factory()
+
+    return [measure("build_properties", lambda: factory.build("application/json"), number)]
+
+
+BENCHMARKS = {
+    "publish": bench_publish,
+    "publish_many": bench_publish_many,
+    "handle_delivery": bench_handle_delivery,
+    "codecs": bench_codecs,
+    "properties": bench_properties,
+}
+
+
+def setup():
+    """Configures Navi to publish through a stand-in connection instead of a broker."""
+    config.init_config(
+        broker_host="navi-benchmark", broker_port=5672, username="guest", password="guest"
+    )
+    base = NaviBase(routing_key="benchmark")
+    get_pool(base._connection_parameters, StandInConnection)  # pylint:disable = protected-access
+
+
+def environment() -> Dict[str, Any]:
+    """Describes the environment the benchmarks ran on, to tell results apart."""
+    try:
+        version = metadata.version("lib-mq-navi")
+
+    except metadata.PackageNotFoundError:
+        version = None
+
+    return {
+        "navi_version": version,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def result_key(result: Dict) -> str:
+    """Identifies a benchmark's results by its name and parameters, to compare runs."""
+    return json.dumps([result["name"], result["params"]], sort_keys=True)
+
+
+def print_table(results: List[Dict], baseline: Dict[str, Dict] = None):
+    """Prints the results as a table, with their throughput's change from the baseline's, if
+    given."""
+    print(
+        f"{'benchmark':<30} {'params':<34} {'ops/s':>12} {'p50 us':>10} {'p99 us':>10}"
+        + (f" {'vs base':>8}" if baseline else "")
+    )
+
+    for result in results:
+        params = ", ".join(f"{key}={value}" for key, value in result["params"].items())
+        line = (
+            f"{result['name']:<30} {params:<34} {result['ops_per_sec']:>12,.0f} "
+            f"{result['p50_us']:>10.2f} {result['p99_us']:>10.2f}"
+        )
+
+        if baseline:
+            previous = baseline.get(result_key(result))
+            change = (
+                f"{result['ops_per_sec'] / previous['ops_per_sec'] - 1:+.1%}" if previous else "new"
+            )
+            line += f" {change:>8}"
+
+        print(line)
+
+
+def main(argv: List[str] = None) -> List[Dict]:
+    """Runs the benchmarks selected by the command line arguments, and prints their results.
+
+    Returns:
+        The benchmarks' results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--only", choices=sorted(BENCHMARKS), action="append", help="Benchmarks to run."
+    )
+    parser.add_argument("--number", type=int, default=20000, help="Calls timed per benchmark.")
+    parser.add_argument("--quick", action="store_true", help="Time 1000 calls per benchmark.")
+    parser.add_argument("--output", help="Path of the JSON file to write the results to.")
+    parser.add_argument("--baseline", help="Path of a previous results file to compare with.")
+    args = parser.parse_args(argv)
+    number = 1000 if args.quick else args.number
+    baseline = None
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as previous:
+            baseline = {result_key(result): result for result in json.load(previous)["results"]}
+
+    setup()
+    results = []
+
+    for name in args.only or BENCHMARKS:
+        results.extend(BENCHMARKS[name](number))
+
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump({"environment": environment(), "results": results}, output, indent=2)
+
+        print(f"Results written to {args.output}.", file=sys.stderr)
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,9 @@ Navi's package library.
 
 import logging
 
+from navi.background import flush
 from navi.config import init_config
-from navi.listener import listen
-from navi.publisher import publish
+from navi.listener import listen, listen_on_nodes
+from navi.publisher import publish, publish_many, publish_stream
+from navi.shutdown import shutdown
+from navi.worker import run_workers
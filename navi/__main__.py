@@ -0,0 +1,58 @@
+"""Navi's command line interface.
+
+Usage:
+    navi worker TARGET [--workers N] [--stop-timeout SECONDS] [--metrics-port PORT]
+
+Also runnable as `python -m navi`.
+"""
+import argparse
+import logging
+from typing import List
+
+from navi.worker import run_workers
+
+
+def main(argv: List[str] = None):
+    """Parses the command line, and runs its command.
+
+    Args:
+        argv: The command line arguments, without the program's name. Defaults to `sys.argv`'s.
+    """
+    parser = argparse.ArgumentParser(prog="navi", description="Navi's command line interface.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser(
+        "worker", help="Runs a module of listener declarations in several worker processes."
+    )
+    worker.add_argument("target", help="The `module` or `module:function` declaring listeners.")
+    worker.add_argument(
+        "-w", "--workers", type=int, help="Number of worker processes. Defaults to the CPU cores."
+    )
+    worker.add_argument(
+        "--stop-timeout",
+        type=float,
+        default=30,
+        help="Seconds to wait for the workers to stop gracefully. Defaults to 30.",
+    )
+    worker.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Port to serve the supervisor's metrics at, workers serving theirs at the next ones.",
+    )
+    worker.add_argument("--log-level", default="INFO", help="Logging level. Defaults to INFO.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        format="%(asctime)s %(processName)s %(levelname)s %(name)s: %(message)s",
+    )
+    run_workers(
+        args.target,
+        workers=args.workers,
+        stop_timeout=args.stop_timeout,
+        metrics_port=args.metrics_port,
+    )
+
+
+if __name__ == "__main__":
+    main()
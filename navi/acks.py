@@ -0,0 +1,144 @@
+"""NaviAcker implementation module."""
+
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from pika.channel import Channel
+
+_RUNNING = None
+_ACKED = True
+
+
+class NaviAcker:
+    """A class that acknowledges a channel's deliveries, coalescing acks into `multiple` ones.
+
+    Deliveries are tracked in delivery order. Once the oldest ones are done, the highest done
+    delivery tag is remembered, and acked with `multiple=True` when `batch_size` deliveries are
+    waiting to be acked, or `interval` seconds after the first one was, whichever comes first.
+    Failed deliveries are nacked one by one, flushing waiting acks beforehand, so a multiple ack
+    never covers a nacked delivery.
+
+    Deliveries done out of order, like when callbacks run on an executor, wait for the older ones
+    to be done before being acked. Every method must be called from the channel's ioloop thread.
+    """
+
+    def __init__(
+            self,
+            channel: Channel,
+            batch_size: int = 100,
+            interval: float = 0.5,
+            call_later: Callable[[float, Callable[[], None]], object] = None,
+    ):
+        """Initializes a NaviAcker.
+
+        Args:
+            channel: The channel messages are delivered on.
+            batch_size: The number of done deliveries to ack at once. 1 acks every delivery right
+                away. Defaults to 100.
+            interval: The max number of seconds a done delivery waits to be acked. Defaults to
+                0.5.
+            call_later: A callable scheduling a callable to be called on the ioloop thread after a
+                number of seconds, like an ioloop's `call_later`. Without one, acks are only
+                flushed by `batch_size` and `flush`.
+        """
+        self._channel = channel
+        self._batch_size = max(batch_size, 1)
+        self._interval = interval
+        self._call_later = call_later
+        self._deliveries: Dict[int, Optional[bool]] = OrderedDict()
+        self._requeue: Dict[int, bool] = {}
+        self._last_done = None
+        self._waiting = 0
+        self._timer = None
+        self.logger = logging.getLogger("navi")
+
+    @property
+    def waiting(self) -> int:
+        """The number of done deliveries waiting to be acked."""
+        return self._waiting
+
+    def __len__(self) -> int:
+        return len(self._deliveries)
+
+    def track(self, delivery_tag: int):
+        """Starts tracking a delivery, which won't be acked until it's done.
+
+        Args:
+            delivery_tag: The delivery's tag.
+        """
+        self._deliveries[delivery_tag] = _RUNNING
+
+    def ack(self, delivery_tag: int):
+        """Marks a delivery as successfully handled, to be acked.
+
+        Args:
+            delivery_tag: The delivery's tag.
+        """
+        self._done(delivery_tag, _ACKED)
+
+    def nack(self, delivery_tag: int, requeue: bool = False):
+        """Marks a delivery as failed, to be nacked.
+
+        Args:
+            delivery_tag: The delivery's tag.
+            requeue: Whether the broker should requeue the message. Defaults to False.
+        """
+        self._requeue[delivery_tag] = requeue
+        self._done(delivery_tag, not _ACKED)
+
+    def flush(self):
+        """Acks every delivery waiting to be acked, with a single multiple ack."""
+        if self._last_done is None:
+            return
+
+        delivery_tag, self._last_done, self._waiting = self._last_done, None, 0
+
+        if self._channel.is_open:
+            self._channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
+
+    def reset(self):
+        """Forgets every tracked delivery, as their tags are no longer valid once the channel
+        closes."""
+        self._deliveries.clear()
+        self._requeue.clear()
+        self._last_done = None
+        self._waiting = 0
+
+    def _done(self, delivery_tag: int, acked: bool):
+        """Marks a delivery as done, and settles the oldest deliveries that are done."""
+        if delivery_tag not in self._deliveries:
+            self.logger.warning("Unknown delivery tag %s. Not acked.", delivery_tag)
+
+            return
+
+        self._deliveries[delivery_tag] = acked
+
+        while self._deliveries:
+            oldest_tag, state = next(iter(self._deliveries.items()))
+
+            if state is _RUNNING:
+                break
+
+            del self._deliveries[oldest_tag]
+
+            if state is _ACKED:
+                self._last_done = oldest_tag
+                self._waiting += 1
+
+            else:
+                self.flush()
+                requeue = self._requeue.pop(oldest_tag)
+
+                if self._channel.is_open:
+                    self._channel.basic_nack(delivery_tag=oldest_tag, requeue=requeue)
+
+        if self._waiting >= self._batch_size:
+            self.flush()
+
+        elif self._waiting and self._timer is None and self._call_later is not None:
+            self._timer = self._call_later(self._interval, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self.flush()
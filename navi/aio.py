@@ -0,0 +1,856 @@
+"""Navi's asyncio implementation module.
+
+NaviAsyncPublisher and NaviAsyncListener mirror NaviPublisher and NaviListener, but run on pika's
+AsyncioConnection, so they share the running event loop instead of blocking it or running on
+threads of their own. They connect to the first broker node, over the pika transport only: they
+can't be created when another transport, or several broker nodes, are configured.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from weakref import WeakKeyDictionary
+
+from pika import BasicProperties, ConnectionParameters
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.channel import Channel
+from pika.exceptions import AMQPConnectionError, AMQPError
+from pika.frame import Method
+
+from navi import config
+from navi.base import NaviBase
+from navi.codecs import NaviCodec, get_codec
+from navi.compression import NaviCompressor, compress, decode_body, get_compressor
+from navi.confirms import ConfirmTracker, PublishResult
+from navi.envelope import get_envelope_factory
+from navi.exceptions import NaviInitException, NaviTransportException
+from navi.nodes import configured_nodes
+from navi.pool import pool_key
+from navi.publisher import MAX_CACHED_PUBLISHERS
+from navi.reconnect import CLOSED, CONNECTED, CONNECTING, DISCONNECTED
+
+NACKED = "Message nacked by the broker."
+
+
+def _resolve(future: asyncio.Future, value: Any = None):
+    """Sets `future`'s result, unless it's already done."""
+    if not future.done():
+        future.set_result(value)
+
+
+def _resolved(value: Any) -> asyncio.Future:
+    """Creates a future, on the running event loop, whose result is already `value`."""
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(value)
+
+    return future
+
+
+def _reject(future: asyncio.Future, error: Exception):
+    """Sets `future`'s exception, unless it's already done."""
+    if not future.done():
+        future.set_exception(error)
+
+
+class NaviAsyncConnection:
+    """An AsyncioConnection, and a channel opened through it, exposing awaitable AMQP methods.
+
+    If the channel or the connection get closed, every AMQP method still waiting for the broker's
+    reply raises the AMQPError that caused it, and the close callbacks are called once.
+    """
+
+    channel: Optional[Channel]
+
+    def __init__(self, connection_parameters: ConnectionParameters):
+        """Initializes a NaviAsyncConnection. It's not opened until `open` is awaited.
+
+        Args:
+            connection_parameters: The ConnectionParameters instance to be used to connect to the
+                broker.
+        """
+        self._connection_parameters = connection_parameters
+        self._connection: Optional[AsyncioConnection] = None
+        self._closed: Optional[asyncio.Future] = None
+        self._waiters: Set[asyncio.Future] = set()
+        self._on_close_callbacks: List[Callable[[AMQPError], None]] = []
+        self._failed = False
+        self.channel = None
+        self.logger = logging.getLogger("navi")
+
+    @property
+    def is_open(self) -> bool:
+        """Checks if both the connection and its channel are open.
+
+        Returns:
+            A boolean value indicating if the connection can be used.
+        """
+        return bool(self._connection and self._connection.is_open and self.channel
+                    and self.channel.is_open)
+
+    def add_on_close_callback(self, callback: Callable[[AMQPError], None]):
+        """Adds a callback to be called with the causing AMQPError when the channel or connection
+        get closed.
+        """
+        self._on_close_callbacks.append(callback)
+
+    async def open(self):
+        """Opens the connection, and a channel through it.
+
+        Raises:
+            AMQPError: When the connection or the channel can't be opened.
+        """
+        loop = asyncio.get_running_loop()
+        self._closed = loop.create_future()
+        self._failed = False
+        opened = self._waiter()
+        self._connection = AsyncioConnection(
+            self._connection_parameters,
+            on_open_callback=lambda connection: _resolve(opened, connection),
+            on_open_error_callback=self._on_open_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=loop,
+        )
+        await opened
+
+        channel_opened = self._waiter()
+        self._connection.channel(on_open_callback=lambda channel: _resolve(channel_opened, channel))
+        self.channel = await channel_opened
+        self.channel.add_on_close_callback(self._on_channel_closed)
+
+    def call(self, method: str, **kwargs) -> Awaitable[Method]:
+        """Calls one of the channel's AMQP methods, and returns an awaitable for the broker's reply.
+
+        Args:
+            method: The name of the channel method to call, which must accept a `callback` argument.
+            **kwargs: The arguments to call the method with.
+
+        Returns:
+            An awaitable that returns the broker's reply frame.
+        """
+        future = self._waiter()
+        getattr(self.channel, method)(callback=lambda frame: _resolve(future, frame), **kwargs)
+
+        return future
+
+    async def close(self):
+        """Closes the connection, if open, and waits until it's fully closed."""
+        if self._connection is None or self._connection.is_closed:
+            return
+
+        if not self._connection.is_closing:
+            self._connection.close()
+
+        await asyncio.shield(self._closed)
+
+    def _waiter(self) -> asyncio.Future:
+        """Creates a future that will be rejected if the channel or connection get closed."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.add(future)
+        future.add_done_callback(self._waiters.discard)
+
+        return future
+
+    def _on_open_error(self, connection: AsyncioConnection, error: Any):
+        # pylint:disable = unused-argument
+        if not isinstance(error, AMQPError):
+            error = AMQPConnectionError(error)
+
+        self._on_connection_closed(connection, error)
+
+    def _on_channel_closed(self, channel: Channel, reason: AMQPError):
+        # pylint:disable = unused-argument
+        self._fail(reason)
+
+    def _on_connection_closed(self, connection: AsyncioConnection, reason: AMQPError):
+        # pylint:disable = unused-argument
+        self._fail(reason)
+        _resolve(self._closed)
+
+    def _fail(self, reason: AMQPError):
+        for future in list(self._waiters):
+            _reject(future, reason)
+
+        if self._failed:
+            return
+
+        self._failed = True
+
+        for callback in self._on_close_callbacks:
+            callback(reason)
+
+
+class NaviAsyncConfirmChannel:
+    """A channel in publisher confirms mode shared by the async publishers of an event loop.
+
+    Publishing doesn't wait for each confirmation to arrive before sending the next message, but
+    the number of unconfirmed messages is bounded by `max_outstanding`, so producers faster than
+    the broker are throttled.
+    """
+
+    def __init__(self, connection_parameters: ConnectionParameters, max_outstanding: int = 1000):
+        """Initializes a NaviAsyncConfirmChannel. It's opened on first use.
+
+        Args:
+            connection_parameters: The ConnectionParameters instance to be used to connect to the
+                broker.
+            max_outstanding: The max number of unconfirmed messages. Defaults to 1000.
+        """
+        self._connection_parameters = connection_parameters
+        self._connection: Optional[NaviAsyncConnection] = None
+        self._tracker = ConfirmTracker()
+        self._exchanges: Set[str] = set()
+        self._lock = asyncio.Lock()
+        self._outstanding = asyncio.Semaphore(max_outstanding)
+        self.logger = logging.getLogger("navi")
+
+    async def publish(
+            self, exchange: str, exchange_type: str, routing_key: str, body: str,
+            properties: BasicProperties,
+    ) -> asyncio.Future:
+        """Publishes a message, without waiting for its confirmation.
+
+        Waits first if `max_outstanding` unconfirmed messages are reached, and opens the channel
+        and declares `exchange` on it if needed.
+
+        Args:
+            exchange: The exchange to publish the message to.
+            exchange_type: The type of the exchange to publish the message to.
+            routing_key: The routing key to publish the message with.
+            body: The serialized message.
+            properties: The message's BasicProperties.
+
+        Returns:
+            A future that returns the message's PublishResult once the broker confirms it, or the
+            channel gets closed.
+
+        Raises:
+            AMQPError: When the channel can't be opened, or the exchange declared.
+        """
+        await self._outstanding.acquire()
+
+        try:
+            connection = await self._open(exchange, exchange_type)
+
+        except AMQPError:
+            self._outstanding.release()
+            raise
+
+        result = PublishResult(message_id=(properties.headers or {}).get("message_id"))
+        confirmed = asyncio.get_running_loop().create_future()
+        confirmed.add_done_callback(lambda future: self._outstanding.release())
+        self._tracker.add((result, confirmed))
+        connection.channel.basic_publish(
+            exchange=exchange, routing_key=routing_key, body=body, properties=properties
+        )
+
+        return confirmed
+
+    async def close(self):
+        """Closes the channel's connection, if open."""
+        if self._connection is not None:
+            await self._connection.close()
+
+    async def _open(self, exchange: str, exchange_type: str) -> NaviAsyncConnection:
+        """Returns the open connection, opening it and declaring `exchange` if needed."""
+        async with self._lock:
+            if self._connection is None or not self._connection.is_open:
+                if self._connection is not None:
+                    await self._connection.close()
+
+                connection = NaviAsyncConnection(self._connection_parameters)
+                await connection.open()
+                connection.add_on_close_callback(self._on_closed)
+                self._tracker = ConfirmTracker()
+                self._exchanges.clear()
+                await connection.call("confirm_delivery", ack_nack_callback=self._on_confirmation)
+                self._connection = connection
+
+            if exchange not in self._exchanges:
+                await self._connection.call(
+                    "exchange_declare", exchange=exchange, exchange_type=exchange_type, durable=True
+                )
+                self._exchanges.add(exchange)
+
+            return self._connection
+
+    def _on_confirmation(self, frame: Method):
+        for (result, confirmed), acked in self._tracker.confirm(frame):
+            result.acked = acked
+
+            if not acked:
+                result.error = NACKED
+
+            _resolve(confirmed, result)
+
+    def _on_closed(self, reason: AMQPError):
+        for result, confirmed in self._tracker.clear():
+            result.error = str(reason)
+            _resolve(confirmed, result)
+
+
+_CHANNELS: "WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, NaviAsyncConfirmChannel]]"
+_CHANNELS = WeakKeyDictionary()
+
+
+def get_confirm_channel(connection_parameters: ConnectionParameters) -> NaviAsyncConfirmChannel:
+    """Returns the running event loop's NaviAsyncConfirmChannel for the broker
+    `connection_parameters` point to, creating it on first use.
+
+    Args:
+        connection_parameters: The ConnectionParameters instance to be used to connect to the
+            broker.
+
+    Returns:
+        The shared NaviAsyncConfirmChannel instance.
+    """
+    channels = _CHANNELS.setdefault(asyncio.get_running_loop(), {})
+    key = pool_key(connection_parameters)
+
+    if key not in channels:
+        channels[key] = NaviAsyncConfirmChannel(connection_parameters)
+
+    return channels[key]
+
+
+class NaviAsyncBase(NaviBase):
+    """The base of the asyncio publisher and listener, which only run on pika's AsyncioConnection,
+    connected to a single broker node."""
+
+    def __init__(self, routing_key: str = None):
+        """Initializes a NaviAsyncBase.
+
+        Args:
+            routing_key: The routing key to be used to publish or listen messages.
+
+        Raises:
+            NaviTransportException: When a transport other than pika is configured.
+            NaviInitException: When several broker nodes are configured.
+        """
+        super().__init__(routing_key=routing_key)
+
+        if self._transport.name != "pika":
+            raise NaviTransportException(
+                f"The asyncio module only runs on the pika transport, not '{self._transport.name}'."
+            )
+
+        if len(configured_nodes()) > 1:
+            raise NaviInitException("The asyncio module doesn't support several broker nodes.")
+
+    def _init_connection(self, connection_parameters: ConnectionParameters) -> NaviAsyncConnection:
+        """Creates a NaviAsyncConnection, not opened until its `open` method is awaited.
+
+        Args:
+            connection_parameters: The ConnectionParameters instance to be used to connect to the
+                broker.
+
+        Returns:
+            The created NaviAsyncConnection.
+        """
+        return NaviAsyncConnection(connection_parameters)
+
+
+class NaviAsyncPublisher(NaviAsyncBase):
+    """A class capable of publishing messages to a broker's exchange from asyncio code.
+
+    Every publisher of an event loop connecting to the same broker shares the same connection and
+    channel, in publisher confirms mode. Messages are serialized with the publisher's codec, and
+    compressed with its compressor, if any, when larger than the compression threshold.
+    """
+
+    _codec: NaviCodec
+    _compressor: Optional[NaviCompressor]
+    _compression_threshold: int
+
+    def __init__(
+            self,
+            routing_key: str = None,
+            codec: Union[str, NaviCodec] = None,
+            compression: Union[str, NaviCompressor] = None,
+            compression_threshold: int = None,
+    ):
+        """Initializes a NaviAsyncPublisher.
+
+        Args:
+            routing_key: The routing key to be used to publish messages to the exchange.
+            codec: The name of the codec, or the codec, to serialize messages with. Defaults to the
+                `NAVI_CODEC` config.
+            compression: The name of the compressor, or the compressor, to compress large messages
+                with. Defaults to the `NAVI_COMPRESSION` config.
+            compression_threshold: The min size, in bytes, of the serialized messages to compress.
+                Defaults to the `NAVI_COMPRESSION_THRESHOLD` config.
+        """
+        super().__init__(routing_key=routing_key)
+
+        self._codec = get_codec(codec)
+        self._compressor = get_compressor(compression)
+        self._compression_threshold = (
+            config.NAVI_COMPRESSION_THRESHOLD if compression_threshold is None
+            else compression_threshold
+        )
+
+    async def publish(self, message: Any) -> PublishResult:
+        """Publishes `message` to the exchange with name and type defined by the `NAVI_EXCHANGE` and
+        `NAVI_EXCHANGE_TYPE` environment variables, and waits for the broker's confirmation.
+
+        Args:
+            message: The data to be serialized with the publisher's codec and sent through the
+                broker.
+
+        Returns:
+            The message's PublishResult.
+        """
+        results = await self.publish_many([message])
+
+        return results[0]
+
+    async def publish_many(self, messages: Iterable[Any]) -> List[PublishResult]:
+        """Publishes every message in `messages`, without waiting for each one's confirmation
+        before sending the next one, and then waits for all the confirmations.
+
+        Messages that are not confirmed because the connection was lost are published again on a
+        new connection, after a jittered exponential backoff, up to `NAVI_PUBLISH_RETRIES` times.
+        They may have reached the broker, so they may be delivered twice.
+
+        Args:
+            messages: An iterable of messages, each one to be serialized with the publisher's codec
+                and sent through the broker.
+
+        Returns:
+            A list with a PublishResult for each message, in the same order as `messages`.
+        """
+        results: List[Optional[PublishResult]] = []
+        bodies: Dict[int, Tuple[bytes, Optional[str]]] = {}
+
+        for index, message in enumerate(messages):
+            try:
+                bodies[index] = compress(
+                    self._codec.encode(message), self._compressor, self._compression_threshold
+                )
+
+            except (TypeError, ValueError) as error:
+                self.logger.error("Message with invalid body: %s", str(error))
+                results.append(PublishResult(error=f"Invalid body: {error}"))
+                continue
+
+            results.append(None)
+
+        backoff = self._init_backoff()
+        pending = list(bodies)
+        attempt = 0
+
+        while pending:
+            for index, result in zip(pending, await self._publish_bodies(pending, bodies)):
+                results[index] = result
+
+            pending = [
+                index for index in pending
+                if not results[index].acked and results[index].error != NACKED
+            ]
+
+            if not pending:
+                self._set_state(CONNECTED)
+                break
+
+            self._set_state(DISCONNECTED)
+
+            if attempt >= config.NAVI_PUBLISH_RETRIES:
+                self.logger.error(
+                    "Error while publishing. Exchange: %s; error: %s.",
+                    config.NAVI_EXCHANGE,
+                    results[pending[0]].error,
+                )
+                break
+
+            attempt += 1
+            delay = backoff.next_delay()
+            self.logger.warning(
+                "Error while publishing %d messages: %s. Retrying in %.2fs (%d/%d).",
+                len(pending),
+                results[pending[0]].error,
+                delay,
+                attempt,
+                config.NAVI_PUBLISH_RETRIES,
+            )
+            await asyncio.sleep(delay)
+            self._set_state(CONNECTING)
+
+        return results
+
+    async def _publish_bodies(
+            self, indexes: List[int], bodies: Dict[int, Tuple[bytes, Optional[str]]]
+    ) -> List[PublishResult]:
+        """Publishes the serialized messages at `indexes`, with their content encodings, and waits
+        for their confirmations.
+
+        Once the channel can't be opened, the remaining messages are not sent, and their results
+        get the raised error.
+
+        Returns:
+            A list with a PublishResult for each index, in the same order as `indexes`.
+        """
+        channel = get_confirm_channel(self._connection_parameters)
+        confirmations = []
+
+        for index in indexes:
+            body, content_encoding = bodies[index]
+            properties = get_envelope_factory().build(self._codec.content_type)
+            properties.content_encoding = content_encoding
+
+            try:
+                confirmations.append(
+                    await channel.publish(
+                        exchange=config.NAVI_EXCHANGE,
+                        exchange_type=config.NAVI_EXCHANGE_TYPE,
+                        routing_key=self._routing_key,
+                        body=body,
+                        properties=properties,
+                    )
+                )
+
+            except AMQPError as error:
+                unsent = len(indexes) - len(confirmations)
+                confirmations.extend(
+                    _resolved(PublishResult(error=str(error))) for _ in range(unsent)
+                )
+                break
+
+        return list(await asyncio.gather(*confirmations))
+
+
+_PUBLISHERS: "OrderedDict[Tuple, NaviAsyncPublisher]" = OrderedDict()
+
+
+def get_publisher(routing_key: str = None) -> NaviAsyncPublisher:
+    """Returns the process-wide NaviAsyncPublisher for `routing_key`, creating it on first use.
+
+    Publishers are cached per routing key, broker, codec and compression, up to
+    `MAX_CACHED_PUBLISHERS` of them, evicting the least recently used ones.
+
+    Args:
+        routing_key: The routing key the publisher will publish messages with.
+
+    Returns:
+        The cached NaviAsyncPublisher instance.
+    """
+    key = (
+        routing_key,
+        config.NAVI_AMQP_HOST,
+        config.NAVI_AMQP_PORT,
+        config.NAVI_AMQP_USERNAME,
+        config.NAVI_CODEC,
+        config.NAVI_COMPRESSION,
+        config.NAVI_COMPRESSION_THRESHOLD,
+    )
+
+    if key not in _PUBLISHERS:
+        _PUBLISHERS[key] = NaviAsyncPublisher(routing_key=routing_key)
+
+        while len(_PUBLISHERS) > MAX_CACHED_PUBLISHERS:
+            _PUBLISHERS.popitem(last=False)
+
+    else:
+        _PUBLISHERS.move_to_end(key)
+
+    return _PUBLISHERS[key]
+
+
+class NaviAsyncListener(NaviAsyncBase):
+    """A class that consumes from a queue on the running event loop, awaiting a coroutine callback
+    for each message.
+
+    Up to `max_concurrency` callbacks run concurrently. Messages are acked once their callback is
+    done, and the broker doesn't deliver more than `max_concurrency` unacked messages, so a slow
+    callback throttles the delivery rate instead of piling up messages in memory.
+
+    When its connection or channel is lost, the listener reconnects after a jittered exponential
+    backoff, and re-declares its exchange, queue and binding before consuming again.
+    """
+
+    _connection: Optional[NaviAsyncConnection]
+    _consumer_tag: Optional[str]
+    _reconnect: bool
+
+    def __init__(
+            self,
+            queue_name: str = None,
+            routing_key: str = None,
+            callback: Callable[[dict, Any], Awaitable] = None,
+            max_concurrency: int = 100,
+            codec: Union[str, NaviCodec] = None,
+            reconnect: bool = None,
+    ):  # pylint:disable = R0913
+        """Initializes a NaviAsyncListener.
+
+        Args:
+            queue_name: The name of the queue to listen at. Defaults to None.
+            routing_key: The routing key to bind the listener's queue to the exchange (defined by
+                the env variable `NAVI_EXCHANGE`). Defaults to None.
+            callback: The coroutine function to be awaited whenever a message is received, with the
+                message's headers and body. Defaults to None.
+            max_concurrency: The max number of callbacks to run concurrently. Defaults to 100.
+            codec: The name of the codec, or the codec, to deserialize messages without a known
+                content type with. Defaults to the `NAVI_CODEC` config.
+            reconnect: Whether the listener should reconnect when its connection is lost. Defaults
+                to the `NAVI_RECONNECT` config.
+        """
+        super().__init__(routing_key=routing_key)
+
+        if not queue_name:
+            raise NaviInitException("Need queue to be not None.")
+
+        if callback is None or not callable(callback):
+            raise NaviInitException("Callable callback needed.")
+
+        self._queue_name = queue_name
+        self._listener_name = f"navi-aio-{self._queue_name}"
+        self._callback = callback
+        self._max_concurrency = max_concurrency
+        self._codec = get_codec(codec)
+        self._connection = None
+        self._consumer_tag = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._reconnect = config.NAVI_RECONNECT if reconnect is None else reconnect
+        self._backoff = self._init_backoff()
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def listen(self):
+        """Connects to the broker, declares the exchange and the queue, binds them, and starts
+        consuming from the queue.
+
+        Raises:
+            AMQPError: When any of these steps fails.
+        """
+        self.logger.info("Starting async listener on %s...", self._queue_name)
+        self._stopping = False
+        await self._connect()
+
+    async def _connect(self):
+        """Opens a connection, declares the listener's topology on it, and starts consuming.
+
+        Raises:
+            AMQPError: When any of these steps fails. The connection is closed then.
+        """
+        self._set_state(CONNECTING)
+        connection = self._init_connection(self._connection_parameters)
+        self._connection = connection
+
+        try:
+            await connection.open()
+            await connection.call(
+                "exchange_declare",
+                exchange=config.NAVI_EXCHANGE,
+                exchange_type=config.NAVI_EXCHANGE_TYPE,
+                durable=True,
+            )
+            await connection.call(
+                "queue_declare",
+                queue=self._queue_name,
+                durable=True,
+                exclusive=True,
+                auto_delete=False,
+            )
+            await connection.call(
+                "queue_bind",
+                exchange=config.NAVI_EXCHANGE,
+                queue=self._queue_name,
+                routing_key=self._routing_key,
+            )
+            await connection.call("basic_qos", prefetch_count=self._max_concurrency)
+
+        except AMQPError:
+            self._set_state(DISCONNECTED)
+            await connection.close()
+            raise
+
+        connection.add_on_close_callback(self._on_connection_lost)
+        self._consumer_tag = connection.channel.basic_consume(self._queue_name, self._on_message)
+        self._backoff.reset()
+        self._set_state(CONNECTED)
+
+    def _on_connection_lost(self, reason: AMQPError):
+        """Called when the listener's channel or connection get closed. Schedules a reconnection,
+        unless the listener is stopping or reconnection is disabled."""
+        self._consumer_tag = None
+        self._set_state(DISCONNECTED)
+
+        if self._stopping:
+            return
+
+        self.logger.error("Async listener on %s lost its connection: %s.", self._queue_name, reason)
+
+        if self._reconnect and (self._reconnect_task is None or self._reconnect_task.done()):
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        """Closes the lost connection, and opens new ones after the backoff's delay until one
+        succeeds, or the listener is stopped."""
+        await self._connection.close()
+
+        while not self._stopping:
+            delay = self._backoff.next_delay()
+            self.logger.info("Reconnecting async listener on %s in %.2fs.", self._queue_name, delay)
+            await asyncio.sleep(delay)
+
+            try:
+                await self._connect()
+
+            except AMQPError as error:
+                self.logger.error(
+                    "Error while reconnecting async listener on %s: %s.", self._queue_name, error
+                )
+
+            else:
+                return
+
+    async def stop(self):
+        """Stops consuming, waits for the running callbacks to finish, and closes the connection.
+        No reconnection is attempted anymore."""
+        self._stopping = True
+
+        if self._reconnect_task is not None and not self._reconnect_task.done():
+            self._reconnect_task.cancel()
+
+            try:
+                await self._reconnect_task
+
+            except asyncio.CancelledError:
+                pass
+
+        self._reconnect_task = None
+
+        if self._connection is None:
+            self._set_state(CLOSED)
+
+            return
+
+        if self._consumer_tag is not None and self._connection.is_open:
+            await self._connection.call("basic_cancel", consumer_tag=self._consumer_tag)
+            self._consumer_tag = None
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        await self._connection.close()
+        self._set_state(CLOSED)
+
+    def _on_message(
+            self, channel: Channel, method: Method, properties: BasicProperties, body: bytes
+    ):
+        """Called on the event loop whenever a message is delivered. Schedules its handling."""
+        task = asyncio.get_running_loop().create_task(
+            self.handle_delivery(channel, method, properties, body)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def handle_delivery(
+            self, channel: Channel, method: Method, properties: BasicProperties, body: bytes
+    ):
+        """Loads the message's body and awaits the user's callback with it. Any raised Exception is
+        caught in order to ensure the listener is kept alive, and the message is acked anyway.
+        """
+        headers = properties.headers or {}
+
+        try:
+            message = decode_body(properties, body, self._codec)
+
+        except (TypeError, ValueError) as error:
+            self.logger.error(
+                "Message %s with invalid body: %s", headers.get("message_id"), str(error)
+            )
+
+        else:
+            try:
+                await self._callback(
+                    {"listener_name": self._listener_name, "queue_name": self._queue_name,
+                     **headers},
+                    message,
+                )
+
+            except Exception as error:  # pylint:disable = W0703
+                self.logger.error(
+                    "Error while handling message %s: %s", headers.get("message_id"), str(error)
+                )
+
+        if channel.is_open:
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+
+
+async def publish(routing_key: str = None, message: Any = None) -> PublishResult:
+    """Publishes `message` to the exchange defined by the `NAVI_EXCHANGE` environment variable,
+    through the running event loop's shared channel, and waits for the broker's confirmation.
+
+    Args:
+        routing_key: The routing key to be used by the broker to find the queues to send the message
+            to.
+        message: The data to be serialized with the configured codec and sent through the broker.
+
+    Returns:
+        The message's PublishResult.
+    """
+    return await get_publisher(routing_key).publish(message)
+
+
+async def publish_many(
+        routing_key: str = None, messages: Iterable[Any] = None
+) -> List[PublishResult]:
+    """Publishes every message in `messages` to the exchange defined by the `NAVI_EXCHANGE`
+    environment variable, through the running event loop's shared channel, and waits for the
+    broker's confirmations.
+
+    Args:
+        routing_key: The routing key to be used by the broker to find the queues to send the
+            messages to.
+        messages: An iterable of messages, each one to be serialized with the configured codec and
+            sent through the broker.
+
+    Returns:
+        A list with a PublishResult for each message, in the same order as `messages`.
+    """
+    return await get_publisher(routing_key).publish_many(messages or ())
+
+
+async def listen(
+        queue_name: str = None,
+        routing_key: str = None,
+        callback: Callable[[dict, Any], Awaitable] = None,
+        max_concurrency: int = 100,
+        codec: Union[str, NaviCodec] = None,
+        reconnect: bool = None,
+) -> NaviAsyncListener:  # pylint:disable = R0913
+    """Starts a NaviAsyncListener on the running event loop.
+
+    Args:
+        queue_name: The name of the queue to listen at.
+        routing_key: The routing key to bind the queue to the exchange.
+        callback: The coroutine function to be awaited whenever a message is received.
+        max_concurrency: The max number of callbacks to run concurrently. Defaults to 100.
+        codec: The name of the codec, or the codec, to deserialize messages without a known content
+            type with. Defaults to the `NAVI_CODEC` config.
+        reconnect: Whether the listener should reconnect when its connection is lost. Defaults to
+            the `NAVI_RECONNECT` config.
+
+    Returns:
+        The listening NaviAsyncListener, so it can be stopped.
+    """
+    listener = NaviAsyncListener(
+        queue_name=queue_name,
+        routing_key=routing_key,
+        callback=callback,
+        max_concurrency=max_concurrency,
+        codec=codec,
+        reconnect=reconnect,
+    )
+    await listener.listen()
+
+    return listener
+
+
+async def close():
+    """Closes the running event loop's shared publishing channels."""
+    channels = _CHANNELS.pop(asyncio.get_running_loop(), {})
+
+    for channel in channels.values():
+        await channel.close()
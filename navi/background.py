@@ -0,0 +1,275 @@
+"""NaviBackgroundPublisher implementation module."""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+from pika import BasicProperties
+
+from navi import config
+from navi.exceptions import NaviBufferFullException
+from navi.metrics import record_publish
+from navi.outbox import store_unconfirmed
+from navi.pool import NaviConnectionPool
+from navi.reconnect import NaviBackoff, publish_confirmed
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+RAISE = "raise"
+POLICIES = (BLOCK, DROP_OLDEST, RAISE)
+
+
+class NaviBackgroundPublisher:
+    """A class that publishes messages from a dedicated I/O thread.
+
+    Messages are enqueued into a bounded in-memory buffer, and the I/O thread drains it in batches,
+    publishing each batch with publisher confirms through its own pooled connection. When the
+    buffer is full, enqueuing blocks, drops the oldest buffered message, or raises a
+    NaviBufferFullException, depending on the configured policy.
+    """
+
+    def __init__(
+            self,
+            pool: NaviConnectionPool,
+            max_size: int = 10000,
+            policy: str = BLOCK,
+            batch_size: int = 500,
+            confirm_timeout: float = 30,
+    ):  # pylint:disable = R0913
+        """Initializes a NaviBackgroundPublisher. Its I/O thread is started on first enqueue.
+
+        Args:
+            pool: The NaviConnectionPool to publish through.
+            max_size: The max number of buffered messages. Defaults to 10000.
+            policy: What to do when the buffer is full: "block", "drop_oldest" or "raise".
+                Defaults to "block".
+            batch_size: The max number of messages published in a single batch. Defaults to 500.
+            confirm_timeout: The max number of seconds to wait for a batch to be confirmed.
+                Defaults to 30.
+
+        Raises:
+            ValueError: When `policy` is not one of the accepted values.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Invalid policy {policy}. Expected one of: {POLICIES}.")
+
+        self._pool = pool
+        self._max_size = max_size
+        self._policy = policy
+        self._batch_size = batch_size
+        self._confirm_timeout = confirm_timeout
+        self._buffer: Deque[Tuple[str, str, BasicProperties]] = deque()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.dropped = 0
+        self.failed = 0
+        self.logger = logging.getLogger("navi")
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def enqueue(self, routing_key: str, body: str, properties: BasicProperties):
+        """Adds a message to the buffer, to be published by the I/O thread.
+
+        Args:
+            routing_key: The routing key to publish the message with.
+            body: The serialized message.
+            properties: The message's BasicProperties.
+
+        Raises:
+            NaviBufferFullException: When the buffer is full and the policy is "raise".
+        """
+        with self._condition:
+            while len(self._buffer) >= self._max_size:
+                if self._policy == RAISE:
+                    raise NaviBufferFullException(self._max_size)
+
+                if self._policy == DROP_OLDEST:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                    self.logger.warning("Background buffer full. Oldest message dropped.")
+
+                else:
+                    self._condition.wait()
+
+            self._buffer.append((routing_key, body, properties))
+            self._condition.notify_all()
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="navi-background-publisher", daemon=True
+                )
+                self._thread.start()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until every buffered message has been published.
+
+        Args:
+            timeout: The max number of seconds to wait for. Waits forever if None.
+
+        Returns:
+            A boolean value indicating if the buffer got drained on time.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._buffer and not self._in_flight, timeout
+            )
+
+    def close(self, timeout: float = None) -> bool:
+        """Flushes the buffer and stops the I/O thread.
+
+        Args:
+            timeout: The max number of seconds to wait for the buffer to be drained. Waits forever
+                if None.
+
+        Returns:
+            A boolean value indicating if the buffer got drained on time.
+        """
+        flushed = self.flush(timeout)
+
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+
+        if self._thread is not None and flushed:
+            self._thread.join()
+
+        if not flushed:
+            self.logger.error(
+                "Background publisher closed with %d messages not published.", len(self._buffer)
+            )
+
+        return flushed
+
+    def _run(self):
+        """Drains the buffer in batches until the publisher is closed."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._buffer or self._stopping)
+
+                if not self._buffer:
+                    return
+
+                batch = [
+                    self._buffer.popleft()
+                    for _ in range(min(self._batch_size, len(self._buffer)))
+                ]
+                self._in_flight = len(batch)
+                self._condition.notify_all()
+
+            try:
+                self._publish_batch(batch)
+
+            finally:
+                with self._condition:
+                    self._in_flight = 0
+                    self._condition.notify_all()
+
+    def _publish_batch(self, batch: List[Tuple[str, str, BasicProperties]]):
+        """Publishes a batch of messages with publisher confirms, retrying on a new connection if
+        the connection is lost, and logging the ones that fail, which are stored in the outbox if
+        it's enabled."""
+        started = time.perf_counter()
+        results = publish_confirmed(
+            self._pool,
+            config.NAVI_EXCHANGE,
+            config.NAVI_EXCHANGE_TYPE,
+            batch,
+            timeout=self._confirm_timeout,
+            retries=config.NAVI_PUBLISH_RETRIES,
+            backoff=NaviBackoff(
+                config.NAVI_RECONNECT_INITIAL_DELAY, config.NAVI_RECONNECT_MAX_DELAY
+            ),
+            logger=self.logger,
+        )
+        failed = len(batch) - sum(result.acked for result in results)
+        record_publish(
+            config.NAVI_EXCHANGE, len(batch) - failed, failed, time.perf_counter() - started
+        )
+
+        if failed:
+            self.failed += failed
+            self.logger.error("Background publisher: %d of %d messages failed.", failed, len(batch))
+            store_unconfirmed(
+                self._pool, config.NAVI_EXCHANGE, config.NAVI_EXCHANGE_TYPE, batch, results
+            )
+
+
+_PUBLISHERS: Dict[NaviConnectionPool, NaviBackgroundPublisher] = {}
+_PUBLISHERS_LOCK = threading.Lock()
+
+
+def get_background_publisher(pool: NaviConnectionPool) -> NaviBackgroundPublisher:
+    """Returns the process-wide NaviBackgroundPublisher publishing through `pool`, creating it on
+    first use with the buffer size and policy set by `init_config`.
+
+    Args:
+        pool: The NaviConnectionPool to publish through.
+
+    Returns:
+        The shared NaviBackgroundPublisher instance.
+    """
+    with _PUBLISHERS_LOCK:
+        publisher = _PUBLISHERS.get(pool)
+
+        if publisher is None:
+            publisher = NaviBackgroundPublisher(
+                pool,
+                max_size=config.NAVI_BACKGROUND_BUFFER_SIZE,
+                policy=config.NAVI_BACKGROUND_POLICY,
+            )
+            _PUBLISHERS[pool] = publisher
+
+    return publisher
+
+
+def flush(timeout: float = None) -> bool:
+    """Waits until every process-wide NaviBackgroundPublisher has drained its buffer.
+
+    Args:
+        timeout: The max number of seconds to wait for each publisher. Waits forever if None.
+
+    Returns:
+        A boolean value indicating if every buffer got drained on time.
+    """
+    with _PUBLISHERS_LOCK:
+        publishers = list(_PUBLISHERS.values())
+
+    return all([publisher.flush(timeout) for publisher in publishers])
+
+
+def close_background_publishers(timeout: float = None):
+    """Drains and stops every process-wide NaviBackgroundPublisher. Registered to be called at
+    interpreter exit, with the timeout set by `init_config`.
+
+    Args:
+        timeout: The max number of seconds to wait for each publisher. Defaults to the
+            `NAVI_BACKGROUND_EXIT_TIMEOUT` config.
+    """
+    with _PUBLISHERS_LOCK:
+        publishers = list(_PUBLISHERS.values())
+        _PUBLISHERS.clear()
+
+    for publisher in publishers:
+        publisher.close(config.NAVI_BACKGROUND_EXIT_TIMEOUT if timeout is None else timeout)
+
+
+atexit.register(close_background_publishers)
+
+
+def _forget_background_publishers():
+    """Makes a forked child process start its own background publishers, the parent's I/O threads
+    not running in the child. Messages buffered in the parent are left to it."""
+    global _PUBLISHERS_LOCK  # pylint:disable = global-statement
+    _PUBLISHERS_LOCK = threading.Lock()
+    _PUBLISHERS.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_background_publishers)
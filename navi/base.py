@@ -1,11 +1,15 @@
 """NaviBase implementation module."""
 
 import logging
+from typing import Callable, List
 
 from pika import BaseConnection, ConnectionParameters, PlainCredentials
 
 from navi import config
 from navi.exceptions import NaviInitException
+from navi.nodes import configured_nodes
+from navi.reconnect import CLOSED, NaviBackoff
+from navi.transport import get_transport
 
 
 class NaviBase:
@@ -16,6 +20,10 @@ class NaviBase:
             a listening queue to an exchange.
         _connection_parameters: The ConnectionParameters instance to be used to establish
             connections.
+        _transport: The NaviTransport connections are opened through.
+        _state: The connection state, one of the `navi.reconnect` states.
+        _state_callbacks: The callables to call with the instance and its new state whenever it
+            changes.
         logger: A logger instance.
     """
 
@@ -37,8 +45,54 @@ class NaviBase:
         self._routing_key = routing_key
 
         self._connection_parameters = self._init_connection_params()
+        self._transport = get_transport()
+        self._state = CLOSED
+        self._state_callbacks: List[Callable[["NaviBase", str], None]] = []
         self.logger = logging.getLogger("navi")
 
+    @property
+    def state(self) -> str:
+        """The connection state, one of the `navi.reconnect` states."""
+        return self._state
+
+    def add_state_callback(self, callback: Callable[["NaviBase", str], None]):
+        """Adds a callable to be called with the instance and its new connection state, whenever
+        it changes.
+
+        Args:
+            callback: The callable to add.
+        """
+        self._state_callbacks.append(callback)
+
+    def _set_state(self, state: str):
+        """Sets the connection state, calling the state callbacks if it changed.
+
+        Args:
+            state: The new connection state.
+        """
+        if state == self._state:
+            return
+
+        self._state = state
+
+        for callback in self._state_callbacks:
+            try:
+                callback(self, state)
+
+            except Exception as error:  # pylint:disable = W0703
+                self.logger.error("Error while calling state callback: %s", str(error))
+
+    def _init_backoff(self) -> NaviBackoff:  # pylint:disable = R0201
+        """Initializes a NaviBackoff with the reconnection delays set by `init_config`.
+
+        Returns:
+            The created NaviBackoff instance.
+        """
+        return NaviBackoff(
+            initial_delay=config.NAVI_RECONNECT_INITIAL_DELAY,
+            max_delay=config.NAVI_RECONNECT_MAX_DELAY,
+        )
+
     def _init_credentials(self) -> PlainCredentials:  # pylint:disable = R0201
         """Initializes a PlainCredentials object.
 
@@ -51,21 +105,39 @@ class NaviBase:
 
         return credentials
 
-    def _init_connection_params(self) -> ConnectionParameters:
+    def _init_connection_params(self, host: str = None, port: int = None) -> ConnectionParameters:
         """Initializes a ConnectionParameters object.
 
         To do so, it first calls `_init_credentials` to create the required PlainCredentials object.
 
+        Args:
+            host: The broker's host. Defaults to the `NAVI_AMQP_HOST` config.
+            port: The broker's port. Defaults to the `NAVI_AMQP_PORT` config.
+
         Returns:
             The created ConnectionParameters instance.
         """
         credentials = self._init_credentials()
         connection_parameters = ConnectionParameters(
-            host=config.NAVI_AMQP_HOST, port=config.NAVI_AMQP_PORT, credentials=credentials
+            host=config.NAVI_AMQP_HOST if host is None else host,
+            port=config.NAVI_AMQP_PORT if port is None else port,
+            credentials=credentials,
+            blocked_connection_timeout=config.NAVI_BLOCKED_CONNECTION_TIMEOUT or None,
         )
 
         return connection_parameters
 
+    def _init_nodes_connection_params(self) -> List[ConnectionParameters]:
+        """Initializes a ConnectionParameters object for each broker node set by `init_config`,
+        the first one being `_connection_parameters`.
+
+        Returns:
+            The ConnectionParameters instances, in the nodes' order.
+        """
+        return [self._connection_parameters] + [
+            self._init_connection_params(host, port) for host, port in configured_nodes()[1:]
+        ]
+
     def _init_connection(self, connection_parameters: ConnectionParameters) -> BaseConnection:
         """Abstract method to be implemented by the NaviListener and NaviPublisher subclasses, as
         each of them should use different connection types.
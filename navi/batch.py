@@ -0,0 +1,373 @@
+"""NaviBatchListener implementation module."""
+
+from concurrent.futures import Executor, Future
+from functools import partial
+from typing import Any, Callable, Iterable, List, Optional, Set, Union
+
+from pika import BasicProperties
+from pika.channel import Channel
+from pika.spec import Basic
+
+from navi.acks import NaviAcker
+from navi.codecs import NaviCodec
+from navi.compression import decode_body
+from navi.dedup import NaviDedupCache
+from navi.delivery import NaviDelivery
+from navi.listener import NaviListener
+
+
+class _Receipt:
+    """The delivery of a message waiting in a batch."""
+
+    __slots__ = ("delivery_tag", "delivered_at", "message_id")
+
+    def __init__(self, delivery_tag: int, delivered_at: float, message_id: Optional[str]):
+        self.delivery_tag = delivery_tag
+        self.delivered_at = delivered_at
+        self.message_id = message_id
+
+
+class NaviBatchListener(NaviListener):
+    """A listener that hands messages to its callback in batches, for bulk and vectorized sinks.
+
+    Deliveries are accumulated until `max_batch_size` of them are waiting, or `max_wait` seconds
+    after the first one, and the callback is then called with a list of (headers, message) tuples,
+    or of NaviDelivery instances in lazy delivery mode.
+
+    Messages are always acked manually: a batch whose callback succeeds is acked with a single
+    multiple ack. The callback may report partial failures by returning the indexes, in the batch,
+    of the entries that failed, which are nacked while the rest of the batch is acked. If it
+    raises, the whole batch is nacked.
+
+    Metrics are recorded for each message of a batch, as a NaviListener does, and messages already
+    handled, according to the listener's deduplication cache, are acked and left out of batches.
+    """
+
+    _max_batch_size: int
+    _max_wait: float
+    _batch: List[Any]
+    _batch_receipts: List[_Receipt]
+    _batch_timer: Optional[object]
+
+    def __init__(
+            self,
+            queue_name: str = None,
+            routing_key: str = None,
+            callback: Callable[[List[Any]], Optional[Iterable[int]]] = None,
+            max_batch_size: int = 100,
+            max_wait: float = 1.0,
+            codec: Union[str, NaviCodec] = None,
+            lazy_delivery: bool = False,
+            executor: Executor = None,
+            prefetch_count: int = None,
+            requeue_failed: bool = False,
+            dedup: Union[bool, NaviDedupCache] = None,
+    ):  # pylint:disable = R0913
+        """Initializes a NaviBatchListener.
+
+        Args:
+            queue_name: The name of the queue to listen at. Defaults to None.
+            routing_key: The routing key to bind the listener's queue to the exchange. Defaults to
+                None.
+            callback: The callable to be executed with each batch. It may return the indexes of the
+                batch's entries that failed. Defaults to None.
+            max_batch_size: The max number of messages in a batch. Defaults to 100.
+            max_wait: The max number of seconds a message waits for its batch to be full. Defaults
+                to 1.
+            codec: The name of the codec, or the codec, to deserialize messages without a known
+                content type with. Defaults to the `NAVI_CODEC` config.
+            lazy_delivery: Whether batches should be made of NaviDelivery instances, instead of
+                (headers, message) tuples. Defaults to False.
+            executor: The executor to run `callback` on, one batch at a time. Defaults to None,
+                running `callback` on the ioloop thread.
+            prefetch_count: The max number of unacked messages the broker delivers at once. Should
+                be at least `max_batch_size`, or batches are cut by `max_wait`. Defaults to twice
+                `max_batch_size`, so the next batch fills while one is being handled.
+            requeue_failed: Whether messages that fail, or can't be deserialized, should be
+                requeued when nacked. Defaults to False.
+            dedup: The NaviDedupCache of handled message ids, or True for an in-memory one.
+                Messages whose `message_id` is in it are acked without being batched. Defaults to
+                None, for no deduplication.
+        """
+        if prefetch_count is None:
+            prefetch_count = 2 * max_batch_size
+
+        super().__init__(
+            queue_name=queue_name,
+            routing_key=routing_key,
+            callback=callback,
+            codec=codec,
+            lazy_delivery=lazy_delivery,
+            executor=executor,
+            max_in_flight=1,
+            prefetch_count=prefetch_count,
+            manual_ack=True,
+            ack_batch_size=max_batch_size,
+            requeue_failed=requeue_failed,
+            dedup=dedup,
+        )
+
+        if prefetch_count < max_batch_size:
+            self.logger.warning(
+                "prefetch_count %d is lower than max_batch_size %d: batches are cut by max_wait.",
+                prefetch_count,
+                max_batch_size,
+            )
+
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._batch = []
+        self._batch_receipts = []
+        self._batch_timer = None
+
+    def on_channel_open(self, new_channel: Channel):
+        """Called when a channel has opened. Messages batched on a previous channel are dropped,
+        as they can't be acked anymore, and will be redelivered by the broker.
+
+        Args:
+            new_channel: A pika's Channel instance, representing the opened communication channel.
+        """
+        self._cancel_batch_timer()
+
+        if self._metrics is not None and self._batch_receipts:
+            self._metrics.in_flight.dec(len(self._batch_receipts))
+
+        self._batch, self._batch_receipts = [], []
+
+        super().on_channel_open(new_channel)
+
+    def handle_delivery(
+            self, channel: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes
+    ):  # pylint:disable=unused-argument
+        """Called whenever a message is dequeued from the declared queue.
+
+        The message is deserialized and added to the current batch, which is handed to the
+        callback once full. Messages that can't be deserialized are nacked right away, those
+        already handled are acked right away, and those delivered while the listener is stopping
+        are requeued.
+        """
+        self._acker.track(method.delivery_tag)
+
+        if self._stop_event.is_set():
+            self._acker.nack(method.delivery_tag, requeue=True)
+            self.requeued += 1
+
+            return
+
+        headers = properties.headers or {}
+        message_id = headers.get("message_id")
+        delivered_at = self._metrics.on_delivery(headers) if self._metrics is not None else 0.0
+
+        if self._dedup is not None and message_id is not None:
+            duplicate = self._dedup.seen(message_id)
+
+            if self._metrics is not None:
+                self._metrics.on_dedup(duplicate)
+
+            if duplicate:
+                self.logger.debug("Skipping already handled message %s.", message_id)
+                self._acker.ack(method.delivery_tag)
+
+                return
+
+        if self._lazy_delivery:
+            entry = NaviDelivery(method, properties, body, self._codec, self._listener_info)
+
+        else:
+            try:
+                message = decode_body(properties, body, self._codec)
+
+            except (TypeError, ValueError) as error:
+                self.logger.error("Message %s with invalid body: %s", message_id, str(error))
+                self._acker.nack(method.delivery_tag, requeue=self._requeue_failed)
+
+                if self._metrics is not None:
+                    self._metrics.on_decode_error()
+
+                return
+
+            entry = ({**self._listener_info, **headers}, message)
+
+        self._batch.append(entry)
+        self._batch_receipts.append(_Receipt(method.delivery_tag, delivered_at, message_id))
+
+        if len(self._batch) >= self._max_batch_size:
+            self.flush_batch()
+
+        elif self._batch_timer is None and self._connection is not None:
+            self._batch_timer = self._connection.ioloop.call_later(
+                self._max_wait, self._on_batch_timer
+            )
+
+    def flush_batch(self):
+        """Hands the current batch to the callback, if it's not empty. Runs on the ioloop thread."""
+        self._cancel_batch_timer()
+
+        if not self._batch:
+            return
+
+        batch, receipts = self._batch, self._batch_receipts
+        self._batch, self._batch_receipts = [], []
+
+        if self._dispatcher is None:
+            try:
+                failed = self._callback(batch)
+
+            except Exception as error:  # pylint:disable = W0703
+                self._on_batch_error(receipts, error)
+
+                return
+
+            self._settle_batch(self._acker, receipts, failed)
+
+            return
+
+        self._dispatcher.submit(
+            None, self._callback, (batch,), partial(self._on_batch_done, self._acker, receipts)
+        )
+
+    def _drain(self, deadline: Optional[float], on_drained: Callable[[], None]):
+        """Hands the current batch to the callback, without waiting for `max_wait`, then drains
+        the listener. Runs on the ioloop thread."""
+        self.flush_batch()
+        super()._drain(deadline, on_drained)
+
+    def _on_batch_timer(self):
+        self._batch_timer = None
+        self.flush_batch()
+
+    def _cancel_batch_timer(self):
+        if self._batch_timer is not None:
+            self._connection.ioloop.remove_timeout(self._batch_timer)
+            self._batch_timer = None
+
+    def _on_batch_done(self, acker: NaviAcker, receipts: List[_Receipt], future: Future):
+        """Called on the ioloop thread when a batch run by the dispatcher is done.
+
+        Args:
+            acker: The NaviAcker of the channel the batch was delivered on.
+            receipts: The deliveries of the batch's messages.
+            future: The callback call's Future.
+        """
+        error = future.exception()
+
+        if error is not None:
+            self._on_batch_error(receipts, error, acker)
+
+            return
+
+        self._settle_batch(acker, receipts, future.result())
+
+    def _on_batch_error(
+            self, receipts: List[_Receipt], error: Exception, acker: NaviAcker = None
+    ):
+        """Logs a batch's error, and nacks every message of the batch."""
+        self.logger.error(
+            "Error while handling batch of %d messages: %s", len(receipts), str(error)
+        )
+        self._settle_batch(acker or self._acker, receipts, range(len(receipts)))
+
+    def _settle_batch(
+            self, acker: NaviAcker, receipts: List[_Receipt], failed: Optional[Iterable[int]]
+    ):
+        """Acks a handled batch with a single multiple ack, nacking its failed entries, and
+        records each message in the listener's metrics and deduplication cache, as `_settle`
+        does.
+
+        Args:
+            acker: The NaviAcker of the channel the batch was delivered on.
+            receipts: The deliveries of the batch's messages.
+            failed: The indexes, in the batch, of the entries that failed. None if none did.
+        """
+        failed_indexes = self._failed_indexes(failed, len(receipts))
+
+        if failed_indexes:
+            self.logger.error(
+                "Batch handled with %d of %d messages failed.", len(failed_indexes), len(receipts)
+            )
+
+        for index, receipt in enumerate(receipts):
+            succeeded = index not in failed_indexes
+
+            if self._metrics is not None:
+                self._metrics.on_done(receipt.delivered_at, succeeded)
+
+            if succeeded and receipt.message_id is not None and self._dedup is not None:
+                self._dedup.add(receipt.message_id)
+
+            if succeeded:
+                acker.ack(receipt.delivery_tag)
+
+            else:
+                acker.nack(receipt.delivery_tag, requeue=self._requeue_failed)
+
+        acker.flush()
+
+        if self._stop_event.is_set():
+            self.drained += len(receipts)
+
+    def _failed_indexes(self, failed: Any, size: int) -> Set[int]:
+        """Validates the value returned by the callback, which should be None or an iterable of
+        indexes in the batch. Invalid values are logged and ignored, so the batch is settled
+        anyway.
+
+        Args:
+            failed: The value returned by the callback.
+            size: The number of entries in the batch.
+
+        Returns:
+            The valid indexes of the entries that failed.
+        """
+        if failed is None:
+            return set()
+
+        try:
+            indexes = set(failed)
+
+        except TypeError:
+            self.logger.error(
+                "Batch callback returned %r instead of the failed indexes. Acking the batch.",
+                failed,
+            )
+
+            return set()
+
+        invalid = {
+            index for index in indexes
+            if isinstance(index, bool) or not isinstance(index, int) or not 0 <= index < size
+        }
+
+        if invalid:
+            self.logger.error("Batch callback returned invalid failed indexes: %r.", invalid)
+
+        return indexes - invalid
+
+
+def listen_batch(
+        queue_name: str = None,
+        routing_key: str = None,
+        callback: Callable[[List[Any]], Optional[Iterable[int]]] = None,
+        max_batch_size: int = 100,
+        max_wait: float = 1.0,
+        **kwargs: Any,
+) -> NaviBatchListener:
+    """Instantiates a threaded batch listener that keeps waiting for events on a queue.
+
+    `callback` is called with batches of up to `max_batch_size` messages, waiting up to `max_wait`
+    seconds for a batch to fill. It may return the indexes of the entries that failed. Any other
+    keyword argument is passed to NaviBatchListener.
+
+    Returns:
+        The created NaviBatchListener.
+    """
+    listener = NaviBatchListener(
+        queue_name=queue_name,
+        routing_key=routing_key,
+        callback=callback,
+        max_batch_size=max_batch_size,
+        max_wait=max_wait,
+        **kwargs,
+    )
+    listener.listen()
+
+    return listener
@@ -0,0 +1,190 @@
+"""Navi's codecs module.
+
+Codecs serialize messages on publish, and deserialize them on delivery. Publishers stamp the
+codec's content type on every message, and listeners pick the decoder matching the content type of
+each delivered message, falling back to their own codec when it's missing or unknown.
+
+The following codecs are registered by default:
+    json: "application/json". Uses orjson when installed, and the stdlib's json otherwise.
+    msgpack: "application/msgpack". Only registered when msgpack is installed.
+    raw: "application/octet-stream". Passes bytes through untouched.
+"""
+
+import json
+from typing import Any, Dict, Union
+
+from navi import config
+from navi.exceptions import NaviCodecException
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+Body = Union[bytes, bytearray, memoryview, str]
+
+
+class NaviCodec:
+    """Base class for Navi codecs.
+
+    Subclasses must set the `name` and `content_type` attributes, and implement `encode` and
+    `decode`, raising TypeError or ValueError for messages they can't handle.
+    """
+
+    name: str
+    content_type: str
+
+    def encode(self, message: Any) -> Body:
+        """Serializes a message.
+
+        Args:
+            message: The message to serialize.
+
+        Returns:
+            The serialized message.
+        """
+        raise NotImplementedError()
+
+    def decode(self, body: Body) -> Any:
+        """Deserializes a message.
+
+        Args:
+            body: The serialized message.
+
+        Returns:
+            The deserialized message.
+        """
+        raise NotImplementedError()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.content_type})"
+
+
+class JsonCodec(NaviCodec):
+    """A JSON codec, using orjson when installed, and the stdlib's json otherwise.
+
+    Like the stdlib's json, non-string dict keys are serialized as strings. Messages orjson can't
+    serialize, like integers over 64 bits, are serialized by the stdlib's json.
+    """
+
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, message: Any) -> Body:
+        if orjson is not None:
+            try:
+                return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS)
+
+            except TypeError:
+                pass
+
+        return json.dumps(message)
+
+    def decode(self, body: Body) -> Any:
+        if orjson is not None:
+            return orjson.loads(body)
+
+        if isinstance(body, memoryview):
+            body = body.tobytes()
+
+        return json.loads(body)
+
+
+class MsgpackCodec(NaviCodec):
+    """A MessagePack codec. Requires msgpack to be installed."""
+
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def encode(self, message: Any) -> Body:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, body: Body) -> Any:
+        return msgpack.unpackb(body, raw=False)
+
+
+class RawCodec(NaviCodec):
+    """A codec passing bytes through untouched, for payloads serialized by the user."""
+
+    name = "raw"
+    content_type = "application/octet-stream"
+
+    def encode(self, message: Any) -> Body:
+        if not isinstance(message, (bytes, bytearray, memoryview)):
+            raise TypeError(f"Raw codec expects bytes, got {type(message).__name__}.")
+
+        return bytes(message)
+
+    def decode(self, body: Body) -> Any:
+        return body
+
+
+_CODECS: Dict[str, NaviCodec] = {}
+_CONTENT_TYPES: Dict[str, NaviCodec] = {}
+
+
+def register_codec(codec: NaviCodec):
+    """Registers a codec, to be selected by its name, and to decode messages of its content type.
+
+    Registering a codec with the name or content type of an already registered one replaces it.
+
+    Args:
+        codec: The codec instance to register.
+    """
+    _CODECS[codec.name] = codec
+    _CONTENT_TYPES[codec.content_type] = codec
+
+
+def get_codec(codec: Union[str, NaviCodec] = None) -> NaviCodec:
+    """Returns a registered codec by its name.
+
+    Args:
+        codec: The codec's name, or a NaviCodec instance, that is returned as is. Defaults to the
+            `NAVI_CODEC` config.
+
+    Returns:
+        The codec instance.
+
+    Raises:
+        NaviCodecException: When no codec is registered with that name.
+    """
+    if isinstance(codec, NaviCodec):
+        return codec
+
+    name = config.NAVI_CODEC if codec is None else codec
+
+    try:
+        return _CODECS[name]
+
+    except KeyError:
+        raise NaviCodecException(
+            f"Unknown codec {name}. Registered codecs: {sorted(_CODECS)}."
+        ) from None
+
+
+def find_codec(content_type: str, default: NaviCodec) -> NaviCodec:
+    """Returns the codec registered for `content_type`, or `default` if there's none.
+
+    Args:
+        content_type: The content type of a delivered message. Optional.
+        default: The codec to return when `content_type` is missing or unknown.
+
+    Returns:
+        The codec instance.
+    """
+    if not content_type:
+        return default
+
+    return _CONTENT_TYPES.get(content_type, default)
+
+
+register_codec(JsonCodec())
+register_codec(RawCodec())
+
+if msgpack is not None:  # pragma: no cover
+    register_codec(MsgpackCodec())
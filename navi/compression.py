@@ -0,0 +1,236 @@
+"""Navi's compression module.
+
+Publishers can compress message bodies larger than a threshold, after serializing them, stamping
+the compressor's name as the message's content encoding. Listeners decompress messages whose
+content encoding matches a registered compressor before decoding them, and pass any other body
+through untouched, so compressed and uncompressed messages can share a queue.
+
+The following compressors are registered by default, all from the stdlib:
+    zlib: Fast, with a moderate ratio. The usual choice.
+    bz2: Slower, with a better ratio on text.
+    lzma: The slowest, with the best ratio.
+"""
+
+import bz2
+import lzma
+import zlib
+from typing import Any, Dict, Optional, Tuple, Union
+
+from pika import BasicProperties
+
+from navi import config
+from navi.codecs import Body, NaviCodec, find_codec
+from navi.exceptions import NaviCodecException
+
+
+class NaviCompressor:
+    """Base class for Navi compressors.
+
+    Subclasses must set the `name` attribute, stamped as the content encoding of the messages they
+    compress, and implement `compress` and `decompress`.
+    """
+
+    name: str
+
+    def compress(self, body: bytes) -> bytes:
+        """Compresses a serialized message.
+
+        Args:
+            body: The serialized message.
+
+        Returns:
+            The compressed message.
+        """
+        raise NotImplementedError()
+
+    def decompress(self, body: bytes) -> bytes:
+        """Decompresses a compressed message.
+
+        Args:
+            body: The compressed message.
+
+        Returns:
+            The serialized message.
+
+        Raises:
+            ValueError: When the body can't be decompressed.
+        """
+        raise NotImplementedError()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name})"
+
+
+class ZlibCompressor(NaviCompressor):
+    """A zlib (deflate) compressor."""
+
+    name = "zlib"
+
+    def __init__(self, level: int = 6):
+        self._level = level
+
+    def compress(self, body: bytes) -> bytes:
+        return zlib.compress(body, self._level)
+
+    def decompress(self, body: bytes) -> bytes:
+        try:
+            return zlib.decompress(body)
+
+        except zlib.error as error:
+            raise ValueError(f"Invalid zlib body: {error}") from error
+
+
+class Bz2Compressor(NaviCompressor):
+    """A bzip2 compressor."""
+
+    name = "bz2"
+
+    def __init__(self, level: int = 9):
+        self._level = level
+
+    def compress(self, body: bytes) -> bytes:
+        return bz2.compress(body, self._level)
+
+    def decompress(self, body: bytes) -> bytes:
+        try:
+            return bz2.decompress(body)
+
+        except OSError as error:
+            raise ValueError(f"Invalid bz2 body: {error}") from error
+
+
+class LzmaCompressor(NaviCompressor):
+    """An LZMA (xz) compressor."""
+
+    name = "lzma"
+
+    def __init__(self, preset: int = 6):
+        self._preset = preset
+
+    def compress(self, body: bytes) -> bytes:
+        return lzma.compress(body, preset=self._preset)
+
+    def decompress(self, body: bytes) -> bytes:
+        try:
+            return lzma.decompress(body)
+
+        except lzma.LZMAError as error:
+            raise ValueError(f"Invalid lzma body: {error}") from error
+
+
+_COMPRESSORS: Dict[str, NaviCompressor] = {}
+
+
+def register_compressor(compressor: NaviCompressor):
+    """Registers a compressor, to be selected by its name, and to decompress messages whose content
+    encoding is its name.
+
+    Registering a compressor with the name of an already registered one replaces it.
+
+    Args:
+        compressor: The compressor instance to register.
+    """
+    _COMPRESSORS[compressor.name] = compressor
+
+
+def get_compressor(compressor: Union[str, NaviCompressor] = None) -> Optional[NaviCompressor]:
+    """Returns a registered compressor by its name.
+
+    Args:
+        compressor: The compressor's name, or a NaviCompressor instance, that is returned as is.
+            Defaults to the `NAVI_COMPRESSION` config.
+
+    Returns:
+        The compressor instance, or None if compression is disabled.
+
+    Raises:
+        NaviCodecException: When no compressor is registered with that name.
+    """
+    if isinstance(compressor, NaviCompressor):
+        return compressor
+
+    name = config.NAVI_COMPRESSION if compressor is None else compressor
+
+    if not name:
+        return None
+
+    try:
+        return _COMPRESSORS[name]
+
+    except KeyError:
+        raise NaviCodecException(
+            f"Unknown compressor {name}. Registered compressors: {sorted(_COMPRESSORS)}."
+        ) from None
+
+
+def compress(
+        body: Body, compressor: Optional[NaviCompressor], threshold: int
+) -> Tuple[Body, Optional[str]]:
+    """Compresses a serialized message if it's larger than `threshold` bytes, once encoded as
+    UTF-8 if it's a str.
+
+    Args:
+        body: The serialized message.
+        compressor: The compressor to use. None to leave the message uncompressed.
+        threshold: The min size, in bytes, of the messages to compress.
+
+    Returns:
+        The body to publish, and its content encoding, None if it wasn't compressed.
+    """
+    if compressor is None:
+        return body, None
+
+    if isinstance(body, str):
+        body = body.encode()
+
+    if len(body) <= threshold:
+        return body, None
+
+    return compressor.compress(body), compressor.name
+
+
+def decompress(body: Body, content_encoding: Optional[str]) -> Body:
+    """Decompresses a delivered message's body, if its content encoding is a registered
+    compressor's name.
+
+    Args:
+        body: The delivered message's body.
+        content_encoding: The delivered message's content encoding. Optional.
+
+    Returns:
+        The decompressed body, or `body` untouched if it's not compressed.
+
+    Raises:
+        ValueError: When the body can't be decompressed.
+    """
+    compressor = _COMPRESSORS.get(content_encoding) if content_encoding else None
+
+    if compressor is None:
+        return body
+
+    return compressor.decompress(body)
+
+
+def decode_body(properties: BasicProperties, body: Body, default: NaviCodec) -> Any:
+    """Decompresses a delivered message's body if needed, and decodes it with the codec matching
+    its content type.
+
+    Args:
+        properties: The delivered message's BasicProperties.
+        body: The delivered message's body.
+        default: The codec to decode messages without a known content type with.
+
+    Returns:
+        The decoded message.
+
+    Raises:
+        TypeError, ValueError: When the body can't be decompressed or decoded.
+    """
+    body = decompress(body, properties.content_encoding)
+
+    return find_codec(properties.content_type, default).decode(body)
+
+
+register_compressor(ZlibCompressor())
+register_compressor(Bz2Compressor())
+register_compressor(LzmaCompressor())
@@ -1,5 +1,7 @@
 """Navi's configuration file."""
 from dataclasses import dataclass
+from typing import Any, Sequence, Tuple
+
 from navi.exceptions import NaviConfigException
 
 NAVI_AMQP_USERNAME = None
@@ -8,6 +10,30 @@ NAVI_AMQP_HOST = None
 NAVI_AMQP_PORT = None
 NAVI_EXCHANGE = None
 NAVI_EXCHANGE_TYPE = None
+NAVI_BACKGROUND_PUBLISHING = False
+NAVI_BACKGROUND_BUFFER_SIZE = 10000
+NAVI_BACKGROUND_POLICY = "block"
+NAVI_BACKGROUND_EXIT_TIMEOUT = 10
+NAVI_CODEC = "json"
+NAVI_RECONNECT = True
+NAVI_RECONNECT_INITIAL_DELAY = 0.5
+NAVI_RECONNECT_MAX_DELAY = 30
+NAVI_PUBLISH_RETRIES = 3
+NAVI_BLOCKED_CONNECTION_TIMEOUT = 60
+NAVI_OUTBOX_DIR = None
+NAVI_OUTBOX_SEGMENT_SIZE = 64 * 1024 * 1024
+NAVI_COMPRESSION = None
+NAVI_COMPRESSION_THRESHOLD = 16 * 1024
+NAVI_METRICS = True
+NAVI_TRANSPORT = "pika"
+NAVI_BROKER_NODES = None
+NAVI_NODE_STRATEGY = "round_robin"
+NAVI_NODE_RETRY_INTERVAL = 10
+NAVI_SCHEDULER_DIR = None
+NAVI_SCHEDULER_TICK = 0.05
+NAVI_RPC_TIMEOUT = 30
+NAVI_STREAM_CHUNK_SIZE = 512 * 1024
+NAVI_STREAM_SPOOL_THRESHOLD = 8 * 1024 * 1024
 
 
 @dataclass
@@ -19,7 +45,7 @@ class NaviConfigEntry:
     """
 
     key: str
-    value: str
+    value: Any
 
     @property
     def is_valid(self):
@@ -31,6 +57,36 @@ class NaviConfigEntry:
         return bool(self.key and self.value is not None)
 
 
+@dataclass
+class NaviOptionalConfigEntry(NaviConfigEntry):
+    """A NaviConfigEntry whose value may be None, disabling the feature it configures."""
+
+    @property
+    def is_valid(self):
+        """Checks if the NaviOptionalConfigEntry has a key.
+
+        Returns:
+            A boolean value indicating if the NaviOptionalConfigEntry instance is valid.
+        """
+        return bool(self.key)
+
+
+@dataclass
+class NaviChoiceConfigEntry(NaviConfigEntry):
+    """A NaviConfigEntry whose value must be one of `choices`."""
+
+    choices: Tuple = ()
+
+    @property
+    def is_valid(self):
+        """Checks if the NaviChoiceConfigEntry is valid, and its value one of `choices`.
+
+        Returns:
+            A boolean value indicating if the NaviChoiceConfigEntry instance is valid.
+        """
+        return super().is_valid and self.value in self.choices
+
+
 def init_config(
         broker_host: str,
         broker_port: str,
@@ -38,7 +94,31 @@ def init_config(
         password: str,
         default_exchange: str = "amq.topic",
         default_exchange_type: str = "topic",
-):  # pylint:disable = R0913
+        background_publishing: bool = False,
+        background_buffer_size: int = 10000,
+        background_policy: str = "block",
+        background_exit_timeout: float = 10,
+        codec: str = "json",
+        reconnect: bool = True,
+        reconnect_initial_delay: float = 0.5,
+        reconnect_max_delay: float = 30,
+        publish_retries: int = 3,
+        blocked_connection_timeout: float = 60,
+        outbox_dir: str = None,
+        outbox_segment_size: int = 64 * 1024 * 1024,
+        compression: str = None,
+        compression_threshold: int = 16 * 1024,
+        metrics: bool = True,
+        transport: str = "pika",
+        broker_nodes: Sequence[str] = None,
+        node_strategy: str = "round_robin",
+        node_retry_interval: float = 10,
+        scheduler_dir: str = None,
+        scheduler_tick: float = 0.05,
+        rpc_timeout: float = 30,
+        stream_chunk_size: int = 512 * 1024,
+        stream_spool_threshold: int = 8 * 1024 * 1024,
+):  # pylint:disable = R0913, R0914
     """Sets Navi's configuration.
 
     This should be called when initializing your application to set the variables needed to
@@ -58,6 +138,69 @@ def init_config(
                 Possible values are: "amq.direct", "amq.fanout", "amq.topic".
             default_exchange_type: The default exchange type to use. Optional. Defaults to "topic".
                 Possible values are: "direct", "fanout", "topic".
+            background_publishing: Whether `publish` should enqueue messages to be published by a
+                background I/O thread, instead of publishing them right away. Optional. Defaults
+                to False.
+            background_buffer_size: The max number of messages waiting to be published in
+                background. Optional. Defaults to 10000.
+            background_policy: What to do when publishing with the background buffer full.
+                Optional. Defaults to "block". Possible values are: "block", "drop_oldest",
+                "raise".
+            background_exit_timeout: The max number of seconds to wait at exit for the background
+                buffer to be drained. Optional. Defaults to 10.
+            codec: The name of the codec publishers and listeners use by default. Optional.
+                Defaults to "json". Possible values are: "json", "msgpack" (if installed), "raw",
+                or the name of a codec registered through `navi.codecs.register_codec`.
+            reconnect: Whether listeners should reconnect, and re-declare their topology, when
+                their connection is lost. Optional. Defaults to True.
+            reconnect_initial_delay: The max number of seconds to wait before the first
+                reconnection attempt. It doubles with each consecutive attempt, with random jitter.
+                Optional. Defaults to 0.5.
+            reconnect_max_delay: The max number of seconds to wait before any reconnection attempt.
+                Optional. Defaults to 30.
+            publish_retries: The number of times `publish` retries, on a new connection, to publish
+                a message that failed. Optional. Defaults to 3.
+            blocked_connection_timeout: The max number of seconds a connection can stay blocked by
+                the broker before it's closed, and the blocked publish fails. 0 to wait forever.
+                Optional. Defaults to 60.
+            outbox_dir: The directory where messages the broker couldn't confirm are stored, to be
+                published again by a background thread once the broker is back. Optional.
+                Defaults to None, for no outbox.
+            outbox_segment_size: The size, in bytes, of each of the outbox's segment files.
+                Optional. Defaults to 64 MiB.
+            compression: The name of the compressor publishers compress large messages with by
+                default. Optional. Defaults to None, for no compression. Possible values are:
+                "zlib", "bz2", "lzma", or the name of a compressor registered through
+                `navi.compression.register_compressor`.
+            compression_threshold: The min size, in bytes, of the serialized messages to compress.
+                Optional. Defaults to 16 KiB.
+            metrics: Whether publishers and listeners should record metrics in the process-wide
+                `navi.metrics` registry. Optional. Defaults to True.
+            transport: The name of the transport publishers and listeners connect through.
+                Optional. Defaults to "pika". Possible values are: "pika", "memory", for the
+                in-process broker of `navi.memory`, or the name of a transport registered through
+                `navi.transport.register_transport`.
+            broker_nodes: The other broker nodes to spread publishing over, and fail over to, as
+                "host" or "host:port" strings, the port defaulting to `broker_port`. The node set
+                by `broker_host` and `broker_port` is the first one. Optional. Defaults to None,
+                for a single node.
+            node_strategy: How publishers pick a node for each publish. Optional. Defaults to
+                "round_robin". Possible values are: "round_robin", "least_loaded", for the node
+                with the fewest publishes in progress, "consistent_hash", hashing the routing key.
+            node_retry_interval: The number of seconds a node is skipped for after a connection
+                failure, unless every node is. Optional. Defaults to 10.
+            scheduler_dir: The directory where messages published with a `delay` or `publish_at`
+                are stored until they're due, so they survive restarts. Optional. Defaults to None,
+                for keeping them in memory only.
+            scheduler_tick: The resolution, in seconds, of the timer wheel scheduling delayed
+                messages. Optional. Defaults to 0.05.
+            rpc_timeout: The max number of seconds an RPC call waits for its reply. Optional.
+                Defaults to 30.
+            stream_chunk_size: The size, in bytes, of the chunks `publish_stream` reads from file
+                objects. Optional. Defaults to 512 KiB.
+            stream_spool_threshold: The max size, in bytes, of a stream reassembled in memory by a
+                streaming listener, before it's spilled to a temporary file. Optional. Defaults to
+                8 MiB.
 
     """
     configs = [
@@ -67,6 +210,42 @@ def init_config(
         NaviConfigEntry(key="NAVI_AMQP_PORT", value=broker_port),
         NaviConfigEntry(key="NAVI_EXCHANGE", value=default_exchange),
         NaviConfigEntry(key="NAVI_EXCHANGE_TYPE", value=default_exchange_type),
+        NaviConfigEntry(key="NAVI_BACKGROUND_PUBLISHING", value=background_publishing),
+        NaviConfigEntry(key="NAVI_BACKGROUND_BUFFER_SIZE", value=background_buffer_size),
+        NaviChoiceConfigEntry(
+            key="NAVI_BACKGROUND_POLICY",
+            value=background_policy,
+            choices=("block", "drop_oldest", "raise"),
+        ),
+        NaviConfigEntry(key="NAVI_BACKGROUND_EXIT_TIMEOUT", value=background_exit_timeout),
+        NaviConfigEntry(key="NAVI_CODEC", value=codec),
+        NaviConfigEntry(key="NAVI_RECONNECT", value=reconnect),
+        NaviConfigEntry(key="NAVI_RECONNECT_INITIAL_DELAY", value=reconnect_initial_delay),
+        NaviConfigEntry(key="NAVI_RECONNECT_MAX_DELAY", value=reconnect_max_delay),
+        NaviConfigEntry(key="NAVI_PUBLISH_RETRIES", value=publish_retries),
+        NaviConfigEntry(
+            key="NAVI_BLOCKED_CONNECTION_TIMEOUT", value=blocked_connection_timeout
+        ),
+        NaviOptionalConfigEntry(key="NAVI_OUTBOX_DIR", value=outbox_dir),
+        NaviConfigEntry(key="NAVI_OUTBOX_SEGMENT_SIZE", value=outbox_segment_size),
+        NaviOptionalConfigEntry(key="NAVI_COMPRESSION", value=compression),
+        NaviConfigEntry(key="NAVI_COMPRESSION_THRESHOLD", value=compression_threshold),
+        NaviConfigEntry(key="NAVI_METRICS", value=metrics),
+        NaviConfigEntry(key="NAVI_TRANSPORT", value=transport),
+        NaviOptionalConfigEntry(
+            key="NAVI_BROKER_NODES", value=tuple(broker_nodes) if broker_nodes else None
+        ),
+        NaviChoiceConfigEntry(
+            key="NAVI_NODE_STRATEGY",
+            value=node_strategy,
+            choices=("round_robin", "least_loaded", "consistent_hash"),
+        ),
+        NaviConfigEntry(key="NAVI_NODE_RETRY_INTERVAL", value=node_retry_interval),
+        NaviOptionalConfigEntry(key="NAVI_SCHEDULER_DIR", value=scheduler_dir),
+        NaviConfigEntry(key="NAVI_SCHEDULER_TICK", value=scheduler_tick),
+        NaviConfigEntry(key="NAVI_RPC_TIMEOUT", value=rpc_timeout),
+        NaviConfigEntry(key="NAVI_STREAM_CHUNK_SIZE", value=stream_chunk_size),
+        NaviConfigEntry(key="NAVI_STREAM_SPOOL_THRESHOLD", value=stream_spool_threshold),
     ]
     invalid_configs = [config for config in configs if not config.is_valid]
 
@@ -0,0 +1,239 @@
+"""NaviConfirmChannel implementation module."""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from pika import BasicProperties
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.frame import Method
+from pika.spec import Basic
+
+
+@dataclass
+class PublishResult:
+    """The outcome of publishing a single message of a batch.
+
+    Attributes:
+        message_id: The `message_id` header the message was published with. None if the message
+            couldn't be serialized.
+        acked: A boolean value indicating if the broker confirmed the message.
+        error: A description of why the message wasn't confirmed, if it wasn't.
+        stored: A boolean value indicating if the unconfirmed message was stored in the outbox, to
+            be published again once the broker is back.
+    """
+
+    message_id: Optional[str] = None
+    acked: bool = False
+    error: Optional[str] = None
+    stored: bool = False
+
+
+class ConfirmTracker:
+    """Tracks the delivery tags of the messages published through a channel in confirms mode.
+
+    Delivery tags are assigned by the broker in publishing order, starting at 1, so a tracker must
+    be used with a single channel, and be discarded if the channel is closed.
+    """
+
+    def __init__(self):
+        self._delivery_tag = 0
+        self._pending: Dict[int, Any] = {}
+        self._pending_tags: Deque[int] = deque()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, value: Any) -> int:
+        """Registers a message that was just published.
+
+        Args:
+            value: The object to be returned once the message is confirmed.
+
+        Returns:
+            The delivery tag assigned to the message.
+        """
+        self._delivery_tag += 1
+        self._pending[self._delivery_tag] = value
+        self._pending_tags.append(self._delivery_tag)
+
+        return self._delivery_tag
+
+    def confirm(self, frame: Method) -> List[Tuple[Any, bool]]:
+        """Resolves the messages acked or nacked by the broker, many if `multiple` is set.
+
+        Args:
+            frame: The Basic.Ack or Basic.Nack method frame sent by the broker.
+
+        Returns:
+            A list of (value, acked) tuples, one for each resolved message.
+        """
+        method = frame.method
+        acked = isinstance(method, Basic.Ack)
+        resolved = []
+
+        if method.multiple:
+            while self._pending_tags and self._pending_tags[0] <= method.delivery_tag:
+                delivery_tag = self._pending_tags.popleft()
+
+                if delivery_tag in self._pending:
+                    resolved.append((self._pending.pop(delivery_tag), acked))
+
+        elif method.delivery_tag in self._pending:
+            resolved.append((self._pending.pop(method.delivery_tag), acked))
+
+            while self._pending_tags and self._pending_tags[0] not in self._pending:
+                self._pending_tags.popleft()
+
+        return resolved
+
+    def clear(self) -> List[Any]:
+        """Forgets every outstanding message.
+
+        Returns:
+            The values of the messages that were still outstanding.
+        """
+        values = list(self._pending.values())
+        self._pending.clear()
+        self._pending_tags.clear()
+
+        return values
+
+
+class NaviConfirmChannel:
+    """A channel in publisher confirms mode that pipelines publishes.
+
+    pika's BlockingChannel waits for the broker's confirmation after every single publish when
+    confirms are enabled. Instead, this class enables them on the underlying asynchronous channel,
+    so messages are written back to back while their delivery tags are tracked, and the broker's
+    acks and nacks (including `multiple` ones) are matched against them as they arrive.
+
+    As the asynchronous channel is driven by the BlockingConnection's ioloop, this class relies on
+    pika's private `_impl` and `_flush_output` members, the same way BlockingChannel does.
+    """
+
+    def __init__(self, channel: BlockingChannel, max_outstanding: int = 1000):
+        """Initializes a NaviConfirmChannel, enabling publisher confirms on `channel`.
+
+        Args:
+            channel: A freshly opened BlockingChannel, that must not be used for anything else.
+            max_outstanding: The max number of unconfirmed messages. When reached, publishing waits
+                for confirmations to arrive. Defaults to 1000.
+
+        Raises:
+            AMQPError: When the broker doesn't acknowledge the confirm mode request.
+        """
+        self._channel = channel
+        self._connection = channel.connection
+        self._max_outstanding = max_outstanding
+        self._tracker = ConfirmTracker()
+
+        selected = []
+        channel._impl.confirm_delivery(  # pylint:disable = protected-access
+            ack_nack_callback=self._on_confirmation, callback=selected.append
+        )
+        self._process_until(lambda: bool(selected))
+
+    @property
+    def is_open(self) -> bool:
+        """Checks if the channel is still open.
+
+        Returns:
+            A boolean value indicating if the channel can still be used.
+        """
+        return bool(self._channel.is_open)
+
+    @property
+    def outstanding(self) -> int:
+        """The number of published messages not confirmed yet."""
+        return len(self._tracker)
+
+    def publish(
+            self, exchange: str, routing_key: str, body: str, properties: BasicProperties
+    ) -> PublishResult:
+        """Publishes a message without waiting for its confirmation.
+
+        If `max_outstanding` unconfirmed messages are reached, waits for confirmations first.
+
+        Args:
+            exchange: The exchange to publish the message to.
+            routing_key: The routing key to publish the message with.
+            body: The serialized message.
+            properties: The message's BasicProperties.
+
+        Returns:
+            The message's PublishResult, that will be updated once the broker confirms it.
+        """
+        if len(self._tracker) >= self._max_outstanding:
+            self._process_until(lambda: len(self._tracker) < self._max_outstanding)
+
+        self._channel._impl.basic_publish(  # pylint:disable = protected-access
+            exchange=exchange, routing_key=routing_key, body=body, properties=properties
+        )
+        result = PublishResult(message_id=(properties.headers or {}).get("message_id"))
+        self._tracker.add(result)
+
+        return result
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits for every outstanding message to be confirmed.
+
+        Messages still unconfirmed when the timeout expires are marked as not acked.
+
+        Args:
+            timeout: The max number of seconds to wait for. Waits forever if None.
+
+        Returns:
+            A boolean value indicating if every message got confirmed on time.
+        """
+        if not self._process_until(lambda: not self._tracker, timeout):
+            self.fail("Timed out waiting for the broker's confirmation.")
+
+            return False
+
+        return True
+
+    def fail(self, error: str):
+        """Marks every outstanding message as not acked, with `error` as the reason.
+
+        Args:
+            error: The description of why the messages weren't confirmed.
+        """
+        for result in self._tracker.clear():
+            result.error = error
+
+    def _process_until(self, ready: Callable[[], bool], timeout: float = None) -> bool:
+        """Processes the connection's I/O until `ready` returns True or `timeout` expires.
+
+        Args:
+            ready: A callable returning True when it's time to stop processing.
+            timeout: The max number of seconds to process I/O for. Unlimited if None.
+
+        Returns:
+            The value returned by `ready` once processing stopped.
+        """
+        # pylint:disable = protected-access
+        expired = []
+        ioloop = self._connection._impl.ioloop
+        timer = None if timeout is None else ioloop.call_later(timeout, lambda: expired.append(1))
+
+        try:
+            self._connection._flush_output(ready, lambda: bool(expired))
+
+        finally:
+            if timer is not None:
+                ioloop.remove_timeout(timer)
+
+        return ready()
+
+    def _on_confirmation(self, frame: Method):
+        """Called when the broker acks or nacks one message, or many if `multiple` is set.
+
+        Args:
+            frame: The Basic.Ack or Basic.Nack method frame sent by the broker.
+        """
+        for result, acked in self._tracker.confirm(frame):
+            result.acked = acked
+
+            if not acked:
+                result.error = "Message nacked by the broker."
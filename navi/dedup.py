@@ -0,0 +1,250 @@
+"""Navi's deduplication module.
+
+Messages can be delivered more than once: redelivered after a listener's connection is lost
+before acking them, or published twice by a publisher retrying. Listeners created with a `dedup`
+cache skip, and ack, the messages whose `message_id` header was already handled successfully,
+instead of running their callback again.
+
+Message ids are only added to the cache once their callback succeeds, so failed messages are
+retried when redelivered. Duplicates delivered while the first copy's callback is still running
+aren't detected.
+
+The following caches are available:
+    NaviMemoryDedupCache: A bounded LRU cache whose entries expire after a TTL, in the listener's
+        process. The default, with `dedup=True`.
+    NaviFileDedupCache: A bounded cache whose entries expire after a TTL, stored in a local SQLite
+        file, to be shared by the processes of a host, such as `navi worker` ones.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+
+
+class NaviDedupCache:
+    """Base class for Navi deduplication caches.
+
+    Subclasses must implement `_contains` and `add`, and be thread-safe.
+
+    Attributes:
+        hits: The number of ids checked that were in the cache.
+        misses: The number of ids checked that weren't in the cache.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger("navi")
+
+    def seen(self, message_id: str) -> bool:
+        """Checks if a message was already handled, counting it as a hit or a miss.
+
+        Args:
+            message_id: The message's id.
+
+        Returns:
+            A boolean value indicating if the message was already handled.
+        """
+        if self._contains(message_id):
+            self.hits += 1
+
+            return True
+
+        self.misses += 1
+
+        return False
+
+    def _contains(self, message_id: str) -> bool:
+        raise NotImplementedError()
+
+    def add(self, message_id: str):
+        """Records a message as handled.
+
+        Args:
+            message_id: The message's id.
+        """
+        raise NotImplementedError()
+
+
+class NaviMemoryDedupCache(NaviDedupCache):
+    """An in-memory LRU cache of handled message ids, expiring after a TTL. Thread-safe."""
+
+    def __init__(self, max_size: int = 100000, ttl: float = 3600):
+        """Initializes a NaviMemoryDedupCache.
+
+        Args:
+            max_size: The max number of ids kept. The least recently seen ones are evicted first.
+                Defaults to 100000.
+            ttl: The number of seconds an id is kept for. Defaults to 3600.
+        """
+        super().__init__()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _contains(self, message_id: str) -> bool:
+        now = time.monotonic()
+
+        with self._lock:
+            expires_at = self._entries.get(message_id)
+
+            if expires_at is None:
+                return False
+
+            if expires_at <= now:
+                del self._entries[message_id]
+
+                return False
+
+            self._entries.move_to_end(message_id)
+
+            return True
+
+    def add(self, message_id: str):
+        now = time.monotonic()
+
+        with self._lock:
+            self._entries[message_id] = now + self._ttl
+            self._entries.move_to_end(message_id)
+            self._evict(now)
+
+    def _evict(self, now: float):
+        """Drops the oldest entries while they're expired, or too many. Must be called while
+        holding the lock."""
+        entries = self._entries
+
+        while entries:
+            message_id, expires_at = next(iter(entries.items()))
+
+            if len(entries) <= self._max_size and expires_at > now:
+                return
+
+            del entries[message_id]
+
+
+class NaviFileDedupCache(NaviDedupCache):
+    """A cache of handled message ids, expiring after a TTL, stored in a SQLite file, so it's
+    shared by every process using the same path. Thread-safe, and safe to use in forked processes.
+
+    Expired entries, and the oldest ones past `max_size`, are pruned every `prune_interval` adds.
+    If the file can't be read or written, ids are considered not handled.
+    """
+
+    def __init__(
+            self, path: str, max_size: int = 1000000, ttl: float = 86400, prune_interval: int = 1000
+    ):
+        """Initializes a NaviFileDedupCache.
+
+        Args:
+            path: The path of the SQLite file, created if needed.
+            max_size: The max number of ids kept. The oldest ones are evicted first. Defaults to
+                1000000.
+            ttl: The number of seconds an id is kept for. Defaults to 86400.
+            prune_interval: The number of adds between two prunings. Defaults to 1000.
+        """
+        super().__init__()
+        self._path = path
+        self._max_size = max_size
+        self._ttl = ttl
+        self._prune_interval = prune_interval
+        self._adds = 0
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns the process' connection to the file, opening it on first use. Must be called
+        while holding the lock."""
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=5, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS navi_dedup "
+                "(message_id TEXT PRIMARY KEY, expires_at REAL NOT NULL) WITHOUT ROWID"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS navi_dedup_expires_at ON navi_dedup (expires_at)"
+            )
+            self._connection = connection
+            self._pid = os.getpid()
+
+        return self._connection
+
+    def _contains(self, message_id: str) -> bool:
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT 1 FROM navi_dedup WHERE message_id = ? AND expires_at > ?",
+                    (message_id, time.time()),
+                ).fetchone()
+
+        except sqlite3.Error as error:
+            self.logger.warning("Error while reading dedup cache %s: %s.", self._path, error)
+
+            return False
+
+        return row is not None
+
+    def add(self, message_id: str):
+        now = time.time()
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO navi_dedup (message_id, expires_at) VALUES (?, ?)",
+                    (message_id, now + self._ttl),
+                )
+                self._adds += 1
+
+                if self._adds % self._prune_interval == 0:
+                    self._prune(connection, now)
+
+        except sqlite3.Error as error:
+            self.logger.warning("Error while writing dedup cache %s: %s.", self._path, error)
+
+    def _prune(self, connection: sqlite3.Connection, now: float):
+        connection.execute("DELETE FROM navi_dedup WHERE expires_at <= ?", (now,))
+        (count,) = connection.execute("SELECT COUNT(*) FROM navi_dedup").fetchone()
+
+        if count > self._max_size:
+            connection.execute(
+                "DELETE FROM navi_dedup WHERE message_id IN "
+                "(SELECT message_id FROM navi_dedup ORDER BY expires_at LIMIT ?)",
+                (count - self._max_size,),
+            )
+
+    def close(self):
+        """Closes the process' connection to the file."""
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+
+            self._connection = None
+
+
+def get_dedup_cache(dedup: Union[bool, NaviDedupCache] = None) -> Optional[NaviDedupCache]:
+    """Returns the deduplication cache a listener's `dedup` argument stands for.
+
+    Args:
+        dedup: True for a new NaviMemoryDedupCache, a NaviDedupCache instance, that is returned as
+            is, or None or False for no deduplication.
+
+    Returns:
+        The NaviDedupCache instance, or None.
+    """
+    if isinstance(dedup, NaviDedupCache):
+        return dedup
+
+    return NaviMemoryDedupCache() if dedup else None
@@ -0,0 +1,100 @@
+"""NaviDelivery implementation module."""
+
+from collections import ChainMap
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from pika import BasicProperties
+from pika.frame import Method
+
+from navi.codecs import NaviCodec
+from navi.compression import decode_body
+
+_NOT_DECODED = object()
+
+
+class NaviDelivery:
+    """A delivered message, as handed to listener callbacks in lazy delivery mode.
+
+    Nothing is copied nor decoded until it's used: the body is exposed as a memoryview over the
+    received bytes, the headers as a read-only view layered over the listener's metadata, and the
+    payload is decoded, with the codec matching the message's content type, on first access and
+    then cached. Consumers that only route or forward messages avoid decoding costs entirely.
+    """
+
+    __slots__ = ("_method", "_properties", "_body", "_codec", "_listener_info", "_payload")
+
+    def __init__(
+            self,
+            method: Method,
+            properties: BasicProperties,
+            body: bytes,
+            codec: NaviCodec,
+            listener_info: Mapping[str, Any],
+    ):  # pylint:disable = R0913
+        """Initializes a NaviDelivery.
+
+        Args:
+            method: The Basic.Deliver method the message was delivered with.
+            properties: The message's BasicProperties.
+            body: The message's raw body.
+            codec: The codec to decode messages without a known content type with.
+            listener_info: The delivering listener's metadata, exposed as headers unless the
+                message has headers with the same names.
+        """
+        self._method = method
+        self._properties = properties
+        self._body = body
+        self._codec = codec
+        self._listener_info = listener_info
+        self._payload = _NOT_DECODED
+
+    @property
+    def body(self) -> memoryview:
+        """A read-only memoryview over the message's raw body."""
+        return memoryview(self._body).toreadonly()
+
+    @property
+    def headers(self) -> Mapping[str, Any]:
+        """A read-only view of the message's headers, layered over the listener's metadata."""
+        return MappingProxyType(ChainMap(self._properties.headers or {}, self._listener_info))
+
+    @property
+    def payload(self) -> Any:
+        """The message's body, decoded on first access.
+
+        Raises:
+            TypeError, ValueError: When the body can't be decoded.
+        """
+        if self._payload is _NOT_DECODED:
+            self._payload = decode_body(self._properties, self._body, self._codec)
+
+        return self._payload
+
+    @property
+    def properties(self) -> BasicProperties:
+        """The message's BasicProperties."""
+        return self._properties
+
+    @property
+    def content_type(self) -> str:
+        """The message's content type, if any."""
+        return self._properties.content_type
+
+    @property
+    def message_id(self) -> str:
+        """The message's `message_id` header, if any."""
+        return (self._properties.headers or {}).get("message_id")
+
+    @property
+    def routing_key(self) -> str:
+        """The routing key the message was published with."""
+        return self._method.routing_key
+
+    @property
+    def delivery_tag(self) -> int:
+        """The delivery tag the message was delivered with."""
+        return self._method.delivery_tag
+
+    def __repr__(self) -> str:
+        return f"NaviDelivery(message_id={self.message_id!r}, routing_key={self.routing_key!r})"
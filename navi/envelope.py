@@ -0,0 +1,141 @@
+"""NaviEnvelopeFactory implementation module."""
+
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from pika import BasicProperties
+
+
+class NaviEnvelopeFactory:
+    """A class that builds the BasicProperties, and metadata headers, messages are published with.
+
+    Everything that doesn't change between messages is computed once: the host's name is resolved
+    when the factory is created, and static headers are kept in a template dict that is copied for
+    each message. Message ids are built from the current time, a counter and a random node id, so
+    they're cheap to generate, unique, and monotonic: each id sorts after the previous one, even
+    if the clock goes back. A forked child process gets a new node id.
+
+    Every message gets the following headers:
+        message_id: The message's unique, time sortable, id.
+        published_at: The UNIX timestamp, in seconds, the message was published at.
+        from_host: The fully qualified domain name of the publishing host.
+    """
+
+    def __init__(self, host: str = None):
+        """Initializes a NaviEnvelopeFactory.
+
+        Args:
+            host: The name of the publishing host. Defaults to the result of `socket.getfqdn`.
+        """
+        self._node = os.urandom(4).hex()
+        self._last_id = 0
+        self._id_lock = threading.Lock()
+        self._template: Dict[str, Any] = {"from_host": host or socket.getfqdn()}
+        self._dynamic_headers: Dict[str, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def headers(self) -> Dict[str, Any]:
+        """A copy of the static headers every message gets."""
+        return dict(self._template)
+
+    def add_static_header(self, name: str, value: Any):
+        """Adds a header with the same value for every message.
+
+        Args:
+            name: The header's name.
+            value: The header's value.
+        """
+        with self._lock:
+            self._template = {**self._template, name: value}
+
+    def add_dynamic_header(self, name: str, provider: Callable[[], Any]):
+        """Adds a header whose value is computed for each message.
+
+        Args:
+            name: The header's name.
+            provider: A callable with no arguments returning the header's value.
+        """
+        with self._lock:
+            self._dynamic_headers = {**self._dynamic_headers, name: provider}
+
+    def message_id(self) -> str:
+        """Generates a unique message id.
+
+        It's made of the current time in microseconds, a 24 bits counter, and the factory's random
+        node id, as fixed width hex strings. The time and counter part is always greater than the
+        previous id's, so ids are monotonic, and sort by generation time as long as the clock
+        doesn't go back.
+
+        Returns:
+            The message id.
+        """
+        now = (time.time_ns() // 1000) << 24
+
+        with self._id_lock:
+            self._last_id = max(self._last_id + 1, now)
+            sequence = self._last_id
+
+        return f"{sequence:020x}{self._node}"
+
+    def _reseed(self):
+        """Gives the factory a new node id, so a forked child process doesn't generate the same
+        ids as its parent."""
+        self._node = os.urandom(4).hex()
+        self._lock = threading.Lock()
+        self._id_lock = threading.Lock()
+
+    def build(self, content_type: str = None) -> BasicProperties:
+        """Builds a BasicProperties with a headers dict containing message metadata.
+
+        Args:
+            content_type: The content type of the message's body. Optional.
+
+        Returns:
+            A BasicProperties instance with a headers dict containing message metadata.
+        """
+        headers = self._template.copy()
+        headers["message_id"] = self.message_id()
+        headers["published_at"] = time.time()
+
+        for name, provider in self._dynamic_headers.items():
+            headers[name] = provider()
+
+        return BasicProperties(content_type=content_type, headers=headers)
+
+
+_FACTORY = None
+_FACTORY_LOCK = threading.Lock()
+
+
+def get_envelope_factory() -> NaviEnvelopeFactory:
+    """Returns the process-wide NaviEnvelopeFactory, creating it on first use.
+
+    Returns:
+        The shared NaviEnvelopeFactory instance.
+    """
+    global _FACTORY  # pylint:disable = global-statement
+
+    if _FACTORY is None:
+        with _FACTORY_LOCK:
+            if _FACTORY is None:
+                _FACTORY = NaviEnvelopeFactory()
+
+    return _FACTORY
+
+
+def _reseed_factory():
+    """Makes a forked child process generate its own message ids, keeping the headers added to the
+    process-wide factory by its parent."""
+    global _FACTORY_LOCK  # pylint:disable = global-statement
+    _FACTORY_LOCK = threading.Lock()
+
+    if _FACTORY is not None:
+        _FACTORY._reseed()  # pylint:disable = protected-access
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_factory)
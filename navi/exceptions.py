@@ -15,3 +15,34 @@ class NaviConfigException(NaviException):
 
     def __init__(self, missing_configs: List["NaviConfigEntry"]):
         super().__init__(f"Invalid Navi configurations: {missing_configs}.")
+
+
+class NaviBufferFullException(NaviException):
+    """NaviException to be raised when a message can't be buffered because the buffer's full."""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Buffer full: {max_size} messages waiting to be published.")
+
+
+class NaviCodecException(NaviException):
+    """NaviException to be raised when a codec can't be found."""
+
+
+class NaviTransportException(NaviException):
+    """NaviException to be raised when a transport can't be found."""
+
+
+class NaviRpcException(NaviException):
+    """NaviException to be raised when an RPC call fails on the server, or can't get its reply."""
+
+
+class NaviStreamException(NaviException):
+    """NaviException to be raised when a stream can't be published, or reassembled."""
+
+
+class NaviOutboxException(NaviException):
+    """NaviException to be raised when an outbox directory is already used by another process."""
+
+
+class NaviSchedulerException(NaviException):
+    """NaviException to be raised when a scheduler's store is already used by another process."""
@@ -0,0 +1,169 @@
+"""NaviDispatcher implementation module."""
+
+import logging
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Set, Tuple
+
+
+class DispatchTask:
+    """A callback call waiting to be run, or running, on a NaviDispatcher's executor.
+
+    Attributes:
+        key: The task's ordering key. Tasks with the same key run one at a time, in order. None
+            if the task can run in parallel with any other.
+        function: The callable to run.
+        arguments: The arguments to call `function` with.
+        on_done: Called with the task's Future, on the dispatcher's thread, once it's done.
+    """
+
+    __slots__ = ("key", "function", "arguments", "on_done")
+
+    def __init__(
+            self,
+            key: Optional[Hashable],
+            function: Callable,
+            arguments: Tuple,
+            on_done: Callable[[Future], None],
+    ):
+        self.key = key
+        self.function = function
+        self.arguments = arguments
+        self.on_done = on_done
+
+
+class NaviDispatcher:
+    """A class that runs listener callbacks on a concurrent.futures Executor.
+
+    At most `max_in_flight` callbacks are submitted to the executor at once, and callbacks for
+    messages with the same ordering key run one at a time, in delivery order, while callbacks for
+    different keys run in parallel. Callbacks that can't run yet are kept waiting in order.
+
+    Every method must be called from the same thread, the listener's ioloop thread: completions are
+    marshalled back to it through `schedule`, so the dispatcher's state is never shared.
+    """
+
+    def __init__(
+            self,
+            executor: Executor,
+            schedule: Callable[[Callable[[], None]], None],
+            max_in_flight: int = 100,
+    ):
+        """Initializes a NaviDispatcher.
+
+        Args:
+            executor: The ThreadPoolExecutor, ProcessPoolExecutor, or any other Executor to run
+                callbacks on. With a ProcessPoolExecutor, callbacks and their arguments must be
+                picklable.
+            schedule: A thread-safe callable that runs a callable on the dispatcher's thread, like
+                an ioloop's `add_callback_threadsafe`.
+            max_in_flight: The max number of callbacks submitted to the executor at once. Defaults
+                to 100.
+        """
+        self._executor = executor
+        self._schedule = schedule
+        self._max_in_flight = max_in_flight
+        self._in_flight = 0
+        self._running_keys: Set[Hashable] = set()
+        self._waiting: Dict[Hashable, Deque[DispatchTask]] = {}
+        self._backlog: Deque[DispatchTask] = deque()
+        self.logger = logging.getLogger("navi")
+
+    @property
+    def in_flight(self) -> int:
+        """The number of callbacks submitted to the executor and not done yet."""
+        return self._in_flight
+
+    @property
+    def pending(self) -> int:
+        """The number of callbacks waiting to be submitted to the executor."""
+        return len(self._backlog) + sum(len(tasks) for tasks in self._waiting.values())
+
+    def submit(
+            self,
+            key: Optional[Hashable],
+            function: Callable,
+            arguments: Tuple,
+            on_done: Callable[[Future], None],
+    ):
+        """Runs `function` with `arguments` on the executor, as soon as `max_in_flight` and the
+        ordering of `key` allow it.
+
+        Args:
+            key: The ordering key. Calls with the same key run one at a time, in submission order.
+                None if the call can run in parallel with any other.
+            function: The callable to run.
+            arguments: The arguments to call `function` with.
+            on_done: Called with the call's Future, on the dispatcher's thread, once it's done.
+        """
+        self._dispatch(DispatchTask(key, function, arguments, on_done))
+
+    def _dispatch(self, task: DispatchTask):
+        """Starts `task`, or keeps it waiting for its key, or for an in-flight slot."""
+        if task.key is not None and task.key in self._running_keys:
+            self._waiting.setdefault(task.key, deque()).append(task)
+
+        elif self._in_flight >= self._max_in_flight:
+            self._backlog.append(task)
+
+        else:
+            self._start(task)
+
+    def _start(self, task: DispatchTask):
+        self._in_flight += 1
+
+        if task.key is not None:
+            self._running_keys.add(task.key)
+
+        future = self._executor.submit(task.function, *task.arguments)
+        future.add_done_callback(
+            lambda done: self._schedule(lambda: self._complete(task, done))
+        )
+
+    def _complete(self, task: DispatchTask, future: Future):
+        """Called on the dispatcher's thread when a task is done. Starts the tasks it unblocks."""
+        self._in_flight -= 1
+
+        try:
+            task.on_done(future)
+
+        except Exception as error:  # pylint:disable = W0703
+            self.logger.error("Error while completing dispatched callback: %s", str(error))
+
+        if task.key is not None:
+            self._running_keys.discard(task.key)
+            waiting = self._waiting.get(task.key)
+
+            if waiting:
+                next_task = waiting.popleft()
+
+                if not waiting:
+                    del self._waiting[task.key]
+
+                self._dispatch(next_task)
+
+        while self._backlog and self._in_flight < self._max_in_flight:
+            self._dispatch(self._backlog.popleft())
+
+
+def ordering_key_getter(
+        ordering_key: Any,
+) -> Optional[Callable[..., Optional[Hashable]]]:
+    """Builds the callable that extracts the ordering key of a message.
+
+    Args:
+        ordering_key: Either the name of the header holding the key, or a callable receiving the
+            same arguments as the listener's callback and returning the key. None for no ordering.
+
+    Returns:
+        A callable receiving the listener's callback arguments and returning the key, or None.
+    """
+    if ordering_key is None or callable(ordering_key):
+        return ordering_key
+
+    def header_key(headers_or_delivery: Any, *_) -> Optional[Hashable]:
+        headers = getattr(headers_or_delivery, "headers", headers_or_delivery)
+
+        return headers.get(ordering_key)
+
+    return header_key
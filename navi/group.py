@@ -0,0 +1,386 @@
+"""NaviListenerGroup implementation module."""
+
+import logging
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, List, Optional
+from weakref import WeakSet
+
+from pika import ConnectionParameters, SelectConnection
+from pika.adapters.select_connection import IOLoop
+
+from navi import config
+from navi.listener import NaviListener
+from navi.pool import pool_key
+from navi.reconnect import CLOSED, DISCONNECTED, NaviBackoff
+from navi.transport import get_transport
+
+
+class GroupConnection:
+    """A connection shared by some of a NaviListenerGroup's listeners, one channel each.
+
+    Attributes:
+        key: The pool key of the connection's parameters.
+        connection: The SelectConnection, None until it's created.
+        listeners: The listeners using the connection.
+        is_open: Whether the connection has been opened.
+        reconnecting: Whether the connection is closed, and waiting to be reopened.
+        backoff: The NaviBackoff computing the delay before each reconnection attempt.
+    """
+
+    __slots__ = ("key", "connection", "listeners", "is_open", "reconnecting", "backoff")
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.connection: Optional[SelectConnection] = None
+        self.listeners: List[NaviListener] = []
+        self.is_open = False
+        self.reconnecting = False
+        self.backoff = NaviBackoff(
+            initial_delay=config.NAVI_RECONNECT_INITIAL_DELAY,
+            max_delay=config.NAVI_RECONNECT_MAX_DELAY,
+        )
+
+
+class NaviListenerGroup:
+    """A class that runs many listeners on a single ioloop thread, over a few shared connections.
+
+    Instead of a thread and a connection per listener, every listener of the group opens its own
+    channel on one of the group's connections, and every connection runs on the same ioloop. Up to
+    `channels_per_connection` listeners share a connection, and more connections are opened as
+    listeners are added. Listeners can be added before or after the group is started.
+
+    When one of its connections is lost, the group reopens it after a jittered exponential backoff,
+    failing over to its listeners' next broker node, and its listeners re-declare their topology
+    and consume again. Listeners created with `reconnect=False`, or while reconnection is disabled
+    by `init_config`, are closed instead.
+    """
+
+    def __init__(self, channels_per_connection: int = 100, name: str = "navi-listener-group"):
+        """Initializes a NaviListenerGroup.
+
+        Args:
+            channels_per_connection: The max number of listeners sharing a connection. Defaults to
+                100.
+            name: The name of the group's ioloop thread. Defaults to "navi-listener-group".
+        """
+        if channels_per_connection < 1:
+            raise ValueError("channels_per_connection must be at least 1.")
+
+        self._channels_per_connection = channels_per_connection
+        self._name = name
+        self._connections: List[GroupConnection] = []
+        self._pending: List[NaviListener] = []
+        self._transport = get_transport()
+        self._ioloop: Optional[IOLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.logger = logging.getLogger("navi")
+
+    @property
+    def listeners(self) -> List[NaviListener]:
+        """Every listener of the group."""
+        with self._lock:
+            return self._pending + [
+                listener for entry in self._connections for listener in entry.listeners
+            ]
+
+    @property
+    def connection_count(self) -> int:
+        """The number of connections the group uses."""
+        return len(self._connections)
+
+    def add(self, listener: NaviListener) -> NaviListener:
+        """Adds a listener to the group. If the group is running, it starts listening right away.
+
+        Args:
+            listener: The NaviListener to add. Its `listen` method must not be called.
+
+        Returns:
+            The added listener.
+        """
+        with self._lock:
+            if self._ioloop is None:
+                self._pending.append(listener)
+
+                return listener
+
+        self._ioloop.add_callback_threadsafe(partial(self._attach, listener))
+
+        return listener
+
+    def listen(
+            self, queue_name: str, routing_key: str, callback: Callable, **kwargs: Any
+    ) -> NaviListener:
+        """Creates a NaviListener and adds it to the group.
+
+        Args:
+            queue_name: The name of the queue to listen at.
+            routing_key: The routing key to bind the queue with.
+            callback: The callable to be executed whenever a message is received.
+            **kwargs: Any other NaviListener argument.
+
+        Returns:
+            The created listener.
+        """
+        return self.add(
+            NaviListener(
+                queue_name=queue_name, routing_key=routing_key, callback=callback, **kwargs
+            )
+        )
+
+    def start(self):
+        """Starts the group's ioloop thread, connecting every listener added so far."""
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._ioloop = self._transport.create_ioloop()
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+
+        self._thread.start()
+        _GROUPS.add(self)
+
+    def stop(self, timeout: float = None):
+        """Drains every listener of the group, as `NaviListener.stop` does, then closes every
+        connection of the group, and stops its ioloop thread.
+
+        Args:
+            timeout: The max number of seconds to wait for the listeners to drain, and the thread
+                to stop. Waits forever if None.
+        """
+        if self._ioloop is None:
+            return
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._ioloop.add_callback_threadsafe(partial(self._drain, deadline))
+
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _drain(self, deadline: Optional[float]):
+        """Drains every listener of the group, then closes its connections. Runs on the ioloop
+        thread."""
+        self._stopping = True
+        listeners = [listener for entry in self._connections for listener in entry.listeners]
+        remaining = [len(listeners)]
+
+        def on_drained():
+            remaining[0] -= 1
+
+            if not remaining[0]:
+                self._close()
+
+        if not listeners:
+            self._close()
+
+        for listener in listeners:
+            listener._stop_event.set()  # pylint:disable = protected-access
+            listener._drain(deadline, on_drained)  # pylint:disable = protected-access
+
+    def _run(self):
+        """Attaches the pending listeners, and spins the ioloop until the group is stopped."""
+        self.logger.info("Starting listener group %s...", self._name)
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        for listener in pending:
+            self._attach(listener)
+
+        self._ioloop.start()
+
+    def _attach(self, listener: NaviListener):
+        """Assigns a listener to a connection with a free channel, opening one if there's none.
+        Connections that are closed for good are dropped first. Runs on the ioloop thread."""
+        if self._stopping:
+            return
+
+        key = pool_key(listener._connection_parameters)  # pylint:disable = protected-access
+        self._connections = [entry for entry in self._connections if self._is_alive(entry)]
+
+        entry = next(
+            (
+                entry for entry in self._connections
+                if entry.key == key and len(entry.listeners) < self._channels_per_connection
+            ),
+            None,
+        )
+
+        if entry is None:
+            entry = GroupConnection(key)
+            self._connections.append(entry)
+            entry.listeners.append(listener)
+            entry.connection = self._init_connection(
+                listener._connection_parameters, entry  # pylint:disable = protected-access
+            )
+
+            return
+
+        entry.listeners.append(listener)
+
+        if entry.is_open:
+            listener.on_connected(entry.connection)
+
+    @staticmethod
+    def _is_alive(entry: GroupConnection) -> bool:
+        """Checks if a connection is open, being opened, or waiting to be reopened."""
+        return entry.is_open or entry.reconnecting or (
+            entry.connection is not None and not entry.connection.is_closed
+        )
+
+    def _init_connection(
+            self, connection_parameters: ConnectionParameters, entry: GroupConnection
+    ) -> SelectConnection:
+        """Initializes a SelectConnection running on the group's ioloop.
+
+        Args:
+            connection_parameters: A set up ConnectionParameters instance.
+            entry: The GroupConnection the connection is for.
+
+        Returns:
+            The set up SelectConnection instance.
+        """
+        return self._transport.select_connection(
+            connection_parameters,
+            on_open_callback=partial(self._on_connected, entry),
+            on_open_error_callback=partial(self._on_connection_error, entry),
+            on_close_callback=partial(self._on_connection_closed, entry),
+            ioloop=self._ioloop,
+        )
+
+    def _on_connected(self, entry: GroupConnection, connection: SelectConnection):
+        """Called when one of the group's connections is opened. Connects its listeners."""
+        entry.is_open = True
+        entry.backoff.reset()
+
+        for listener in entry.listeners:
+            listener.on_connected(connection)
+
+    def _on_connection_error(
+            self, entry: GroupConnection, connection: SelectConnection, error: Exception
+    ):  # pylint:disable = unused-argument
+        """Called when one of the group's connections can't be opened."""
+        self.logger.error(
+            "Error while connecting listeners %s: %s.",
+            [listener._queue_name for listener in entry.listeners],  # pylint:disable = W0212
+            str(error),
+        )
+        self._on_connection_closed(entry, connection, error)
+
+    def _on_connection_closed(
+            self, entry: GroupConnection, connection: SelectConnection, reason: Exception
+    ):  # pylint:disable = unused-argument
+        """Called when one of the group's connections is closed. Its listeners created with
+        `reconnect=False` are closed for good, and the others fail over to their next broker node,
+        then the connection is reopened after the backoff's delay. Listeners whose next node
+        differs from the connection's are attached again instead. The ioloop is stopped once every
+        connection is closed while stopping."""
+        entry.is_open = False
+
+        for listener in entry.listeners:
+            listener._set_state(DISCONNECTED)  # pylint:disable = protected-access
+
+        if not self._stopping:
+            for listener in entry.listeners:
+                if not listener._reconnect:  # pylint:disable = protected-access
+                    listener._set_state(CLOSED)  # pylint:disable = protected-access
+
+            entry.listeners = [
+                listener for listener in entry.listeners
+                if listener._reconnect  # pylint:disable = protected-access
+            ]
+
+        if not self._stopping and entry.listeners:
+            moved = self._fail_over(entry)
+            delay = entry.backoff.next_delay()
+            self.logger.error(
+                "Listener group connection closed: %s. Reconnecting in %.2fs.", str(reason), delay
+            )
+            entry.reconnecting = True
+            self._ioloop.call_later(delay, partial(self._reconnect, entry, moved))
+
+            return
+
+        if not self._stopping:
+            self.logger.error("Listener group connection closed: %s.", str(reason))
+
+        if entry in self._connections:
+            self._connections.remove(entry)
+
+        if not self._connections:
+            self._ioloop.stop()
+
+    @staticmethod
+    def _fail_over(entry: GroupConnection) -> List[NaviListener]:
+        """Fails the listeners of a lost connection over to their next broker node, and keys the
+        connection by the first one's.
+
+        Returns:
+            The listeners removed from the connection, as their next node differs from it, pinned
+            listeners staying on their node.
+        """
+        for listener in entry.listeners:
+            listener._next_node()  # pylint:disable = protected-access
+
+        entry.key = pool_key(entry.listeners[0]._connection_parameters)  # pylint:disable = W0212
+        moved = [
+            listener for listener in entry.listeners
+            if pool_key(listener._connection_parameters) != entry.key  # pylint:disable = W0212
+        ]
+        entry.listeners = [listener for listener in entry.listeners if listener not in moved]
+
+        return moved
+
+    def _reconnect(self, entry: GroupConnection, moved: List[NaviListener] = ()):
+        """Reopens one of the group's connections, unless the group is stopping, and attaches the
+        listeners that moved to another node. Runs on the ioloop thread. Connections left without
+        listeners are dropped instead."""
+        entry.reconnecting = False
+
+        if self._stopping or entry not in self._connections:
+            return
+
+        if not entry.listeners:
+            self._connections.remove(entry)
+
+        else:
+            entry.connection = self._init_connection(
+                entry.listeners[0]._connection_parameters,  # pylint:disable = protected-access
+                entry,
+            )
+
+        for listener in moved:
+            self._attach(listener)
+
+    def _close(self):
+        """Closes every connection of the group. Runs on the ioloop thread."""
+        self._stopping = True
+        closing = False
+
+        for entry in list(self._connections):
+            if entry.connection is not None and not (
+                    entry.connection.is_closed or entry.connection.is_closing
+            ):
+                entry.connection.close()
+                closing = True
+
+            else:
+                self._connections.remove(entry)
+
+        if not closing:
+            self._ioloop.stop()
+
+
+_GROUPS: "WeakSet[NaviListenerGroup]" = WeakSet()
+
+
+def running_groups() -> List[NaviListenerGroup]:
+    """Returns the listener groups of the process started with `start` whose thread is still
+    alive."""
+    return [
+        group for group in list(_GROUPS)
+        if group._thread is not None and group._thread.is_alive()  # pylint:disable = W0212
+    ]
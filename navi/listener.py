@@ -1,31 +1,129 @@
 """NaviListener implementation module"""
 
-import json
-from threading import Thread
-from typing import Callable
+import time
+from concurrent.futures import Executor, Future
+from functools import partial
+from threading import Event, Thread, current_thread
+from types import MappingProxyType
+from typing import IO, TYPE_CHECKING, Any, Callable, Hashable, List, Mapping, Optional, Tuple, Union
+from weakref import WeakSet
 
 from pika import BaseConnection, BasicProperties, ConnectionParameters, SelectConnection
+from pika.adapters.select_connection import IOLoop
 from pika.channel import Channel
 from pika.exceptions import AMQPError
 from pika.frame import Method
 
 from navi import config
+from navi.acks import NaviAcker
 from navi.base import NaviBase
-from navi.exceptions import NaviInitException
+from navi.codecs import NaviCodec, get_codec
+from navi.dedup import NaviDedupCache, get_dedup_cache
+from navi.compression import decode_body, decompress
+from navi.delivery import NaviDelivery
+from navi.exceptions import NaviInitException, NaviStreamException
+from navi.executor import NaviDispatcher, ordering_key_getter
+from navi.metrics import NaviListenerMetrics, get_listener_metrics
+from navi.nodes import configured_nodes
+from navi.reconnect import BLOCKED, CLOSED, CONNECTED, CONNECTING, DISCONNECTED
+from navi.stream import NaviStreamAssembler, as_stream, is_chunk
+
+if TYPE_CHECKING:  # pragma: no cover
+    from navi.group import NaviListenerGroup
 
 
 class NaviListener(NaviBase):
-    """A class that sets up an AMQP connection, creates a queue, and binds a listener to it."""
+    """A class that sets up an AMQP connection, creates a queue, and binds a listener to it.
+
+    Messages are deserialized with the codec registered for their content type, or with the
+    listener's codec if they have none.
+
+    By default, the callback is called with the message's headers, merged with the listener's
+    metadata, and its deserialized body. In lazy delivery mode, it's called with a single
+    NaviDelivery instead, which decodes the body only if its payload is accessed. In streaming
+    mode, it's called with the headers and a binary file instead: the chunks of streams published
+    with `publish_stream` are reassembled into a spooled buffer, and the callback called once the
+    stream is complete, while other messages' bodies are wrapped as a file. The file is closed once
+    the callback returns.
+
+    If an executor is given, callbacks run on it instead of the ioloop thread, through a
+    NaviDispatcher that bounds the in-flight callbacks and, if an ordering key is given, runs the
+    callbacks of messages with the same key one at a time, in delivery order.
+
+    By default, messages are acked by the broker as soon as they're delivered, without bound. A
+    prefetch count or size bounds the unacked messages the broker pushes, and in manual ack mode,
+    messages are acked only once their callback succeeds, through a NaviAcker that coalesces acks
+    into `multiple` ones, and nacked when it fails.
+
+    When its connection is lost, the listener reconnects after a jittered exponential backoff, and
+    re-declares its exchange, queue and binding before consuming again. A closed channel is
+    reopened on the same connection. Connection state changes are reported to the callbacks added
+    with `add_state_callback`.
+
+    When stopped, the listener drains before closing its connection: its consumer is cancelled,
+    the deliveries prefetched but not handled yet are requeued in manual ack mode, and handled
+    otherwise, the callbacks in flight are waited for, and the pending acks flushed. The numbers of
+    messages handled, requeued and abandoned while draining are kept in the `drained`, `requeued`
+    and `abandoned` attributes.
+
+    Deliveries, decode errors, callback errors and durations, end-to-end latencies and in-flight
+    messages are recorded in the process-wide `navi.metrics` registry, labelled by queue, unless
+    metrics are disabled by `init_config`.
+    """
 
     _callback: Callable
+    _codec: NaviCodec
+    _lazy_delivery: bool
+    _listener_info: Mapping[str, Any]
+    _executor: Optional[Executor]
+    _max_in_flight: int
+    _get_ordering_key: Optional[Callable[..., Optional[Hashable]]]
+    _dispatcher: Optional[NaviDispatcher]
+    _prefetch_count: Optional[int]
+    _prefetch_size: int
+    _manual_ack: bool
+    _ack_batch_size: int
+    _ack_interval: float
+    _requeue_failed: bool
+    _acker: Optional[NaviAcker]
+    _metrics: Optional[NaviListenerMetrics]
+    _dedup: Optional[NaviDedupCache]
+    _assembler: Optional[NaviStreamAssembler]
+    _consumer_tag: Optional[str]
+    drained: int
+    requeued: int
+    abandoned: int
+    _connection: Optional[SelectConnection]
+    _reconnect: bool
+    _ioloop: Optional[IOLoop]
+    _stop_event: Event
     _channel: Channel
     _queue_name: str
     _thread_name: str
     _thread: Thread
 
     def __init__(
-            self, queue_name: str = None, routing_key: str = None, callback: Callable = None
-    ):
+            self,
+            queue_name: str = None,
+            routing_key: str = None,
+            callback: Callable = None,
+            codec: Union[str, NaviCodec] = None,
+            lazy_delivery: bool = False,
+            executor: Executor = None,
+            max_in_flight: int = 100,
+            ordering_key: Union[str, Callable[..., Hashable]] = None,
+            prefetch_count: int = None,
+            prefetch_size: int = 0,
+            manual_ack: bool = False,
+            ack_batch_size: int = 100,
+            ack_interval: float = 0.5,
+            requeue_failed: bool = False,
+            reconnect: bool = None,
+            dedup: Union[bool, NaviDedupCache] = None,
+            node: int = None,
+            streaming: bool = False,
+            stream_timeout: float = 300,
+    ):  # pylint:disable = R0913, R0914
         """Initializes a NaviListener.
 
         This class sets up a connection to an AMQP broker and binds a listener and a callback method
@@ -37,6 +135,50 @@ class NaviListener(NaviBase):
                 argument) to the exchange (defined by the env variable`NAVI_EXCHANGE`). Defaults to
                 None.
             callback: The callable to be executed whenever a message is received. Defaults to None.
+            codec: The name of the codec, or the codec, to deserialize messages without a known
+                content type with. Defaults to the `NAVI_CODEC` config.
+            lazy_delivery: Whether `callback` should be called with a single NaviDelivery argument,
+                instead of the message's headers and deserialized body. Defaults to False.
+            executor: The ThreadPoolExecutor or ProcessPoolExecutor to run `callback` on. With a
+                ProcessPoolExecutor, `callback` and its arguments must be picklable, so it can't be
+                used in lazy delivery mode. Defaults to None, running `callback` on the ioloop
+                thread.
+            max_in_flight: The max number of callbacks running on `executor` at once. Defaults to
+                100.
+            ordering_key: The name of the header holding the ordering key, or a callable receiving
+                the same arguments as `callback` and returning it. Messages with the same key are
+                handled one at a time, in delivery order. Only used with an `executor`. Defaults to
+                None.
+            prefetch_count: The max number of unacked messages the broker delivers at once. In
+                auto ack mode, it only applies while messages are in the broker's socket buffers.
+                Defaults to None, for no limit.
+            prefetch_size: The max size, in bytes, of the unacked messages the broker delivers at
+                once. Defaults to 0, for no limit.
+            manual_ack: Whether messages should be acked only once `callback` succeeds, instead of
+                as soon as they're delivered. Defaults to False.
+            ack_batch_size: In manual ack mode, the number of handled messages to ack at once, with
+                a single multiple ack. Defaults to 100.
+            ack_interval: In manual ack mode, the max number of seconds a handled message waits to
+                be acked. Defaults to 0.5.
+            requeue_failed: In manual ack mode, whether messages whose `callback` fails, or that
+                can't be deserialized, should be requeued when nacked. Defaults to False.
+            reconnect: Whether the listener should reconnect when its connection is lost. Defaults
+                to the `NAVI_RECONNECT` config.
+            dedup: The NaviDedupCache of handled message ids, or True for an in-memory one.
+                Messages whose id is in it are acked without calling `callback`. Defaults to None,
+                for no deduplication.
+            node: The index of the broker node set by `init_config` to listen on, without failing
+                over to the others. Defaults to None, for the first node, failing over to the next
+                one whenever the connection is lost.
+            streaming: Whether `callback` should be called with the message's headers and a binary
+                file, reassembling the chunks of streams. Can't be combined with lazy delivery.
+                Defaults to False.
+            stream_timeout: In streaming mode, the max number of seconds between two chunks of a
+                stream, before it's dropped. Defaults to 300.
+
+        Raises:
+            NaviInitException: When `queue_name` or `callback` is missing, `node` isn't the index
+                of a broker node, or both `streaming` and `lazy_delivery` are set.
         """
         super().__init__(routing_key=routing_key)
 
@@ -45,49 +187,235 @@ class NaviListener(NaviBase):
 
         self._queue_name = queue_name
         self._thread_name = f"navi-{self._queue_name}"
+        self._nodes_parameters = self._init_nodes_connection_params()
+        self._node = node
+        self._node_index = node or 0
+
+        if node is not None:
+            if not 0 <= node < len(self._nodes_parameters):
+                raise NaviInitException(f"Broker node {node} not set by init_config.")
+
+            self._connection_parameters = self._nodes_parameters[node]
+            self._thread_name = (
+                f"navi-{self._queue_name}@{self._connection_parameters.host}:"
+                f"{self._connection_parameters.port}"
+            )
 
         if callback is None or not callable(callback):
             raise NaviInitException("Callable callback needed.")
 
+        if streaming and lazy_delivery:
+            raise NaviInitException("Streaming and lazy delivery can't be combined.")
+
         self._callback = callback
+        self._codec = get_codec(codec)
+        self._lazy_delivery = lazy_delivery
+        self._assembler = (
+            NaviStreamAssembler(config.NAVI_STREAM_SPOOL_THRESHOLD, stream_timeout) if streaming
+            else None
+        )
+        self._listener_info = MappingProxyType(
+            {"listener_name": self._thread_name, "queue_name": self._queue_name}
+        )
+        self._executor = executor
+        self._max_in_flight = max_in_flight
+        self._get_ordering_key = ordering_key_getter(ordering_key)
+        self._dispatcher = None
+        self._prefetch_count = prefetch_count
+        self._prefetch_size = prefetch_size
+        self._manual_ack = manual_ack
+        self._ack_batch_size = ack_batch_size
+        self._ack_interval = ack_interval
+        self._requeue_failed = requeue_failed
+        self._acker = None
+        self._metrics = get_listener_metrics(self._queue_name)
+        self._dedup = get_dedup_cache(dedup)
+        self._consumer_tag = None
+        self.drained = 0
+        self.requeued = 0
+        self.abandoned = 0
+        self._connection = None
+        self._reconnect = config.NAVI_RECONNECT if reconnect is None else reconnect
+        self._backoff = self._init_backoff()
+        self._ioloop = None
+        self._stop_event = Event()
+        self._thread = None
 
     def _init_connection(self, connection_parameters: ConnectionParameters) -> BaseConnection:
         """Initializes a BaseConnection to be used by the listener.
 
+        Every connection of the listener runs on the same ioloop, so callbacks scheduled on it
+        outlive reconnections.
+
         Args:
             connection_parameters: A set up ConnectionParameters instance.
 
         Returns:
             The set up BaseConnection instance.
         """
-        connection = SelectConnection(connection_parameters, on_open_callback=self.on_connected)
+        if self._ioloop is None:
+            self._ioloop = self._transport.create_ioloop()
+
+        connection = self._transport.select_connection(
+            connection_parameters,
+            on_open_callback=self.on_connected,
+            on_open_error_callback=self.on_connection_error,
+            on_close_callback=self.on_connection_closed,
+            ioloop=self._ioloop,
+        )
 
         return connection
 
     def listen(self):
         """Starts a thread that will spin the `_listen` method in background."""
+        if self._ioloop is None:
+            self._ioloop = self._transport.create_ioloop()
+
         self._thread = Thread(target=self._listen, name=self._thread_name)
         self._thread.start()
+        _LISTENERS.add(self)
+
+    def stop(self, timeout: float = None) -> bool:
+        """Stops the listener, once drained: its consumer is cancelled, the callbacks in flight
+        are waited for, its pending acks are flushed, then its connection is closed, no
+        reconnection is attempted anymore, and its thread ends. Safe to call from any thread.
+
+        Args:
+            timeout: The max number of seconds to wait for the listener to drain, and its thread
+                to end. Callbacks still running after it are abandoned, their messages requeued by
+                the broker in manual ack mode. Waits forever if None.
+
+        Returns:
+            A boolean value indicating if the listener's thread ended on time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._stop_event.set()
+
+        if self._ioloop is not None:
+            self._ioloop.add_callback_threadsafe(partial(self._drain, deadline, self._close))
+
+        if self._thread is None or self._thread is current_thread():
+            return True
+
+        self._thread.join(timeout)
+
+        return not self._thread.is_alive()
+
+    def _drain(self, deadline: Optional[float], on_drained: Callable[[], None]):
+        """Cancels the listener's consumer, so the broker stops delivering messages to it, then
+        calls `on_drained` once its callbacks in flight are done, or `deadline` is reached. Runs
+        on the ioloop thread.
+
+        Args:
+            deadline: The `time.monotonic` time to stop waiting for the callbacks at. None to wait
+                until they're done.
+            on_drained: Called on the ioloop thread once the listener is drained.
+        """
+        channel = getattr(self, "_channel", None)
+
+        if self._consumer_tag is not None and channel is not None and channel.is_open:
+            self.logger.info("Draining listener on %s...", self._queue_name)
+            channel.basic_cancel(self._consumer_tag)
+
+        self._consumer_tag = None
+        self._wait_drained(deadline, on_drained)
+
+    def _wait_drained(self, deadline: Optional[float], on_drained: Callable[[], None]):
+        """Calls `on_drained`, once the callbacks in flight are done, or `deadline` is reached,
+        after flushing the pending acks. Runs on the ioloop thread."""
+        dispatcher = self._dispatcher
+        busy = dispatcher.in_flight + dispatcher.pending if dispatcher is not None else 0
+        connection = self._connection
+
+        if busy and connection is not None and connection.is_open:
+            if deadline is None or time.monotonic() < deadline:
+                connection.ioloop.call_later(
+                    DRAIN_POLL_INTERVAL, partial(self._wait_drained, deadline, on_drained)
+                )
+
+                return
+
+            self.abandoned += busy
+            self.logger.warning(
+                "Listener on %s abandoning %d messages still being handled.",
+                self._queue_name,
+                busy,
+            )
+
+        if self._acker is not None:
+            self._acker.flush()
+
+        on_drained()
+
+    def _close(self):
+        """Closes the listener's connection, or stops its ioloop if there's no connection to
+        close. Runs on the ioloop thread."""
+        connection = self._connection
+
+        if connection is None or connection.is_closing or connection.is_closed:
+            self._ioloop.stop()
+
+            return
+
+        try:
+            connection.close()
+
+        except AMQPError as error:
+            self.logger.error("Error while closing listener on %s: %s.", self._queue_name, error)
+            self._ioloop.stop()
 
     def _listen(self):
         """Starts listening in the NaviListener's queue.
 
-            If any AMQPError is raised, the connection will be closed.
+            If any AMQPError is raised, the connection will be closed. Whenever the connection is
+            lost, a new one is opened after the backoff's delay, unless reconnection is disabled.
         """
         self.logger.info("Starting listener on %s...", self._queue_name)
-        connection = None
 
-        try:
-            connection = self._init_connection(self._connection_parameters)
-            connection.ioloop.start()
+        while not self._stop_event.is_set():
+            connection = None
+            self._set_state(CONNECTING)
 
-        except AMQPError as error:
-            self.logger.error(
-                "Error while listening on %s: %s. Closing connection.",
-                self._queue_name,
-                str(error),
-            )
-            self._close_connection(connection)
+            try:
+                connection = self._init_connection(self._connection_parameters)
+                self._connection = connection
+                connection.ioloop.start()
+
+            except AMQPError as error:
+                self.logger.error(
+                    "Error while listening on %s: %s. Closing connection.",
+                    self._queue_name,
+                    str(error),
+                )
+                self._close_connection(connection)
+
+            self._set_state(DISCONNECTED)
+
+            if not self._reconnect or self._stop_event.is_set():
+                break
+
+            self._next_node()
+            delay = self._backoff.next_delay()
+            self.logger.info("Reconnecting listener on %s in %.2fs...", self._queue_name, delay)
+
+            if self._stop_event.wait(delay):
+                break
+
+        self._set_state(CLOSED)
+
+    def _next_node(self):
+        """Fails over to the next broker node, unless the listener is pinned to a node."""
+        if self._node is not None or len(self._nodes_parameters) < 2:
+            return
+
+        self._node_index = (self._node_index + 1) % len(self._nodes_parameters)
+        self._connection_parameters = self._nodes_parameters[self._node_index]
+        self.logger.info(
+            "Listener on %s failing over to broker node %s:%s.",
+            self._queue_name,
+            self._connection_parameters.host,
+            self._connection_parameters.port,
+        )
 
     def _close_connection(self, connection: SelectConnection):
         """Closes a given `SelectConnection` instance.
@@ -115,25 +443,132 @@ class NaviListener(NaviBase):
             )
 
     def on_connected(self, connection: SelectConnection):
-        """Called when the connection to the message broker is completed
+        """Called when the connection to the message broker is completed.
+
+        If the listener has an executor, its NaviDispatcher is created, marshalling completions
+        back to the connection's ioloop thread. The reconnection backoff is reset.
 
         Args:
             connection: The SelectConnection instance, representing the achieved connection with the
             broker.
         """
+        self._connection = connection
+        self._backoff.reset()
+        self._set_state(CONNECTED)
+        connection.add_on_connection_blocked_callback(self.on_connection_blocked)
+        connection.add_on_connection_unblocked_callback(self.on_connection_unblocked)
+
+        if self._executor is not None and self._dispatcher is None:
+            self._dispatcher = NaviDispatcher(
+                self._executor, connection.ioloop.add_callback_threadsafe, self._max_in_flight
+            )
+
         connection.channel(on_open_callback=self.on_channel_open)
 
+    def on_connection_error(self, connection: SelectConnection, error: Exception):
+        """Called when the connection to the message broker can't be opened. Stops the ioloop, so
+        `_listen` can retry.
+
+        Args:
+            connection: The SelectConnection instance that failed to connect.
+            error: The connection error.
+        """
+        self.logger.error("Error while connecting listener on %s: %s.", self._queue_name, error)
+        connection.ioloop.stop()
+
+    def on_connection_closed(self, connection: SelectConnection, reason: Exception):
+        """Called when the connection to the message broker is closed. Stops the ioloop, so
+        `_listen` can reconnect.
+
+        Args:
+            connection: The closed SelectConnection instance.
+            reason: The reason the connection was closed.
+        """
+        if not self._stop_event.is_set():
+            self.logger.warning("Listener on %s lost its connection: %s.", self._queue_name, reason)
+
+        self._connection = None
+        self._set_state(DISCONNECTED)
+        connection.ioloop.stop()
+
+    def on_connection_blocked(
+            self, connection: SelectConnection, method: Method
+    ):  # pylint:disable=unused-argument
+        """Called when the broker blocks the connection, usually because of a resource alarm."""
+        self.logger.warning("Listener on %s: connection blocked by the broker.", self._queue_name)
+        self._set_state(BLOCKED)
+
+    def on_connection_unblocked(
+            self, connection: SelectConnection, method: Method
+    ):  # pylint:disable=unused-argument
+        """Called when the broker unblocks the connection."""
+        self.logger.info("Listener on %s: connection unblocked by the broker.", self._queue_name)
+        self._set_state(CONNECTED)
+
+    def on_channel_closed(self, channel: Channel, reason: Exception):
+        """Called when the listener's channel is closed. Its unacked deliveries are forgotten, as
+        their tags are no longer valid. If its connection is still open, a new channel is opened
+        on it after the backoff's delay, re-declaring the listener's topology.
+
+        Args:
+            channel: The closed Channel instance.
+            reason: The reason the channel was closed.
+        """
+        if channel is not self._channel:
+            return
+
+        if self._acker is not None:
+            self._acker.reset()
+
+        if self._stop_event.is_set():
+            return
+
+        connection = self._connection
+
+        if connection is None or not connection.is_open:
+            return
+
+        delay = self._backoff.next_delay()
+        self.logger.warning(
+            "Listener on %s lost its channel: %s. Reopening in %.2fs.",
+            self._queue_name,
+            reason,
+            delay,
+        )
+        connection.ioloop.call_later(delay, partial(self._reopen_channel, connection))
+
+    def _reopen_channel(self, connection: SelectConnection):
+        """Opens a new channel for the listener, if `connection` is still open."""
+        if connection.is_open and not self._stop_event.is_set():
+            connection.channel(on_open_callback=self.on_channel_open)
+
     def on_channel_open(self, new_channel: Channel):
         """Called when a channel has opened.
 
         Through that channel, an exchange and a queue are declared. The exchange name and type will
         be set with config.NAVI_EXCHANGE and config.NAVI_EXCHANGE_TYPE, respectively. The queue name
-        will be set with NaviListener._queue_name
+        will be set with NaviListener._queue_name. The channel's QoS is set if a prefetch limit is
+        given, and, in manual ack mode, a NaviAcker is created for it.
 
         Args:
             new_channel: A pika's Channel instance, representing the opened communication channel.
         """
         self._channel = new_channel
+        self._channel.add_on_close_callback(self.on_channel_closed)
+
+        if self._prefetch_count is not None or self._prefetch_size:
+            self._channel.basic_qos(
+                prefetch_size=self._prefetch_size, prefetch_count=self._prefetch_count or 0
+            )
+
+        if self._manual_ack:
+            self._acker = NaviAcker(
+                new_channel,
+                batch_size=self._ack_batch_size,
+                interval=self._ack_interval,
+                call_later=self._connection.ioloop.call_later if self._connection else None,
+            )
+
         self._channel.exchange_declare(
             exchange=config.NAVI_EXCHANGE, exchange_type=config.NAVI_EXCHANGE_TYPE, durable=True
         )
@@ -144,6 +579,10 @@ class NaviListener(NaviBase):
             auto_delete=False,  # Delete after consumer cancels or disconnects
             callback=self.on_queue_declared,
         )
+        self._bind_queue()
+
+    def _bind_queue(self):
+        """Binds the listener's queue to the exchange, with the listener's routing key."""
         self._channel.queue_bind(
             exchange=config.NAVI_EXCHANGE, queue=self._queue_name, routing_key=self._routing_key
         )
@@ -158,49 +597,362 @@ class NaviListener(NaviBase):
         Args:
             method: The broker's response to a queue declaration request.
         """
-        self._channel.basic_consume(self._queue_name, self.handle_delivery, auto_ack=True)
+        self._backoff.reset()
+
+        if self._stop_event.is_set():
+            return
+
+        self._consumer_tag = self._channel.basic_consume(
+            self._queue_name, self.handle_delivery, auto_ack=self._acker is None
+        )
 
     def handle_delivery(
             self, channel: Channel, method: Method, properties: BasicProperties, body: bytes
     ):  # pylint:disable=unused-argument
         """Called whenever a message is dequeued from the declared queue.
 
-        It loads/deserializes the message's body. If this executes without errors, the user's
-        callback is executed. Any raised Exception during these actions is catched in order to
-        ensure the listener is kept alive.
+        It loads/deserializes the message's body, with the codec matching its content type. If this
+        executes without errors, the user's callback is executed. In lazy delivery mode, the
+        callback is executed right away with a NaviDelivery instead. Any raised Exception during
+        these actions is catched in order to ensure the listener is kept alive. In manual ack mode,
+        the message is acked once the callback succeeds, and nacked if it fails. Messages already
+        handled, according to the listener's deduplication cache, are acked and skipped. In
+        streaming mode, chunks are acked once spooled, and the callback executed with the stream's
+        file once its last chunk is.
         """
-        try:
-            message = json.loads(body)
+        headers = properties.headers or {}
+        message_id = headers.get("message_id")
+
+        if self._stop_event.is_set() and self._acker is not None:
+            # Prefetched before the consumer was cancelled: handed back to the broker right away.
+            self._acker.track(method.delivery_tag)
+            self._acker.nack(method.delivery_tag, requeue=True)
+            self.requeued += 1
+
+            return
+
+        if self._acker is not None:
+            self._acker.track(method.delivery_tag)
+
+        callback = self._callback_for(method)
 
-        except (TypeError, ValueError) as error:
-            message_id = properties.headers.get("message_id")
-            self.logger.error("Message %s with invalid body: %s", message_id, str(error))
+        if callback is None:
+            self.logger.debug("No callback for message %s. Skipping it.", message_id)
+            self._settle(self._acker, method.delivery_tag, True)
+
+            return
+
+        delivered_at = self._metrics.on_delivery(headers) if self._metrics is not None else 0.0
+
+        if self._dedup is not None and message_id is not None:
+            duplicate = self._dedup.seen(message_id)
+
+            if self._metrics is not None:
+                self._metrics.on_dedup(duplicate)
+
+            if duplicate:
+                self.logger.debug("Skipping already handled message %s.", message_id)
+                self._settle(self._acker, method.delivery_tag, True)
+
+                return
+
+        if self._assembler is not None:
+            stream = self._assemble(method, properties, body, message_id)
+
+            if stream is None:
+                return
+
+            arguments = ({**self._listener_info, **headers}, stream)
+            callback = partial(_consume_stream, callback)
+
+        elif self._lazy_delivery:
+            arguments = (NaviDelivery(method, properties, body, self._codec, self._listener_info),)
 
         else:
-            headers = {
-                **{
-                    "listener_name": self._thread_name,
-                    "queue_name": self._queue_name
-                },
-                **properties.headers,
-            }
+            try:
+                message = decode_body(properties, body, self._codec)
+
+            except (TypeError, ValueError) as error:
+                self.logger.error("Message %s with invalid body: %s", message_id, str(error))
+                self._settle(self._acker, method.delivery_tag, False)
+
+                if self._metrics is not None:
+                    self._metrics.on_decode_error()
+
+                return
+
+            arguments = ({**self._listener_info, **headers}, message)
+
+        self._execute(arguments, message_id, method.delivery_tag, delivered_at, callback)
+
+    def _assemble(
+            self, method: Method, properties: BasicProperties, body: bytes, message_id: str
+    ) -> Optional[IO[bytes]]:
+        """Adds a delivered chunk to its stream, acking it, or wraps a message that isn't chunked
+        as a file.
+
+        Returns:
+            The file to call the callback with, or None if the delivery was a chunk of an
+            incomplete stream, or invalid.
+        """
+        headers = properties.headers or {}
+
+        try:
+            body = decompress(body, properties.content_encoding)
+
+            if not is_chunk(headers):
+                return as_stream(body)
+
+            stream = self._assembler.add(headers, body)
+
+        except (NaviStreamException, ValueError) as error:
+            self.logger.error("Message %s with invalid chunk: %s", message_id, str(error))
+            self._settle(self._acker, method.delivery_tag, False)
+
+            if self._metrics is not None:
+                self._metrics.on_decode_error()
+
+            return None
+
+        if stream is None:
+            self._settle(self._acker, method.delivery_tag, True, message_id=message_id)
+
+            if self._metrics is not None:
+                # Spooled without calling the callback, so it's no longer in flight.
+                self._metrics.in_flight.dec()
+
+        return stream
+
+    def _callback_for(self, method: Method) -> Optional[Callable]:  # pylint:disable = W0613
+        """Returns the callable to handle a delivery with: the user's callback.
+
+        Args:
+            method: The delivery's method frame.
+
+        Returns:
+            The callable, or None to ack and skip the delivery.
+        """
+        return self._callback
+
+    def _execute(
+            self,
+            arguments: Tuple,
+            message_id: str,
+            delivery_tag: int,
+            delivered_at: float = 0.0,
+            callback: Callable = None,
+    ):  # pylint:disable = R0913
+        """Runs the user's callback with `arguments`, right away, or through the dispatcher if the
+        listener has an executor.
+
+        Args:
+            arguments: The arguments to call the callback with.
+            message_id: The id of the message being handled, for logging purposes.
+            delivery_tag: The delivery tag of the message being handled.
+            delivered_at: The time the message was delivered at, as returned by the listener's
+                metrics. Optional.
+            callback: The callable to run instead of the user's callback. Optional.
+        """
+        callback = self._callback if callback is None else callback
 
+        if self._dispatcher is None:
             try:
-                self._callback(headers, message)
+                callback(*arguments)
 
             except Exception as error:  # pylint:disable = W0703
-                message_id = properties.headers.get("message_id")
                 self.logger.error("Error while handling message %s: %s", message_id, str(error))
+                self._settle(self._acker, delivery_tag, False, delivered_at)
+
+                return
+
+            self._settle(self._acker, delivery_tag, True, delivered_at, message_id)
+
+            return
+
+        key = None
+
+        if self._get_ordering_key is not None:
+            try:
+                key = self._get_ordering_key(*arguments)
+
+            except Exception as error:  # pylint:disable = W0703
+                self.logger.error(
+                    "Error while getting ordering key of message %s: %s", message_id, str(error)
+                )
+
+        self._dispatcher.submit(
+            key,
+            callback,
+            arguments,
+            partial(self._on_callback_done, message_id, self._acker, delivery_tag, delivered_at),
+        )
+
+    def _on_callback_done(
+            self,
+            message_id: str,
+            acker: Optional[NaviAcker],
+            delivery_tag: int,
+            delivered_at: float,
+            future: Future,
+    ):  # pylint:disable = R0913
+        """Called on the ioloop thread when a callback run by the dispatcher is done.
+
+        Args:
+            message_id: The id of the handled message.
+            acker: The NaviAcker of the channel the message was delivered on, if any.
+            delivery_tag: The delivery tag of the handled message.
+            delivered_at: The time the message was delivered at, as returned by the listener's
+                metrics.
+            future: The callback call's Future.
+        """
+        error = future.exception()
+
+        if error is not None:
+            self.logger.error("Error while handling message %s: %s", message_id, str(error))
+
+        self._settle(acker, delivery_tag, error is None, delivered_at, message_id)
+
+    def _settle(
+            self,
+            acker: Optional[NaviAcker],
+            delivery_tag: int,
+            succeeded: bool,
+            delivered_at: float = None,
+            message_id: str = None,
+    ):  # pylint:disable = R0913
+        """Acks or nacks a handled message in manual ack mode, and records its callback's outcome
+        and duration in the listener's metrics, if its callback was called. Successfully handled
+        messages are added to the listener's deduplication cache.
+
+        Args:
+            acker: The NaviAcker of the channel the message was delivered on, if any.
+            delivery_tag: The delivery tag of the handled message.
+            succeeded: Whether the message was successfully handled.
+            delivered_at: The time the message was delivered at, as returned by the listener's
+                metrics. None if its callback wasn't called.
+            message_id: The id of the handled message, to add to the deduplication cache.
+                Optional.
+        """
+        if self._metrics is not None and delivered_at is not None:
+            self._metrics.on_done(delivered_at, succeeded)
+
+        if delivered_at is not None and self._stop_event.is_set():
+            self.drained += 1
+
+        if succeeded and message_id is not None and self._dedup is not None:
+            self._dedup.add(message_id)
+
+        if acker is None:
+            return
+
+        if succeeded:
+            acker.ack(delivery_tag)
+
+        else:
+            acker.nack(delivery_tag, requeue=self._requeue_failed)
+
+
+def _consume_stream(callback: Callable, info: Mapping[str, Any], stream: IO[bytes]):
+    """Calls a streaming listener's callback, closing its stream once it returns."""
+    try:
+        callback(info, stream)
+
+    finally:
+        stream.close()
+
+
+_LISTENERS: "WeakSet[NaviListener]" = WeakSet()
+
+DRAIN_POLL_INTERVAL = 0.05
+
+
+def running_listeners() -> List[NaviListener]:
+    """Returns the listeners of the process started with `listen` whose thread is still alive."""
+    return [
+        listener for listener in list(_LISTENERS)
+        if listener._thread is not None and listener._thread.is_alive()  # pylint:disable = W0212
+    ]
 
 
 def listen(
-        queue_name: str = None, routing_key: str = None, callback: Callable = None,
-):
+        queue_name: str = None,
+        routing_key: str = None,
+        callback: Callable = None,
+        codec: Union[str, NaviCodec] = None,
+        lazy_delivery: bool = False,
+        executor: Executor = None,
+        max_in_flight: int = 100,
+        ordering_key: Union[str, Callable[..., Hashable]] = None,
+        prefetch_count: int = None,
+        prefetch_size: int = 0,
+        manual_ack: bool = False,
+        ack_batch_size: int = 100,
+        ack_interval: float = 0.5,
+        requeue_failed: bool = False,
+        reconnect: bool = None,
+        group: "NaviListenerGroup" = None,
+        dedup: Union[bool, NaviDedupCache] = None,
+        node: int = None,
+        streaming: bool = False,
+) -> NaviListener:  # pylint:disable = R0913, R0914
     """Instantiates a threaded listener that keeps waiting for events on a queue.
 
     The queue will be named `queue_name`, bound to the exchange defined by `NAVI_EXCHANGE` env
     variable through routing key`routing_key`, and will execute `callback` whenever a message is
-    dequeued.
+    dequeued. Messages without a known content type are deserialized with `codec`, which defaults
+    to the `NAVI_CODEC` config. If `lazy_delivery` is set, `callback` is called with a single
+    NaviDelivery argument. If `executor` is given, `callback` runs on it, with up to
+    `max_in_flight` calls at once, and messages with the same `ordering_key` handled in order.
+    `prefetch_count` and `prefetch_size` bound the unacked messages delivered at once, and if
+    `manual_ack` is set, messages are acked, in batches, only once `callback` succeeds. Unless
+    `reconnect` is False, the listener reconnects whenever its connection is lost. If `group`
+    is given, the listener is added to that NaviListenerGroup, sharing its connections and ioloop
+    thread, instead of getting its own. If `dedup` is given, messages whose `message_id` was
+    already handled are acked and skipped. If `node` is given, the listener only listens on that
+    broker node, instead of failing over to the next one whenever its connection is lost. If
+    `streaming` is set, `callback` is called with the headers and a binary file, chunked streams
+    being reassembled first.
+
+    Returns:
+        The created NaviListener.
     """
-    listener = NaviListener(queue_name=queue_name, routing_key=routing_key, callback=callback,)
+    listener = NaviListener(
+        queue_name=queue_name,
+        routing_key=routing_key,
+        callback=callback,
+        codec=codec,
+        lazy_delivery=lazy_delivery,
+        executor=executor,
+        max_in_flight=max_in_flight,
+        ordering_key=ordering_key,
+        prefetch_count=prefetch_count,
+        prefetch_size=prefetch_size,
+        manual_ack=manual_ack,
+        ack_batch_size=ack_batch_size,
+        ack_interval=ack_interval,
+        requeue_failed=requeue_failed,
+        reconnect=reconnect,
+        dedup=dedup,
+        node=node,
+        streaming=streaming,
+    )
+
+    if group is not None:
+        return group.add(listener)
+
     listener.listen()
+
+    return listener
+
+
+def listen_on_nodes(**kwargs) -> List[NaviListener]:
+    """Instantiates a threaded listener on each broker node set by `init_config`, for queues
+    sharded across the nodes, so messages published to any node are consumed.
+
+    Args:
+        **kwargs: The `listen` arguments, but `node`.
+
+    Returns:
+        The created NaviListeners, in the nodes' order.
+    """
+    return [listen(node=node, **kwargs) for node in range(len(configured_nodes()))]
@@ -0,0 +1,1040 @@
+"""Navi's in-memory broker module.
+
+NaviMemoryBroker is an in-process broker implementing the subset of AMQP 0-9-1 Navi relies on:
+direct, fanout and topic exchanges, the default exchange, queues, exclusive and auto-delete ones
+included, bindings, consumers with a prefetch count, acks, nacks and requeues, publisher confirms,
+and direct reply-to. The memory transport (`init_config(transport="memory")`) opens connections to
+the process-wide broker, so listeners and publishers talk to each other within a process, without
+RabbitMQ, for tests and throughput tests.
+
+The connection, channel and ioloop classes of this module implement the subset of pika's
+SelectConnection, BlockingConnection, Channel and IOLoop APIs Navi uses. Deliveries and channel
+callbacks run on the consuming connection's MemoryIOLoop, as they run on pika's ioloop.
+
+Messages are only kept in memory, and delivered by reference: bodies are not copied, and every
+queue a message is routed to shares its properties.
+"""
+# pylint:disable = too-many-lines
+
+import copy
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from collections import deque
+from functools import lru_cache, partial
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from pika import BasicProperties
+from pika.exceptions import (
+    AMQPError,
+    ChannelClosedByBroker,
+    ChannelClosedByClient,
+    ChannelWrongStateError,
+    ConnectionClosedByBroker,
+    ConnectionClosedByClient,
+    ConnectionWrongStateError,
+)
+from pika.frame import Method
+from pika.spec import Basic, Queue
+
+from navi.confirms import PublishResult
+from navi.exceptions import NaviTransportException
+
+DIRECT = "direct"
+FANOUT = "fanout"
+TOPIC = "topic"
+EXCHANGE_TYPES = (DIRECT, FANOUT, TOPIC)
+
+DIRECT_REPLY_TO = "amq.rabbitmq.reply-to"
+
+_OPENING, _OPEN, _CLOSING, _CLOSED = range(4)
+
+
+@lru_cache(maxsize=4096)
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """Checks if a routing key matches a topic binding pattern, where `*` matches exactly one
+    word, and `#` zero or more words.
+
+    Args:
+        pattern: The binding's pattern, with dot separated words.
+        routing_key: The message's routing key, with dot separated words.
+
+    Returns:
+        A boolean value indicating if the routing key matches the pattern.
+    """
+    return _match_words(tuple(pattern.split(".")), tuple(routing_key.split(".")))
+
+
+def _match_words(pattern: Tuple[str, ...], words: Tuple[str, ...]) -> bool:
+    if not pattern:
+        return not words
+
+    head, rest = pattern[0], pattern[1:]
+
+    if head == "#":
+        return any(_match_words(rest, words[index:]) for index in range(len(words) + 1))
+
+    return bool(words) and head in ("*", words[0]) and _match_words(rest, words[1:])
+
+
+class MemoryMessage:
+    """A message waiting in a queue, or delivered and not acked yet."""
+
+    __slots__ = ("exchange", "routing_key", "body", "properties", "redelivered")
+
+    def __init__(self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.redelivered = False
+
+
+class MemoryExchange:
+    """An exchange, routing messages to the queues bound to it."""
+
+    def __init__(self, name: str, exchange_type: str):
+        self.name = name
+        self.type = exchange_type
+        self.bindings: Dict[str, Set[str]] = {}
+        self._routes: Dict[str, List[str]] = {}
+
+    def bind(self, queue: str, routing_key: str):
+        """Binds a queue to the exchange with a routing key."""
+        self.bindings.setdefault(queue, set()).add(routing_key)
+        self._routes.clear()
+
+    def unbind_queue(self, queue: str):
+        """Removes every binding of a queue to the exchange."""
+        if self.bindings.pop(queue, None) is not None:
+            self._routes.clear()
+
+    def route(self, routing_key: str) -> List[str]:
+        """Returns the names of the queues a message with `routing_key` is routed to. Routes are
+        cached until the bindings change."""
+        queues = self._routes.get(routing_key)
+
+        if queues is None:
+            queues = [
+                queue for queue, keys in self.bindings.items() if self._matches(keys, routing_key)
+            ]
+
+            if len(self._routes) >= 10000:
+                self._routes.clear()
+
+            self._routes[routing_key] = queues
+
+        return queues
+
+    def _matches(self, keys: Set[str], routing_key: str) -> bool:
+        if self.type == FANOUT:
+            return True
+
+        if self.type == DIRECT:
+            return routing_key in keys
+
+        return any(topic_matches(key, routing_key) for key in keys)
+
+
+class MemoryConsumer:
+    """A consumer of a queue, through a channel."""
+
+    __slots__ = ("tag", "channel", "queue", "callback", "auto_ack", "unacked", "active")
+
+    def __init__(
+            self,
+            tag: str,
+            channel: "MemoryChannel",
+            queue: "MemoryQueue",
+            callback: Callable,
+            auto_ack: bool,
+    ):
+        self.tag = tag
+        self.channel = channel
+        self.queue = queue
+        self.callback = callback
+        self.auto_ack = auto_ack
+        self.unacked = 0
+        self.active = True
+
+    @property
+    def ready(self) -> bool:
+        """Whether the consumer can get one more message, within its channel's prefetch count."""
+        prefetch_count = self.channel.prefetch_count
+
+        return self.auto_ack or not prefetch_count or self.unacked < prefetch_count
+
+
+class MemoryQueue:
+    """A queue, holding the messages routed to it until they're delivered to its consumers."""
+
+    def __init__(self, name: str, owner: "MemoryConnection" = None, auto_delete: bool = False):
+        self.name = name
+        self.owner = owner
+        self.auto_delete = auto_delete
+        self.messages: Deque[MemoryMessage] = deque()
+        self.consumers: List[MemoryConsumer] = []
+        self._next_consumer = 0
+
+    def next_ready_consumer(self) -> Optional[MemoryConsumer]:
+        """Returns the next consumer able to get a message, round robin, if there's any."""
+        count = len(self.consumers)
+
+        for offset in range(count):
+            consumer = self.consumers[(self._next_consumer + offset) % count]
+
+            if consumer.ready:
+                self._next_consumer = (self._next_consumer + offset + 1) % count
+
+                return consumer
+
+        return None
+
+
+class NaviMemoryBroker:
+    """An in-process AMQP broker. Thread-safe.
+
+    Every operation runs right away, under the broker's lock, and deliveries are scheduled on the
+    consuming connections' ioloops.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._exchanges: Dict[str, MemoryExchange] = {}
+        self._queues: Dict[str, MemoryQueue] = {}
+        self._connections: "weakref.WeakSet[MemoryConnection]" = weakref.WeakSet()
+        self._consumer_tags = itertools.count(1)
+        self.reset()
+
+    def reset(self):
+        """Drops every queue, message and exchange, except the predeclared exchanges, and closes
+        every connection."""
+        self.close_connections(ConnectionClosedByClient(200, "Broker reset"))
+
+        with self._lock:
+            self._queues.clear()
+            self._exchanges = {
+                "": MemoryExchange("", DIRECT),
+                "amq.direct": MemoryExchange("amq.direct", DIRECT),
+                "amq.fanout": MemoryExchange("amq.fanout", FANOUT),
+                "amq.topic": MemoryExchange("amq.topic", TOPIC),
+            }
+
+    def queue_size(self, queue: str) -> int:
+        """Returns the number of messages waiting in a queue, not counting the unacked ones."""
+        with self._lock:
+            return len(self._get_queue(queue).messages)
+
+    def queue_names(self) -> List[str]:
+        """Returns the names of the declared queues."""
+        with self._lock:
+            return list(self._queues)
+
+    def close_connections(self, reason: AMQPError = None):
+        """Closes every connection to the broker, like a broker restart does, so reconnections can
+        be tested.
+
+        Args:
+            reason: The error the connections are closed with. Defaults to a forced closure.
+        """
+        reason = reason or ConnectionClosedByBroker(
+            320, "CONNECTION_FORCED - broker forced connection closure"
+        )
+
+        for connection in list(self._connections):
+            connection._close(reason)  # pylint:disable = protected-access
+
+    def _add_connection(self, connection: "MemoryConnection"):
+        with self._lock:
+            self._connections.add(connection)
+
+    def _remove_connection(self, connection: "MemoryConnection"):
+        with self._lock:
+            self._connections.discard(connection)
+
+            for queue in [queue for queue in self._queues.values() if queue.owner is connection]:
+                self._delete_queue(queue)
+
+    def declare_exchange(self, exchange: str, exchange_type: str):
+        """Declares an exchange, unless it exists with the same type.
+
+        Raises:
+            ChannelClosedByBroker: When it exists with another type, or the type is unsupported.
+        """
+        with self._lock:
+            existing = self._exchanges.get(exchange)
+
+            if existing is not None:
+                if existing.type != exchange_type:
+                    raise ChannelClosedByBroker(
+                        406,
+                        f"PRECONDITION_FAILED - inequivalent arg 'type' for exchange '{exchange}':"
+                        f" received '{exchange_type}' but current is '{existing.type}'",
+                    )
+
+                return
+
+            if exchange_type not in EXCHANGE_TYPES:
+                raise ChannelClosedByBroker(
+                    503, f"COMMAND_INVALID - unknown exchange type '{exchange_type}'"
+                )
+
+            self._exchanges[exchange] = MemoryExchange(exchange, exchange_type)
+
+    def declare_queue(
+            self,
+            queue: str,
+            owner: "MemoryConnection",
+            exclusive: bool = False,
+            auto_delete: bool = False,
+    ) -> Tuple[str, int, int]:
+        """Declares a queue, unless it exists. Exclusive queues belong to the connection that
+        declared them, and are deleted when it closes. Server named if `queue` is empty.
+
+        Returns:
+            The queue's name, and its number of messages and consumers.
+
+        Raises:
+            ChannelClosedByBroker: When the queue is exclusive to another connection.
+        """
+        with self._lock:
+            queue = queue or f"amq.gen-{uuid4().hex}"
+            existing = self._queues.get(queue)
+
+            if existing is None:
+                existing = self._queues[queue] = MemoryQueue(
+                    queue, owner if exclusive else None, auto_delete
+                )
+
+            self._check_owner(existing, owner)
+
+            return queue, len(existing.messages), len(existing.consumers)
+
+    def bind_queue(self, queue: str, exchange: str, routing_key: str):
+        """Binds a queue to an exchange.
+
+        Raises:
+            ChannelClosedByBroker: When the queue or the exchange doesn't exist.
+        """
+        with self._lock:
+            self._get_queue(queue)
+            self._get_exchange(exchange).bind(queue, routing_key or "")
+
+    def delete_queue(self, queue: str):
+        """Deletes a queue, with its messages and bindings."""
+        with self._lock:
+            self._delete_queue(self._get_queue(queue))
+
+    def publish(
+            self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties = None
+    ) -> int:
+        """Routes a message to the queues bound to `exchange` matching its routing key, or to the
+        queue named `routing_key` through the default exchange. Unroutable messages are dropped.
+
+        Returns:
+            The number of queues the message was routed to.
+
+        Raises:
+            ChannelClosedByBroker: When the exchange doesn't exist.
+        """
+        if isinstance(body, str):
+            body = body.encode()
+
+        properties = properties or BasicProperties()
+
+        with self._lock:
+            if exchange == "":
+                queues = [routing_key] if routing_key in self._queues else []
+
+            else:
+                queues = self._get_exchange(exchange).route(routing_key)
+
+            for name in queues:
+                queue = self._queues[name]
+                queue.messages.append(MemoryMessage(exchange, routing_key, body, properties))
+                self._dispatch(queue)
+
+            return len(queues)
+
+    def _get_queue(self, queue: str) -> MemoryQueue:
+        try:
+            return self._queues[queue]
+
+        except KeyError:
+            raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue}'") from None
+
+    def _get_exchange(self, exchange: str) -> MemoryExchange:
+        try:
+            return self._exchanges[exchange]
+
+        except KeyError:
+            raise ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{exchange}'") from None
+
+    @staticmethod
+    def _check_owner(queue: MemoryQueue, connection: "MemoryConnection"):
+        if queue.owner is not None and queue.owner is not connection:
+            raise ChannelClosedByBroker(
+                405,
+                f"RESOURCE_LOCKED - cannot obtain exclusive access to locked queue '{queue.name}'",
+            )
+
+    def _delete_queue(self, queue: MemoryQueue):
+        self._queues.pop(queue.name, None)
+
+        for exchange in self._exchanges.values():
+            exchange.unbind_queue(queue.name)
+
+        for consumer in queue.consumers:
+            consumer.active = False
+
+    def consume(
+            self, channel: "MemoryChannel", queue: str, callback: Callable, auto_ack: bool
+    ) -> str:
+        """Adds a consumer of a channel to a queue, returning its tag."""
+        with self._lock:
+            if queue == DIRECT_REPLY_TO:
+                queue = self._declare_reply_queue(channel, auto_ack)
+
+            memory_queue = self._get_queue(queue)
+            self._check_owner(memory_queue, channel.connection)
+            consumer = MemoryConsumer(
+                f"ctag.{next(self._consumer_tags)}", channel, memory_queue, callback, auto_ack
+            )
+            memory_queue.consumers.append(consumer)
+            channel.consumers[consumer.tag] = consumer
+            self._dispatch(memory_queue)
+
+            return consumer.tag
+
+    def _declare_reply_queue(self, channel: "MemoryChannel", auto_ack: bool) -> str:
+        """Declares the pseudo-queue replies to the messages `channel` publishes with a direct
+        reply-to are routed to, deleted with its consumer. Must be called while holding the lock.
+
+        Raises:
+            ChannelClosedByBroker: When the consumer isn't in auto ack mode.
+        """
+        if not auto_ack:
+            raise ChannelClosedByBroker(
+                406, "PRECONDITION_FAILED - reply consumer cannot acknowledge"
+            )
+
+        name = f"{DIRECT_REPLY_TO}.{uuid4().hex}"
+        self._queues[name] = MemoryQueue(name, channel.connection, auto_delete=True)
+        channel.reply_queue = name
+
+        return name
+
+    def cancel(self, consumer: MemoryConsumer):
+        """Removes a consumer. Auto-delete queues are deleted with their last consumer."""
+        with self._lock:
+            self._cancel(consumer)
+
+    def _cancel(self, consumer: MemoryConsumer):
+        consumer.active = False
+        queue = consumer.queue
+
+        if consumer in queue.consumers:
+            queue.consumers.remove(consumer)
+
+        if queue.auto_delete and not queue.consumers:
+            self._delete_queue(queue)
+
+    def _dispatch(self, queue: MemoryQueue):
+        """Delivers a queue's messages to its consumers able to get them. Must be called while
+        holding the lock."""
+        while queue.messages:
+            consumer = queue.next_ready_consumer()
+
+            if consumer is None:
+                return
+
+            consumer.channel._deliver(  # pylint:disable = protected-access
+                consumer, queue.messages.popleft()
+            )
+
+    def settle(self, channel: "MemoryChannel", delivery_tag: int, multiple: bool, requeue: bool):
+        """Acks, or nacks, one or many messages delivered through `channel`. Nacked messages are
+        requeued at the head of their queue, in order, or dropped.
+
+        Raises:
+            ChannelClosedByBroker: When the delivery tag is unknown.
+        """
+        with self._lock:
+            unacked = channel.unacked
+
+            if multiple:
+                tags = [tag for tag in unacked if tag <= delivery_tag or not delivery_tag]
+
+            elif delivery_tag in unacked:
+                tags = [delivery_tag]
+
+            else:
+                raise ChannelClosedByBroker(
+                    406, f"PRECONDITION_FAILED - unknown delivery tag {delivery_tag}"
+                )
+
+            self._release(channel, tags, requeue)
+
+    def _release(self, channel: "MemoryChannel", tags: List[int], requeue: bool):
+        """Forgets delivered messages, requeueing them if `requeue` is set, and delivers the next
+        ones. Must be called while holding the lock."""
+        queues = {}
+
+        for tag in sorted(tags, reverse=True):
+            consumer, message = channel.unacked.pop(tag)
+            consumer.unacked -= 1
+            queues[consumer.queue.name] = consumer.queue
+
+            if requeue and consumer.queue.name in self._queues:
+                message.redelivered = True
+                consumer.queue.messages.appendleft(message)
+
+        for queue in queues.values():
+            if queue.name in self._queues:
+                self._dispatch(queue)
+
+    def _close_channel(self, channel: "MemoryChannel"):
+        """Cancels a closed channel's consumers, and requeues its unacked messages."""
+        with self._lock:
+            consumers = list(channel.consumers.values())
+            channel.consumers.clear()
+
+            for consumer in consumers:
+                self._cancel(consumer)
+
+            self._release(channel, list(channel.unacked), requeue=True)
+
+
+class _MemoryTimer:
+    __slots__ = ("deadline", "callback", "cancelled")
+
+    def __init__(self, deadline: float, callback: Callable[[], None]):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def __lt__(self, other: "_MemoryTimer") -> bool:
+        return self.deadline < other.deadline
+
+
+class MemoryIOLoop:
+    """An ioloop running callbacks and timers on the thread that calls `start`, like pika's IOLoop.
+
+    `add_callback_threadsafe` and `stop` are safe to call from any thread.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._callbacks: Deque[Callable[[], None]] = deque()
+        self._timers: List[_MemoryTimer] = []
+        self._stopping = False
+
+    def add_callback_threadsafe(self, callback: Callable[[], None]):
+        """Schedules `callback` to run on the ioloop's thread."""
+        with self._condition:
+            self._callbacks.append(callback)
+            self._condition.notify()
+
+    add_callback = add_callback_threadsafe
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> _MemoryTimer:
+        """Schedules `callback` to run on the ioloop's thread after `delay` seconds.
+
+        Returns:
+            The timer's handle, to be passed to `remove_timeout` to cancel it.
+        """
+        timer = _MemoryTimer(time.monotonic() + delay, callback)
+
+        with self._condition:
+            heapq.heappush(self._timers, timer)
+            self._condition.notify()
+
+        return timer
+
+    def remove_timeout(self, timer: _MemoryTimer):
+        """Cancels a timer scheduled by `call_later`."""
+        timer.cancelled = True
+
+    def start(self):
+        """Runs the scheduled callbacks and timers until `stop` is called."""
+        try:
+            while True:
+                with self._condition:
+                    ready = self._next_batch()
+
+                    if self._stopping:
+                        return
+
+                    if not ready:
+                        self._condition.wait(self._next_timeout())
+                        continue
+
+                for callback in ready:
+                    callback()
+
+        finally:
+            with self._condition:
+                self._stopping = False
+
+    def stop(self):
+        """Stops the ioloop once the callback running, if any, returns. If the ioloop isn't
+        running, the next `start` returns right away."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+    def close(self):
+        """Drops every scheduled callback and timer."""
+        with self._condition:
+            self._callbacks.clear()
+            self._timers.clear()
+
+    def _next_batch(self) -> List[Callable[[], None]]:
+        """Pops the callbacks to run, and the due timers' ones. Must be called while holding the
+        condition's lock."""
+        ready = list(self._callbacks)
+        self._callbacks.clear()
+        now = time.monotonic()
+
+        while self._timers and (self._timers[0].cancelled or self._timers[0].deadline <= now):
+            timer = heapq.heappop(self._timers)
+
+            if not timer.cancelled:
+                ready.append(timer.callback)
+
+        return ready
+
+    def _next_timeout(self) -> Optional[float]:
+        if not self._timers:
+            return None
+
+        return max(self._timers[0].deadline - time.monotonic(), 0)
+
+
+class MemoryChannel:
+    """A channel of a MemoryConnection or MemoryBlockingConnection, implementing the subset of
+    pika's Channel and BlockingChannel APIs Navi uses.
+
+    On a MemoryConnection, operations take a `callback`, called on the connection's ioloop once
+    they're done, and errors close the channel, calling its close callbacks with the error, as
+    they do with pika. On a MemoryBlockingConnection, errors are raised instead.
+    """
+
+    def __init__(self, connection: "MemoryConnection", channel_number: int):
+        self.connection = connection
+        self.channel_number = channel_number
+        self.prefetch_count = 0
+        self.consumers: Dict[str, MemoryConsumer] = {}
+        self.unacked: Dict[int, Tuple[MemoryConsumer, MemoryMessage]] = {}
+        self.reply_queue: Optional[str] = None
+        self._broker = connection.broker
+        self._delivery_tags = itertools.count(1)
+        self._close_callbacks: List[Callable] = []
+        self._state = _OPEN
+
+    def __repr__(self) -> str:
+        return f"<MemoryChannel number={self.channel_number}>"
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the channel is open."""
+        return self._state == _OPEN
+
+    @property
+    def is_closing(self) -> bool:
+        """Whether the channel is closing."""
+        return self._state == _CLOSING
+
+    @property
+    def is_closed(self) -> bool:
+        """Whether the channel is closed."""
+        return self._state == _CLOSED
+
+    def add_on_close_callback(self, callback: Callable):
+        """Adds a callable to be called with the channel and the reason once it's closed."""
+        self._close_callbacks.append(callback)
+
+    def close(self, reply_code: int = 0, reply_text: str = "Normal shutdown"):
+        """Closes the channel, requeueing its unacked messages."""
+        if self._state != _OPEN:
+            return
+
+        self._shutdown(ChannelClosedByClient(reply_code, reply_text))
+
+    def exchange_declare(  # pylint:disable = unused-argument
+            self,
+            exchange: str,
+            exchange_type: str = DIRECT,
+            durable: bool = False,
+            callback: Callable = None,
+            **kwargs,
+    ):
+        """Declares an exchange. Exchanges are never durable, as the broker lives in memory."""
+        self._run(partial(self._broker.declare_exchange, exchange, exchange_type), callback)
+
+    def queue_declare(  # pylint:disable = unused-argument
+            self,
+            queue: str,
+            durable: bool = False,
+            exclusive: bool = False,
+            auto_delete: bool = False,
+            callback: Callable = None,
+            **kwargs,
+    ) -> Optional[Method]:
+        """Declares a queue, returning its Queue.DeclareOk method if no callback is given."""
+        def declare() -> Method:
+            name, message_count, consumer_count = self._broker.declare_queue(
+                queue, self.connection, exclusive, auto_delete
+            )
+
+            return Method(self.channel_number, Queue.DeclareOk(name, message_count, consumer_count))
+
+        return self._run(declare, callback, with_result=True)
+
+    def queue_bind(  # pylint:disable = unused-argument
+            self,
+            queue: str,
+            exchange: str,
+            routing_key: str = None,
+            callback: Callable = None,
+            **kwargs,
+    ):
+        """Binds a queue to an exchange with a routing key."""
+        self._run(partial(self._broker.bind_queue, queue, exchange, routing_key), callback)
+
+    def queue_delete(self, queue: str, callback: Callable = None, **kwargs):  # pylint:disable=W0613
+        """Deletes a queue, dropping its messages and cancelling its consumers."""
+        self._run(partial(self._broker.delete_queue, queue), callback)
+
+    def basic_qos(
+            self,
+            prefetch_size: int = 0,
+            prefetch_count: int = 0,
+            global_qos: bool = False,
+            callback: Callable = None,
+    ):  # pylint:disable = unused-argument
+        """Sets the prefetch count of the consumers of the channel. The prefetch size is ignored,
+        as it is by RabbitMQ."""
+        def qos():
+            self.prefetch_count = prefetch_count
+
+        self._run(qos, callback)
+
+    def basic_consume(  # pylint:disable = unused-argument
+            self,
+            queue: str,
+            on_message_callback: Callable,
+            auto_ack: bool = False,
+            callback: Callable = None,
+            **kwargs,
+    ) -> Optional[str]:
+        """Starts consuming from a queue, calling `on_message_callback` with the channel, a
+        Basic.Deliver method, the message's properties and body, on the connection's ioloop.
+
+        Returns:
+            The consumer's tag.
+
+        Raises:
+            NaviTransportException: raised if the channel's connection has no ioloop.
+        """
+        if self.connection.ioloop is None:
+            raise NaviTransportException("Consuming needs a MemoryConnection, with an ioloop.")
+
+        return self._run(
+            partial(self._broker.consume, self, queue, on_message_callback, auto_ack), callback
+        )
+
+    def basic_cancel(self, consumer_tag: str, callback: Callable = None):
+        """Cancels a consumer of the channel."""
+        def cancel():
+            consumer = self.consumers.pop(consumer_tag, None)
+
+            if consumer is not None:
+                self._broker.cancel(consumer)
+
+        self._run(cancel, callback)
+
+    def basic_publish(
+            self,
+            exchange: str,
+            routing_key: str,
+            body: bytes,
+            properties: BasicProperties = None,
+            mandatory: bool = False,
+    ):  # pylint:disable = unused-argument
+        """Publishes a message. A direct reply-to is replaced by the name of the channel's reply
+        pseudo-queue, which replies are routed to through the default exchange."""
+        def publish() -> int:
+            reply_properties = properties
+
+            if properties is not None and properties.reply_to == DIRECT_REPLY_TO:
+                if self.reply_queue is None:
+                    raise ChannelClosedByBroker(
+                        406, "PRECONDITION_FAILED - fast reply consumer does not exist"
+                    )
+
+                reply_properties = copy.copy(properties)
+                reply_properties.reply_to = self.reply_queue
+
+            return self._broker.publish(exchange, routing_key, body, reply_properties)
+
+        self._run(publish)
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        """Acks a message, or every message up to it if `multiple`."""
+        self._run(partial(self._broker.settle, self, delivery_tag, multiple, False))
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True):
+        """Nacks a message, or every message up to it if `multiple`, requeueing them if
+        `requeue`."""
+        self._run(partial(self._broker.settle, self, delivery_tag, multiple, requeue))
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True):
+        """Rejects a message, requeueing it if `requeue`."""
+        self.basic_nack(delivery_tag, requeue=requeue)
+
+    def _run(self, operation: Callable, callback: Callable = None, with_result: bool = False):
+        """Runs a broker operation, and schedules its callback, with its result if `with_result`
+        is set, or a None method frame otherwise.
+
+        Raises:
+            ChannelWrongStateError: When the channel is closed.
+            ChannelClosedByBroker: On a blocking connection, when the operation fails.
+        """
+        if self._state == _CLOSING:
+            return None
+
+        if self._state == _CLOSED:
+            raise ChannelWrongStateError("Channel is closed.")
+
+        try:
+            result = operation()
+
+        except ChannelClosedByBroker as error:
+            self._shutdown(error)
+
+            if self.connection.ioloop is None:
+                raise
+
+            return None
+
+        if callback is not None:
+            self.connection._schedule(  # pylint:disable = protected-access
+                partial(callback, result if with_result else None)
+            )
+
+        return result
+
+    def _shutdown(self, reason: AMQPError):
+        """Closes the channel, releasing its consumers and unacked messages, and calls its close
+        callbacks with `reason` on the connection's ioloop."""
+        self._state = _CLOSING
+        self._broker._close_channel(self)  # pylint:disable = protected-access
+        self.connection._forget_channel(self)  # pylint:disable = protected-access
+        self.connection._schedule(partial(self._on_closed, reason))  # pylint:disable = W0212
+
+    def _on_closed(self, reason: AMQPError):
+        self._state = _CLOSED
+
+        for callback in self._close_callbacks:
+            callback(self, reason)
+
+    def _deliver(self, consumer: MemoryConsumer, message: MemoryMessage):
+        """Assigns a delivery tag to a message, and schedules its delivery to the consumer. Called
+        by the broker, while holding its lock."""
+        delivery_tag = next(self._delivery_tags)
+
+        if not consumer.auto_ack:
+            self.unacked[delivery_tag] = (consumer, message)
+            consumer.unacked += 1
+
+        self.connection._schedule(  # pylint:disable = protected-access
+            partial(self._on_deliver, consumer, delivery_tag, message)
+        )
+
+    def _on_deliver(self, consumer: MemoryConsumer, delivery_tag: int, message: MemoryMessage):
+        """Calls the consumer's callback, on the ioloop's thread, unless the message was requeued
+        since, because the channel closed."""
+        if not (self.is_open and consumer.active):
+            return
+
+        if not consumer.auto_ack and delivery_tag not in self.unacked:
+            return
+
+        method = Basic.Deliver(
+            consumer_tag=consumer.tag,
+            delivery_tag=delivery_tag,
+            redelivered=message.redelivered,
+            exchange=message.exchange,
+            routing_key=message.routing_key,
+        )
+        consumer.callback(self, method, message.properties, message.body)
+
+
+class MemoryConnection:
+    """A connection to a NaviMemoryBroker, implementing the subset of pika's SelectConnection API
+    Navi uses. It's opened on its ioloop, calling `on_open_callback` with itself once it is."""
+
+    def __init__(
+            self,
+            broker: NaviMemoryBroker,
+            ioloop: Optional[MemoryIOLoop],
+            on_open_callback: Callable = None,
+            on_open_error_callback: Callable = None,
+            on_close_callback: Callable = None,
+    ):  # pylint:disable = unused-argument
+        self.broker = broker
+        self.ioloop = ioloop
+        self._on_close_callback = on_close_callback
+        self._channels: Dict[int, MemoryChannel] = {}
+        self._channel_numbers = itertools.count(1)
+        self._state = _OPENING
+        broker._add_connection(self)  # pylint:disable = protected-access
+
+        if ioloop is None:
+            self._state = _OPEN
+
+        else:
+            self._schedule(partial(self._on_open, on_open_callback))
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the connection is open."""
+        return self._state == _OPEN
+
+    @property
+    def is_closing(self) -> bool:
+        """Whether the connection is closing."""
+        return self._state == _CLOSING
+
+    @property
+    def is_closed(self) -> bool:
+        """Whether the connection is closed."""
+        return self._state == _CLOSED
+
+    def add_on_connection_blocked_callback(self, callback: Callable):  # pylint:disable=C0103
+        """Accepted for compatibility. The in-memory broker never blocks connections."""
+
+    def add_on_connection_unblocked_callback(self, callback: Callable):  # pylint:disable=C0103
+        """Accepted for compatibility. The in-memory broker never blocks connections."""
+
+    def channel(self, on_open_callback: Callable = None) -> MemoryChannel:
+        """Opens a channel, calling `on_open_callback` with it on the ioloop.
+
+        Raises:
+            ConnectionWrongStateError: When the connection isn't open.
+        """
+        if self._state != _OPEN:
+            raise ConnectionWrongStateError("Connection is not open.")
+
+        channel = MemoryChannel(self, next(self._channel_numbers))
+        self._channels[channel.channel_number] = channel
+
+        if on_open_callback is not None:
+            self._schedule(partial(on_open_callback, channel))
+
+        return channel
+
+    def close(self, reply_code: int = 200, reply_text: str = "Normal shutdown"):
+        """Closes the connection and its channels, calling `on_close_callback` on the ioloop."""
+        if self._state in (_CLOSING, _CLOSED):
+            return
+
+        self._close(ConnectionClosedByClient(reply_code, reply_text))
+
+    def _close(self, reason: AMQPError):
+        if self._state in (_CLOSING, _CLOSED):
+            return
+
+        self._state = _CLOSING
+
+        for channel in list(self._channels.values()):
+            channel._shutdown(reason)  # pylint:disable = protected-access
+
+        self.broker._remove_connection(self)  # pylint:disable = protected-access
+        self._schedule(partial(self._on_closed, reason))
+
+    def _on_open(self, on_open_callback: Optional[Callable]):
+        if self._state != _OPENING:
+            return
+
+        self._state = _OPEN
+
+        if on_open_callback is not None:
+            on_open_callback(self)
+
+    def _on_closed(self, reason: AMQPError):
+        self._state = _CLOSED
+
+        if self._on_close_callback is not None:
+            self._on_close_callback(self, reason)
+
+    def _forget_channel(self, channel: MemoryChannel):
+        self._channels.pop(channel.channel_number, None)
+
+    def _schedule(self, callback: Callable[[], None]):
+        """Runs `callback` on the ioloop, or right away on a blocking connection."""
+        if self.ioloop is None:
+            callback()
+
+        else:
+            self.ioloop.add_callback_threadsafe(callback)
+
+
+class MemoryBlockingConnection(MemoryConnection):
+    """A connection to a NaviMemoryBroker, implementing the subset of pika's BlockingConnection
+    API Navi uses to publish. Open as soon as it's created."""
+
+    def __init__(self, broker: NaviMemoryBroker):
+        super().__init__(broker, None)
+
+    def process_data_events(self, time_limit: float = 0):  # pylint:disable = unused-argument
+        """Accepted for compatibility. Operations on the in-memory broker never wait."""
+
+
+class MemoryConfirmChannel:
+    """A channel in publisher confirms mode, with the API of NaviConfirmChannel. The in-memory
+    broker confirms every message as soon as it's routed."""
+
+    def __init__(
+            self, channel: MemoryChannel, max_outstanding: int = 1000
+    ):  # pylint:disable = unused-argument
+        self._channel = channel
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the underlying channel is open."""
+        return self._channel.is_open
+
+    @property
+    def outstanding(self) -> int:
+        """The number of unconfirmed messages, which is always 0."""
+        return 0
+
+    def publish(
+            self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties
+    ) -> PublishResult:
+        """Publishes a message, which is confirmed as soon as it's routed."""
+        self._channel.basic_publish(
+            exchange=exchange, routing_key=routing_key, body=body, properties=properties
+        )
+
+        return PublishResult(message_id=(properties.headers or {}).get("message_id"), acked=True)
+
+    def wait(self, timeout: float = None) -> bool:  # pylint:disable = unused-argument
+        """Returns True at once, as no message is ever outstanding."""
+        return True
+
+    def fail(self, error: str):
+        """Does nothing, as no message is ever outstanding."""
+
+
+_BROKER = NaviMemoryBroker()
+
+
+def get_broker() -> NaviMemoryBroker:
+    """Returns the process-wide NaviMemoryBroker the memory transport connects to."""
+    return _BROKER
@@ -0,0 +1,603 @@
+"""Navi's metrics module.
+
+Publishers and listeners record their activity in a process-wide NaviMetricsRegistry, unless
+metrics are disabled by `init_config`. The registry can be read as a dict snapshot, or in the
+Prometheus text exposition format, which `start_metrics_server` serves over HTTP.
+
+Metrics:
+    navi_messages_published_total: Messages published, per exchange. Confirmed ones, when
+        published with confirms.
+    navi_messages_publish_failed_total: Messages that couldn't be published, per exchange.
+    navi_publish_latency_seconds: Time taken by each publish, until the broker confirmed it when
+        published with confirms, per exchange.
+    navi_messages_delivered_total: Messages delivered to listeners, per queue.
+    navi_messages_decode_errors_total: Delivered messages that couldn't be decoded, per queue.
+    navi_callback_errors_total: Listener callbacks that raised an exception, per queue.
+    navi_callback_duration_seconds: Time from a message's delivery until its callback is done,
+        per queue. Includes the wait for an executor's worker, if the listener has an executor.
+    navi_end_to_end_latency_seconds: Time from a message's publishing, as stamped in its
+        `published_at` header, until its delivery, per queue. Relies on synchronized clocks.
+    navi_messages_in_flight: Messages delivered whose callback isn't done yet, per queue.
+    navi_outbox_backlog_messages, navi_outbox_backlog_bytes, navi_outbox_replayed_total,
+    navi_outbox_failed_batches_total, navi_outbox_replay_rate: The stats of each outbox, per
+        directory.
+"""
+
+import bisect
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from navi import config
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _CounterValue:
+    """The value of a counter, for a set of label values."""
+
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        """Increments the counter by `amount`, which can't be negative."""
+        if amount < 0:
+            raise ValueError("Counters can't be decremented.")
+
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeValue:
+    """The value of a gauge, for a set of label values."""
+
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        """Increments the gauge by `amount`."""
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        """Decrements the gauge by `amount`."""
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        """Sets the gauge to `value`."""
+        with self._lock:
+            self.value = value
+
+
+class _HistogramValue:
+    """The observations of a histogram, for a set of label values."""
+
+    __slots__ = ("_lock", "_buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Records an observation, in the first bucket whose upper bound is greater or equal."""
+        index = bisect.bisect_left(self._buckets, value)
+
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class NaviMetric:
+    """Base class for Navi metrics.
+
+    A metric has a value for each combination of label values it's been used with, returned by
+    its `labels` method. Metrics without labels have a single value, and can be used directly.
+    """
+
+    kind: str
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Initializes a NaviMetric.
+
+        Args:
+            name: The metric's name.
+            documentation: A description of what the metric measures.
+            labelnames: The names of the metric's labels. Optional.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: Any) -> Any:
+        """Returns the metric's value for a combination of label values, creating it on first use.
+
+        Args:
+            *values: A value for each of the metric's labels, in order.
+
+        Returns:
+            The value, with the methods to update it.
+
+        Raises:
+            ValueError: When the number of values doesn't match the metric's labels.
+        """
+        key = tuple(str(value) for value in values)
+        metric_value = self._values.get(key)
+
+        if metric_value is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}.")
+
+            with self._lock:
+                metric_value = self._values.setdefault(key, self._new_value())
+
+        return metric_value
+
+    def _new_value(self) -> Any:
+        raise NotImplementedError()
+
+    def _items(self) -> List[Tuple[Dict[str, str], Any]]:
+        """Returns the metric's values, with their labels."""
+        with self._lock:
+            items = list(self._values.items())
+
+        return [(dict(zip(self.labelnames, key)), value) for key, value in items]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the metric's type, description and values, as a dict."""
+        return {
+            "type": self.kind,
+            "help": self.documentation,
+            "values": [
+                {"labels": labels, "value": self._snapshot_value(value)}
+                for labels, value in self._items()
+            ],
+        }
+
+    def _snapshot_value(self, value: Any) -> Any:
+        return value.value
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Returns the metric's samples, as (name, labels, value) tuples, in the Prometheus
+        exposition format's layout."""
+        return [(self.name, labels, value.value) for labels, value in self._items()]
+
+
+class NaviCounter(NaviMetric):
+    """A metric that only goes up, like a number of messages."""
+
+    kind = "counter"
+
+    def _new_value(self) -> _CounterValue:
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        """Increments a counter without labels by `amount`."""
+        self.labels().inc(amount)
+
+
+class NaviGauge(NaviMetric):
+    """A metric that goes up and down, like a number of messages in flight."""
+
+    kind = "gauge"
+
+    def _new_value(self) -> _GaugeValue:
+        return _GaugeValue()
+
+    def set(self, value: float):
+        """Sets a gauge without labels to `value`."""
+        self.labels().set(value)
+
+
+class NaviHistogram(NaviMetric):
+    """A metric counting observations, like latencies, in buckets of upper bounds."""
+
+    kind = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        """Initializes a NaviHistogram.
+
+        Args:
+            name: The metric's name.
+            documentation: A description of what the metric measures.
+            labelnames: The names of the metric's labels. Optional.
+            buckets: The buckets' upper bounds, in increasing order. Defaults to latencies from
+                1ms to 60s.
+        """
+        super().__init__(name, documentation, labelnames)
+
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        """Records an observation of a histogram without labels."""
+        self.labels().observe(value)
+
+    def _cumulative(self, value: _HistogramValue) -> List[Tuple[float, int]]:
+        """Returns the cumulative count of observations up to each bucket's upper bound."""
+        total = 0
+        cumulative = []
+
+        for upper_bound, count in zip(self.buckets + (math.inf,), value.counts):
+            total += count
+            cumulative.append((upper_bound, total))
+
+        return cumulative
+
+    def _snapshot_value(self, value: _HistogramValue) -> Dict[str, Any]:
+        return {
+            "count": value.count,
+            "sum": value.sum,
+            "buckets": {
+                _format_value(upper_bound): count
+                for upper_bound, count in self._cumulative(value)
+            },
+        }
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+
+        for labels, value in self._items():
+            for upper_bound, count in self._cumulative(value):
+                samples.append(
+                    (f"{self.name}_bucket", {**labels, "le": _format_value(upper_bound)}, count)
+                )
+
+            samples.append((f"{self.name}_sum", labels, value.sum))
+            samples.append((f"{self.name}_count", labels, value.count))
+
+        return samples
+
+
+class NaviMetricsRegistry:
+    """A set of named metrics, and of collectors building metrics when the registry is read."""
+
+    def __init__(self):
+        self._metrics: Dict[str, NaviMetric] = {}
+        self._collectors: List[Callable[[], Iterable[NaviMetric]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class: type, name: str, *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}.")
+
+        return metric
+
+    def counter(
+            self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> NaviCounter:
+        """Returns the registry's counter named `name`, creating it on first use.
+
+        Raises:
+            ValueError: When a metric of another type is registered with that name.
+        """
+        return self._get_or_create(NaviCounter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> NaviGauge:
+        """Returns the registry's gauge named `name`, creating it on first use.
+
+        Raises:
+            ValueError: When a metric of another type is registered with that name.
+        """
+        return self._get_or_create(NaviGauge, name, documentation, labelnames)
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> NaviHistogram:
+        """Returns the registry's histogram named `name`, creating it on first use.
+
+        Raises:
+            ValueError: When a metric of another type is registered with that name.
+        """
+        return self._get_or_create(NaviHistogram, name, documentation, labelnames, buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[NaviMetric]]):
+        """Registers a callable returning metrics built on demand, whenever the registry is read.
+
+        Args:
+            collector: The callable, returning an iterable of NaviMetric instances.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self) -> List[NaviMetric]:
+        """Returns every metric of the registry, and every metric built by its collectors."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            metrics.extend(collector())
+
+        return metrics
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the current value of every metric, by name.
+
+        Returns:
+            A dict with the `type`, `help` and `values` of each metric, by name. Each value is a
+            dict with its `labels` and its `value`, which for histograms is a dict with the
+            `count` and `sum` of the observations, and their cumulative count by bucket.
+        """
+        return {metric.name: metric.snapshot() for metric in self.collect()}
+
+    def to_prometheus(self) -> str:
+        """Returns the current value of every metric, in the Prometheus text exposition format."""
+        lines = []
+
+        for metric in self.collect():
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(labels: Mapping[str, str]) -> str:
+    if not labels:
+        return ""
+
+    pairs = ",".join(
+        '{}="{}"'.format(name, _escape(value).replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+
+    return f"{{{pairs}}}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+
+    return repr(float(value))
+
+
+_REGISTRY = NaviMetricsRegistry()
+
+PUBLISHED = _REGISTRY.counter(
+    "navi_messages_published_total", "Messages published.", ("exchange",)
+)
+PUBLISH_FAILED = _REGISTRY.counter(
+    "navi_messages_publish_failed_total", "Messages that couldn't be published.", ("exchange",)
+)
+PUBLISH_LATENCY = _REGISTRY.histogram(
+    "navi_publish_latency_seconds", "Time taken by each publish.", ("exchange",)
+)
+DELIVERED = _REGISTRY.counter(
+    "navi_messages_delivered_total", "Messages delivered to listeners.", ("queue",)
+)
+DECODE_ERRORS = _REGISTRY.counter(
+    "navi_messages_decode_errors_total", "Delivered messages that couldn't be decoded.", ("queue",)
+)
+CALLBACK_ERRORS = _REGISTRY.counter(
+    "navi_callback_errors_total", "Listener callbacks that raised an exception.", ("queue",)
+)
+CALLBACK_DURATION = _REGISTRY.histogram(
+    "navi_callback_duration_seconds",
+    "Time from a message's delivery until its callback is done.",
+    ("queue",),
+)
+END_TO_END_LATENCY = _REGISTRY.histogram(
+    "navi_end_to_end_latency_seconds",
+    "Time from a message's publishing until its delivery.",
+    ("queue",),
+)
+DEDUP_HITS = _REGISTRY.counter(
+    "navi_dedup_hits_total", "Delivered messages skipped as already handled.", ("queue",)
+)
+DEDUP_MISSES = _REGISTRY.counter(
+    "navi_dedup_misses_total", "Delivered messages checked for duplicates and handled.", ("queue",)
+)
+IN_FLIGHT = _REGISTRY.gauge(
+    "navi_messages_in_flight", "Messages delivered whose callback isn't done yet.", ("queue",)
+)
+
+
+class NaviListenerMetrics:
+    """The metrics of a listener's queue, recording its deliveries and callbacks."""
+
+    __slots__ = (
+        "delivered",
+        "decode_errors",
+        "callback_errors",
+        "callback_duration",
+        "latency",
+        "in_flight",
+        "dedup_hits",
+        "dedup_misses",
+    )
+
+    def __init__(self, queue_name: str):
+        """Initializes a NaviListenerMetrics.
+
+        Args:
+            queue_name: The name of the listener's queue, labelling its metrics.
+        """
+        self.delivered = DELIVERED.labels(queue_name)
+        self.decode_errors = DECODE_ERRORS.labels(queue_name)
+        self.callback_errors = CALLBACK_ERRORS.labels(queue_name)
+        self.callback_duration = CALLBACK_DURATION.labels(queue_name)
+        self.latency = END_TO_END_LATENCY.labels(queue_name)
+        self.in_flight = IN_FLIGHT.labels(queue_name)
+        self.dedup_hits = DEDUP_HITS.labels(queue_name)
+        self.dedup_misses = DEDUP_MISSES.labels(queue_name)
+
+    def on_delivery(self, headers: Mapping[str, Any]) -> float:
+        """Records a delivered message, and its end-to-end latency if its `published_at` header
+        is a UNIX timestamp.
+
+        Args:
+            headers: The delivered message's headers.
+
+        Returns:
+            The delivery's time, to be passed to `on_done` once its callback is done.
+        """
+        self.delivered.inc()
+        self.in_flight.inc()
+        published_at = headers.get("published_at")
+
+        if isinstance(published_at, (int, float)) and not isinstance(published_at, bool):
+            self.latency.observe(max(time.time() - published_at, 0))
+
+        return time.perf_counter()
+
+    def on_decode_error(self):
+        """Records a delivered message that couldn't be decoded, so its callback isn't called."""
+        self.decode_errors.inc()
+        self.in_flight.dec()
+
+    def on_dedup(self, hit: bool):
+        """Records a delivered message checked against the listener's deduplication cache. A hit
+        is skipped, so its callback isn't called.
+
+        Args:
+            hit: Whether the message was already handled.
+        """
+        if hit:
+            self.dedup_hits.inc()
+            self.in_flight.dec()
+
+        else:
+            self.dedup_misses.inc()
+
+    def on_done(self, delivered_at: float, succeeded: bool):
+        """Records a callback being done.
+
+        Args:
+            delivered_at: The time returned by `on_delivery`.
+            succeeded: Whether the callback succeeded.
+        """
+        self.callback_duration.observe(time.perf_counter() - delivered_at)
+        self.in_flight.dec()
+
+        if not succeeded:
+            self.callback_errors.inc()
+
+
+def get_listener_metrics(queue_name: str) -> Optional[NaviListenerMetrics]:
+    """Returns the metrics of a listener's queue, or None if metrics are disabled by `init_config`.
+
+    Args:
+        queue_name: The name of the listener's queue.
+    """
+    return NaviListenerMetrics(queue_name) if config.NAVI_METRICS else None
+
+
+def record_publish(exchange: str, published: int, failed: int, duration: float = None):
+    """Records a publish, unless metrics are disabled by `init_config`.
+
+    Args:
+        exchange: The exchange the messages were published to.
+        published: The number of messages published, or confirmed.
+        failed: The number of messages that couldn't be published.
+        duration: The number of seconds the publish took. None if nothing was sent, like when a
+            message can't be serialized.
+    """
+    if not config.NAVI_METRICS:
+        return
+
+    if published:
+        PUBLISHED.labels(exchange).inc(published)
+
+    if failed:
+        PUBLISH_FAILED.labels(exchange).inc(failed)
+
+    if duration is not None:
+        PUBLISH_LATENCY.labels(exchange).observe(duration)
+
+
+def get_registry() -> NaviMetricsRegistry:
+    """Returns the process-wide NaviMetricsRegistry."""
+    return _REGISTRY
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Returns the current value of every metric of the process-wide registry, by name. See
+    `NaviMetricsRegistry.snapshot`."""
+    return _REGISTRY.snapshot()
+
+
+def prometheus_text() -> str:
+    """Returns the process-wide registry's metrics, in the Prometheus text exposition format."""
+    return _REGISTRY.to_prometheus()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the process-wide registry's metrics, in the Prometheus text exposition format."""
+
+    def do_GET(self):  # pylint:disable = invalid-name
+        """Serves the metrics at /metrics, and a 404 error anywhere else."""
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+
+            return
+
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint:disable = redefined-builtin
+        """Disables the per-request logging to stderr."""
+
+
+def start_metrics_server(port: int, address: str = "") -> ThreadingHTTPServer:
+    """Starts an HTTP server on a daemon thread, serving the process-wide registry's metrics at
+    /metrics, in the Prometheus text exposition format.
+
+    Args:
+        port: The port to listen at. 0 picks a free port, available through the returned
+            server's `server_port` attribute.
+        address: The address to listen at. Defaults to every interface.
+
+    Returns:
+        The started server. Its `shutdown` method stops it.
+    """
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="navi-metrics", daemon=True)
+    thread.start()
+
+    return server
@@ -0,0 +1,335 @@
+"""Navi's broker nodes module.
+
+When `init_config` is called with `broker_nodes`, publishers spread their load over every node,
+picking one for each publish with the configured strategy:
+    round_robin: Each node in turn.
+    least_loaded: The node with the fewest publishes in progress in the process, each node in turn
+        among the least loaded ones.
+    consistent_hash: The node a consistent hash ring maps the publisher's routing key to, so
+        messages with the same routing key go to the same node, and adding a node only remaps a
+        share of the routing keys.
+
+A node whose connection fails is skipped for `node_retry_interval` seconds, unless every node is.
+Publishes fail over to the next node right away if the connection can't be opened, and on their
+retries otherwise. Listeners fail over to the next node whenever their connection is lost, while
+`listen_on_nodes` attaches a listener to every node, for queues sharded across the nodes.
+"""
+
+import bisect
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Callable, ContextManager, Dict, Iterator, List, Sequence, Tuple, Union
+
+from pika import BlockingConnection, ConnectionParameters
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.exceptions import AMQPError
+
+from navi import config
+from navi.confirms import NaviConfirmChannel
+from navi.pool import NaviConnectionPool, get_pool
+from navi.transport import NaviTransport, get_transport
+
+ROUND_ROBIN = "round_robin"
+LEAST_LOADED = "least_loaded"
+CONSISTENT_HASH = "consistent_hash"
+STRATEGIES = (ROUND_ROBIN, LEAST_LOADED, CONSISTENT_HASH)
+
+VIRTUAL_NODES = 64
+
+
+def parse_node(node: str, default_port: int) -> Tuple[str, int]:
+    """Parses a "host" or "host:port" node.
+
+    Args:
+        node: The node to parse.
+        default_port: The port of nodes without one.
+
+    Returns:
+        The node's host and port.
+    """
+    host, _, port = node.rpartition(":") if ":" in node else (node, None, None)
+
+    return host, int(port) if port else int(default_port)
+
+
+def configured_nodes() -> List[Tuple[str, int]]:
+    """Returns the host and port of every broker node set by `init_config`, the first one being
+    `broker_host` and `broker_port`."""
+    nodes = [(config.NAVI_AMQP_HOST, config.NAVI_AMQP_PORT)]
+
+    for node in config.NAVI_BROKER_NODES or ():
+        nodes.append(parse_node(node, config.NAVI_AMQP_PORT))
+
+    return nodes
+
+
+def _hash(value: str) -> int:
+    """A hash stable across processes, unlike the builtin one."""
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class NaviNodeSet:
+    """The broker nodes publishers spread their load over, with a NaviConnectionPool for each one,
+    and their health and publishes in progress. Thread-safe."""
+
+    def __init__(
+            self,
+            pools: Sequence[NaviConnectionPool],
+            strategy: str = ROUND_ROBIN,
+            retry_interval: float = 10,
+    ):
+        """Initializes a NaviNodeSet.
+
+        Args:
+            pools: The pool of each node.
+            strategy: How nodes are picked. Defaults to "round_robin".
+            retry_interval: The number of seconds a node is skipped for after a connection failure.
+                Defaults to 10.
+
+        Raises:
+            ValueError: When the strategy is unknown.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown node strategy '{strategy}'. Possible values: {STRATEGIES}.")
+
+        self.pools = list(pools)
+        self.strategy = strategy
+        self._retry_interval = retry_interval
+        self._down_until = [0.0] * len(self.pools)
+        self._in_flight = [0] * len(self.pools)
+        self._turns = itertools.count()
+        self._lock = threading.Lock()
+        self._ring = sorted(
+            (_hash(f"{pool.key}#{replica}"), index)
+            for index, pool in enumerate(self.pools)
+            for replica in range(VIRTUAL_NODES)
+        )
+        self._ring_hashes = [point for point, _ in self._ring]
+        self.logger = logging.getLogger("navi")
+
+    def __len__(self) -> int:
+        return len(self.pools)
+
+    def node_for_key(self, key: str) -> int:
+        """Returns the index of the node the consistent hash ring maps `key` to."""
+        position = bisect.bisect(self._ring_hashes, _hash(key)) % len(self._ring)
+
+        return self._ring[position][1]
+
+    def candidates(self, primary: int = None) -> List[int]:
+        """Returns the indexes of the nodes to try, in order: the healthy ones, ordered by the
+        strategy, then the ones skipped after a failure.
+
+        Args:
+            primary: The node to try first, if healthy, with the consistent hash strategy.
+        """
+        count = len(self.pools)
+
+        with self._lock:
+            if primary is not None and self.strategy == CONSISTENT_HASH:
+                order = [(primary + offset) % count for offset in range(count)]
+
+            else:
+                start = next(self._turns) % count
+                order = [(start + offset) % count for offset in range(count)]
+
+                if self.strategy == LEAST_LOADED:
+                    order.sort(key=self._in_flight.__getitem__)
+
+            now = time.monotonic()
+            healthy = [index for index in order if self._down_until[index] <= now]
+
+        return healthy + [index for index in order if index not in healthy]
+
+    def mark_failed(self, index: int, error: Exception):
+        """Skips a node for `retry_interval` seconds, after its connection failed."""
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self._retry_interval
+
+        self.logger.warning(
+            "Broker node %s:%s failed: %s. Skipping it for %ss.",
+            *self.pools[index].key[:2],
+            error,
+            self._retry_interval,
+        )
+
+    @contextmanager
+    def use(self, index: int) -> Iterator[NaviConnectionPool]:
+        """Yields a node's pool, counting the publish in progress, and skipping the node for a
+        while if an AMQPError is raised."""
+        with self._lock:
+            self._in_flight[index] += 1
+
+        try:
+            yield self.pools[index]
+
+        except AMQPError as error:
+            self.mark_failed(index, error)
+            raise
+
+        finally:
+            with self._lock:
+                self._in_flight[index] -= 1
+
+    def close(self):
+        """Closes every node's pool."""
+        for pool in self.pools:
+            pool.close()
+
+    def forget(self):
+        """Resets the nodes' health and publishes in progress. Called in forked child processes."""
+        self._down_until = [0.0] * len(self.pools)
+        self._in_flight = [0] * len(self.pools)
+        self._lock = threading.Lock()
+
+
+class NaviNodePool:
+    """A NaviConnectionPool spreading its channels over the nodes of a NaviNodeSet, so it can be
+    used by publishers, background publishers and outboxes alike.
+
+    Each `channel` and `confirm_channel` call picks a node, failing over to the next one if the
+    connection can't be opened. An AMQPError raised while a channel is in use marks its node as
+    failed, so the publish's retry goes to another node.
+    """
+
+    def __init__(self, nodes: NaviNodeSet, primary: int = None):
+        """Initializes a NaviNodePool.
+
+        Args:
+            nodes: The NaviNodeSet to spread channels over.
+            primary: The node to try first, with the consistent hash strategy.
+        """
+        self._nodes = nodes
+        self._primary = primary
+
+    def __len__(self) -> int:
+        return sum(len(pool) for pool in self._nodes.pools)
+
+    @property
+    def key(self) -> Tuple:
+        """The key identifying the nodes the pool connects to, and its primary node, if any."""
+        keys = [pool.key for pool in self._nodes.pools]
+
+        return (*keys[self._primary or 0], "nodes", len(keys), self._primary)
+
+    @contextmanager
+    def channel(self, exchange: str = None, exchange_type: str = None) -> Iterator[BlockingChannel]:
+        """Yields the calling thread's channel to a node. See `NaviConnectionPool.channel`."""
+        with self._use(lambda pool: pool.channel(exchange, exchange_type)) as channel:
+            yield channel
+
+    @contextmanager
+    def confirm_channel(
+            self, exchange: str = None, exchange_type: str = None
+    ) -> Iterator[NaviConfirmChannel]:
+        """Yields the calling thread's confirm channel to a node. See
+        `NaviConnectionPool.confirm_channel`."""
+        with self._use(lambda pool: pool.confirm_channel(exchange, exchange_type)) as channel:
+            yield channel
+
+    @contextmanager
+    def _use(self, open_channel: Callable[[NaviConnectionPool], ContextManager]) -> Iterator:
+        """Yields a channel opened by `open_channel` on the first node it succeeds on."""
+        error = None
+
+        for index in self._nodes.candidates(self._primary):
+            with ExitStack() as stack:
+                pool = stack.enter_context(self._nodes.use(index))
+
+                try:
+                    channel = stack.enter_context(open_channel(pool))
+
+                except AMQPError as open_error:
+                    self._nodes.mark_failed(index, open_error)
+                    error = open_error
+                    continue
+
+                yield channel
+
+                return
+
+        raise error
+
+    def discard(self):
+        """Closes and forgets the calling thread's connection to every node."""
+        for pool in self._nodes.pools:
+            pool.discard()
+
+    def close(self):
+        """Closes every connection to every node."""
+        self._nodes.close()
+
+
+_NODE_SETS: Dict[Tuple, NaviNodeSet] = {}
+_NODE_POOLS: Dict[Tuple, NaviNodePool] = {}
+_NODES_LOCK = threading.Lock()
+
+
+def get_node_pool(
+        nodes_parameters: Sequence[ConnectionParameters],
+        routing_key: str = None,
+        connection_factory: Callable[[ConnectionParameters], BlockingConnection] = None,
+        transport: NaviTransport = None,
+) -> Union[NaviConnectionPool, NaviNodePool]:
+    """Returns the process-wide pool to publish through to the broker nodes `nodes_parameters`
+    point to: the NaviConnectionPool of the node if there's a single one, and a NaviNodePool
+    spreading publishes over the nodes, with the configured strategy, otherwise.
+
+    Args:
+        nodes_parameters: The ConnectionParameters of each node.
+        routing_key: The routing key messages are published with, hashed by the consistent hash
+            strategy. Optional.
+        connection_factory: The callable used to open connections, if pools have to be created.
+            Defaults to the transport's blocking connection.
+        transport: The transport connections are opened through. Defaults to the configured
+            transport.
+
+    Returns:
+        The shared NaviConnectionPool or NaviNodePool instance.
+    """
+    transport = get_transport(transport)
+    pools = [
+        get_pool(parameters, connection_factory, transport) for parameters in nodes_parameters
+    ]
+
+    if len(pools) == 1:
+        return pools[0]
+
+    strategy = config.NAVI_NODE_STRATEGY
+    key = (transport.name, strategy, *(pool.key for pool in pools))
+
+    with _NODES_LOCK:
+        nodes = _NODE_SETS.get(key)
+
+        if nodes is None:
+            nodes = _NODE_SETS[key] = NaviNodeSet(pools, strategy, config.NAVI_NODE_RETRY_INTERVAL)
+
+        primary = None
+
+        if strategy == CONSISTENT_HASH and routing_key is not None:
+            primary = nodes.node_for_key(routing_key)
+
+        node_pool = _NODE_POOLS.get((key, primary))
+
+        if node_pool is None:
+            node_pool = _NODE_POOLS[(key, primary)] = NaviNodePool(nodes, primary)
+
+    return node_pool
+
+
+def _forget_node_sets():
+    """Makes a forked child process track its own node health and publishes in progress."""
+    global _NODES_LOCK  # pylint:disable = global-statement
+    _NODES_LOCK = threading.Lock()
+
+    for nodes in _NODE_SETS.values():
+        nodes.forget()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_node_sets)
@@ -0,0 +1,789 @@
+"""NaviOutbox implementation module.
+
+Messages the broker couldn't confirm are appended to an outbox: a directory of size-capped segment
+files, written and read through memory maps. A NaviOutboxReplayer drains the outbox in order from a
+background thread, publishing its messages in batches with publisher confirms once the broker is
+back. Replay is at least once: messages may be delivered twice.
+
+An outbox directory is used by a single process at a time, which holds an exclusive `flock` on its
+`.lock` file. Processes sharing the `NAVI_OUTBOX_DIR` config, like prefork workers, each take the
+first free slot of a broker's outbox: its directory, then `<directory>.1`, `<directory>.2`, and so
+on, so a restarted process adopts the messages left in the slot of one that exited.
+
+Segment format, little endian:
+    header: the b"NVOB" magic, a u16 format version, two reserved bytes, and the u64 offset of the
+        first record not replayed yet.
+    records: the u32 length of the payload, and its u32 CRC-32, followed by the payload: the u16
+        lengths of the exchange, the exchange type and the routing key, the u32 length of the JSON
+        encoded properties, those four fields, and the body. A zero length ends the segment.
+"""
+
+import atexit
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from pika import BasicProperties
+
+from navi import config
+from navi.confirms import PublishResult
+from navi.exceptions import NaviOutboxException
+from navi.metrics import NaviCounter, NaviGauge, NaviMetric, get_registry
+from navi.pool import NaviConnectionPool
+from navi.reconnect import NaviBackoff, publish_confirmed
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+MAGIC = b"NVOB"
+VERSION = 1
+LOCK_FILE = ".lock"
+
+_HEADER = struct.Struct("<4sHxxQ")
+_RECORD = struct.Struct("<II")
+_FIELDS = struct.Struct("<HHHI")
+_READ_OFFSET = struct.Struct("<Q")
+_READ_OFFSET_POSITION = 8
+
+_PROPERTIES = (
+    "content_type", "content_encoding", "headers", "delivery_mode", "priority", "correlation_id",
+    "reply_to", "expiration", "message_id", "timestamp", "type", "user_id", "app_id",
+)
+
+
+@dataclass
+class OutboxRecord:
+    """A message stored in a NaviOutbox.
+
+    Attributes:
+        exchange: The exchange the message is published to.
+        exchange_type: The type of the exchange, declared if needed.
+        routing_key: The routing key the message is published with.
+        body: The serialized message.
+        properties: The message's BasicProperties.
+    """
+
+    exchange: str
+    exchange_type: str
+    routing_key: str
+    body: bytes
+    properties: BasicProperties
+
+    def pack(self) -> bytes:
+        """Serializes the record into a segment record's payload."""
+        exchange = self.exchange.encode()
+        exchange_type = self.exchange_type.encode()
+        routing_key = (self.routing_key or "").encode()
+        properties = json.dumps(
+            {
+                name: getattr(self.properties, name) for name in _PROPERTIES
+                if getattr(self.properties, name, None) is not None
+            },
+            default=str,
+        ).encode()
+
+        return b"".join((
+            _FIELDS.pack(len(exchange), len(exchange_type), len(routing_key), len(properties)),
+            exchange,
+            exchange_type,
+            routing_key,
+            properties,
+            self.body,
+        ))
+
+    @classmethod
+    def unpack(cls, payload: Union[bytes, memoryview]) -> "OutboxRecord":
+        """Deserializes a segment record's payload."""
+        sizes = _FIELDS.unpack_from(payload)
+        fields, position = [], _FIELDS.size
+
+        for size in sizes:
+            fields.append(bytes(payload[position:position + size]))
+            position += size
+
+        exchange, exchange_type, routing_key, properties = fields
+
+        return cls(
+            exchange=exchange.decode(),
+            exchange_type=exchange_type.decode(),
+            routing_key=routing_key.decode(),
+            body=bytes(payload[position:]),
+            properties=BasicProperties(**json.loads(properties)),
+        )
+
+
+class OutboxSegment:
+    """A segment file of a NaviOutbox, memory mapped.
+
+    Attributes:
+        sequence: The segment's number, ordering it among the outbox's segments.
+        path: The segment file's path.
+        read_offset: The offset of the first record not replayed yet.
+        write_offset: The offset the next record is written at.
+        records: The number of records not replayed yet.
+    """
+
+    __slots__ = ("sequence", "path", "read_offset", "write_offset", "records", "_file", "_map")
+
+    def __init__(self, sequence: int, path: str, size: int = None):
+        """Opens a segment file, creating it with `size` bytes if it doesn't exist.
+
+        Args:
+            sequence: The segment's number.
+            path: The segment file's path.
+            size: The size of the segment file, if it has to be created.
+        """
+        self.sequence = sequence
+        self.path = path
+        created = not os.path.exists(path)
+        self._file = open(path, "w+b" if created else "r+b")  # pylint:disable = R1732
+
+        if created:
+            self._file.truncate(size)
+
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+        if created:
+            _HEADER.pack_into(self._map, 0, MAGIC, VERSION, _HEADER.size)
+
+        magic, version, self.read_offset = _HEADER.unpack_from(self._map)
+
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} outbox segment.")
+
+        self.write_offset = self.read_offset
+        self.records = 0
+
+        for _, self.write_offset in self.iter_records(self.read_offset):
+            self.records += 1
+
+    @property
+    def size(self) -> int:
+        """The size of the segment file."""
+        return len(self._map)
+
+    def iter_records(self, offset: int):
+        """Yields every valid record's payload from `offset`, with the offset of the next record.
+
+        A record whose CRC-32 doesn't match, like one torn by a crash, ends the segment.
+        """
+        while offset + _RECORD.size <= self.size:
+            length, checksum = _RECORD.unpack_from(self._map, offset)
+            end = offset + _RECORD.size + length
+
+            if not length or end > self.size:
+                return
+
+            payload = memoryview(self._map)[offset + _RECORD.size:end]
+
+            try:
+                if zlib.crc32(payload) != checksum:
+                    return
+
+                yield payload, end
+
+            finally:
+                payload.release()
+
+            offset = end
+
+    def append(self, payload: bytes, sync: bool = False) -> bool:
+        """Appends a record, if it fits in the segment.
+
+        Args:
+            payload: The record's payload.
+            sync: Whether to flush the record to disk before returning.
+
+        Returns:
+            A boolean value indicating if the record fit.
+        """
+        end = self.write_offset + _RECORD.size + len(payload)
+
+        if end > self.size:
+            return False
+
+        self._map[self.write_offset + _RECORD.size:end] = payload
+        _RECORD.pack_into(self._map, self.write_offset, len(payload), zlib.crc32(payload))
+
+        if sync:
+            self._map.flush()
+
+        self.write_offset = end
+        self.records += 1
+
+        return True
+
+    def commit(self, offset: int, records: int):
+        """Marks the records before `offset` as replayed.
+
+        Args:
+            offset: The offset of the first record not replayed yet.
+            records: The number of records replayed.
+        """
+        _READ_OFFSET.pack_into(self._map, _READ_OFFSET_POSITION, offset)
+        self.read_offset = offset
+        self.records -= records
+
+    def close(self):
+        """Flushes and closes the segment file."""
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
+
+        self._file.close()
+
+
+class NaviOutbox:
+    """A disk-backed, append-only queue of messages waiting to be published.
+
+    Messages are appended to the newest segment file, and a new one is created once it's full,
+    so the outbox never rewrites data. Segments are removed once all their messages have been
+    replayed. Writes go through the memory map to the OS page cache, so they survive the process
+    crashing; with `sync` set, each one is also flushed to disk, surviving the host crashing.
+
+    The outbox holds an exclusive lock on its directory until it's closed, so no other process
+    writes to its segments. Locking is skipped where `fcntl` isn't available.
+    """
+
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024, sync: bool = False):
+        """Initializes a NaviOutbox, opening the segments already in `directory`.
+
+        Args:
+            directory: The directory the segment files are stored in. Created if needed.
+            segment_size: The size of each segment file, in bytes. Messages larger than it get a
+                segment of their own. Defaults to 64 MiB.
+            sync: Whether to flush each message to disk when it's appended. Defaults to False.
+
+        Raises:
+            NaviOutboxException: When another process uses the directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock_file = _lock_directory(directory)
+        self._directory = directory
+        self._segment_size = segment_size
+        self._sync = sync
+        self._lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+        self._segments: List[OutboxSegment] = [
+            OutboxSegment(int(name[:-4]), os.path.join(directory, name))
+            for name in sorted(os.listdir(directory)) if re.fullmatch(r"\d{20}\.seg", name)
+        ]
+        self.logger = logging.getLogger("navi")
+        self.commit(0)
+
+    @property
+    def directory(self) -> str:
+        """The directory the segment files are stored in."""
+        return self._directory
+
+    @property
+    def backlog(self) -> int:
+        """The number of messages waiting to be replayed."""
+        with self._lock:
+            return sum(segment.records for segment in self._segments)
+
+    @property
+    def backlog_bytes(self) -> int:
+        """The size of the messages waiting to be replayed, in bytes."""
+        with self._lock:
+            return sum(
+                segment.write_offset - segment.read_offset for segment in self._segments
+            )
+
+    def __len__(self) -> int:
+        return self.backlog
+
+    def append(
+            self,
+            exchange: str,
+            exchange_type: str,
+            routing_key: str,
+            body: Union[bytes, str],
+            properties: BasicProperties,
+    ):  # pylint:disable = R0913
+        """Appends a message to the outbox.
+
+        Args:
+            exchange: The exchange the message is published to.
+            exchange_type: The type of the exchange.
+            routing_key: The routing key the message is published with.
+            body: The serialized message.
+            properties: The message's BasicProperties.
+        """
+        if isinstance(body, str):
+            body = body.encode()
+
+        payload = OutboxRecord(exchange, exchange_type, routing_key, body, properties).pack()
+
+        with self._lock:
+            if not self._segments or not self._segments[-1].append(payload, self._sync):
+                segment = self._new_segment(len(payload))
+                segment.append(payload, self._sync)
+
+            self._appended.notify_all()
+
+    def peek(self, max_count: int) -> List[OutboxRecord]:
+        """Returns the oldest messages waiting to be replayed, without removing them.
+
+        Args:
+            max_count: The max number of messages to return.
+
+        Returns:
+            Up to `max_count` OutboxRecords, oldest first.
+        """
+        records = []
+
+        with self._lock:
+            for segment in self._segments:
+                for payload, _ in segment.iter_records(segment.read_offset):
+                    if len(records) >= max_count:
+                        return records
+
+                    records.append(OutboxRecord.unpack(payload))
+
+        return records
+
+    def commit(self, count: int):
+        """Removes the `count` oldest messages, once they have been replayed.
+
+        Args:
+            count: The number of messages to remove.
+        """
+        with self._lock:
+            while self._segments:
+                segment = self._segments[0]
+
+                if count and segment.records:
+                    offset, committed = segment.read_offset, 0
+
+                    for _, offset in segment.iter_records(segment.read_offset):
+                        committed += 1
+
+                        if committed == count:
+                            break
+
+                    segment.commit(offset, committed)
+                    count -= committed
+
+                if segment.records or segment is self._segments[-1]:
+                    break
+
+                self._segments.pop(0)
+                segment.close()
+                os.remove(segment.path)
+
+    def wait(self, timeout: float) -> bool:
+        """Waits until the outbox has messages waiting to be replayed.
+
+        Args:
+            timeout: The max number of seconds to wait for.
+
+        Returns:
+            A boolean value indicating if the outbox has messages.
+        """
+        with self._appended:
+            return self._appended.wait_for(
+                lambda: any(segment.records for segment in self._segments), timeout
+            )
+
+    def close(self):
+        """Closes every segment file, and releases the directory's lock."""
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+
+            self._segments = []
+
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _forget_lock(self):
+        """Closes a forked child process' copy of the lock file, without releasing the lock held
+        by its parent."""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _new_segment(self, payload_size: int) -> OutboxSegment:
+        """Creates a new segment, large enough for a payload of `payload_size` bytes. Must be
+        called while holding `_lock`."""
+        sequence = self._segments[-1].sequence + 1 if self._segments else 0
+        size = max(self._segment_size, _HEADER.size + _RECORD.size + payload_size)
+        segment = OutboxSegment(
+            sequence, os.path.join(self._directory, f"{sequence:020d}.seg"), size
+        )
+        self._segments.append(segment)
+
+        return segment
+
+
+def _lock_directory(directory: str):
+    """Takes an exclusive lock on an outbox directory, held until the returned file is closed.
+
+    Returns:
+        The lock file, or None if `fcntl` isn't available.
+
+    Raises:
+        NaviOutboxException: When another process holds the lock.
+    """
+    if fcntl is None:  # pragma: no cover
+        return None
+
+    lock_file = open(os.path.join(directory, LOCK_FILE), "a+b")  # pylint:disable = R1732
+
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    except OSError as error:
+        lock_file.close()
+
+        raise NaviOutboxException(f"Outbox {directory} is used by another process.") from error
+
+    return lock_file
+
+
+class NaviOutboxReplayer:
+    """A class that replays a NaviOutbox's messages from a background thread.
+
+    The oldest messages are published in batches with publisher confirms, and removed from the
+    outbox up to the first one that isn't confirmed, so messages are replayed in order. After a
+    failed batch, the replayer waits for a jittered exponential backoff before trying again.
+    """
+
+    def __init__(
+            self,
+            outbox: NaviOutbox,
+            pool: NaviConnectionPool,
+            batch_size: int = 500,
+            interval: float = 1.0,
+            confirm_timeout: float = 30,
+    ):  # pylint:disable = R0913
+        """Initializes a NaviOutboxReplayer. Its thread is started by `start`.
+
+        Args:
+            outbox: The NaviOutbox to replay.
+            pool: The NaviConnectionPool to publish through.
+            batch_size: The max number of messages published in a single batch. Defaults to 500.
+            interval: The max number of seconds to wait before checking the outbox again when it's
+                empty. Defaults to 1.
+            confirm_timeout: The max number of seconds to wait for a batch to be confirmed.
+                Defaults to 30.
+        """
+        self._outbox = outbox
+        self._pool = pool
+        self._batch_size = batch_size
+        self._interval = interval
+        self._confirm_timeout = confirm_timeout
+        self._backoff = NaviBackoff(
+            config.NAVI_RECONNECT_INITIAL_DELAY, config.NAVI_RECONNECT_MAX_DELAY
+        )
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.replayed = 0
+        self.failed_batches = 0
+        self.replay_rate = 0.0
+        self.logger = logging.getLogger("navi")
+
+    @property
+    def outbox(self) -> NaviOutbox:
+        """The NaviOutbox being replayed."""
+        return self._outbox
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the outbox's backlog and the replay's throughput.
+
+        Returns:
+            A dict with the number of messages (`backlog`) and bytes (`backlog_bytes`) waiting to
+            be replayed, the number of messages `replayed` and of `failed_batches` so far, and the
+            `replay_rate` of the last batch, in messages per second.
+        """
+        return {
+            "backlog": self._outbox.backlog,
+            "backlog_bytes": self._outbox.backlog_bytes,
+            "replayed": self.replayed,
+            "failed_batches": self.failed_batches,
+            "replay_rate": self.replay_rate,
+        }
+
+    def start(self):
+        """Starts the replayer's thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="navi-outbox-replayer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = None) -> bool:
+        """Stops the replayer's thread, once the batch being replayed, if any, is done.
+
+        Args:
+            timeout: The max number of seconds to wait for the thread to stop. Waits forever if
+                None.
+
+        Returns:
+            A boolean value indicating if the thread stopped on time.
+        """
+        self._stop_event.set()
+
+        if self._thread is None:
+            return True
+
+        self._thread.join(timeout)
+
+        return not self._thread.is_alive()
+
+    def replay(self) -> int:
+        """Publishes a batch of the oldest messages, and removes the confirmed ones from the
+        outbox.
+
+        Returns:
+            The number of messages replayed, or -1 if a message wasn't confirmed.
+        """
+        records = self._outbox.peek(self._batch_size)
+
+        if not records:
+            return 0
+
+        exchange, exchange_type = records[0].exchange, records[0].exchange_type
+        end = next(
+            (
+                index for index, record in enumerate(records)
+                if (record.exchange, record.exchange_type) != (exchange, exchange_type)
+            ),
+            len(records),
+        )
+        records = records[:end]
+        started = time.monotonic()
+        results = publish_confirmed(
+            self._pool,
+            exchange,
+            exchange_type,
+            [(record.routing_key, record.body, record.properties) for record in records],
+            timeout=self._confirm_timeout,
+            logger=self.logger,
+        )
+        confirmed = next(
+            (index for index, result in enumerate(results) if not result.acked), len(results)
+        )
+        self._outbox.commit(confirmed)
+        self.replayed += confirmed
+        self.replay_rate = confirmed / max(time.monotonic() - started, 1e-6)
+
+        if confirmed < len(records):
+            self.failed_batches += 1
+
+            return -1
+
+        return confirmed
+
+    def _run(self):
+        """Replays the outbox until the replayer is stopped."""
+        while not self._stop_event.is_set():
+            if not self._outbox.wait(self._interval):
+                continue
+
+            try:
+                replayed = self.replay()
+
+            except Exception as error:  # pylint:disable = W0703
+                self.logger.error("Error while replaying outbox: %s.", str(error))
+                replayed = -1
+
+            if replayed >= 0:
+                self._backoff.reset()
+                continue
+
+            delay = self._backoff.next_delay()
+            self.logger.warning(
+                "Outbox replay failed, %d messages waiting. Retrying in %.2fs.",
+                self._outbox.backlog,
+                delay,
+            )
+            self._stop_event.wait(delay)
+
+
+_REPLAYERS: Dict[NaviConnectionPool, NaviOutboxReplayer] = {}
+_REPLAYERS_LOCK = threading.Lock()
+
+
+def get_outbox(pool: NaviConnectionPool) -> Optional[NaviOutbox]:
+    """Returns the process-wide NaviOutbox of the broker `pool` publishes to, creating it on first
+    use, with its replayer, if an outbox directory was set by `init_config`.
+
+    Each broker gets its own subdirectory of the `NAVI_OUTBOX_DIR` config, or the first of its
+    numbered siblings that isn't used by another process.
+
+    Args:
+        pool: The NaviConnectionPool messages are published through.
+
+    Returns:
+        The shared NaviOutbox instance, or None if the outbox is disabled.
+    """
+    if not config.NAVI_OUTBOX_DIR:
+        return None
+
+    with _REPLAYERS_LOCK:
+        replayer = _REPLAYERS.get(pool)
+
+        if replayer is None:
+            name = re.sub(r"[^\w.-]", "_", "_".join(str(part) for part in pool.key))
+            outbox = _open_free_slot(os.path.join(config.NAVI_OUTBOX_DIR, name))
+            replayer = NaviOutboxReplayer(outbox, pool)
+            replayer.start()
+            _REPLAYERS[pool] = replayer
+
+    return replayer.outbox
+
+
+def _open_free_slot(directory: str) -> NaviOutbox:
+    """Opens the first slot of an outbox directory that isn't used by another process: the
+    directory itself, then `<directory>.1`, `<directory>.2`, and so on."""
+    slot = 0
+
+    while True:
+        try:
+            return NaviOutbox(
+                f"{directory}.{slot}" if slot else directory,
+                segment_size=config.NAVI_OUTBOX_SEGMENT_SIZE,
+            )
+
+        except NaviOutboxException:
+            slot += 1
+
+
+def store_unconfirmed(
+        pool: NaviConnectionPool,
+        exchange: str,
+        exchange_type: str,
+        messages: Sequence[Tuple[str, Union[bytes, str], BasicProperties]],
+        results: Sequence[PublishResult] = None,
+) -> int:
+    """Appends the messages the broker didn't confirm to the outbox, if it's enabled, marking their
+    PublishResults as stored.
+
+    Args:
+        pool: The NaviConnectionPool the messages were published through.
+        exchange: The exchange the messages were published to.
+        exchange_type: The type of the exchange.
+        messages: The (routing_key, body, properties) tuples that were published.
+        results: The messages' PublishResults. Every message is stored if not given.
+
+    Returns:
+        The number of messages stored.
+    """
+    stored = 0
+
+    try:
+        outbox = get_outbox(pool)
+
+        if outbox is None:
+            return 0
+
+        for index, (routing_key, body, properties) in enumerate(messages):
+            if results is not None and results[index].acked:
+                continue
+
+            outbox.append(exchange, exchange_type, routing_key, body, properties)
+            stored += 1
+
+            if results is not None:
+                results[index].stored = True
+
+    except (OSError, ValueError) as error:
+        logging.getLogger("navi").error(
+            "Error while storing messages in the outbox: %s. %d stored.", str(error), stored
+        )
+
+        return stored
+
+    if stored:
+        outbox.logger.warning("%d unconfirmed messages stored in the outbox.", stored)
+
+    return stored
+
+
+def get_replayer_stats() -> Dict[str, Dict[str, float]]:
+    """Returns the stats of every process-wide NaviOutboxReplayer, by outbox directory."""
+    with _REPLAYERS_LOCK:
+        replayers = list(_REPLAYERS.values())
+
+    return {replayer.outbox.directory: replayer.stats() for replayer in replayers}
+
+
+def collect_metrics() -> List[NaviMetric]:
+    """Builds metrics from the stats of every process-wide NaviOutboxReplayer, labelled by outbox
+    directory. Registered as a collector of the process-wide `navi.metrics` registry."""
+    backlog = NaviGauge(
+        "navi_outbox_backlog_messages", "Messages waiting to be replayed.", ("directory",)
+    )
+    backlog_bytes = NaviGauge(
+        "navi_outbox_backlog_bytes", "Bytes of the messages waiting to be replayed.", ("directory",)
+    )
+    replayed = NaviCounter("navi_outbox_replayed_total", "Messages replayed.", ("directory",))
+    failed_batches = NaviCounter(
+        "navi_outbox_failed_batches_total", "Replayed batches not fully confirmed.", ("directory",)
+    )
+    replay_rate = NaviGauge(
+        "navi_outbox_replay_rate",
+        "Messages per second replayed in the last batch.",
+        ("directory",),
+    )
+
+    for directory, stats in get_replayer_stats().items():
+        backlog.labels(directory).set(stats["backlog"])
+        backlog_bytes.labels(directory).set(stats["backlog_bytes"])
+        replayed.labels(directory).inc(stats["replayed"])
+        failed_batches.labels(directory).inc(stats["failed_batches"])
+        replay_rate.labels(directory).set(stats["replay_rate"])
+
+    return [backlog, backlog_bytes, replayed, failed_batches, replay_rate]
+
+
+def close_outboxes(timeout: float = 5):
+    """Stops every process-wide NaviOutboxReplayer, and closes its outbox. Messages not replayed
+    yet are kept on disk, to be replayed by the next process using the same directory.
+    Registered to be called at interpreter exit.
+
+    Args:
+        timeout: The max number of seconds to wait for each replayer to stop. Defaults to 5.
+    """
+    with _REPLAYERS_LOCK:
+        replayers = list(_REPLAYERS.values())
+        _REPLAYERS.clear()
+
+    for replayer in replayers:
+        if replayer.stop(timeout):
+            replayer.outbox.close()
+
+
+atexit.register(close_outboxes)
+get_registry().register_collector(collect_metrics)
+
+
+def _forget_replayers():
+    """Makes a forked child process open its own outboxes, the parent's replayer threads not
+    running in the child, and the parent's outbox directories staying locked by it."""
+    global _REPLAYERS_LOCK  # pylint:disable = global-statement
+    _REPLAYERS_LOCK = threading.Lock()
+
+    for replayer in _REPLAYERS.values():
+        replayer.outbox._forget_lock()  # pylint:disable = protected-access
+
+    _REPLAYERS.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_replayers)
@@ -0,0 +1,313 @@
+"""NaviConnectionPool implementation module."""
+
+import atexit
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+from pika import BlockingConnection, ConnectionParameters
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.exceptions import AMQPError
+
+from navi.confirms import NaviConfirmChannel
+from navi.transport import NaviTransport, get_transport
+
+
+class PooledConnection:
+    """A long-lived connection, and the channel opened through it, owned by a single thread.
+
+    Attributes:
+        connection: The open BlockingConnection.
+        channel: The channel opened through `connection`.
+        confirm_channel: The NaviConfirmChannel opened through `connection`, once it's used.
+        exchanges: The names of the exchanges already declared through `channel`, so they're
+            declared only once per channel instead of once per message.
+    """
+
+    __slots__ = ("connection", "channel", "confirm_channel", "exchanges")
+
+    def __init__(self, connection: BlockingConnection, channel: BlockingChannel):
+        self.connection = connection
+        self.channel = channel
+        self.confirm_channel: Optional[NaviConfirmChannel] = None
+        self.exchanges: Set[str] = set()
+
+    @property
+    def is_open(self) -> bool:
+        """Checks if both the connection and its channel are still open.
+
+        Returns:
+            A boolean value indicating if the pooled connection can still be used.
+        """
+        return bool(self.connection.is_open and self.channel.is_open)
+
+    def is_alive(self) -> bool:
+        """Checks if the pooled connection is open, processing the frames and socket events
+        waiting on it first, without blocking, so a connection closed by the broker, or whose
+        socket was lost, while idle is found dead before being used.
+
+        Returns:
+            A boolean value indicating if the pooled connection can still be used.
+        """
+        if not self.is_open:
+            return False
+
+        try:
+            self.connection.process_data_events(time_limit=0)
+
+        except AMQPError:
+            return False
+
+        return self.is_open
+
+    def close(self):
+        """Closes the connection, ignoring any error raised because it's already dead."""
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+
+        except AMQPError:
+            pass
+
+
+class NaviConnectionPool:
+    """A thread-safe pool of long-lived BlockingConnections.
+
+    pika's BlockingConnection is not thread-safe, so the pool hands each thread its own connection
+    and channel and keeps them open between publishes. Connections found closed are replaced
+    before being handed out, as are idle connections the broker closed or whose socket was lost,
+    found by processing their pending events first. Connections that raise an AMQPError while in
+    use are discarded, so the next use reconnects.
+    """
+
+    def __init__(
+            self,
+            connection_parameters: ConnectionParameters,
+            connection_factory: Callable[[ConnectionParameters], BlockingConnection] = None,
+            transport: NaviTransport = None,
+    ):
+        """Initializes a NaviConnectionPool.
+
+        Args:
+            connection_parameters: The ConnectionParameters instance to be used to establish
+                connections.
+            connection_factory: The callable used to open a connection from
+                `connection_parameters`. Defaults to the transport's blocking connection.
+            transport: The transport connections are opened through. Defaults to the configured
+                transport.
+        """
+        self._connection_parameters = connection_parameters
+        self._transport = get_transport(transport)
+        self._connection_factory = connection_factory or self._transport.blocking_connection
+        self._connections: Dict[int, PooledConnection] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("navi")
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    @property
+    def key(self) -> Tuple:
+        """The key identifying the broker and user the pool connects as."""
+        return pool_key(self._connection_parameters)
+
+    @contextmanager
+    def channel(self, exchange: str = None, exchange_type: str = None) -> Iterator[BlockingChannel]:
+        """Yields the calling thread's channel, opening a connection first if needed.
+
+        If `exchange` is given, it's declared as durable the first time it's used on the channel.
+        If an AMQPError is raised while the channel is in use, the connection is discarded and the
+        error re-raised.
+
+        Args:
+            exchange: The name of the exchange to declare. Optional.
+            exchange_type: The type of the exchange to declare. Optional.
+
+        Yields:
+            An open BlockingChannel owned by the calling thread.
+        """
+        with self._use(exchange, exchange_type) as pooled:
+            yield pooled.channel
+
+    @contextmanager
+    def confirm_channel(
+            self, exchange: str = None, exchange_type: str = None
+    ) -> Iterator[NaviConfirmChannel]:
+        """Yields the calling thread's channel in publisher confirms mode.
+
+        It's opened on the same connection as the one yielded by `channel`, the first time it's
+        used. Exchange declaration and error handling work as in `channel`.
+
+        Args:
+            exchange: The name of the exchange to declare. Optional.
+            exchange_type: The type of the exchange to declare. Optional.
+
+        Yields:
+            An open NaviConfirmChannel owned by the calling thread.
+        """
+        with self._use(exchange, exchange_type) as pooled:
+            if pooled.confirm_channel is None or not pooled.confirm_channel.is_open:
+                pooled.confirm_channel = self._transport.confirm_channel(
+                    pooled.connection.channel()
+                )
+
+            yield pooled.confirm_channel
+
+    @contextmanager
+    def _use(self, exchange: str = None, exchange_type: str = None) -> Iterator[PooledConnection]:
+        """Yields the calling thread's pooled connection, declaring `exchange` on it if needed, and
+        discarding it if an AMQPError is raised while in use.
+        """
+        pooled = self._acquire()
+
+        try:
+            if exchange and exchange not in pooled.exchanges:
+                pooled.channel.exchange_declare(
+                    exchange=exchange, exchange_type=exchange_type, durable=True
+                )
+                pooled.exchanges.add(exchange)
+
+            yield pooled
+
+        except AMQPError:
+            self.discard()
+            raise
+
+    def _acquire(self) -> PooledConnection:
+        """Returns the calling thread's pooled connection, replacing it if it's no longer alive."""
+        ident = threading.get_ident()
+        pooled = self._connections.get(ident)
+
+        if pooled is not None and pooled.is_alive():
+            return pooled
+
+        if pooled is not None:
+            self.logger.warning("Pooled connection found closed. Reconnecting.")
+            self.discard()
+
+        connection = self._connection_factory(self._connection_parameters)
+
+        try:
+            pooled = PooledConnection(connection, connection.channel())
+
+        except AMQPError:
+            if connection.is_open:
+                connection.close()
+            raise
+
+        with self._lock:
+            self._prune()
+            self._connections[ident] = pooled
+
+        return pooled
+
+    def _prune(self):
+        """Closes the connections owned by threads that are no longer alive.
+
+        Must be called while holding `_lock`.
+        """
+        alive = {thread.ident for thread in threading.enumerate()}
+
+        for ident in [ident for ident in self._connections if ident not in alive]:
+            self._connections.pop(ident).close()
+
+    def discard(self):
+        """Closes and forgets the calling thread's connection, if any."""
+        with self._lock:
+            pooled = self._connections.pop(threading.get_ident(), None)
+
+        if pooled is not None:
+            pooled.close()
+
+    def close(self):
+        """Closes every connection in the pool."""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+
+        for pooled in connections:
+            pooled.close()
+
+    def forget(self):
+        """Forgets every connection in the pool without closing them. Called in forked child
+        processes, whose inherited connections share their sockets with the parent's."""
+        self._connections = {}
+        self._lock = threading.Lock()
+
+
+_POOLS: Dict[Tuple, NaviConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def pool_key(connection_parameters: ConnectionParameters) -> Tuple:
+    """Builds the key identifying the broker and user a ConnectionParameters connects as."""
+    credentials = connection_parameters.credentials
+
+    return (
+        connection_parameters.host,
+        connection_parameters.port,
+        connection_parameters.virtual_host,
+        getattr(credentials, "username", None),
+    )
+
+
+def get_pool(
+        connection_parameters: ConnectionParameters,
+        connection_factory: Callable[[ConnectionParameters], BlockingConnection] = None,
+        transport: NaviTransport = None,
+) -> NaviConnectionPool:
+    """Returns the process-wide NaviConnectionPool for the broker `connection_parameters` point to.
+
+    The pool is created on first use, so every publisher connecting to the same broker with the
+    same user, through the same transport, shares the same long-lived connections.
+
+    Args:
+        connection_parameters: The ConnectionParameters instance to be used to establish
+            connections.
+        connection_factory: The callable used to open connections, if the pool has to be created.
+            Defaults to the transport's blocking connection.
+        transport: The transport connections are opened through. Defaults to the configured
+            transport.
+
+    Returns:
+        The shared NaviConnectionPool instance.
+    """
+    transport = get_transport(transport)
+    key = (transport.name, *pool_key(connection_parameters))
+
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+
+        if pool is None:
+            pool = NaviConnectionPool(connection_parameters, connection_factory, transport)
+            _POOLS[key] = pool
+
+    return pool
+
+
+def close_pools():
+    """Closes every process-wide pool. Registered to be called at interpreter exit."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_pools)
+
+
+def _forget_pools():
+    """Makes a forked child process open its own connections, instead of using the parent's."""
+    global _POOLS_LOCK  # pylint:disable = global-statement
+    _POOLS_LOCK = threading.Lock()
+
+    for pool in _POOLS.values():
+        pool.forget()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_pools)
@@ -1,24 +1,115 @@
 """NaviPublisher implementation module"""
-import json
-import socket
-from datetime import datetime
-from uuid import uuid4
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional, Tuple, Union
 
 from pika import BaseConnection, BasicProperties, BlockingConnection, ConnectionParameters
 from pika.exceptions import AMQPError
 
 from navi import config
+from navi.background import get_background_publisher
 from navi.base import NaviBase
+from navi.codecs import NaviCodec, get_codec
+from navi.compression import NaviCompressor, compress, get_compressor
+from navi.confirms import PublishResult
+from navi.envelope import get_envelope_factory
+from navi.exceptions import NaviStreamException
+from navi.metrics import record_publish
+from navi.outbox import store_unconfirmed
+from navi.nodes import NaviNodePool, get_node_pool
+from navi.pool import NaviConnectionPool
+from navi.reconnect import BLOCKED, CONNECTED, call_with_retries, publish_confirmed
+from navi.scheduler import get_scheduler
+from navi.stream import (
+    STREAM_CONTENT_TYPE_HEADER,
+    STREAM_ID_HEADER,
+    STREAM_LAST_HEADER,
+    STREAM_SEQ_HEADER,
+    Source,
+    iter_chunks,
+)
+
+STREAM_CHUNK_CONTENT_TYPE = "application/octet-stream"
 
 
 class NaviPublisher(NaviBase):
     """A class that sets up a connection with a AMQP broker and is capable of publishing messages to
     a broker's exchange.
 
-    It opens a new connection for each message to be published. After the message is sent, or if an
-    exception is raised, the connections is closed.
+    Messages are published through the long-lived connections of a NaviConnectionPool shared by
+    every publisher connecting to the same broker, so no connection is opened per message. If an
+    AMQPError is raised, the failing connection is discarded, and publishing is retried on a new
+    one, up to `NAVI_PUBLISH_RETRIES` times, after a jittered exponential backoff. Connection state
+    changes are reported to the callbacks added with `add_state_callback`. Messages that still
+    can't be confirmed are stored in the outbox, if `init_config` set an outbox directory, to be
+    published again once the broker is back.
+
+    Large payloads can be published with `publish_stream`, as a stream of ordered chunks read
+    lazily from a file object or an iterable, instead of being serialized as a whole.
+
+    In background mode, `publish` enqueues messages into the buffer of a NaviBackgroundPublisher,
+    which publishes them from its own I/O thread, instead of waiting for the broker.
+
+    Messages are serialized with the publisher's codec, whose content type is stamped on them.
+    Serialized messages larger than the compression threshold are compressed, if the publisher has
+    a compressor, whose name is stamped as their content encoding.
     """
 
+    _pool: Union[NaviConnectionPool, NaviNodePool]
+    _background: bool
+    _codec: NaviCodec
+    _compressor: Optional[NaviCompressor]
+    _compression_threshold: int
+
+    def __init__(
+            self,
+            routing_key: str = None,
+            background: bool = None,
+            codec: Union[str, NaviCodec] = None,
+            compression: Union[str, NaviCompressor] = None,
+            compression_threshold: int = None,
+    ):  # pylint:disable = R0913
+        """Initializes a NaviPublisher.
+
+        Args:
+            routing_key: The routing key to be used to publish messages to the exchange.
+            background: Whether to publish messages in background. Defaults to the
+                `NAVI_BACKGROUND_PUBLISHING` config.
+            codec: The name of the codec, or the codec, to serialize messages with. Defaults to the
+                `NAVI_CODEC` config.
+            compression: The name of the compressor, or the compressor, to compress large messages
+                with. Defaults to the `NAVI_COMPRESSION` config.
+            compression_threshold: The min size, in bytes, of the serialized messages to compress.
+                Defaults to the `NAVI_COMPRESSION_THRESHOLD` config.
+
+        Raises:
+            NaviCodecException: When `codec` is not a registered codec's name, or `compression` a
+                registered compressor's name.
+        """
+        super().__init__(routing_key=routing_key)
+
+        self._pool = get_node_pool(
+            self._init_nodes_connection_params(),
+            self._routing_key,
+            self._init_connection,
+            self._transport,
+        )
+        self._background = (
+            config.NAVI_BACKGROUND_PUBLISHING if background is None else background
+        )
+        self._codec = get_codec(codec)
+        self._compressor = get_compressor(compression)
+        self._compression_threshold = (
+            config.NAVI_COMPRESSION_THRESHOLD if compression_threshold is None
+            else compression_threshold
+        )
+
+        if config.NAVI_SCHEDULER_DIR:
+            # Resumes the messages scheduled for the broker before a restart.
+            get_scheduler(self._pool)
+
     def _init_connection(self, connection_parameters: ConnectionParameters) -> BaseConnection:
         """Initializes a BlockingConnection to be used by the listener.
 
@@ -28,87 +119,432 @@ class NaviPublisher(NaviBase):
         Returns:
             The set up BaseConnection instance.
         """
-        connection = BlockingConnection(connection_parameters)
+        connection = self._transport.blocking_connection(connection_parameters)
+        connection.add_on_connection_blocked_callback(self._on_connection_blocked)
+        connection.add_on_connection_unblocked_callback(self._on_connection_unblocked)
 
         return connection
 
-    def publish(self, message: dict):
+    def _on_connection_blocked(
+            self, connection: BlockingConnection, method: Any
+    ):  # pylint:disable=unused-argument
+        """Called when the broker blocks a pooled connection. Publishing through it blocks until
+        it's unblocked, or fails after `NAVI_BLOCKED_CONNECTION_TIMEOUT` seconds."""
+        self.logger.warning("Publisher connection blocked by the broker.")
+        self._set_state(BLOCKED)
+
+    def _on_connection_unblocked(
+            self, connection: BlockingConnection, method: Any
+    ):  # pylint:disable=unused-argument
+        """Called when the broker unblocks a pooled connection."""
+        self.logger.info("Publisher connection unblocked by the broker.")
+        self._set_state(CONNECTED)
+
+    def publish(
+            self,
+            message: Any,
+            delay: float = None,
+            publish_at: Union[float, datetime.datetime] = None,
+    ) -> Optional[int]:
         """Publishes `message` to the exchange with name and type defined by the `NAVI_EXCHANGE` and
         `NAVI_EXCHANGE_TYPE` environment variables.
 
-        To do so, it dumps/serializes the message and opens a connection to the broker. After having
-        published the message, or if an Exception is raised, the connection is closed, if set.
+        To do so, it dumps/serializes the message and sends it through the calling thread's pooled
+        channel, or enqueues it to be sent in background, if the publisher is in background mode.
+        With a `delay` or `publish_at`, the serialized message is handed to the broker's
+        NaviScheduler instead, to be published once it's due.
 
         Args:
-            message: A dict containing data to be sent as a JSON string through the broker.
+            message: The data to be serialized with the publisher's codec and sent through the
+                broker.
+            delay: The number of seconds to wait before publishing the message. Optional.
+            publish_at: The datetime, or UNIX timestamp, to publish the message at. Optional.
+
+        Returns:
+            The scheduled message's timer id, to cancel it with `navi.scheduler.cancel`, or None
+            if the message isn't scheduled.
+
+        Raises:
+            NaviBufferFullException: In background mode, when the buffer is full and its policy is
+                "raise".
+            ValueError: When both `delay` and `publish_at` are given.
         """
+        if delay is not None and publish_at is not None:
+            raise ValueError("Need at most one of delay and publish_at.")
+
         try:
-            body = json.dumps(message)
+            body = self._codec.encode(message)
 
         except (TypeError, ValueError) as error:
             self.logger.error("Message with invalid body: %s", str(error))
+            record_publish(config.NAVI_EXCHANGE, 0, 1)
 
-        else:
-            self._publish_message(body)
+            return None
 
-    def _publish_message(self, body: str):
-        connection = None
-        message_properties = self._build_message_properties()
+        if delay is not None or publish_at is not None:
+            return get_scheduler(self._pool).schedule(
+                self._routing_key, *self._prepare(body), delay=delay, publish_at=publish_at
+            )
 
-        try:
-            connection = self._init_connection(self._connection_parameters)
-            channel = connection.channel()
-            channel.exchange_declare(
-                exchange=config.NAVI_EXCHANGE,
-                exchange_type=config.NAVI_EXCHANGE_TYPE,
-                durable=True,
+        self._publish_message(body)
+
+        return None
+
+    def _publish_message(self, body: Union[bytes, str]):
+        body, message_properties = self._prepare(body)
+
+        if self._background:
+            get_background_publisher(self._pool).enqueue(
+                self._routing_key, body, message_properties
             )
-            channel.basic_publish(
-                exchange=config.NAVI_EXCHANGE,
-                routing_key=self._routing_key,
-                properties=message_properties,
-                body=body,
+
+            return
+
+        def send():
+            with self._pool.channel(config.NAVI_EXCHANGE, config.NAVI_EXCHANGE_TYPE) as channel:
+                channel.basic_publish(
+                    exchange=config.NAVI_EXCHANGE,
+                    routing_key=self._routing_key,
+                    properties=message_properties,
+                    body=body,
+                )
+
+        started = time.perf_counter()
+
+        try:
+            call_with_retries(
+                send, config.NAVI_PUBLISH_RETRIES, self._init_backoff(), self._set_state
             )
             self.logger.info("Exchange %s: Message sent.", config.NAVI_EXCHANGE)
+            record_publish(config.NAVI_EXCHANGE, 1, 0, time.perf_counter() - started)
 
         except AMQPError as error:
             self.logger.error(
                 "Error while publishing. Exchange: %s; error: %s.", config.NAVI_EXCHANGE, error
             )
+            record_publish(config.NAVI_EXCHANGE, 0, 1, time.perf_counter() - started)
+            store_unconfirmed(
+                self._pool,
+                config.NAVI_EXCHANGE,
+                config.NAVI_EXCHANGE_TYPE,
+                [(self._routing_key, body, message_properties)],
+            )
+
+    def publish_many(self, messages: Iterable[Any], timeout: float = 30) -> List[PublishResult]:
+        """Publishes every message in `messages` through a single channel, with publisher confirms.
+
+        Messages are serialized and sent back to back without waiting for each confirmation. Once
+        all of them have been sent, it waits for the broker to confirm them. If the connection is
+        lost, the unconfirmed messages are republished on a new one, up to `NAVI_PUBLISH_RETRIES`
+        times, so they may be delivered twice. Messages still unconfirmed are then stored in the
+        outbox, if it's enabled.
+
+        Args:
+            messages: An iterable of messages, each one to be serialized with the publisher's codec
+                and sent through the broker.
+            timeout: The max number of seconds to wait for the broker's confirmations once every
+                message has been sent. Defaults to 30.
+
+        Returns:
+            A list with a PublishResult for each message, in the same order as `messages`. Messages
+            that couldn't be serialized, were nacked, or weren't confirmed on time are reported as
+            not acked.
+        """
+        results: List[Optional[PublishResult]] = []
+        outgoing: List[Tuple[str, Union[bytes, str], BasicProperties]] = []
+        positions = []
+
+        for message in messages:
+            try:
+                body = self._codec.encode(message)
+
+            except (TypeError, ValueError) as error:
+                self.logger.error("Message with invalid body: %s", str(error))
+                results.append(PublishResult(error=f"Invalid body: {error}"))
+                continue
+
+            positions.append(len(results))
+            results.append(None)
+            outgoing.append((self._routing_key, *self._prepare(body)))
 
-        finally:
+        started = time.perf_counter()
+        published = publish_confirmed(
+            self._pool,
+            config.NAVI_EXCHANGE,
+            config.NAVI_EXCHANGE_TYPE,
+            outgoing,
+            timeout=timeout,
+            retries=config.NAVI_PUBLISH_RETRIES,
+            backoff=self._init_backoff(),
+            on_state=self._set_state,
+            logger=self.logger,
+        )
+        store_unconfirmed(
+            self._pool, config.NAVI_EXCHANGE, config.NAVI_EXCHANGE_TYPE, outgoing, published
+        )
+
+        for position, result in zip(positions, published):
+            results[position] = result
+
+        acked = sum(result.acked for result in results)
+        record_publish(
+            config.NAVI_EXCHANGE,
+            acked,
+            len(results) - acked,
+            time.perf_counter() - started if outgoing else None,
+        )
+        self.logger.info(
+            "Exchange %s: %d of %d messages confirmed.", config.NAVI_EXCHANGE, acked, len(results)
+        )
+
+        return results
+
+    def publish_stream(
+            self,
+            source: Source,
+            content_type: str = None,
+            chunk_size: int = None,
+            window: int = 8,
+            timeout: float = 30,
+    ) -> str:
+        """Publishes a large payload as a stream of ordered chunks, to be reassembled by a
+        streaming listener. See `navi.stream`.
+
+        The source is read one chunk at a time, and chunks are published with publisher confirms,
+        `window` chunks at a time, so at most a window of chunks is held in memory. Chunks larger
+        than the compression threshold are compressed. Background publishing doesn't apply.
+
+        Args:
+            source: A binary file object, or an iterable of bytes or str chunks.
+            content_type: The content type of the whole payload, passed to the listener's callback
+                in the `stream_content_type` header. Optional.
+            chunk_size: The size, in bytes, of the chunks read from a file object. Defaults to the
+                `NAVI_STREAM_CHUNK_SIZE` config.
+            window: The number of chunks published before waiting for their confirmations.
+                Defaults to 8.
+            timeout: The max number of seconds to wait for a window's confirmations. Defaults to
+                30.
+
+        Returns:
+            The stream's id.
+
+        Raises:
+            NaviStreamException: When a chunk isn't confirmed by the broker. Its stream is
+                aborted, and dropped by listeners once it times out.
+        """
+        factory = get_envelope_factory()
+        stream_id = factory.message_id()
+        chunks = iter_chunks(source, chunk_size or config.NAVI_STREAM_CHUNK_SIZE)
+        outgoing: List[Tuple[str, Union[bytes, str], BasicProperties]] = []
+
+        for seq, (chunk, last) in enumerate(chunks):
+            body, content_encoding = compress(
+                chunk, self._compressor, self._compression_threshold
+            )
+            properties = factory.build(STREAM_CHUNK_CONTENT_TYPE)
+            properties.content_encoding = content_encoding
+            properties.headers[STREAM_ID_HEADER] = stream_id
+            properties.headers[STREAM_SEQ_HEADER] = seq
+            properties.headers[STREAM_LAST_HEADER] = last
 
-            if connection:
-                connection.close()
+            if content_type is not None:
+                properties.headers[STREAM_CONTENT_TYPE_HEADER] = content_type
+
+            outgoing.append((self._routing_key, body, properties))
+
+            if last or len(outgoing) >= window:
+                self._publish_chunks(stream_id, outgoing, timeout)
+                outgoing = []
+
+        self.logger.info("Exchange %s: Stream %s sent.", config.NAVI_EXCHANGE, stream_id)
+
+        return stream_id
+
+    def _publish_chunks(
+            self,
+            stream_id: str,
+            outgoing: List[Tuple[str, Union[bytes, str], BasicProperties]],
+            timeout: float,
+    ):
+        """Publishes a window of a stream's chunks, with publisher confirms.
+
+        Raises:
+            NaviStreamException: When a chunk isn't confirmed.
+        """
+        started = time.perf_counter()
+        results = publish_confirmed(
+            self._pool,
+            config.NAVI_EXCHANGE,
+            config.NAVI_EXCHANGE_TYPE,
+            outgoing,
+            timeout=timeout,
+            retries=config.NAVI_PUBLISH_RETRIES,
+            backoff=self._init_backoff(),
+            on_state=self._set_state,
+            logger=self.logger,
+        )
+        failed = [result for result in results if not result.acked]
+        record_publish(
+            config.NAVI_EXCHANGE,
+            len(results) - len(failed),
+            len(failed),
+            time.perf_counter() - started,
+        )
+
+        if failed:
+            raise NaviStreamException(
+                f"Stream {stream_id}: {len(failed)} chunks not confirmed: {failed[0].error}"
+            )
+
+    def _prepare(self, body: Union[bytes, str]) -> Tuple[Union[bytes, str], BasicProperties]:
+        """Compresses a serialized message if it's larger than the compression threshold, and
+        builds its properties.
+
+        Args:
+            body: The serialized message.
+
+        Returns:
+            The body to publish, and its BasicProperties.
+        """
+        body, content_encoding = compress(body, self._compressor, self._compression_threshold)
+        properties = self._build_message_properties(self._codec.content_type)
+        properties.content_encoding = content_encoding
+
+        return body, properties
 
     @staticmethod
-    def _build_message_properties() -> BasicProperties:  # pylint:disable = R0201
+    def _build_message_properties(content_type: str = None) -> BasicProperties:
         """Builds a headers dict with metadata about the message, adds it to a BasicProperties,
         and returns the properties object.
 
+        The process-wide NaviEnvelopeFactory is used, so the host's name isn't resolved for each
+        message.
+
+        Args:
+            content_type: The content type of the message's body. Optional.
+
         Returns:
             A BasicProperties instance with a headers dict containing message metadata.
         """
-        headers = {
-            "message_id": str(uuid4()),
-            "published_at": str(datetime.utcnow()),
-            "from_host": socket.getfqdn(),
-        }
-        message_properties = BasicProperties(headers=headers)
+        return get_envelope_factory().build(content_type)
+
+
+MAX_CACHED_PUBLISHERS = 1024
+
+_PUBLISHERS: "OrderedDict[Tuple, NaviPublisher]" = OrderedDict()
+_PUBLISHERS_LOCK = threading.Lock()
+
+
+def get_publisher(routing_key: str = None) -> NaviPublisher:
+    """Returns the process-wide NaviPublisher for `routing_key`, creating it on first use.
+
+    Publishers are cached per routing key, broker, codec, compression, publishing mode, transport
+    and scheduler directory, so calling `init_config` with different ones results in new
+    publishers.
+    Up to `MAX_CACHED_PUBLISHERS` publishers are cached, evicting the least recently used ones,
+    which only hold their settings, as connections belong to the shared pools.
+
+    Args:
+        routing_key: The routing key the publisher will publish messages with.
+
+    Returns:
+        The cached NaviPublisher instance.
+    """
+    key = (
+        routing_key,
+        config.NAVI_AMQP_HOST,
+        config.NAVI_AMQP_PORT,
+        config.NAVI_AMQP_USERNAME,
+        config.NAVI_BROKER_NODES,
+        config.NAVI_NODE_STRATEGY,
+        config.NAVI_CODEC,
+        config.NAVI_BACKGROUND_PUBLISHING,
+        config.NAVI_COMPRESSION,
+        config.NAVI_COMPRESSION_THRESHOLD,
+        config.NAVI_TRANSPORT,
+        config.NAVI_SCHEDULER_DIR,
+    )
+
+    with _PUBLISHERS_LOCK:
+        publisher = _PUBLISHERS.get(key)
 
-        return message_properties
+        if publisher is None:
+            publisher = NaviPublisher(routing_key=routing_key)
+            _PUBLISHERS[key] = publisher
+
+            while len(_PUBLISHERS) > MAX_CACHED_PUBLISHERS:
+                _PUBLISHERS.popitem(last=False)
+
+        else:
+            _PUBLISHERS.move_to_end(key)
 
+    return publisher
 
-def publish(routing_key: str = None, message: dict = None):
+
+def publish(
+        routing_key: str = None,
+        message: Any = None,
+        delay: float = None,
+        publish_at: Union[float, datetime.datetime] = None,
+) -> Optional[int]:
     """
-    Instantiates a NaviPublisher that will publish the `message` to the exchange defined by the
-    `NAVI_EXCHANGE` environment variable.
+    Publishes the `message` to the exchange defined by the `NAVI_EXCHANGE` environment variable,
+    through the process-wide NaviPublisher for `routing_key`.
 
     Args:
         routing_key: The routing key to be used by the broker to find the queues to send the message
             to. Queues that have been declared as bound to the exact routing_key will receive this
             message.
-        message: A dict containing data to be sent as a JSON string through the broker.
+        message: The data to be serialized with the configured codec and sent through the broker.
+        delay: The number of seconds to wait before publishing the message. Optional.
+        publish_at: The datetime, or UNIX timestamp, to publish the message at. Optional.
+
+    Returns:
+        The scheduled message's timer id, to cancel it with `navi.scheduler.cancel`, or None if the
+        message isn't scheduled.
+    """
+    publisher = get_publisher(routing_key)
+
+    return publisher.publish(message, delay=delay, publish_at=publish_at)
+
+
+def publish_many(routing_key: str = None, messages: Iterable[Any] = None) -> List[PublishResult]:
     """
-    publisher = NaviPublisher(routing_key=routing_key)
-    publisher.publish(message)
+    Publishes every message in `messages` to the exchange defined by the `NAVI_EXCHANGE`
+    environment variable, with publisher confirms, through the process-wide NaviPublisher for
+    `routing_key`.
+
+    Args:
+        routing_key: The routing key to be used by the broker to find the queues to send the
+            messages to.
+        messages: An iterable of messages, each one to be serialized with the configured codec and
+            sent through the broker.
+
+    Returns:
+        A list with a PublishResult for each message, in the same order as `messages`.
+    """
+    publisher = get_publisher(routing_key)
+
+    return publisher.publish_many(messages or ())
+
+
+def publish_stream(
+        routing_key: str = None, source: Source = None, content_type: str = None
+) -> str:
+    """
+    Publishes a large payload as a stream of ordered chunks to the exchange defined by the
+    `NAVI_EXCHANGE` environment variable, through the process-wide NaviPublisher for
+    `routing_key`. See `NaviPublisher.publish_stream`.
+
+    Args:
+        routing_key: The routing key to be used by the broker to find the queues to send the
+            chunks to.
+        source: A binary file object, or an iterable of bytes or str chunks.
+        content_type: The content type of the whole payload. Optional.
+
+    Returns:
+        The stream's id.
+    """
+    publisher = get_publisher(routing_key)
+
+    return publisher.publish_stream(source if source is not None else (), content_type)
@@ -0,0 +1,226 @@
+"""Navi's reconnection module.
+
+Listeners and publishers recover from broker failures on their own: listeners reconnect, and
+re-declare their exchange, queue and binding before consuming again, while publishers retry on a
+new connection. Both wait between attempts following a NaviBackoff, and report their connection
+state changes to the callbacks added with their `add_state_callback` method.
+
+Connection states:
+    connecting: Opening a connection to the broker.
+    connected: Connected to the broker.
+    blocked: Connected, but the broker blocked publishing, usually because of a resource alarm.
+    disconnected: The connection was lost. A reconnection may follow.
+    closed: The connection was closed for good.
+"""
+
+import logging
+import random
+import time
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+from pika import BasicProperties
+from pika.exceptions import AMQPError
+
+from navi.confirms import PublishResult
+from navi.pool import NaviConnectionPool
+
+T = TypeVar("T")
+
+CONNECTING = "connecting"
+CONNECTED = "connected"
+BLOCKED = "blocked"
+DISCONNECTED = "disconnected"
+CLOSED = "closed"
+STATES = (CONNECTING, CONNECTED, BLOCKED, DISCONNECTED, CLOSED)
+
+
+class NaviBackoff:
+    """A jittered exponential backoff, computing how long to wait before each reconnection attempt.
+
+    The delay before the n-th consecutive attempt is a random value between zero and
+    `initial_delay * multiplier ** n`, capped at `max_delay` ("full jitter"), so clients losing
+    their connection at once don't reconnect all at the same time.
+    """
+
+    def __init__(self, initial_delay: float = 0.5, max_delay: float = 30, multiplier: float = 2):
+        """Initializes a NaviBackoff.
+
+        Args:
+            initial_delay: The max number of seconds to wait before the first attempt. Defaults to
+                0.5.
+            max_delay: The max number of seconds to wait before any attempt. Defaults to 30.
+            multiplier: The factor the max delay grows by after each attempt. Defaults to 2.
+        """
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._multiplier = multiplier
+        self._attempts = 0
+
+    @property
+    def attempts(self) -> int:
+        """The number of consecutive attempts since the last reset."""
+        return self._attempts
+
+    def next_delay(self) -> float:
+        """Computes the number of seconds to wait before the next attempt, and counts it.
+
+        Returns:
+            The delay, in seconds.
+        """
+        exponent = min(self._attempts, 64)
+        ceiling = min(self._max_delay, self._initial_delay * self._multiplier ** exponent)
+        self._attempts += 1
+
+        return random.uniform(0, ceiling)
+
+    def reset(self):
+        """Resets the attempts count, once connected."""
+        self._attempts = 0
+
+
+def call_with_retries(
+        operation: Callable[[], T],
+        retries: int,
+        backoff: NaviBackoff,
+        on_state: Callable[[str], None] = None,
+) -> T:
+    """Calls `operation`, calling it again after the backoff's delay whenever it raises an
+    AMQPError, up to `retries` more times.
+
+    Operations using a NaviConnectionPool get a new connection on each attempt, as the pool
+    discards connections that raise AMQPErrors.
+
+    Args:
+        operation: The callable to call.
+        retries: The max number of times to call `operation` again.
+        backoff: The NaviBackoff computing the delay before each retry.
+        on_state: A callable to call with the connection state after each attempt. Optional.
+
+    Returns:
+        The value returned by `operation`.
+
+    Raises:
+        AMQPError: The last error raised by `operation`, once the retries are exhausted.
+    """
+    on_state = on_state or (lambda state: None)
+    attempt = 0
+
+    while True:
+        try:
+            result = operation()
+
+        except AMQPError as error:
+            on_state(DISCONNECTED)
+
+            if attempt >= retries:
+                raise
+
+            attempt += 1
+            delay = backoff.next_delay()
+            logging.getLogger("navi").warning(
+                "AMQP error: %s. Retrying in %.2fs (%d/%d).", error, delay, attempt, retries
+            )
+            time.sleep(delay)
+            on_state(CONNECTING)
+
+        else:
+            on_state(CONNECTED)
+
+            return result
+
+
+def publish_confirmed(
+        pool: NaviConnectionPool,
+        exchange: str,
+        exchange_type: str,
+        messages: Sequence[Tuple[str, bytes, BasicProperties]],
+        timeout: float = 30,
+        retries: int = 0,
+        backoff: NaviBackoff = None,
+        on_state: Callable[[str], None] = None,
+        logger: logging.Logger = None,
+) -> List[PublishResult]:  # pylint:disable = R0913
+    """Publishes messages with publisher confirms, through the calling thread's pooled confirm
+    channel, republishing the unconfirmed ones on a new connection if an AMQPError is raised.
+
+    Messages sent but unconfirmed when the connection was lost may have reached the broker, so
+    retried messages may be delivered twice. Nacked messages, and messages not confirmed within
+    `timeout`, are not retried.
+
+    Args:
+        pool: The NaviConnectionPool to publish through.
+        exchange: The exchange to publish the messages to.
+        exchange_type: The type of the exchange, declared if needed.
+        messages: The (routing_key, body, properties) tuples to publish.
+        timeout: The max number of seconds to wait for confirmations in each attempt. Defaults
+            to 30.
+        retries: The max number of times to retry after an AMQPError. Defaults to 0.
+        backoff: The NaviBackoff computing the delay before each retry. Defaults to a new one.
+        on_state: A callable to call with the connection state after each attempt. Optional.
+        logger: The logger to report errors to. Defaults to the "navi" logger.
+
+    Returns:
+        A list with a PublishResult for each message, in the same order as `messages`.
+    """
+    backoff = backoff or NaviBackoff()
+    on_state = on_state or (lambda state: None)
+    logger = logger or logging.getLogger("navi")
+    results: List[Optional[PublishResult]] = [None] * len(messages)
+    pending = list(range(len(messages)))
+    attempt = 0
+
+    while pending:
+        sent = 0
+        confirm_channel = None
+
+        try:
+            with pool.confirm_channel(exchange, exchange_type) as confirm_channel:
+                for index in pending:
+                    routing_key, body, properties = messages[index]
+                    results[index] = confirm_channel.publish(
+                        exchange=exchange, routing_key=routing_key, body=body, properties=properties
+                    )
+                    sent += 1
+
+                confirm_channel.wait(timeout)
+
+        except AMQPError as error:
+            on_state(DISCONNECTED)
+
+            if confirm_channel is not None:
+                confirm_channel.fail(str(error))
+
+            unconfirmed = [index for index in pending[:sent] if not results[index].acked]
+            pending = unconfirmed + pending[sent:]
+
+            if attempt >= retries:
+                logger.error(
+                    "Error while publishing. Exchange: %s; error: %s.", exchange, error
+                )
+
+                for index in pending:
+                    results[index] = PublishResult(
+                        message_id=(messages[index][2].headers or {}).get("message_id"),
+                        error=str(error),
+                    )
+
+                return results
+
+            attempt += 1
+            delay = backoff.next_delay()
+            logger.warning(
+                "Error while publishing %d messages: %s. Retrying in %.2fs (%d/%d).",
+                len(pending),
+                error,
+                delay,
+                attempt,
+                retries,
+            )
+            time.sleep(delay)
+            on_state(CONNECTING)
+
+        else:
+            on_state(CONNECTED)
+            pending = []
+
+    return results
@@ -0,0 +1,304 @@
+"""NaviRouter implementation module.
+
+A NaviRouter is a listener declaring a single queue, bound with every routing key pattern it
+routes, and dispatching each delivery in-process to the callbacks whose pattern matches its
+routing key, so a service with many handlers needs one queue and one consumer:
+
+    router = NaviRouter(queue_name="billing")
+
+    @router.route("orders.*.created")
+    def on_order_created(headers, message):
+        ...
+
+    router.route("payments.#", on_payment)
+    router.listen()
+
+Patterns follow AMQP topic exchanges: words are separated by dots, `*` matches exactly one word
+and `#` zero or more words. They're compiled into a NaviTopicTrie, whose matches are cached per
+routing key, so routing a delivery doesn't depend on the number of patterns.
+"""
+
+import logging
+import threading
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+from pika.frame import Method
+
+from navi import config
+from navi.listener import NaviListener
+
+if TYPE_CHECKING:  # pragma: no cover
+    from navi.group import NaviListenerGroup
+
+logger = logging.getLogger("navi")
+
+
+class TopicNode:
+    """A node of a NaviTopicTrie, standing for a pattern's word.
+
+    Attributes:
+        children: The nodes of the literal words following this one.
+        star: The node of a `*` following this one, if any.
+        hash: The node of a `#` following this one, if any.
+        values: The (order, value) tuples of the patterns ending at this node.
+    """
+
+    __slots__ = ("children", "star", "hash", "values")
+
+    def __init__(self):
+        self.children: Dict[str, "TopicNode"] = {}
+        self.star: Optional["TopicNode"] = None
+        self.hash: Optional["TopicNode"] = None
+        self.values: List[Tuple[int, Any]] = []
+
+    def child(self, word: str) -> "TopicNode":
+        """Returns the node of `word` following this one, creating it if needed."""
+        if word == "*":
+            self.star = self.star or TopicNode()
+
+            return self.star
+
+        if word == "#":
+            self.hash = self.hash or TopicNode()
+
+            return self.hash
+
+        return self.children.setdefault(word, TopicNode())
+
+
+class NaviTopicTrie:
+    """A trie of topic patterns, matching routing keys like an AMQP topic exchange. Thread-safe.
+
+    Values are returned in the order their patterns were added, each one once, even if several
+    of its patterns match.
+    """
+
+    def __init__(self, cache_size: int = 10000):
+        """Initializes a NaviTopicTrie.
+
+        Args:
+            cache_size: The max number of routing keys whose matches are cached. Defaults to 10000.
+        """
+        self._root = TopicNode()
+        self._patterns: List[str] = []
+        self._count = 0
+        self._cache: Dict[str, Tuple[Any, ...]] = {}
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def patterns(self) -> List[str]:
+        """The distinct patterns added, in the order they were first added."""
+        return list(self._patterns)
+
+    def add(self, pattern: str, value: Any):
+        """Adds a pattern, whose matching routing keys should return `value`.
+
+        Args:
+            pattern: The pattern, with dot separated words, `*` and `#` included.
+            value: The value to return for matching routing keys.
+        """
+        with self._lock:
+            node = self._root
+
+            for word in pattern.split("."):
+                node = node.child(word)
+
+            node.values.append((self._count, value))
+            self._count += 1
+
+            if pattern not in self._patterns:
+                self._patterns.append(pattern)
+
+            self._cache = {}
+
+    def match(self, routing_key: str) -> Tuple[Any, ...]:
+        """Returns the values whose pattern matches a routing key.
+
+        Args:
+            routing_key: The routing key, with dot separated words.
+
+        Returns:
+            The matching values, in the order their patterns were added.
+        """
+        values = self._cache.get(routing_key)
+
+        if values is not None:
+            return values
+
+        with self._lock:
+            matches: Dict[int, Any] = {}
+            _collect(self._root, routing_key.split("."), 0, matches)
+            ordered = [value for _, value in sorted(matches.items())]
+            values = tuple({id(value): value for value in ordered}.values())
+
+            if len(self._cache) >= self._cache_size:
+                self._cache = {}
+
+            self._cache[routing_key] = values
+
+        return values
+
+
+def _collect(node: TopicNode, words: List[str], index: int, matches: Dict[int, Any]):
+    """Adds the values of the patterns below `node` matching `words[index:]` to `matches`."""
+    if node.hash is not None:
+        for start in range(index, len(words) + 1):
+            _collect(node.hash, words, start, matches)
+
+    if index == len(words):
+        matches.update(node.values)
+
+        return
+
+    child = node.children.get(words[index])
+
+    if child is not None:
+        _collect(child, words, index + 1, matches)
+
+    if node.star is not None:
+        _collect(node.star, words, index + 1, matches)
+
+
+def dispatch(callbacks: Tuple[Callable, ...], *arguments: Any):
+    """Calls every callback with `arguments`, in order, even if some of them raise.
+
+    Raises:
+        Exception: The first error raised by a callback, once they were all called.
+    """
+    first_error = None
+
+    for callback in callbacks:
+        try:
+            callback(*arguments)
+
+        except Exception as error:  # pylint:disable = W0703
+            logger.error("Error in routed callback %r: %s", callback, str(error))
+            first_error = first_error or error
+
+    if first_error is not None:
+        raise first_error
+
+
+class NaviRouter(NaviListener):
+    """A listener consuming a single queue, bound with many routing key patterns, and dispatching
+    each delivery in-process to the callbacks whose pattern matches its routing key.
+
+    Every matching callback is called, in the order they were routed. If any of them raises, the
+    delivery is failed once they were all called, so, with `requeue_failed`, it's redelivered to
+    all of them. Deliveries no pattern matches are acked and skipped. Callbacks routed
+    while the router is listening are bound on its channel right away.
+
+    With an executor, the callbacks of a delivery run together, as a single task, so the executor
+    must be a ThreadPoolExecutor, or the callbacks picklable for a ProcessPoolExecutor.
+    """
+
+    _trie: NaviTopicTrie
+
+    def __init__(
+            self,
+            queue_name: str = None,
+            routes: Mapping[str, Union[Callable, List[Callable]]] = None,
+            **kwargs,
+    ):
+        """Initializes a NaviRouter.
+
+        Args:
+            queue_name: The name of the queue to listen at.
+            routes: The callback, or callbacks, to route each pattern to. Optional, as callbacks
+                can be routed with `route` later.
+            **kwargs: Other NaviListener arguments, but `routing_key` and `callback`.
+        """
+        # The routing key and callback are unused, as the queue is bound with the routed patterns
+        # and deliveries are dispatched by `_callback_for`.
+        super().__init__(queue_name=queue_name, routing_key="#", callback=dispatch, **kwargs)
+
+        self._trie = NaviTopicTrie()
+
+        for pattern, callbacks in (routes or {}).items():
+            for callback in callbacks if isinstance(callbacks, (list, tuple)) else [callbacks]:
+                self.route(pattern, callback)
+
+    @property
+    def patterns(self) -> List[str]:
+        """The routing key patterns the router's queue is bound with."""
+        return self._trie.patterns
+
+    def route(self, pattern: str, callback: Callable = None):
+        """Routes the deliveries whose routing key matches `pattern` to `callback`. Used as a
+        decorator when `callback` is omitted.
+
+        Args:
+            pattern: The routing key pattern, with dot separated words, `*` and `#` included.
+            callback: The callable to call, like a NaviListener's callback.
+
+        Returns:
+            The callback, or the decorator routing it.
+        """
+        if callback is None:
+            return lambda function: self.route(pattern, function)
+
+        new_pattern = pattern not in self._trie.patterns
+        self._trie.add(pattern, callback)
+        connection = self._connection
+
+        if new_pattern and connection is not None:
+            # The connection's ioloop is the router's own, or its group's.
+            connection.ioloop.add_callback_threadsafe(lambda: self._bind_pattern(pattern))
+
+        return callback
+
+    def _bind_queue(self):
+        """Binds the router's queue to the exchange with every routed pattern."""
+        for pattern in self._trie.patterns:
+            self._bind_pattern(pattern)
+
+    def _bind_pattern(self, pattern: str):
+        """Binds the router's queue to the exchange with `pattern`, if its channel is open."""
+        channel = getattr(self, "_channel", None)
+
+        if channel is not None and channel.is_open:
+            channel.queue_bind(
+                exchange=config.NAVI_EXCHANGE, queue=self._queue_name, routing_key=pattern
+            )
+
+    def _callback_for(self, method: Method) -> Optional[Callable]:
+        callbacks = self._trie.match(method.routing_key)
+
+        if not callbacks:
+            return None
+
+        return partial(dispatch, callbacks)
+
+
+def listen_router(
+        queue_name: str = None,
+        routes: Mapping[str, Union[Callable, List[Callable]]] = None,
+        group: "NaviListenerGroup" = None,
+        **kwargs,
+) -> NaviRouter:
+    """Instantiates a threaded NaviRouter on a queue, bound with every pattern of `routes`, and
+    starts it, or adds it to `group`.
+
+    Args:
+        queue_name: The name of the queue to listen at.
+        routes: The callback, or callbacks, to route each pattern to.
+        group: The NaviListenerGroup to add the router to, instead of starting its own thread.
+            Optional.
+        **kwargs: Other NaviListener arguments, but `routing_key` and `callback`.
+
+    Returns:
+        The created NaviRouter.
+    """
+    router = NaviRouter(queue_name=queue_name, routes=routes, **kwargs)
+
+    if group is not None:
+        return group.add(router)
+
+    router.listen()
+
+    return router
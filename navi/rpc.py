@@ -0,0 +1,669 @@
+"""Navi's RPC module.
+
+A NaviRpcClient publishes requests to the exchange, like a NaviPublisher, and waits for their
+replies, routed back to it through RabbitMQ's direct reply-to: requests are published with
+`reply_to` set to the `amq.rabbitmq.reply-to` pseudo-queue and a correlation id, and replies are
+consumed, without acks, from that pseudo-queue, so no reply queue is declared per client nor per
+call. Every client of a process connecting to the same broker shares a single NaviReplyConsumer,
+whose long-lived consumer and channel multiplex all the calls in flight, resolving each call's
+future when the reply with its correlation id comes back, or failing it once its timeout expires:
+
+    client = NaviRpcClient(routing_key="orders.get")
+    order = client.call({"id": 42}, timeout=5)
+    order = await client.call_async({"id": 42})
+
+A NaviRpcServer is a listener whose callback's return value is published back to the caller, with
+the request's correlation id. If the callback raises, the caller's call raises a NaviRpcException
+with the error instead:
+
+    serve(queue_name="orders", routing_key="orders.get", callback=get_order)
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from concurrent import futures
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union
+
+from pika import BasicProperties, BlockingConnection, ConnectionParameters, SelectConnection
+from pika.channel import Channel
+from pika.exceptions import AMQPError
+from pika.frame import Method
+
+from navi import config
+from navi.base import NaviBase
+from navi.codecs import NaviCodec, get_codec
+from navi.compression import decode_body
+from navi.delivery import NaviDelivery
+from navi.envelope import get_envelope_factory
+from navi.exceptions import NaviRpcException
+from navi.listener import NaviListener
+from navi.pool import pool_key
+from navi.reconnect import NaviBackoff
+from navi.transport import DIRECT_REPLY_TO, NaviTransport, get_transport
+
+if TYPE_CHECKING:  # pragma: no cover
+    from navi.group import NaviListenerGroup
+
+ERROR_HEADER = "rpc_error"
+
+
+def _resolve(future: futures.Future, result: Any = None, error: Exception = None):
+    """Sets `future`'s result, or exception, unless it was cancelled."""
+    if not future.set_running_or_notify_cancel():
+        return
+
+    if error is not None:
+        future.set_exception(error)
+
+    else:
+        future.set_result(result)
+
+
+class NaviReplyConsumer:
+    """A long-lived consumer of the direct reply-to pseudo-queue, on its own connection and ioloop
+    thread, through which every NaviRpcClient of the process connecting to the same broker
+    publishes its requests, and gets their replies.
+
+    Direct reply-to routes replies to the channel requests were published on, so requests are
+    published on the consumer's channel, from its ioloop thread. Requests made before the consumer
+    is ready are published once it is. When the channel or the connection is lost, the replies of
+    the calls in flight can't be routed anymore, so their futures fail with the error, and the
+    consumer reconnects after a jittered exponential backoff.
+    """
+
+    def __init__(
+            self,
+            connection_parameters: ConnectionParameters,
+            transport: NaviTransport = None,
+            backoff: NaviBackoff = None,
+    ):
+        """Initializes a NaviReplyConsumer. It's not connected until `start` is called.
+
+        Args:
+            connection_parameters: The ConnectionParameters instance to be used to connect.
+            transport: The transport to connect through. Defaults to the configured transport.
+            backoff: The NaviBackoff computing the delay before each reconnection. Defaults to one
+                with the reconnection delays set by `init_config`.
+        """
+        self._connection_parameters = connection_parameters
+        self._transport = get_transport(transport)
+        self._backoff = backoff or NaviBackoff(
+            initial_delay=config.NAVI_RECONNECT_INITIAL_DELAY,
+            max_delay=config.NAVI_RECONNECT_MAX_DELAY,
+        )
+        self._pending: Dict[str, Tuple[futures.Future, NaviCodec]] = {}
+        self._lock = threading.Lock()
+        self._unsent: List[Tuple[str, str, str, bytes, BasicProperties]] = []
+        self._timers: Dict[str, Any] = {}
+        self._connection: Optional[SelectConnection] = None
+        self._channel: Optional[Channel] = None
+        self._consuming = False
+        self._ioloop = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger("navi")
+
+    def __len__(self) -> int:
+        """The number of calls waiting for their reply."""
+        return len(self._pending)
+
+    def start(self):
+        """Starts the consumer's ioloop thread."""
+        self._ioloop = self._transport.create_ioloop()
+        self._thread = threading.Thread(target=self._run, name="navi-rpc", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None) -> bool:
+        """Stops the consumer: its connection is closed, and the calls in flight fail.
+
+        Args:
+            timeout: The max number of seconds to wait for the consumer's thread to end. Waits
+                forever if None.
+
+        Returns:
+            A boolean value indicating if the consumer's thread ended on time.
+        """
+        self._stop_event.set()
+
+        if self._ioloop is not None:
+            self._ioloop.add_callback_threadsafe(self._close)
+
+        if self._thread is None or self._thread is threading.current_thread():
+            return True
+
+        self._thread.join(timeout)
+
+        return not self._thread.is_alive()
+
+    def request(
+            self,
+            exchange: str,
+            routing_key: str,
+            body: bytes,
+            properties: BasicProperties,
+            codec: NaviCodec,
+            timeout: float,
+    ) -> futures.Future:
+        """Publishes a request, whose reply is decoded with `codec`.
+
+        Args:
+            exchange: The exchange to publish the request to.
+            routing_key: The routing key to publish the request with.
+            body: The serialized request.
+            properties: The request's BasicProperties, with its correlation id set. Its reply to is
+                set to the direct reply-to pseudo-queue.
+            codec: The codec to decode replies without a known content type with.
+            timeout: The max number of seconds to wait for the reply.
+
+        Returns:
+            A Future resolved with the decoded reply, or failed with a NaviRpcException if the
+            server's callback raised, a TimeoutError once `timeout` expires, or an AMQPError if
+            the consumer's channel is lost first.
+        """
+        future = futures.Future()
+        correlation_id = properties.correlation_id
+        properties.reply_to = DIRECT_REPLY_TO
+
+        with self._lock:
+            self._pending[correlation_id] = (future, codec)
+
+        if self._stop_event.is_set():
+            with self._lock:
+                pending = self._pending.pop(correlation_id, None)
+
+            if pending is not None:
+                _resolve(future, error=NaviRpcException("RPC reply consumer stopped."))
+
+            return future
+
+        self._ioloop.add_callback_threadsafe(
+            partial(self._send, correlation_id, exchange, routing_key, body, properties, timeout)
+        )
+
+        return future
+
+    def _run(self):
+        """Connects and consumes replies, reconnecting whenever the connection is lost, until the
+        consumer is stopped."""
+        while not self._stop_event.is_set():
+            try:
+                self._connection = self._transport.select_connection(
+                    self._connection_parameters,
+                    on_open_callback=self._on_connected,
+                    on_open_error_callback=self._on_connection_closed,
+                    on_close_callback=self._on_connection_closed,
+                    ioloop=self._ioloop,
+                )
+                self._ioloop.start()
+
+            except AMQPError as error:
+                self.logger.error("Error while consuming RPC replies: %s.", error)
+                self._fail_pending(error)
+
+            if self._stop_event.wait(self._backoff.next_delay()):
+                break
+
+        self._fail_pending(NaviRpcException("RPC reply consumer stopped."))
+
+    def _close(self):
+        """Closes the consumer's connection, or stops its ioloop if there's none. Runs on the
+        ioloop thread."""
+        connection = self._connection
+
+        if connection is None or connection.is_closing or connection.is_closed:
+            self._ioloop.stop()
+
+            return
+
+        connection.close()
+
+    def _on_connected(self, connection: SelectConnection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_channel_open(self, channel: Channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.exchange_declare(
+            exchange=config.NAVI_EXCHANGE, exchange_type=config.NAVI_EXCHANGE_TYPE, durable=True
+        )
+        channel.basic_consume(
+            DIRECT_REPLY_TO, self._on_reply, auto_ack=True, callback=self._on_consume_ok
+        )
+
+    def _on_consume_ok(self, method: Method):  # pylint:disable = unused-argument
+        """Called once replies are consumed. Publishes the requests made until then."""
+        self._consuming = True
+        self._backoff.reset()
+        unsent, self._unsent = self._unsent, []
+
+        for correlation_id, exchange, routing_key, body, properties in unsent:
+            self._send(correlation_id, exchange, routing_key, body, properties)
+
+    def _send(
+            self,
+            correlation_id: str,
+            exchange: str,
+            routing_key: str,
+            body: bytes,
+            properties: BasicProperties,
+            timeout: float = None,
+    ):  # pylint:disable = R0913
+        """Publishes a request on the consumer's channel, or keeps it until the consumer is ready,
+        and starts its timeout, if given. Runs on the ioloop thread."""
+        if correlation_id not in self._pending:
+            return
+
+        if timeout is not None:
+            self._timers[correlation_id] = self._ioloop.call_later(
+                timeout, partial(self._expire, correlation_id, timeout)
+            )
+
+        if not self._consuming:
+            self._unsent.append((correlation_id, exchange, routing_key, body, properties))
+
+            return
+
+        try:
+            self._channel.basic_publish(
+                exchange=exchange, routing_key=routing_key, body=body, properties=properties
+            )
+
+        except AMQPError as error:
+            self._settle(correlation_id, error=error)
+
+    def _expire(self, correlation_id: str, timeout: float):
+        """Fails a call whose reply didn't come back on time. Runs on the ioloop thread."""
+        self._timers.pop(correlation_id, None)
+        self._settle(correlation_id, error=futures.TimeoutError(f"No RPC reply in {timeout}s."))
+
+    def _on_reply(
+            self, channel: Channel, method: Method, properties: BasicProperties, body: bytes
+    ):  # pylint:disable = unused-argument
+        """Resolves the future of the call a reply is for. Late replies, whose call timed out,
+        are dropped."""
+        with self._lock:
+            pending = self._pending.get(properties.correlation_id)
+
+        if pending is None:
+            self.logger.debug("Dropping late RPC reply %s.", properties.correlation_id)
+
+            return
+
+        error = (properties.headers or {}).get(ERROR_HEADER)
+
+        if error is not None:
+            self._settle(properties.correlation_id, error=NaviRpcException(error))
+
+            return
+
+        try:
+            result = decode_body(properties, body, pending[1])
+
+        except (TypeError, ValueError) as decode_error:
+            self._settle(properties.correlation_id, error=decode_error)
+
+            return
+
+        self._settle(properties.correlation_id, result)
+
+    def _settle(self, correlation_id: str, result: Any = None, error: Exception = None):
+        """Forgets a call, and resolves its future. Runs on the ioloop thread."""
+        with self._lock:
+            pending = self._pending.pop(correlation_id, None)
+
+        timer = self._timers.pop(correlation_id, None)
+
+        if timer is not None:
+            self._ioloop.remove_timeout(timer)
+
+        if pending is not None:
+            _resolve(pending[0], result, error)
+
+    def _on_channel_closed(self, channel: Channel, reason: AMQPError):
+        """Fails the calls in flight, whose replies can't be routed anymore, and closes the
+        connection, to reconnect."""
+        if channel is not self._channel:
+            return
+
+        self._consuming = False
+
+        if not self._stop_event.is_set():
+            self.logger.warning("RPC reply consumer lost its channel: %s.", reason)
+
+        self._fail_pending(reason)
+        connection = self._connection
+
+        if connection is not None and connection.is_open:
+            connection.close()
+
+    def _on_connection_closed(self, connection: SelectConnection, reason: Any):
+        """Fails the calls in flight, and stops the ioloop, so `_run` can reconnect."""
+        self._consuming = False
+
+        if not self._stop_event.is_set():
+            self.logger.warning("RPC reply consumer lost its connection: %s.", reason)
+
+        self._fail_pending(reason if isinstance(reason, Exception) else AMQPError(reason))
+        connection.ioloop.stop()
+
+    def _fail_pending(self, error: Exception):
+        """Fails every call in flight with `error`, and cancels their timeouts. Runs on the ioloop
+        thread."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        timers, self._timers = self._timers, {}
+
+        for timer in timers.values():
+            self._ioloop.remove_timeout(timer)
+
+        self._unsent = []
+
+        for future, _ in pending.values():
+            _resolve(future, error=error)
+
+
+class NaviRpcClient(NaviBase):
+    """A class that calls remote procedures served by NaviRpcServers: each call publishes a
+    request to the exchange, with the client's routing key, and waits for its reply.
+
+    Requests are serialized with the client's codec, and replies deserialized with the codec
+    matching their content type. Every client of the process connecting to the same broker shares
+    a single NaviReplyConsumer, so calls in flight are multiplexed over one channel. Requests are
+    published with an expiration matching their timeout, so the broker drops those no server
+    picked up before their caller gave up.
+    """
+
+    _codec: NaviCodec
+    _timeout: float
+    _consumer: NaviReplyConsumer
+
+    def __init__(
+            self,
+            routing_key: str = None,
+            codec: Union[str, NaviCodec] = None,
+            timeout: float = None,
+    ):
+        """Initializes a NaviRpcClient.
+
+        Args:
+            routing_key: The routing key to publish requests with.
+            codec: The name of the codec, or the codec, to serialize requests with. Defaults to the
+                `NAVI_CODEC` config.
+            timeout: The default max number of seconds to wait for a reply. Defaults to the
+                `NAVI_RPC_TIMEOUT` config.
+
+        Raises:
+            NaviCodecException: When `codec` is not a registered codec's name.
+        """
+        super().__init__(routing_key=routing_key)
+
+        self._codec = get_codec(codec)
+        self._timeout = config.NAVI_RPC_TIMEOUT if timeout is None else timeout
+        self._consumer = get_reply_consumer(self._connection_parameters, self._transport)
+
+    def _init_connection(self, connection_parameters: ConnectionParameters) -> BlockingConnection:
+        """Initializes a BlockingConnection to the client's broker. Calls don't use it, as
+        requests are published on the shared NaviReplyConsumer's channel, for their replies to be
+        routed back to it.
+
+        Args:
+            connection_parameters: A set up ConnectionParameters instance.
+
+        Returns:
+            The set up BlockingConnection instance.
+        """
+        return self._transport.blocking_connection(connection_parameters)
+
+    def call_future(self, message: Any, timeout: float = None) -> futures.Future:
+        """Publishes a request, without waiting for its reply.
+
+        Args:
+            message: The request, to be serialized with the client's codec.
+            timeout: The max number of seconds to wait for the reply. Defaults to the client's.
+
+        Returns:
+            A Future resolved with the deserialized reply. See `NaviReplyConsumer.request`.
+
+        Raises:
+            TypeError, ValueError: When the request can't be serialized.
+        """
+        timeout = self._timeout if timeout is None else timeout
+        body = self._codec.encode(message)
+        properties = get_envelope_factory().build(self._codec.content_type)
+        properties.correlation_id = properties.headers["message_id"]
+        properties.expiration = str(max(int(timeout * 1000), 1))
+
+        return self._consumer.request(
+            config.NAVI_EXCHANGE, self._routing_key, body, properties, self._codec, timeout
+        )
+
+    def call(self, message: Any, timeout: float = None) -> Any:
+        """Calls the remote procedure, and waits for its reply.
+
+        Args:
+            message: The request, to be serialized with the client's codec.
+            timeout: The max number of seconds to wait for the reply. Defaults to the client's.
+
+        Returns:
+            The deserialized reply.
+
+        Raises:
+            NaviRpcException: When the server's callback raised.
+            TimeoutError: When no reply came back on time.
+            AMQPError: When the reply consumer's channel was lost before the reply came back.
+        """
+        return self.call_future(message, timeout).result()
+
+    async def call_async(self, message: Any, timeout: float = None) -> Any:
+        """Calls the remote procedure from asyncio code, and awaits its reply, without blocking
+        the event loop. See `call`."""
+        return await asyncio.wrap_future(self.call_future(message, timeout))
+
+
+class NaviRpcServer(NaviListener):
+    """A listener replying to the requests of NaviRpcClients with its callback's return value,
+    serialized with its codec, and published through the default exchange to the request's reply
+    to, with its correlation id. If the callback raises, the error is replied instead, and the
+    request is failed like any listener's delivery. Requests without a reply to are handled
+    without replying.
+
+    The callback is called like a NaviListener's, with a single NaviDelivery in lazy delivery mode.
+    With an executor, it must be a ThreadPoolExecutor, as requests are handled lazily.
+    """
+
+    _reply_lazily: bool
+
+    def __init__(
+            self,
+            queue_name: str = None,
+            routing_key: str = None,
+            callback: Callable = None,
+            lazy_delivery: bool = False,
+            **kwargs,
+    ):
+        """Initializes a NaviRpcServer.
+
+        Args:
+            queue_name: The name of the queue to listen at.
+            routing_key: The routing key to bind the queue with.
+            callback: The callable to be executed whenever a request is received, returning the
+                reply.
+            lazy_delivery: Whether `callback` should be called with a single NaviDelivery argument.
+                Defaults to False.
+            **kwargs: Other NaviListener arguments.
+        """
+        super().__init__(
+            queue_name=queue_name,
+            routing_key=routing_key,
+            callback=callback,
+            lazy_delivery=True,
+            **kwargs,
+        )
+
+        self._reply_lazily = lazy_delivery
+
+    def _callback_for(self, method: Method) -> Optional[Callable]:
+        return self._respond
+
+    def _respond(self, delivery: NaviDelivery):
+        """Calls the user's callback with a request, and replies with its return value or error."""
+        reply_to = delivery.properties.reply_to
+
+        try:
+            if self._reply_lazily:
+                result = self._callback(delivery)
+
+            else:
+                result = self._callback(dict(delivery.headers), delivery.payload)
+
+            body = self._codec.encode(result) if reply_to else b""
+
+        except Exception as error:
+            if reply_to:
+                self._reply(delivery.properties, b"", f"{type(error).__name__}: {error}")
+
+            raise
+
+        if reply_to:
+            self._reply(delivery.properties, body)
+
+    def _reply(self, request: BasicProperties, body: bytes, error: str = None):
+        """Publishes a reply, from the ioloop thread, on the server's channel."""
+        properties = get_envelope_factory().build(self._codec.content_type)
+        properties.correlation_id = request.correlation_id
+
+        if error is not None:
+            properties.headers[ERROR_HEADER] = error
+
+        connection = self._connection
+
+        if connection is None:
+            self.logger.warning("Dropping RPC reply %s: not connected.", request.correlation_id)
+
+            return
+
+        connection.ioloop.add_callback_threadsafe(
+            partial(self._publish_reply, request.reply_to, body, properties)
+        )
+
+    def _publish_reply(self, reply_to: str, body: bytes, properties: BasicProperties):
+        channel = getattr(self, "_channel", None)
+
+        if channel is None or not channel.is_open:
+            self.logger.warning(
+                "Dropping RPC reply %s: channel closed.", properties.correlation_id
+            )
+
+            return
+
+        channel.basic_publish(exchange="", routing_key=reply_to, body=body, properties=properties)
+
+
+_CONSUMERS: Dict[Tuple, NaviReplyConsumer] = {}
+_CONSUMERS_LOCK = threading.Lock()
+
+
+def get_reply_consumer(
+        connection_parameters: ConnectionParameters, transport: NaviTransport = None
+) -> NaviReplyConsumer:
+    """Returns the process-wide NaviReplyConsumer for the broker `connection_parameters` point to,
+    creating and starting it on first use.
+
+    Args:
+        connection_parameters: The ConnectionParameters instance to be used to connect.
+        transport: The transport to connect through. Defaults to the configured transport.
+
+    Returns:
+        The shared NaviReplyConsumer instance.
+    """
+    transport = get_transport(transport)
+    key = (transport.name, *pool_key(connection_parameters))
+
+    with _CONSUMERS_LOCK:
+        consumer = _CONSUMERS.get(key)
+
+        if consumer is None:
+            consumer = _CONSUMERS[key] = NaviReplyConsumer(connection_parameters, transport)
+            consumer.start()
+
+    return consumer
+
+
+def call(routing_key: str = None, message: Any = None, timeout: float = None) -> Any:
+    """Calls the remote procedure served with `routing_key`, and waits for its reply. See
+    `NaviRpcClient.call`."""
+    return NaviRpcClient(routing_key=routing_key).call(message, timeout)
+
+
+async def call_async(routing_key: str = None, message: Any = None, timeout: float = None) -> Any:
+    """Calls the remote procedure served with `routing_key` from asyncio code, and awaits its
+    reply. See `NaviRpcClient.call`."""
+    return await NaviRpcClient(routing_key=routing_key).call_async(message, timeout)
+
+
+def serve(
+        queue_name: str = None,
+        routing_key: str = None,
+        callback: Callable = None,
+        group: "NaviListenerGroup" = None,
+        **kwargs,
+) -> NaviRpcServer:
+    """Instantiates a threaded NaviRpcServer replying to the requests published with
+    `routing_key`, and starts it, or adds it to `group`.
+
+    Args:
+        queue_name: The name of the queue to listen at.
+        routing_key: The routing key to bind the queue with.
+        callback: The callable to be executed whenever a request is received, returning the reply.
+        group: The NaviListenerGroup to add the server to, instead of starting its own thread.
+            Optional.
+        **kwargs: Other NaviListener arguments.
+
+    Returns:
+        The created NaviRpcServer.
+    """
+    server = NaviRpcServer(
+        queue_name=queue_name, routing_key=routing_key, callback=callback, **kwargs
+    )
+
+    if group is not None:
+        return group.add(server)
+
+    server.listen()
+
+    return server
+
+
+def close_reply_consumers(timeout: float = 5):
+    """Stops every process-wide NaviReplyConsumer, failing the calls in flight. Registered to be
+    called at interpreter exit.
+
+    Args:
+        timeout: The max number of seconds to wait for each consumer to stop. Defaults to 5.
+    """
+    with _CONSUMERS_LOCK:
+        consumers = list(_CONSUMERS.values())
+        _CONSUMERS.clear()
+
+    for consumer in consumers:
+        consumer.stop(timeout)
+
+
+atexit.register(close_reply_consumers)
+
+
+def _forget_reply_consumers():
+    """Makes a forked child process start its own reply consumers, the parent's threads not
+    running in the child."""
+    global _CONSUMERS_LOCK  # pylint:disable = global-statement
+    _CONSUMERS_LOCK = threading.Lock()
+    _CONSUMERS.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_reply_consumers)
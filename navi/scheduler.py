@@ -0,0 +1,704 @@
+"""Navi's scheduler module.
+
+Messages published with a `delay`, or a `publish_at` time, are serialized right away, and kept
+by the NaviScheduler of the broker they're published to until they're due. A scheduler keeps its
+pending messages in a NaviTimerWheel: a hierarchical timing wheel, whose scheduling, cancelling
+and expiry cost O(1), however many messages are pending. A single scheduler thread advances the
+wheel every tick, and publishes the due messages in batches, with publisher confirms, those the
+broker doesn't confirm being stored in the outbox, if it's enabled.
+
+When `init_config` is called with a `scheduler_dir`, pending messages are also stored in a SQLite
+file of that directory, per broker, and scheduled again by the next process publishing to the
+same broker, so they survive restarts. Messages due while no process was running are published
+right away. Each file is locked by the process using it, so processes sharing a directory, such as
+prefork workers, each get their own slot: `<broker>.sqlite`, then `<broker>.1.sqlite`, and so on.
+"""
+
+import atexit
+import datetime
+import heapq
+import itertools
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from pika import BasicProperties
+
+from navi import config
+from navi.exceptions import NaviSchedulerException
+from navi.metrics import NaviCounter, NaviGauge, NaviMetric, get_registry
+from navi.outbox import OutboxRecord, store_unconfirmed
+from navi.pool import NaviConnectionPool
+from navi.reconnect import NaviBackoff, publish_confirmed
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+class NaviTimerWheel:
+    """A hierarchical timing wheel of items due at a given monotonic time. Not thread-safe.
+
+    Time is split into ticks. Level 0 has a slot per tick, and each following level a slot per
+    full turn of the previous one, so `levels` levels of `2 ** slot_bits` slots cover
+    `2 ** (slot_bits * levels)` ticks, items due later waiting in an overflow heap. When a level's
+    slot is reached, its items are cascaded down to the lower levels, until they expire from level
+    0. Items are never returned before they're due, and at most a tick late.
+    """
+
+    def __init__(
+            self, tick: float = 0.05, slot_bits: int = 6, levels: int = 4, start: float = None
+    ):
+        """Initializes a NaviTimerWheel.
+
+        Args:
+            tick: The wheel's resolution, in seconds. Defaults to 0.05.
+            slot_bits: The base 2 logarithm of the number of slots of each level. Defaults to 6.
+            levels: The number of levels. Defaults to 4, covering 2 ** 24 ticks, about 9.7 days
+                with the default tick.
+            start: The monotonic time of the wheel's first tick. Defaults to now.
+        """
+        self.tick = tick
+        self._bits = slot_bits
+        self._mask = (1 << slot_bits) - 1
+        self._levels = [[[] for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self._span = 1 << (slot_bits * levels)
+        self._overflow: List[Tuple[int, int, list]] = []
+        self._ready: List[list] = []
+        self._start = time.monotonic() if start is None else start
+        self._current = 0
+        self._timers: Dict[int, list] = {}
+        self._ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def add(self, due: float, item: Any) -> int:
+        """Adds an item due at the monotonic time `due`.
+
+        Args:
+            due: The monotonic time the item is due at.
+            item: The item to return once it's due.
+
+        Returns:
+            The item's timer id, to cancel it with.
+        """
+        timer_id = next(self._ids)
+        entry = [timer_id, math.ceil((due - self._start) / self.tick), item]
+        self._timers[timer_id] = entry
+        self._place(entry)
+
+        return timer_id
+
+    def cancel(self, timer_id: int) -> Optional[Any]:
+        """Cancels a pending item.
+
+        Args:
+            timer_id: The item's timer id, as returned by `add`.
+
+        Returns:
+            The cancelled item, or None if it's not pending anymore.
+        """
+        entry = self._timers.pop(timer_id, None)
+
+        return None if entry is None else entry[2]
+
+    def advance(self, now: float) -> List[Any]:
+        """Advances the wheel to the monotonic time `now`, returning the items due since.
+
+        Args:
+            now: The current monotonic time.
+
+        Returns:
+            The due items, in the order they were due.
+        """
+        target = int((now - self._start) / self.tick)
+        expired, self._ready = self._ready, []
+
+        if not self._timers:
+            self._clear()
+            self._current = max(self._current, target)
+
+        while self._current < target:
+            expired.extend(self._step())
+
+        expired.extend(self._ready)
+        self._ready = []
+
+        return [entry[2] for entry in expired if self._timers.pop(entry[0], None) is not None]
+
+    def _place(self, entry: list):
+        """Puts an entry in the slot of the lowest level covering its due tick."""
+        due_tick = entry[1]
+        delta = due_tick - self._current
+
+        if delta <= 0:
+            self._ready.append(entry)
+
+            return
+
+        for level, slots in enumerate(self._levels):
+            if delta < 1 << (self._bits * (level + 1)):
+                slots[(due_tick >> (self._bits * level)) & self._mask].append(entry)
+
+                return
+
+        heapq.heappush(self._overflow, (due_tick, entry[0], entry))
+
+    def _step(self) -> List[list]:
+        """Moves to the next tick, cascading the higher levels' slots reached, and returns the
+        entries of the level 0 slot."""
+        self._current += 1
+        current = self._current
+
+        if current % self._span == 0:
+            while self._overflow and self._overflow[0][0] - current < self._span:
+                self._place(heapq.heappop(self._overflow)[2])
+
+        for level in range(len(self._levels) - 1, 0, -1):
+            if current & ((1 << (self._bits * level)) - 1) == 0:
+                slots = self._levels[level]
+                index = (current >> (self._bits * level)) & self._mask
+                entries, slots[index] = slots[index], []
+
+                for entry in entries:
+                    if entry[0] in self._timers:
+                        self._place(entry)
+
+        slots = self._levels[0]
+        entries, slots[current & self._mask] = slots[current & self._mask], []
+
+        return entries
+
+    def _clear(self):
+        """Drops the cancelled entries left in the slots, once no timer is pending."""
+        for slots in self._levels:
+            for index, entries in enumerate(slots):
+                if entries:
+                    slots[index] = []
+
+        self._overflow = []
+
+
+class NaviTimerStore:
+    """The SQLite file pending scheduled messages are stored in, to survive restarts. Thread-safe.
+
+    Messages are stored as outbox records, with their due time as a UNIX timestamp. The store holds
+    an exclusive lock on the `<path>.lock` file until it's closed, so a single process restores
+    and publishes its messages. Locking is skipped where `fcntl` isn't available.
+    """
+
+    def __init__(self, path: str):
+        """Initializes a NaviTimerStore, creating its file if needed.
+
+        Args:
+            path: The path of the SQLite file.
+
+        Raises:
+            NaviSchedulerException: When another process uses the file.
+        """
+        self._lock_file = _lock_store(path)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS navi_scheduled "
+            "(id INTEGER PRIMARY KEY, due REAL NOT NULL, record BLOB NOT NULL)"
+        )
+
+    def add(self, due: float, record: OutboxRecord) -> int:
+        """Stores a message.
+
+        Args:
+            due: The UNIX timestamp the message is due at.
+            record: The message.
+
+        Returns:
+            The message's row id.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "INSERT INTO navi_scheduled (due, record) VALUES (?, ?)", (due, record.pack())
+            ).lastrowid
+
+    def remove(self, row_ids: Sequence[int]):
+        """Deletes messages, once published or cancelled."""
+        with self._lock:
+            self._connection.executemany(
+                "DELETE FROM navi_scheduled WHERE id = ?", [(row_id,) for row_id in row_ids]
+            )
+
+    def load(self) -> List[Tuple[int, float, OutboxRecord]]:
+        """Returns every stored message, as (row id, due timestamp, record) tuples."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, due, record FROM navi_scheduled ORDER BY due, id"
+            ).fetchall()
+
+        return [(row_id, due, OutboxRecord.unpack(record)) for row_id, due, record in rows]
+
+    def close(self):
+        """Closes the SQLite file, and releases its lock."""
+        with self._lock:
+            self._connection.close()
+
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _forget_lock(self):
+        """Closes a forked child process' copy of the lock file, without releasing the lock held
+        by its parent."""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def _lock_store(path: str):
+    """Takes an exclusive lock on a timer store's file, held until the returned file is closed.
+
+    Returns:
+        The lock file, or None if `fcntl` isn't available.
+
+    Raises:
+        NaviSchedulerException: When another process holds the lock.
+    """
+    if fcntl is None:  # pragma: no cover
+        return None
+
+    lock_file = open(f"{path}.lock", "a+b")  # pylint:disable = R1732
+
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    except OSError as error:
+        lock_file.close()
+
+        raise NaviSchedulerException(f"Timer store {path} is used by another process.") from error
+
+    return lock_file
+
+
+class ScheduledMessage:
+    """A message waiting in a NaviScheduler.
+
+    Attributes:
+        exchange: The exchange the message is published to.
+        exchange_type: The type of the exchange, declared if needed.
+        routing_key: The routing key the message is published with.
+        body: The serialized message.
+        properties: The message's BasicProperties.
+        row_id: The message's row id in the scheduler's NaviTimerStore, if any.
+    """
+
+    __slots__ = ("exchange", "exchange_type", "routing_key", "body", "properties", "row_id")
+
+    def __init__(
+            self,
+            exchange: str,
+            exchange_type: str,
+            routing_key: str,
+            body: bytes,
+            properties: BasicProperties,
+            row_id: int = None,
+    ):  # pylint:disable = R0913
+        self.exchange = exchange
+        self.exchange_type = exchange_type
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.row_id = row_id
+
+
+_TIMER_IDS = itertools.count(1)
+
+
+class NaviScheduler:
+    """Publishes messages to a broker once they're due, from a single thread advancing a
+    NaviTimerWheel. Thread-safe.
+
+    Attributes:
+        published: The number of scheduled messages published, confirmed or not.
+    """
+
+    def __init__(
+            self,
+            pool: NaviConnectionPool,
+            store: NaviTimerStore = None,
+            tick: float = 0.05,
+            batch_size: int = 1000,
+    ):
+        """Initializes a NaviScheduler, scheduling the messages of `store` again.
+
+        Args:
+            pool: The NaviConnectionPool due messages are published through.
+            store: The NaviTimerStore pending messages are stored in. Optional.
+            tick: The resolution, in seconds, of the timer wheel. Defaults to 0.05.
+            batch_size: The max number of due messages published at once. Defaults to 1000.
+        """
+        self._pool = pool
+        self._store = store
+        self._batch_size = batch_size
+        self._wheel = NaviTimerWheel(tick)
+        self._timer_ids: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._backoff = NaviBackoff(
+            initial_delay=config.NAVI_RECONNECT_INITIAL_DELAY,
+            max_delay=config.NAVI_RECONNECT_MAX_DELAY,
+        )
+        self.published = 0
+        self.logger = logging.getLogger("navi")
+
+        if store is not None:
+            self._restore()
+
+    def __len__(self) -> int:
+        return len(self._timer_ids)
+
+    def schedule(
+            self,
+            routing_key: str,
+            body: Union[bytes, str],
+            properties: BasicProperties,
+            delay: float = None,
+            publish_at: Union[float, datetime.datetime] = None,
+    ) -> int:
+        """Schedules a serialized message to be published after `delay` seconds, or at the time
+        `publish_at`.
+
+        Args:
+            routing_key: The routing key to publish the message with.
+            body: The serialized message.
+            properties: The message's BasicProperties.
+            delay: The number of seconds to wait before publishing the message.
+            publish_at: The datetime, or UNIX timestamp, to publish the message at. Naive
+                datetimes are in local time.
+
+        Returns:
+            The message's timer id, to cancel it with `cancel`.
+        """
+        delay = publish_delay(delay, publish_at)
+        message = ScheduledMessage(
+            config.NAVI_EXCHANGE,
+            config.NAVI_EXCHANGE_TYPE,
+            routing_key,
+            body.encode() if isinstance(body, str) else body,
+            properties,
+        )
+
+        if self._store is not None:
+            record = OutboxRecord(
+                message.exchange, message.exchange_type, routing_key, message.body, properties
+            )
+            message.row_id = self._store.add(time.time() + delay, record)
+
+        return self._add(message, time.monotonic() + delay)
+
+    def cancel(self, timer_id: int) -> bool:
+        """Cancels a scheduled message.
+
+        Args:
+            timer_id: The message's timer id, as returned by `schedule`.
+
+        Returns:
+            A boolean value indicating if the message was cancelled, False if it was already
+            published, or isn't a message of this scheduler.
+        """
+        with self._lock:
+            wheel_id = self._timer_ids.pop(timer_id, None)
+            item = None if wheel_id is None else self._wheel.cancel(wheel_id)
+
+        if item is not None and item[1].row_id is not None:
+            self._store.remove([item[1].row_id])
+
+        return item is not None
+
+    def start(self):
+        """Starts the scheduler thread."""
+        self._thread = threading.Thread(target=self._run, name="navi-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None) -> bool:
+        """Stops the scheduler thread. Pending messages are kept in the store, if any.
+
+        Args:
+            timeout: The max number of seconds to wait for the thread to end. Waits forever if
+                None.
+
+        Returns:
+            A boolean value indicating if the thread ended on time.
+        """
+        self._stop_event.set()
+        self._wakeup.set()
+
+        if self._thread is None or self._thread is threading.current_thread():
+            return True
+
+        self._thread.join(timeout)
+
+        return not self._thread.is_alive()
+
+    def _add(self, message: ScheduledMessage, due: float) -> int:
+        timer_id = next(_TIMER_IDS)
+
+        with self._lock:
+            self._timer_ids[timer_id] = self._wheel.add(due, (timer_id, message))
+
+        self._wakeup.set()
+
+        return timer_id
+
+    def _restore(self):
+        """Schedules the messages of the store again."""
+        now, wall_now = time.monotonic(), time.time()
+        rows = self._store.load()
+
+        for row_id, due, record in rows:
+            message = ScheduledMessage(
+                record.exchange,
+                record.exchange_type,
+                record.routing_key,
+                record.body,
+                record.properties,
+                row_id,
+            )
+            self._add(message, now + max(due - wall_now, 0))
+
+        if rows:
+            self.logger.info("Restored %d scheduled messages from %s.", len(rows), self._store.path)
+
+    def _run(self):
+        """Advances the wheel every tick while messages are pending, publishing the due ones."""
+        while not self._stop_event.is_set():
+            with self._lock:
+                due = self._wheel.advance(time.monotonic())
+
+                for timer_id, _ in due:
+                    self._timer_ids.pop(timer_id, None)
+
+                pending = len(self._wheel)
+
+            for batch in _batches([message for _, message in due], self._batch_size):
+                self._publish(batch)
+
+            self._wakeup.wait(self._wheel.tick if pending else None)
+            self._wakeup.clear()
+
+    def _publish(self, messages: List[ScheduledMessage]):
+        """Publishes due messages with publisher confirms, storing the unconfirmed ones in the
+        outbox, if it's enabled, and scheduling them again after a backoff if publishing
+        raised."""
+        exchange, exchange_type = messages[0].exchange, messages[0].exchange_type
+        outgoing = [(message.routing_key, message.body, message.properties) for message in messages]
+
+        try:
+            results = publish_confirmed(
+                self._pool,
+                exchange,
+                exchange_type,
+                outgoing,
+                retries=config.NAVI_PUBLISH_RETRIES,
+                backoff=self._backoff,
+                logger=self.logger,
+            )
+            store_unconfirmed(self._pool, exchange, exchange_type, outgoing, results)
+
+        except Exception as error:  # pylint:disable = W0703
+            delay = self._backoff.next_delay()
+            self.logger.error(
+                "Error while publishing %d scheduled messages: %s. Retrying in %.2fs.",
+                len(messages),
+                str(error),
+                delay,
+            )
+
+            for message in messages:
+                self._add(message, time.monotonic() + delay)
+
+            return
+
+        self._backoff.reset()
+        self.published += len(messages)
+        failed = sum(not result.acked and not result.stored for result in results)
+
+        if failed:
+            self.logger.warning("%d scheduled messages weren't confirmed by the broker.", failed)
+
+        if self._store is not None:
+            self._store.remove([message.row_id for message in messages])
+
+
+def _batches(messages: List[ScheduledMessage], size: int) -> List[List[ScheduledMessage]]:
+    """Splits due messages into batches of up to `size` messages published to the same
+    exchange."""
+    batches: List[List[ScheduledMessage]] = []
+
+    for message in messages:
+        batch = batches[-1] if batches else None
+
+        if (
+                batch is None or len(batch) >= size
+                or (batch[0].exchange, batch[0].exchange_type)
+                != (message.exchange, message.exchange_type)
+        ):
+            batches.append([message])
+
+        else:
+            batch.append(message)
+
+    return batches
+
+
+def publish_delay(delay: float = None, publish_at: Union[float, datetime.datetime] = None) -> float:
+    """Returns the number of seconds to wait before publishing a message, 0 for a past time.
+
+    Args:
+        delay: A number of seconds.
+        publish_at: A datetime, or UNIX timestamp. Naive datetimes are in local time.
+
+    Raises:
+        ValueError: When both or neither of `delay` and `publish_at` are given.
+    """
+    if (delay is None) == (publish_at is None):
+        raise ValueError("Need exactly one of delay and publish_at.")
+
+    if publish_at is not None:
+        if isinstance(publish_at, datetime.datetime):
+            publish_at = publish_at.timestamp()
+
+        delay = publish_at - time.time()
+
+    return max(delay, 0)
+
+
+_SCHEDULERS: Dict[NaviConnectionPool, NaviScheduler] = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_scheduler(pool: NaviConnectionPool) -> NaviScheduler:
+    """Returns the process-wide NaviScheduler publishing through `pool`, creating and starting it
+    on first use, with the messages stored for its broker, if a scheduler directory was set by
+    `init_config`.
+
+    Args:
+        pool: The NaviConnectionPool due messages are published through.
+
+    Returns:
+        The shared NaviScheduler instance.
+    """
+    with _SCHEDULERS_LOCK:
+        scheduler = _SCHEDULERS.get(pool)
+
+        if scheduler is None:
+            store = None
+
+            if config.NAVI_SCHEDULER_DIR:
+                os.makedirs(config.NAVI_SCHEDULER_DIR, exist_ok=True)
+                name = re.sub(r"[^\w.-]", "_", "_".join(str(part) for part in pool.key))
+                store = _open_free_slot(os.path.join(config.NAVI_SCHEDULER_DIR, name))
+
+            scheduler = NaviScheduler(pool, store, config.NAVI_SCHEDULER_TICK)
+            scheduler.start()
+            _SCHEDULERS[pool] = scheduler
+
+    return scheduler
+
+
+def _open_free_slot(prefix: str) -> NaviTimerStore:
+    """Opens the first slot of a broker's timer store that isn't used by another process:
+    `<prefix>.sqlite`, then `<prefix>.1.sqlite`, `<prefix>.2.sqlite`, and so on."""
+    slot = 0
+
+    while True:
+        try:
+            return NaviTimerStore(f"{prefix}.{slot}.sqlite" if slot else f"{prefix}.sqlite")
+
+        except NaviSchedulerException:
+            slot += 1
+
+
+def cancel(timer_id: int) -> bool:
+    """Cancels a message scheduled by any process-wide NaviScheduler.
+
+    Args:
+        timer_id: The message's timer id, as returned by `publish`.
+
+    Returns:
+        A boolean value indicating if the message was cancelled.
+    """
+    with _SCHEDULERS_LOCK:
+        schedulers = list(_SCHEDULERS.values())
+
+    return any(scheduler.cancel(timer_id) for scheduler in schedulers)
+
+
+def collect_metrics() -> List[NaviMetric]:
+    """Builds metrics from every process-wide NaviScheduler. Registered as a collector of the
+    process-wide `navi.metrics` registry."""
+    pending = NaviGauge("navi_scheduled_messages", "Scheduled messages waiting to be due.")
+    published = NaviCounter("navi_scheduled_published_total", "Scheduled messages published.")
+
+    with _SCHEDULERS_LOCK:
+        schedulers = list(_SCHEDULERS.values())
+
+    pending.set(sum(len(scheduler) for scheduler in schedulers))
+    published.inc(sum(scheduler.published for scheduler in schedulers))
+
+    return [pending, published]
+
+
+get_registry().register_collector(collect_metrics)
+
+
+def close_schedulers(timeout: float = 5):
+    """Stops every process-wide NaviScheduler. Messages not due yet are kept in their store, if
+    any, and lost otherwise. Registered to be called at interpreter exit.
+
+    Args:
+        timeout: The max number of seconds to wait for each scheduler to stop. Defaults to 5.
+    """
+    with _SCHEDULERS_LOCK:
+        schedulers = list(_SCHEDULERS.values())
+        _SCHEDULERS.clear()
+
+    for scheduler in schedulers:
+        lost = 0 if scheduler._store is not None else len(scheduler)  # pylint:disable = W0212
+
+        if lost:
+            scheduler.logger.warning("%d scheduled messages not published before exit.", lost)
+
+        if scheduler.stop(timeout) and scheduler._store is not None:  # pylint:disable = W0212
+            scheduler._store.close()  # pylint:disable = W0212
+
+
+atexit.register(close_schedulers)
+
+
+def _forget_schedulers():
+    """Makes a forked child process start its own schedulers, the parent's threads not running in
+    the child, and the parent's timer stores staying locked by it."""
+    global _SCHEDULERS_LOCK  # pylint:disable = global-statement
+    _SCHEDULERS_LOCK = threading.Lock()
+
+    for scheduler in _SCHEDULERS.values():
+        if scheduler._store is not None:  # pylint:disable = protected-access
+            scheduler._store._forget_lock()  # pylint:disable = protected-access
+
+    _SCHEDULERS.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_schedulers)
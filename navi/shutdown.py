@@ -0,0 +1,100 @@
+"""Navi's shutdown module.
+
+`shutdown` stops every running listener and listener group of the process gracefully, sharing a
+timeout: their consumers are cancelled, the callbacks in flight waited for and the pending acks
+flushed, before connections are closed. The background publishers are drained last, and the
+messages drained, requeued and abandoned are reported:
+
+    report = navi.shutdown(timeout=30)
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from navi.background import flush
+from navi.group import running_groups
+from navi.listener import running_listeners
+
+logger = logging.getLogger("navi")
+
+
+@dataclass
+class NaviShutdownReport:
+    """The outcome of `shutdown`.
+
+    Attributes:
+        drained: The number of messages whose callbacks completed while draining.
+        requeued: The number of deliveries handed back to the broker without being handled,
+            as they were prefetched after the listeners' consumers were cancelled.
+        abandoned: The number of messages still being handled when the timeout was reached.
+        stopped: Whether everything stopped, and the background publishers were drained, on time.
+    """
+
+    drained: int = 0
+    requeued: int = 0
+    abandoned: int = 0
+    stopped: bool = True
+
+
+def shutdown(timeout: float = None) -> NaviShutdownReport:
+    """Stops the process' running listeners and listener groups gracefully, and drains its
+    background publishers.
+
+    Every listener's consumer is cancelled, so it stops getting new deliveries, the callbacks in
+    flight are waited for, and the pending acks flushed, before connections are closed. Safe to
+    call from a signal handler's thread, but not from a listener's callback.
+
+    Args:
+        timeout: The max number of seconds to wait for everything to stop, shared by every
+            listener. Waits forever if None.
+
+    Returns:
+        A NaviShutdownReport, counting the messages drained, requeued and abandoned.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+    groups = running_groups()
+    standalone = running_listeners()
+    listeners = standalone + [listener for group in groups for listener in group.listeners]
+    stopped = True
+
+    for group in groups:
+        group.stop(remaining())
+
+    for listener in standalone:
+        stopped = listener.stop(remaining()) and stopped
+
+    stopped = flush(remaining()) and stopped and not running_groups()
+    report = NaviShutdownReport(
+        drained=sum(listener.drained for listener in listeners),
+        requeued=sum(listener.requeued for listener in listeners),
+        abandoned=sum(listener.abandoned for listener in listeners),
+        stopped=stopped,
+    )
+    logger.info(
+        "Shut down %d listeners: %d messages drained, %d requeued, %d abandoned.",
+        len(listeners),
+        report.drained,
+        report.requeued,
+        report.abandoned,
+    )
+
+    return report
+
+
+def stop_listeners(timeout: float = None) -> bool:
+    """Stops the process' running listeners and listener groups, and drains its background
+    publishers, with `shutdown`.
+
+    Args:
+        timeout: The max number of seconds to wait for everything to stop. Waits forever if None.
+
+    Returns:
+        A boolean value indicating if everything stopped on time.
+    """
+    return shutdown(timeout).stopped
@@ -0,0 +1,186 @@
+"""Navi's streaming module.
+
+Large payloads can be published as a stream of ordered chunks, with `NaviPublisher.publish_stream`,
+instead of being serialized and published as a single message: the source, an iterable of bytes
+or a binary file object, is read one chunk at a time, and chunks are published in confirmed
+windows, so publishing peaks at a few chunks in memory whatever the payload's size.
+
+Each chunk is published with the following headers:
+    stream_id: The id of the stream, shared by all its chunks.
+    stream_seq: The chunk's position in the stream, from 0.
+    stream_last: Whether it's the stream's last chunk.
+    stream_content_type: The content type of the whole payload, if given.
+
+Listeners created with `streaming=True` reassemble the chunks of each stream incrementally into a
+SpooledTemporaryFile, kept in memory up to `NAVI_STREAM_SPOOL_THRESHOLD` bytes and spilled to disk
+past it, and call their callback with the headers of the last chunk and the binary file, rewound,
+once the stream is complete. Chunks are acked as soon as they're spooled, so a stream's chunks
+never exceed the listener's prefetch count. Duplicated chunks are skipped, while a missing chunk
+drops its stream, as does a stream left incomplete for `stream_timeout` seconds.
+"""
+
+import io
+import logging
+import tempfile
+import threading
+import time
+from typing import IO, Any, Dict, Iterable, Iterator, Mapping, Optional, Tuple, Union
+
+from navi.exceptions import NaviStreamException
+
+STREAM_ID_HEADER = "stream_id"
+STREAM_SEQ_HEADER = "stream_seq"
+STREAM_LAST_HEADER = "stream_last"
+STREAM_CONTENT_TYPE_HEADER = "stream_content_type"
+
+Source = Union[Iterable[Union[bytes, str]], IO]
+
+
+def iter_chunks(source: Source, chunk_size: int) -> Iterator[Tuple[bytes, bool]]:
+    """Reads a source one chunk at a time, flagging the last one. An empty source yields a single
+    empty last chunk.
+
+    Args:
+        source: A binary file object, read `chunk_size` bytes at a time, or an iterable of bytes
+            or str chunks, encoded as UTF-8, yielded as they are.
+        chunk_size: The size, in bytes, of the chunks read from a file object.
+
+    Yields:
+        Each chunk, and whether it's the last one.
+    """
+    if hasattr(source, "read"):
+        chunks = iter(lambda: source.read(chunk_size), b"")
+
+    else:
+        chunks = iter(source)
+
+    current = next(chunks, b"")
+
+    for upcoming in chunks:
+        yield _to_bytes(current), False
+        current = upcoming
+
+    yield _to_bytes(current), True
+
+
+def _to_bytes(chunk: Union[bytes, str]) -> bytes:
+    return chunk.encode() if isinstance(chunk, str) else bytes(chunk)
+
+
+class _Stream:
+    """A stream being reassembled."""
+
+    __slots__ = ("buffer", "next_seq", "updated_at")
+
+    def __init__(self, spool_threshold: int):
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+        self.next_seq = 0
+        self.updated_at = time.monotonic()
+
+
+class NaviStreamAssembler:
+    """Reassembles the chunks of streams published with `publish_stream`, keyed by stream id, so
+    chunks of streams from many publishers can be interleaved. Thread-safe.
+
+    Attributes:
+        expired: The number of streams dropped because they were left incomplete for too long.
+    """
+
+    def __init__(self, spool_threshold: int = 8 * 1024 * 1024, timeout: float = 300):
+        """Initializes a NaviStreamAssembler.
+
+        Args:
+            spool_threshold: The max size, in bytes, of a stream kept in memory before it's
+                spilled to a temporary file. Defaults to 8 MiB.
+            timeout: The max number of seconds between two chunks of a stream, before it's
+                dropped. Defaults to 300.
+        """
+        self._spool_threshold = spool_threshold
+        self._timeout = timeout
+        self._streams: Dict[str, _Stream] = {}
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.logger = logging.getLogger("navi")
+
+    def __len__(self) -> int:
+        """The number of streams being reassembled."""
+        return len(self._streams)
+
+    def add(self, headers: Mapping[str, Any], body: bytes) -> Optional[IO[bytes]]:
+        """Appends a chunk to its stream.
+
+        Args:
+            headers: The chunk's headers, with its stream id and position.
+            body: The chunk's decompressed body.
+
+        Returns:
+            The stream's binary file, rewound, once its last chunk is added, or None. The caller
+            must close it.
+
+        Raises:
+            NaviStreamException: When a chunk is missing, dropping its stream.
+        """
+        stream_id = headers[STREAM_ID_HEADER]
+        seq = headers[STREAM_SEQ_HEADER]
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire(now)
+            stream = self._streams.get(stream_id)
+
+            if stream is None and seq == 0:
+                stream = self._streams[stream_id] = _Stream(self._spool_threshold)
+
+            if stream is not None and seq < stream.next_seq:
+                self.logger.debug("Skipping duplicated chunk %s of stream %s.", seq, stream_id)
+
+                return None
+
+            if stream is None or seq > stream.next_seq:
+                self._drop(stream_id)
+
+                raise NaviStreamException(f"Stream {stream_id} is missing chunks before {seq}.")
+
+            stream.buffer.write(body)
+            stream.next_seq += 1
+            stream.updated_at = now
+
+            if not headers.get(STREAM_LAST_HEADER):
+                return None
+
+            del self._streams[stream_id]
+
+        stream.buffer.seek(0)
+
+        return stream.buffer
+
+    def close(self):
+        """Drops every stream being reassembled."""
+        with self._lock:
+            for stream_id in list(self._streams):
+                self._drop(stream_id)
+
+    def _expire(self, now: float):
+        """Drops the streams without a chunk for `timeout` seconds. Must be called while holding
+        the lock."""
+        for stream_id, stream in list(self._streams.items()):
+            if now - stream.updated_at > self._timeout:
+                self.logger.warning("Dropping incomplete stream %s.", stream_id)
+                self._drop(stream_id)
+                self.expired += 1
+
+    def _drop(self, stream_id: str):
+        stream = self._streams.pop(stream_id, None)
+
+        if stream is not None:
+            stream.buffer.close()
+
+
+def is_chunk(headers: Mapping[str, Any]) -> bool:
+    """Checks if a message is a chunk of a stream, from its headers."""
+    return STREAM_ID_HEADER in headers
+
+
+def as_stream(body: bytes) -> IO[bytes]:
+    """Wraps the body of a message that isn't chunked as a binary file."""
+    return io.BytesIO(body)
@@ -0,0 +1,92 @@
+"""Test cases for navi.acks"""
+from unittest import TestCase, mock
+
+from navi.acks import NaviAcker
+
+
+class TestNaviAcker(TestCase):
+    """Test cases for NaviAcker"""
+
+    def setUp(self):
+        """Initializes a NaviAcker over a mocked channel, with a mocked `call_later`."""
+        self.channel = mock.MagicMock(is_open=True)
+        self.call_later = mock.MagicMock()
+        self.acker = NaviAcker(
+            self.channel, batch_size=3, interval=0.5, call_later=self.call_later
+        )
+        self.acker.logger = mock.MagicMock()
+
+        for delivery_tag in range(1, 6):
+            self.acker.track(delivery_tag)
+
+    def test_ack_batch_size(self):
+        """When `batch_size` deliveries are done, they should be acked with one multiple ack."""
+        for delivery_tag in (1, 2):
+            self.acker.ack(delivery_tag)
+
+        self.channel.basic_ack.assert_not_called()
+        self.call_later.assert_called_once_with(0.5, self.acker._on_timer)
+
+        self.acker.ack(3)
+
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+        self.assertEqual(self.acker.waiting, 0)
+        self.assertEqual(len(self.acker), 2)
+
+    def test_ack_out_of_order(self):
+        """When deliveries are done out of order, they should wait for the older ones."""
+        for delivery_tag in (2, 3, 4):
+            self.acker.ack(delivery_tag)
+
+        self.channel.basic_ack.assert_not_called()
+
+        self.acker.ack(1)
+
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=4, multiple=True)
+
+    def test_nack(self):
+        """When a delivery fails, waiting acks should be flushed before it's nacked alone."""
+        self.acker.ack(1)
+        self.acker.nack(2, requeue=True)
+        self.acker.ack(3)
+
+        self.assertEqual(
+            self.channel.method_calls,
+            [
+                mock.call.basic_ack(delivery_tag=1, multiple=True),
+                mock.call.basic_nack(delivery_tag=2, requeue=True),
+            ],
+        )
+        self.assertEqual(self.acker.waiting, 1)
+
+    def test_timer(self):
+        """When the timer fires, every waiting ack should be flushed."""
+        self.acker.ack(1)
+        _, on_timer = self.call_later.call_args[0]
+
+        on_timer()
+
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+
+        self.acker.ack(2)
+
+        self.assertEqual(self.call_later.call_count, 2)
+
+    def test_channel_closed(self):
+        """When the channel is closed, nothing should be acked."""
+        self.channel.is_open = False
+        self.acker.ack(1)
+
+        self.acker.flush()
+
+        self.channel.basic_ack.assert_not_called()
+        self.assertEqual(self.acker.waiting, 0)
+
+    def test_unknown_tag(self):
+        """When an unknown, or reset, delivery tag is acked, a warning should be logged."""
+        self.acker.reset()
+
+        self.acker.ack(1)
+
+        self.acker.logger.warning.assert_called_once()
+        self.channel.basic_ack.assert_not_called()
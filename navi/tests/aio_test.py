@@ -0,0 +1,366 @@
+"""Test cases for navi.aio"""
+import asyncio
+import zlib
+from unittest import IsolatedAsyncioTestCase, mock
+
+from pika import BasicProperties
+from pika.exceptions import AMQPError
+from pika.frame import Method
+from pika.spec import Basic
+
+from navi import aio, config
+from navi.aio import (
+    NaviAsyncConfirmChannel, NaviAsyncConnection, NaviAsyncListener, NaviAsyncPublisher
+)
+from navi.confirms import PublishResult
+from navi.exceptions import NaviInitException, NaviTransportException
+
+
+class TestNaviAsyncConnection(IsolatedAsyncioTestCase):
+    """Test cases for NaviAsyncConnection"""
+
+    async def test_close_callbacks_called_once(self):
+        """When the channel and then the connection get closed, the waiting calls should be
+        rejected, and the close callbacks called only once.
+        """
+        connection = NaviAsyncConnection(mock.MagicMock())
+        connection._closed = asyncio.get_running_loop().create_future()
+        callback = mock.MagicMock()
+        connection.add_on_close_callback(callback)
+        waiter = connection._waiter()
+        reason = AMQPError("closed")
+
+        connection._on_channel_closed(mock.MagicMock(), reason)
+        connection._on_connection_closed(mock.MagicMock(), AMQPError("connection closed"))
+
+        callback.assert_called_once_with(reason)
+        self.assertIs(waiter.exception(), reason)
+        self.assertTrue(connection._closed.done())
+
+
+class TestNaviAsyncConfirmChannel(IsolatedAsyncioTestCase):
+    """Test cases for NaviAsyncConfirmChannel"""
+
+    async def asyncSetUp(self):
+        """Initializes a NaviAsyncConfirmChannel over a mocked NaviAsyncConnection."""
+        self.channel = NaviAsyncConfirmChannel(mock.MagicMock(), max_outstanding=2)
+        self.connection = mock.MagicMock()
+        self.connection.call = mock.AsyncMock()
+        self.channel._open = mock.AsyncMock(return_value=self.connection)
+
+    async def _publish(self, message_id: str) -> asyncio.Future:
+        return await self.channel.publish(
+            "exchange", "topic", "key", "{}", BasicProperties(headers={"message_id": message_id})
+        )
+
+    async def test_publish_confirmed(self):
+        """When a published message is acked, its future should return an acked PublishResult."""
+        confirmed = await self._publish("first")
+
+        self.connection.channel.basic_publish.assert_called_once()
+        self.assertFalse(confirmed.done())
+
+        self.channel._on_confirmation(Method(1, Basic.Ack(delivery_tag=1)))
+        result = await confirmed
+
+        self.assertTrue(result.acked)
+        self.assertEqual(result.message_id, "first")
+
+    async def test_publish_bounded(self):
+        """When `max_outstanding` messages are unconfirmed, publishing should wait for their
+        confirmations.
+        """
+        await self._publish("first")
+        await self._publish("second")
+        third = asyncio.ensure_future(self._publish("third"))
+        await asyncio.sleep(0)
+
+        self.assertFalse(third.done())
+
+        self.channel._on_confirmation(Method(1, Basic.Ack(delivery_tag=2, multiple=True)))
+        await third
+
+        self.assertEqual(self.connection.channel.basic_publish.call_count, 3)
+
+    async def test_on_closed(self):
+        """When the channel is closed, the unconfirmed messages should be reported as failed."""
+        confirmed = await self._publish("first")
+
+        self.channel._on_closed(AMQPError("closed"))
+        result = await confirmed
+
+        self.assertFalse(result.acked)
+        self.assertIsNotNone(result.error)
+
+
+class TestNaviAsyncConfirmChannelOpen(IsolatedAsyncioTestCase):
+    """Test cases for NaviAsyncConfirmChannel's connection handling"""
+
+    @mock.patch("navi.aio.NaviAsyncConnection")
+    async def test_open_closes_previous_connection(self, connection_mock):
+        """When the channel's connection is no longer open, it should be closed before being
+        replaced by a new one.
+        """
+        previous, new = mock.MagicMock(), mock.MagicMock()
+
+        for connection in (previous, new):
+            connection.open = mock.AsyncMock()
+            connection.close = mock.AsyncMock()
+            connection.call = mock.AsyncMock()
+
+        connection_mock.side_effect = [previous, new]
+        channel = NaviAsyncConfirmChannel(mock.MagicMock())
+
+        await channel._open("exchange", "topic")
+        previous.is_open = False
+        opened = await channel._open("exchange", "topic")
+
+        previous.close.assert_awaited_once()
+        self.assertIs(opened, new)
+
+
+class TestNaviAsyncPublisher(IsolatedAsyncioTestCase):
+    """Test cases for NaviAsyncPublisher"""
+
+    def setUp(self):
+        """Initializes a NaviAsyncPublisher"""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.publisher = NaviAsyncPublisher(routing_key="test_routing_key")
+        self.publisher.logger = mock.MagicMock()
+
+    @mock.patch("navi.aio.get_confirm_channel")
+    async def test_publish_many(self, get_confirm_channel_mock):
+        """When `publish_many` is called, every message should be published through the shared
+        channel, and a PublishResult returned for each one, in order.
+        """
+        channel = get_confirm_channel_mock.return_value
+
+        async def publish(**kwargs):
+            confirmed = asyncio.get_running_loop().create_future()
+            confirmed.set_result(PublishResult(acked=True))
+            return confirmed
+
+        channel.publish.side_effect = publish
+
+        results = await self.publisher.publish_many([{"hello": "world"}, {"invalid": object()}])
+
+        channel.publish.assert_called_once()
+        self.assertEqual([result.acked for result in results], [True, False])
+        self.publisher.logger.error.assert_called_once()
+
+    @mock.patch("navi.aio.get_confirm_channel")
+    async def test_publish_compressed(self, get_confirm_channel_mock):
+        """When the publisher has a compressor, a message larger than the threshold should be
+        compressed, and stamped with its name as its content encoding.
+        """
+        channel = get_confirm_channel_mock.return_value
+        channel.publish = mock.AsyncMock(return_value=aio._resolved(PublishResult(acked=True)))
+        publisher = NaviAsyncPublisher(
+            routing_key="test_routing_key", compression="zlib", compression_threshold=64
+        )
+
+        await publisher.publish({"large": "x" * 1024})
+
+        kwargs = channel.publish.call_args.kwargs
+        self.assertEqual(kwargs["properties"].content_encoding, "zlib")
+        self.assertEqual(zlib.decompress(kwargs["body"]), b'{"large":"' + b"x" * 1024 + b'"}')
+
+    @mock.patch.object(config, "NAVI_PUBLISH_RETRIES", 0)
+    @mock.patch("navi.aio.get_confirm_channel")
+    async def test_publish_amqp_error(self, get_confirm_channel_mock):
+        """When the shared channel can't be opened, the message should be reported as failed."""
+        get_confirm_channel_mock.return_value.publish = mock.AsyncMock(side_effect=AMQPError())
+
+        result = await self.publisher.publish({"hello": "world"})
+
+        self.assertFalse(result.acked)
+        self.publisher.logger.error.assert_called_once()
+
+    @mock.patch("navi.aio.asyncio.sleep", new_callable=mock.AsyncMock)
+    @mock.patch("navi.aio.get_confirm_channel")
+    async def test_publish_many_retry(self, get_confirm_channel_mock, sleep_mock):
+        """When messages are not confirmed because the connection was lost, they should be
+        published again after a backoff delay, while nacked messages should not.
+        """
+        channel = get_confirm_channel_mock.return_value
+        outcomes = iter([
+            PublishResult(acked=True),
+            PublishResult(error=aio.NACKED),
+            PublishResult(error="Connection lost."),
+            PublishResult(acked=True),
+        ])
+
+        async def publish(**kwargs):
+            return aio._resolved(next(outcomes))
+
+        channel.publish.side_effect = publish
+        states = []
+        self.publisher.add_state_callback(lambda publisher, state: states.append(state))
+
+        results = await self.publisher.publish_many([{"a": 1}, {"b": 2}, {"c": 3}])
+
+        self.assertEqual(channel.publish.call_count, 4)
+        self.assertEqual([result.acked for result in results], [True, False, True])
+        sleep_mock.assert_awaited_once()
+        self.assertEqual(states, ["disconnected", "connecting", "connected"])
+
+    @mock.patch.object(NaviAsyncPublisher, "publish")
+    async def test_module_publish(self, publish_mock):
+        """When `aio.publish` is called, the cached NaviAsyncPublisher's `publish` method should be
+        awaited with the message.
+        """
+        message = {"hello": "world"}
+
+        await aio.publish(routing_key="some.routing.key", message=message)
+
+        publish_mock.assert_awaited_once_with(message)
+
+
+    def test_unsupported_config(self):
+        """Async publishers and listeners shouldn't be created over another transport than pika,
+        or with several broker nodes."""
+        with mock.patch.object(config, "NAVI_TRANSPORT", "memory"):
+            with self.assertRaises(NaviTransportException):
+                NaviAsyncPublisher(routing_key="key")
+
+        with mock.patch.object(config, "NAVI_BROKER_NODES", ("other",)):
+            with self.assertRaises(NaviInitException):
+                NaviAsyncListener(queue_name="queue", routing_key="key", callback=print)
+
+
+class TestNaviAsyncListener(IsolatedAsyncioTestCase):
+    """Test cases for NaviAsyncListener"""
+
+    def setUp(self):
+        """Initializes a NaviAsyncListener"""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.callback = mock.AsyncMock()
+        self.listener = NaviAsyncListener(
+            queue_name="test_queue", routing_key="test_routing_key", callback=self.callback
+        )
+        self.listener.logger = mock.MagicMock()
+
+    @mock.patch("navi.aio.NaviAsyncConnection")
+    async def test_listen(self, connection_mock):
+        """When `listen` is awaited, the topology should be declared, the prefetch count set, and
+        the queue consumed.
+        """
+        connection = connection_mock.return_value
+        connection.open = mock.AsyncMock()
+        connection.call = mock.AsyncMock()
+
+        await self.listener.listen()
+
+        methods = [call.args[0] for call in connection.call.await_args_list]
+        self.assertEqual(methods, ["exchange_declare", "queue_declare", "queue_bind", "basic_qos"])
+        connection.call.assert_any_await("basic_qos", prefetch_count=100)
+        connection.channel.basic_consume.assert_called_once_with(
+            "test_queue", self.listener._on_message
+        )
+
+    @mock.patch("navi.aio.NaviAsyncConnection")
+    async def test_listen_error(self, connection_mock):
+        """When the topology can't be declared, the connection should be closed, and the error
+        raised.
+        """
+        connection = connection_mock.return_value
+        connection.open = mock.AsyncMock()
+        connection.close = mock.AsyncMock()
+        connection.call = mock.AsyncMock(side_effect=AMQPError("denied"))
+
+        with self.assertRaises(AMQPError):
+            await self.listener.listen()
+
+        connection.close.assert_awaited_once()
+        self.assertEqual(self.listener.state, "disconnected")
+
+    @mock.patch("navi.aio.asyncio.sleep", new_callable=mock.AsyncMock)
+    @mock.patch("navi.aio.NaviAsyncConnection")
+    async def test_reconnect(self, connection_mock, sleep_mock):
+        """When the connection is lost, the listener should close it, and connect again after a
+        backoff delay, retrying until it succeeds.
+        """
+        lost, failing, reconnected = mock.MagicMock(), mock.MagicMock(), mock.MagicMock()
+
+        for connection in (lost, failing, reconnected):
+            connection.open = mock.AsyncMock()
+            connection.close = mock.AsyncMock()
+            connection.call = mock.AsyncMock()
+
+        failing.open.side_effect = AMQPError("refused")
+        connection_mock.side_effect = [lost, failing, reconnected]
+
+        await self.listener.listen()
+        on_close = lost.add_on_close_callback.call_args.args[0]
+        on_close(AMQPError("lost"))
+        self.assertEqual(self.listener.state, "disconnected")
+        await self.listener._reconnect_task
+
+        lost.close.assert_awaited_once()
+        failing.close.assert_awaited_once()
+        self.assertEqual(sleep_mock.await_count, 2)
+        reconnected.channel.basic_consume.assert_called_once()
+        self.assertEqual(self.listener.state, "connected")
+
+    @mock.patch("navi.aio.NaviAsyncConnection")
+    async def test_reconnect_disabled(self, connection_mock):
+        """When reconnection is disabled, a lost connection should not be reopened."""
+        connection = connection_mock.return_value
+        connection.open = mock.AsyncMock()
+        connection.call = mock.AsyncMock()
+        self.listener._reconnect = False
+
+        await self.listener.listen()
+        connection.add_on_close_callback.call_args.args[0](AMQPError("lost"))
+
+        self.assertIsNone(self.listener._reconnect_task)
+
+    @mock.patch("navi.aio.NaviAsyncConnection")
+    async def test_stop_while_reconnecting(self, connection_mock):
+        """When the listener is stopped while waiting to reconnect, no reconnection should be
+        attempted anymore.
+        """
+        connection = connection_mock.return_value
+        connection.open = mock.AsyncMock()
+        connection.close = mock.AsyncMock()
+        connection.call = mock.AsyncMock()
+        self.listener._backoff = mock.MagicMock(**{"next_delay.return_value": 60})
+
+        await self.listener.listen()
+        connection.add_on_close_callback.call_args.args[0](AMQPError("lost"))
+        await asyncio.sleep(0)
+        await self.listener.stop()
+
+        self.assertEqual(connection.open.await_count, 1)
+        self.assertEqual(self.listener.state, "closed")
+
+    async def test_handle_delivery(self):
+        """When `handle_delivery` is awaited, the callback should be awaited with the headers and
+        the message, and the message acked.
+        """
+        channel = mock.MagicMock()
+        method = mock.MagicMock()
+        properties = BasicProperties(headers={"message_id": "id"})
+
+        await self.listener.handle_delivery(channel, method, properties, b'{"hello": "world"}')
+
+        headers, message = self.callback.await_args.args
+        self.assertEqual(message, {"hello": "world"})
+        self.assertEqual(headers["queue_name"], "test_queue")
+        channel.basic_ack.assert_called_once_with(delivery_tag=method.delivery_tag)
+
+    async def test_handle_delivery_failure(self):
+        """When the callback raises an Exception, it should be logged, and the message acked."""
+        channel = mock.MagicMock()
+        self.callback.side_effect = Exception()
+
+        await self.listener.handle_delivery(
+            channel, mock.MagicMock(), BasicProperties(headers={}), b"{}"
+        )
+
+        self.listener.logger.error.assert_called_once()
+        channel.basic_ack.assert_called_once()
@@ -0,0 +1,130 @@
+"""Test cases for navi.background"""
+import os
+import unittest
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+from pika.exceptions import AMQPError
+
+from navi import config
+from navi.background import (
+    DROP_OLDEST, RAISE, NaviBackgroundPublisher, close_background_publishers,
+    get_background_publisher
+)
+from navi.confirms import PublishResult
+from navi.exceptions import NaviBufferFullException
+
+
+class TestNaviBackgroundPublisher(TestCase):
+    """Test cases for NaviBackgroundPublisher"""
+
+    def setUp(self):
+        """Initializes a NaviBackgroundPublisher over a mocked pool."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.pool = mock.MagicMock()
+        self.confirm_channel = self.pool.confirm_channel.return_value.__enter__.return_value
+        self.confirm_channel.publish.side_effect = lambda **kwargs: PublishResult(acked=True)
+
+    def _background_publisher(self, **kwargs) -> NaviBackgroundPublisher:
+        publisher = NaviBackgroundPublisher(self.pool, **kwargs)
+        publisher.logger = mock.MagicMock()
+        self.addCleanup(publisher.close, 1)
+
+        return publisher
+
+    def test_enqueue_flush(self):
+        """When messages are enqueued and `flush` is called, they should all be published through
+        the confirm channel.
+        """
+        publisher = self._background_publisher()
+
+        for index in range(3):
+            publisher.enqueue("key", str(index), BasicProperties())
+
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(self.confirm_channel.publish.call_count, 3)
+        self.assertEqual(len(publisher), 0)
+        self.assertEqual(publisher.failed, 0)
+
+    def test_enqueue_batches(self):
+        """When more messages than `batch_size` are enqueued, they should be confirmed in batches."""
+        publisher = self._background_publisher(batch_size=2)
+        publisher._thread = mock.MagicMock()
+
+        for index in range(5):
+            publisher.enqueue("key", str(index), BasicProperties())
+
+        publisher._thread = None
+        publisher.enqueue("key", "last", BasicProperties())
+        publisher.flush(timeout=5)
+
+        self.assertEqual(self.confirm_channel.publish.call_count, 6)
+        self.assertEqual(self.confirm_channel.wait.call_count, 3)
+
+    def test_enqueue_drop_oldest(self):
+        """When the buffer is full and the policy is "drop_oldest", the oldest message should be
+        dropped.
+        """
+        publisher = self._background_publisher(max_size=2, policy=DROP_OLDEST)
+        publisher._thread = mock.MagicMock()
+        self.addCleanup(publisher._buffer.clear)
+
+        for index in range(3):
+            publisher.enqueue("key", str(index), BasicProperties())
+
+        self.assertEqual([body for _, body, _ in publisher._buffer], ["1", "2"])
+        self.assertEqual(publisher.dropped, 1)
+
+    def test_enqueue_raise(self):
+        """When the buffer is full and the policy is "raise", NaviBufferFullException should be
+        raised.
+        """
+        publisher = self._background_publisher(max_size=1, policy=RAISE)
+        publisher._thread = mock.MagicMock()
+        self.addCleanup(publisher._buffer.clear)
+        publisher.enqueue("key", "first", BasicProperties())
+
+        with self.assertRaises(NaviBufferFullException):
+            publisher.enqueue("key", "second", BasicProperties())
+
+    def test_invalid_policy(self):
+        """When initialized with an unknown policy, ValueError should be raised."""
+        with self.assertRaises(ValueError):
+            NaviBackgroundPublisher(self.pool, policy="ignore")
+
+    @mock.patch("navi.reconnect.time.sleep")
+    def test_publish_batch_amqp_error(self, sleep_mock):
+        """When an AMQPError is raised while publishing a batch, it should be retried, and once
+        the retries are exhausted, the messages should be counted as failed and the error logged.
+        """
+        self.confirm_channel.publish.side_effect = AMQPError()
+        publisher = self._background_publisher()
+
+        publisher.enqueue("key", "body", BasicProperties())
+        publisher.flush(timeout=5)
+
+        self.assertEqual(publisher.failed, 1)
+        self.assertEqual(publisher.logger.error.call_count, 2)
+        self.assertEqual(self.confirm_channel.publish.call_count, config.NAVI_PUBLISH_RETRIES + 1)
+        self.assertEqual(sleep_mock.call_count, config.NAVI_PUBLISH_RETRIES)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Needs os.fork.")
+    def test_fork(self):
+        """A forked child process should get its own background publisher, with its own I/O
+        thread, instead of the parent's."""
+        self.addCleanup(close_background_publishers, 1)
+        parent = get_background_publisher(self.pool)
+        parent.enqueue("key", "body", BasicProperties())
+        self.assertTrue(parent.flush(timeout=5))
+
+        pid = os.fork()
+
+        if not pid:  # pragma: no cover
+            child = get_background_publisher(self.pool)
+            child.enqueue("key", "body", BasicProperties())
+            os._exit(0 if child is not parent and child.flush(timeout=5) else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
@@ -0,0 +1,206 @@
+"""Test cases for navi.batch"""
+from concurrent.futures import Future
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+
+from navi import config
+from navi.batch import NaviBatchListener, listen_batch
+from navi.dedup import NaviMemoryDedupCache
+from navi.metrics import NaviListenerMetrics
+
+
+class TestNaviBatchListener(TestCase):
+    """Test cases for NaviBatchListener"""
+
+    def setUp(self):
+        """Initializes a NaviBatchListener with a mocked connection and acker."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.callback = mock.MagicMock(return_value=None)
+        self.listener = NaviBatchListener(
+            queue_name="test_queue",
+            routing_key="test_routing_key",
+            callback=self.callback,
+            max_batch_size=3,
+            max_wait=0.5,
+        )
+        self.listener.logger = mock.MagicMock()
+        self.listener._connection = mock.MagicMock()
+        self.listener._acker = mock.MagicMock()
+
+    def _deliver(self, delivery_tag: int, body: bytes = b'{"id": 1}'):
+        self.listener.handle_delivery(
+            mock.MagicMock(),
+            mock.MagicMock(delivery_tag=delivery_tag),
+            BasicProperties(headers={"message_id": str(delivery_tag)}),
+            body,
+        )
+
+    def test_handle_delivery_max_batch_size(self):
+        """
+        When `max_batch_size` messages are delivered, the callback should be called with the
+        batch, and every message acked with a single flush.
+        """
+        for delivery_tag in (1, 2, 3):
+            self._deliver(delivery_tag)
+
+        (batch,), _ = self.callback.call_args
+        self.assertEqual([message for _, message in batch], [{"id": 1}] * 3)
+        self.assertEqual(batch[0][0]["message_id"], "1")
+        self.assertEqual(
+            self.listener._acker.method_calls[-4:],
+            [mock.call.ack(1), mock.call.ack(2), mock.call.ack(3), mock.call.flush()],
+        )
+
+    def test_handle_delivery_max_wait(self):
+        """
+        When fewer than `max_batch_size` messages are delivered, the callback should be called
+        once the timer fires.
+        """
+        self._deliver(1)
+        self._deliver(2)
+
+        self.listener._connection.ioloop.call_later.assert_called_once_with(
+            0.5, self.listener._on_batch_timer
+        )
+        self.callback.assert_not_called()
+
+        self.listener._on_batch_timer()
+
+        self.assertEqual(len(self.callback.call_args[0][0]), 2)
+
+    def test_partial_failure(self):
+        """When the callback returns failed indexes, those messages should be nacked."""
+        self.callback.return_value = [1]
+
+        for delivery_tag in (1, 2, 3):
+            self._deliver(delivery_tag)
+
+        self.listener._acker.nack.assert_called_once_with(2, requeue=False)
+        self.assertEqual(self.listener._acker.ack.call_count, 2)
+
+    def test_invalid_failed_indexes(self):
+        """When the callback returns something other than failed indexes, it should be logged,
+        and the batch settled anyway.
+        """
+        for returned, nacked in ((3, []), ([1, "2", 7, True], [2])):
+            self.listener._acker.reset_mock()
+            self.listener.logger.reset_mock()
+            self.callback.return_value = returned
+
+            for delivery_tag in (1, 2, 3):
+                self._deliver(delivery_tag)
+
+            message = self.listener.logger.error.call_args_list[0].args[0]
+            self.assertTrue(message.startswith("Batch callback returned"))
+            self.assertEqual(
+                [call.args[0] for call in self.listener._acker.nack.call_args_list], nacked
+            )
+            self.listener._acker.flush.assert_called_once()
+
+    def test_default_prefetch_count(self):
+        """When no prefetch count is given, it should be twice `max_batch_size`."""
+        self.assertEqual(self.listener._prefetch_count, 6)
+
+    def test_callback_error(self):
+        """When the callback raises, the whole batch should be nacked."""
+        self.callback.side_effect = Exception()
+
+        for delivery_tag in (1, 2, 3):
+            self._deliver(delivery_tag)
+
+        self.assertEqual(self.listener._acker.nack.call_count, 3)
+        self.listener._acker.ack.assert_not_called()
+
+    def test_invalid_body(self):
+        """When a message can't be deserialized, it should be nacked and left out of the batch."""
+        self._deliver(1, b"{")
+
+        self.listener._acker.nack.assert_called_once_with(1, requeue=False)
+        self.assertEqual(self.listener._batch, [])
+
+    def test_dispatcher(self):
+        """When the listener has a dispatcher, batches should be submitted to it."""
+        self.listener._dispatcher = mock.MagicMock()
+
+        for delivery_tag in (1, 2, 3):
+            self._deliver(delivery_tag)
+
+        key, callback, (batch,), on_done = self.listener._dispatcher.submit.call_args[0]
+        self.assertIsNone(key)
+        self.assertIs(callback, self.callback)
+        self.assertEqual(len(batch), 3)
+
+        future = Future()
+        future.set_result(None)
+        on_done(future)
+
+        self.listener._acker.flush.assert_called_once()
+
+    def test_on_channel_open(self):
+        """When a new channel opens, the pending batch should be dropped."""
+        self._deliver(1)
+
+        self.listener.on_channel_open(mock.MagicMock())
+
+        self.assertEqual(self.listener._batch, [])
+        self.listener._connection.ioloop.remove_timeout.assert_called_once()
+
+
+    def test_drain(self):
+        """When the listener is drained, the pending batch should be handed to the callback right
+        away, and messages delivered afterwards requeued."""
+        self._deliver(1)
+        on_drained = mock.MagicMock()
+        self.listener._stop_event.set()
+
+        self.listener._drain(None, on_drained)
+        self._deliver(2)
+
+        self.assertEqual(len(self.callback.call_args[0][0]), 1)
+        self.listener._acker.nack.assert_called_once_with(2, requeue=True)
+        self.assertEqual((self.listener.drained, self.listener.requeued), (1, 1))
+        on_drained.assert_called_once()
+
+
+    def test_metrics(self):
+        """Every batched message should be recorded in the listener's metrics, and be out of
+        flight once its batch is settled."""
+        self.listener._metrics = NaviListenerMetrics(f"batch-test-{id(self)}")
+
+        self._deliver(1)
+        self._deliver(2, body=b"{")
+        self.assertEqual(self.listener._metrics.in_flight.value, 1)
+
+        self.listener.flush_batch()
+
+        self.assertEqual(self.listener._metrics.delivered.value, 2)
+        self.assertEqual(self.listener._metrics.decode_errors.value, 1)
+        self.assertEqual(self.listener._metrics.in_flight.value, 0)
+
+    def test_dedup(self):
+        """Messages already handled should be acked without being batched."""
+        self.listener._dedup = NaviMemoryDedupCache()
+        self._deliver(1)
+        self.listener.flush_batch()
+
+        self._deliver(2)
+        self._deliver(1)
+        self.listener.flush_batch()
+
+        self.assertEqual(len(self.callback.call_args[0][0]), 1)
+        self.listener._acker.ack.assert_any_call(1)
+
+
+class TestListenBatch(TestCase):
+    """Test cases for the batch.listen_batch function."""
+
+    @mock.patch.object(NaviBatchListener, "listen")
+    def test_listen_batch(self, listen_mock):
+        """When `listen_batch` is called, a NaviBatchListener should be started."""
+        listener = listen_batch(queue_name="queue", routing_key="key", callback=print)
+
+        self.assertTrue(isinstance(listener, NaviBatchListener))
+        listen_mock.assert_called_once()
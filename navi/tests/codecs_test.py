@@ -0,0 +1,78 @@
+"""Test cases for navi.codecs"""
+from unittest import TestCase, mock
+
+from navi import config
+from navi.codecs import JsonCodec, NaviCodec, RawCodec, find_codec, get_codec, register_codec
+from navi.exceptions import NaviCodecException
+
+
+class TestCodecs(TestCase):
+    """Test cases for the codecs registry and the default codecs."""
+
+    def test_json_round_trip(self):
+        """When a message is encoded and decoded by JsonCodec, the same message should be
+        obtained, either with orjson or with the stdlib's json.
+        """
+        message = {"hello": "world", "numbers": [1, 2.5]}
+        codec = JsonCodec()
+
+        self.assertEqual(codec.decode(codec.encode(message)), message)
+
+        with mock.patch("navi.codecs.orjson", None):
+            self.assertEqual(codec.decode(memoryview(codec.encode(message).encode())), message)
+
+    def test_json_stdlib_compatible(self):
+        """When a message has non-string keys, or values orjson can't serialize, JsonCodec should
+        serialize it as the stdlib's json does.
+        """
+        codec = JsonCodec()
+
+        self.assertEqual(codec.decode(codec.encode({1: "one", None: "none"})),
+                         {"1": "one", "null": "none"})
+        self.assertEqual(codec.decode(codec.encode({"big": 2 ** 70})), {"big": 2 ** 70})
+
+    def test_json_invalid(self):
+        """When JsonCodec can't handle a message, TypeError or ValueError should be raised."""
+        codec = JsonCodec()
+
+        with self.assertRaises(TypeError):
+            codec.encode({"invalid": object()})
+
+        with self.assertRaises(ValueError):
+            codec.decode(b"{invalid")
+
+    def test_raw(self):
+        """When RawCodec is used, bytes should be passed through, and anything else rejected."""
+        codec = RawCodec()
+
+        self.assertEqual(codec.encode(bytearray(b"raw")), b"raw")
+        self.assertEqual(codec.decode(b"raw"), b"raw")
+
+        with self.assertRaises(TypeError):
+            codec.encode({"hello": "world"})
+
+    def test_get_codec(self):
+        """When `get_codec` is called, the codec registered with that name should be returned,
+        defaulting to the `NAVI_CODEC` config.
+        """
+        self.assertEqual(get_codec("raw").content_type, "application/octet-stream")
+        self.assertEqual(get_codec().name, config.NAVI_CODEC)
+
+        with self.assertRaises(NaviCodecException):
+            get_codec("unknown")
+
+    def test_register_find_codec(self):
+        """When a codec is registered, `find_codec` should return it for its content type, and
+        return the default for missing or unknown content types.
+        """
+        codec = mock.MagicMock(spec=NaviCodec)
+        codec.name = "custom"
+        codec.content_type = "application/x-custom"
+        default = get_codec("json")
+
+        register_codec(codec)
+
+        self.assertIs(get_codec("custom"), codec)
+        self.assertIs(find_codec("application/x-custom", default), codec)
+        self.assertIs(find_codec(None, default), default)
+        self.assertIs(find_codec("application/unknown", default), default)
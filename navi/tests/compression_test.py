@@ -0,0 +1,110 @@
+"""Test cases for navi.compression"""
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+
+from navi import config
+from navi.codecs import get_codec
+from navi.compression import (
+    NaviCompressor,
+    compress,
+    decode_body,
+    decompress,
+    get_compressor,
+    register_compressor,
+)
+from navi.exceptions import NaviCodecException
+
+
+class TestCompressors(TestCase):
+    """Test cases for the registered compressors."""
+
+    def test_round_trip(self):
+        """Every registered compressor should shrink a repetitive body, and restore it."""
+        body = b'{"values": [' + b", ".join([b'"navi"'] * 1000) + b"]}"
+
+        for name in ("zlib", "bz2", "lzma"):
+            with self.subTest(compressor=name):
+                compressed, encoding = compress(body, get_compressor(name), 0)
+
+                self.assertEqual(encoding, name)
+                self.assertLess(len(compressed), len(body))
+                self.assertEqual(decompress(compressed, encoding), body)
+
+    def test_invalid_body(self):
+        """When a body can't be decompressed, a ValueError should be raised."""
+        for name in ("zlib", "bz2", "lzma"):
+            with self.subTest(compressor=name):
+                with self.assertRaises(ValueError):
+                    decompress(b"not compressed", name)
+
+
+class TestCompress(TestCase):
+    """Test cases for the compression.compress function."""
+
+    def test_threshold(self):
+        """Bodies up to the threshold, in bytes once encoded, should be left uncompressed."""
+        compressor = get_compressor("zlib")
+
+        self.assertEqual(compress(b"x" * 10, compressor, 10), (b"x" * 10, None))
+        self.assertEqual(compress(b"x" * 11, compressor, 10)[1], "zlib")
+        self.assertEqual(compress("é" * 6, compressor, 10)[1], "zlib")
+
+    def test_disabled(self):
+        """When there's no compressor, bodies should be left uncompressed."""
+        self.assertEqual(compress(b"x" * 100, None, 0), (b"x" * 100, None))
+
+    def test_str_body(self):
+        """String bodies should be encoded before being compressed."""
+        compressed, _ = compress("x" * 100, get_compressor("zlib"), 0)
+
+        self.assertEqual(decompress(compressed, "zlib"), b"x" * 100)
+
+
+class TestDecompress(TestCase):
+    """Test cases for the compression.decompress function."""
+
+    def test_unknown_encoding(self):
+        """Bodies without a content encoding, or with an unknown one, should be passed through."""
+        self.assertEqual(decompress(b"{}", None), b"{}")
+        self.assertEqual(decompress(b"{}", "utf-8"), b"{}")
+
+    def test_decode_body(self):
+        """`decode_body` should decompress a body, and decode it with its content type's codec."""
+        body, encoding = compress(b'{"hello": "world"}', get_compressor("zlib"), 0)
+        properties = BasicProperties(content_type="application/json", content_encoding=encoding)
+
+        self.assertEqual(decode_body(properties, body, get_codec("json")), {"hello": "world"})
+
+
+class TestGetCompressor(TestCase):
+    """Test cases for the compression.get_compressor function."""
+
+    @mock.patch.object(config, "NAVI_COMPRESSION", None)
+    def test_disabled(self):
+        """When compression isn't configured, no compressor should be returned."""
+        self.assertIsNone(get_compressor())
+
+    @mock.patch.object(config, "NAVI_COMPRESSION", "lzma")
+    def test_config(self):
+        """The compressor should default to the `NAVI_COMPRESSION` config."""
+        self.assertEqual(get_compressor().name, "lzma")
+
+    def test_unknown(self):
+        """When no compressor is registered with the name, a NaviCodecException is raised."""
+        with self.assertRaises(NaviCodecException):
+            get_compressor("unknown")
+
+    def test_register(self):
+        """A registered compressor should be selectable by its name, and used to decompress
+        messages with its name as their content encoding.
+        """
+        compressor = mock.MagicMock(spec=NaviCompressor)
+        compressor.name = "custom"
+        compressor.decompress.return_value = b"{}"
+
+        with mock.patch.dict("navi.compression._COMPRESSORS"):
+            register_compressor(compressor)
+
+            self.assertIs(get_compressor("custom"), compressor)
+            self.assertEqual(decompress(b"packed", "custom"), b"{}")
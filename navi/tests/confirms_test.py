@@ -0,0 +1,73 @@
+"""Test cases for navi.confirms"""
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+from pika.frame import Method
+from pika.spec import Basic
+
+from navi.confirms import NaviConfirmChannel
+
+
+class TestNaviConfirmChannel(TestCase):
+    """Test cases for NaviConfirmChannel"""
+
+    def setUp(self):
+        """Initializes a NaviConfirmChannel over a mocked BlockingChannel."""
+        self.channel = mock.MagicMock()
+        self.channel._impl.confirm_delivery.side_effect = (
+            lambda ack_nack_callback, callback: callback(mock.MagicMock())
+        )
+        self.confirm_channel = NaviConfirmChannel(self.channel)
+
+    def _publish(self, count: int):
+        return [
+            self.confirm_channel.publish(
+                "exchange", "key", "{}", BasicProperties(headers={"message_id": str(index)})
+            )
+            for index in range(count)
+        ]
+
+    def test_init_enables_confirms(self):
+        """When a NaviConfirmChannel is initialized, confirms should be enabled on the underlying
+        channel.
+        """
+        self.channel._impl.confirm_delivery.assert_called_once()
+
+    def test_publish_pipelined(self):
+        """When `publish` is called, the message should be published without waiting for its
+        confirmation, and be kept as outstanding.
+        """
+        results = self._publish(3)
+
+        self.assertEqual(self.channel._impl.basic_publish.call_count, 3)
+        self.assertEqual(self.confirm_channel.outstanding, 3)
+        self.assertEqual([result.message_id for result in results], ["0", "1", "2"])
+        self.assertFalse(any(result.acked for result in results))
+
+    def test_on_confirmation_single(self):
+        """When a single ack or nack arrives, only the matching message should be resolved."""
+        results = self._publish(3)
+
+        self.confirm_channel._on_confirmation(Method(1, Basic.Ack(delivery_tag=2)))
+        self.confirm_channel._on_confirmation(Method(1, Basic.Nack(delivery_tag=1)))
+
+        self.assertEqual([result.acked for result in results], [False, True, False])
+        self.assertIsNotNone(results[0].error)
+        self.assertEqual(self.confirm_channel.outstanding, 1)
+
+    def test_on_confirmation_multiple(self):
+        """When a `multiple` ack arrives, every message up to its delivery tag should be acked."""
+        results = self._publish(3)
+
+        self.confirm_channel._on_confirmation(Method(1, Basic.Ack(delivery_tag=2, multiple=True)))
+
+        self.assertEqual([result.acked for result in results], [True, True, False])
+        self.assertEqual(self.confirm_channel.outstanding, 1)
+
+    def test_wait_timeout(self):
+        """When `wait` times out, the outstanding messages should be marked as failed."""
+        results = self._publish(2)
+
+        self.assertFalse(self.confirm_channel.wait(timeout=0))
+        self.assertTrue(all(result.error for result in results))
+        self.assertEqual(self.confirm_channel.outstanding, 0)
@@ -0,0 +1,122 @@
+"""Test cases for navi.dedup"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from navi.dedup import NaviFileDedupCache, NaviMemoryDedupCache, get_dedup_cache
+
+
+class TestNaviMemoryDedupCache(TestCase):
+    """Test cases for NaviMemoryDedupCache"""
+
+    def test_seen(self):
+        """Added ids should be seen, and checks counted as hits or misses."""
+        cache = NaviMemoryDedupCache()
+
+        self.assertFalse(cache.seen("1"))
+        cache.add("1")
+        self.assertTrue(cache.seen("1"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru(self):
+        """Past `max_size`, the least recently seen ids should be evicted first."""
+        cache = NaviMemoryDedupCache(max_size=2)
+
+        cache.add("1")
+        cache.add("2")
+        cache.seen("1")
+        cache.add("3")
+
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.seen("1"))
+        self.assertFalse(cache.seen("2"))
+        self.assertTrue(cache.seen("3"))
+
+    @mock.patch("navi.dedup.time.monotonic")
+    def test_ttl(self, monotonic):
+        """Ids should no longer be seen once their TTL passed."""
+        cache = NaviMemoryDedupCache(ttl=10)
+        monotonic.return_value = 100
+        cache.add("1")
+
+        monotonic.return_value = 109
+        self.assertTrue(cache.seen("1"))
+
+        monotonic.return_value = 110
+        self.assertFalse(cache.seen("1"))
+        self.assertEqual(len(cache), 0)
+
+
+class TestNaviFileDedupCache(TestCase):
+    """Test cases for NaviFileDedupCache"""
+
+    def setUp(self):
+        """Creates a directory for the cache's file."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "dedup.sqlite")
+
+    def cache(self, **kwargs) -> NaviFileDedupCache:
+        cache = NaviFileDedupCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+
+        return cache
+
+    def test_shared(self):
+        """Ids added through a cache should be seen by every cache using the same file."""
+        first, second = self.cache(), self.cache()
+
+        first.add("1")
+
+        self.assertTrue(second.seen("1"))
+        self.assertFalse(second.seen("2"))
+
+    @mock.patch("navi.dedup.time.time")
+    def test_ttl(self, now):
+        """Ids should no longer be seen once their TTL passed, and be pruned."""
+        cache = self.cache(ttl=10, prune_interval=2)
+        now.return_value = 100
+        cache.add("1")
+
+        now.return_value = 110
+        self.assertFalse(cache.seen("1"))
+
+        cache.add("2")
+
+        connection = cache._connect()  # pylint:disable = protected-access
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM navi_dedup").fetchone(), (1,))
+
+    def test_max_size(self):
+        """Past `max_size`, the oldest ids should be pruned."""
+        cache = self.cache(max_size=2, prune_interval=3)
+
+        for message_id in ("1", "2", "3"):
+            cache.add(message_id)
+
+        self.assertFalse(cache.seen("1"))
+        self.assertTrue(cache.seen("2"))
+        self.assertTrue(cache.seen("3"))
+
+    def test_unusable_file(self):
+        """When the file can't be used, ids should be considered not handled."""
+        cache = NaviFileDedupCache(os.path.dirname(self.path))
+        cache.logger = mock.MagicMock()
+
+        cache.add("1")
+
+        self.assertFalse(cache.seen("1"))
+        cache.logger.warning.assert_called()
+
+
+class TestGetDedupCache(TestCase):
+    """Test cases for the dedup.get_dedup_cache function."""
+
+    def test_get(self):
+        """True should stand for a new in-memory cache, and caches be returned as is."""
+        cache = NaviMemoryDedupCache()
+
+        self.assertIsInstance(get_dedup_cache(True), NaviMemoryDedupCache)
+        self.assertIs(get_dedup_cache(cache), cache)
+        self.assertIsNone(get_dedup_cache(None))
+        self.assertIsNone(get_dedup_cache(False))
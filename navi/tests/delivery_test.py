@@ -0,0 +1,77 @@
+"""Test cases for navi.delivery"""
+from types import MappingProxyType
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+
+from navi.codecs import get_codec
+from navi.delivery import NaviDelivery
+
+
+class TestNaviDelivery(TestCase):
+    """Test cases for NaviDelivery"""
+
+    def setUp(self):
+        """Initializes a NaviDelivery"""
+        self.method = mock.MagicMock(routing_key="some.routing.key", delivery_tag=7)
+        self.properties = BasicProperties(
+            content_type="application/json",
+            headers={"message_id": "id", "queue_name": "overridden"},
+        )
+        self.codec = mock.MagicMock(wraps=get_codec("json"))
+        self.delivery = NaviDelivery(
+            self.method,
+            self.properties,
+            b'{"hello": "world"}',
+            self.codec,
+            MappingProxyType({"listener_name": "navi-queue", "queue_name": "queue"}),
+        )
+
+    def test_body(self):
+        """When `body` is accessed, a read-only memoryview over the raw body should be returned."""
+        body = self.delivery.body
+
+        self.assertTrue(isinstance(body, memoryview))
+        self.assertTrue(body.readonly)
+        self.assertEqual(body.tobytes(), b'{"hello": "world"}')
+
+    def test_headers(self):
+        """When `headers` is accessed, the message's headers layered over the listener's metadata
+        should be returned, as a read-only mapping.
+        """
+        headers = self.delivery.headers
+
+        self.assertEqual(headers["message_id"], "id")
+        self.assertEqual(headers["listener_name"], "navi-queue")
+        self.assertEqual(headers["queue_name"], "overridden")
+
+        with self.assertRaises(TypeError):
+            headers["message_id"] = "other"
+
+    @mock.patch("navi.delivery.decode_body")
+    def test_payload_lazy_cached(self, decode_body_mock):
+        """When `payload` is accessed, the body should be decoded only once, according to the
+        message's properties.
+        """
+        decode_body_mock.return_value = {"hello": "world"}
+
+        self.assertEqual(self.delivery.payload, {"hello": "world"})
+        self.assertEqual(self.delivery.payload, {"hello": "world"})
+
+        decode_body_mock.assert_called_once_with(
+            self.properties, b'{"hello": "world"}', self.codec
+        )
+
+    def test_metadata(self):
+        """When metadata properties are accessed, they should come from the method and
+        properties.
+        """
+        self.assertEqual(self.delivery.message_id, "id")
+        self.assertEqual(self.delivery.routing_key, "some.routing.key")
+        self.assertEqual(self.delivery.delivery_tag, 7)
+        self.assertEqual(self.delivery.content_type, "application/json")
+
+    def test_slots(self):
+        """NaviDelivery instances should not have a __dict__."""
+        with self.assertRaises(AttributeError):
+            self.delivery.extra = True
@@ -0,0 +1,89 @@
+"""Test cases for navi.envelope"""
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+
+from navi.envelope import NaviEnvelopeFactory, get_envelope_factory
+
+
+class TestNaviEnvelopeFactory(TestCase):
+    """Test cases for NaviEnvelopeFactory"""
+
+    def setUp(self):
+        """Initializes a NaviEnvelopeFactory"""
+        self.factory = NaviEnvelopeFactory(host="test.host")
+
+    @mock.patch("navi.envelope.socket")
+    def test_init_resolves_host_once(self, socket_mock):
+        """When a NaviEnvelopeFactory is initialized without a host, `socket.getfqdn` should be
+        called once, and never again when building properties.
+        """
+        factory = NaviEnvelopeFactory()
+        factory.build()
+        factory.build()
+
+        socket_mock.getfqdn.assert_called_once()
+        self.assertEqual(factory.headers["from_host"], socket_mock.getfqdn.return_value)
+
+    def test_build(self):
+        """When `build` is called, a BasicProperties object should be created, containing the
+        metadata headers.
+        """
+        properties = self.factory.build()
+
+        self.assertTrue(isinstance(properties, BasicProperties))
+        self.assertEqual(properties.headers["from_host"], "test.host")
+        self.assertTrue(isinstance(properties.headers["published_at"], float))
+        self.assertTrue(properties.headers["message_id"])
+
+    def test_build_headers_not_shared(self):
+        """When `build` is called twice, each BasicProperties should get its own headers dict."""
+        first = self.factory.build()
+        second = self.factory.build()
+
+        first.headers["extra"] = True
+
+        self.assertNotIn("extra", second.headers)
+        self.assertNotIn("extra", self.factory.headers)
+
+    def test_message_id_sortable(self):
+        """When `message_id` is called repeatedly, the ids should be unique and increasing."""
+        message_ids = [self.factory.message_id() for _ in range(1000)]
+
+        self.assertEqual(len(set(message_ids)), 1000)
+        self.assertEqual(message_ids, sorted(message_ids))
+
+    @mock.patch("navi.envelope.time.time_ns")
+    def test_message_id_monotonic(self, time_ns):
+        """When the clock goes back, ids should keep increasing."""
+        time_ns.return_value = 2_000_000_000
+        first = self.factory.message_id()
+        time_ns.return_value = 1_000_000_000
+
+        self.assertLess(first, self.factory.message_id())
+
+    def test_reseed(self):
+        """When reseeded, as in a forked child process, the factory should get a new node id."""
+        node = self.factory.message_id()[20:]
+        self.factory._reseed()
+
+        self.assertNotEqual(self.factory.message_id()[20:], node)
+
+    def test_add_headers(self):
+        """When static and dynamic headers are added, built properties should contain them, and
+        dynamic headers should be computed for each message.
+        """
+        provider = mock.MagicMock(return_value="dynamic")
+        self.factory.add_static_header("service", "billing")
+        self.factory.add_dynamic_header("trace_id", provider)
+
+        headers = self.factory.build().headers
+        self.factory.build()
+
+        self.assertEqual(headers["service"], "billing")
+        self.assertEqual(headers["trace_id"], "dynamic")
+        self.assertEqual(provider.call_count, 2)
+
+    def test_get_envelope_factory_shared(self):
+        """When `get_envelope_factory` is called twice, the same factory should be returned."""
+        self.assertIs(get_envelope_factory(), get_envelope_factory())
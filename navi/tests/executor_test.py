@@ -0,0 +1,114 @@
+"""Test cases for navi.executor"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest import TestCase, mock
+
+from navi.executor import NaviDispatcher, ordering_key_getter
+
+
+class FakeExecutor:
+    """An Executor that keeps submitted calls pending until they're completed by the test."""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, function, *arguments):
+        future = Future()
+        self.calls.append((arguments, future))
+
+        return future
+
+    def complete(self, index: int = 0):
+        arguments, future = self.calls.pop(index)
+        future.set_result(arguments)
+
+
+class TestNaviDispatcher(TestCase):
+    """Test cases for NaviDispatcher"""
+
+    def setUp(self):
+        """Initializes a NaviDispatcher over a FakeExecutor, scheduling completions right away."""
+        self.executor = FakeExecutor()
+        self.on_done = mock.MagicMock()
+        self.dispatcher = NaviDispatcher(
+            self.executor, schedule=lambda function: function(), max_in_flight=2
+        )
+
+    def _submitted(self):
+        return [arguments[0] for arguments, _ in self.executor.calls]
+
+    def test_submit_max_in_flight(self):
+        """When more than `max_in_flight` calls are submitted, the exceeding ones should wait for
+        the running ones to complete.
+        """
+        for index in range(3):
+            self.dispatcher.submit(None, print, (index,), self.on_done)
+
+        self.assertEqual(self._submitted(), [0, 1])
+        self.assertEqual(self.dispatcher.pending, 1)
+
+        self.executor.complete()
+
+        self.assertEqual(self._submitted(), [1, 2])
+        self.assertEqual(self.dispatcher.in_flight, 2)
+        self.on_done.assert_called_once()
+
+    def test_submit_ordering_key(self):
+        """When calls with the same key are submitted, they should run one at a time, in order,
+        while calls with other keys run in parallel.
+        """
+        self.dispatcher.submit("a", print, ("a1",), self.on_done)
+        self.dispatcher.submit("a", print, ("a2",), self.on_done)
+        self.dispatcher.submit("b", print, ("b1",), self.on_done)
+
+        self.assertEqual(self._submitted(), ["a1", "b1"])
+
+        self.executor.complete(0)
+
+        self.assertEqual(self._submitted(), ["b1", "a2"])
+
+    def test_on_done_error(self):
+        """When `on_done` raises an Exception, it should be logged and dispatching continue."""
+        self.dispatcher.logger = mock.MagicMock()
+        self.on_done.side_effect = Exception()
+        self.dispatcher.submit(None, print, (1,), self.on_done)
+
+        self.executor.complete()
+
+        self.dispatcher.logger.error.assert_called_once()
+        self.assertEqual(self.dispatcher.in_flight, 0)
+
+    def test_thread_pool(self):
+        """When used with a ThreadPoolExecutor, every call should run and complete."""
+        completions = []
+        scheduled = []
+        executor = ThreadPoolExecutor(max_workers=4)
+        dispatcher = NaviDispatcher(executor, schedule=scheduled.append, max_in_flight=4)
+
+        for index in range(4):
+            dispatcher.submit(index, abs, (-index,), completions.append)
+
+        executor.shutdown(wait=True)
+        for function in scheduled:
+            function()
+
+        self.assertEqual(sorted(future.result() for future in completions), [0, 1, 2, 3])
+        self.assertEqual(dispatcher.in_flight, 0)
+
+
+class TestOrderingKeyGetter(TestCase):
+    """Test cases for the executor.ordering_key_getter function."""
+
+    def test_header_name(self):
+        """When given a header name, the getter should read it from headers or a delivery."""
+        getter = ordering_key_getter("customer_id")
+        delivery = mock.MagicMock(headers={"customer_id": 2})
+
+        self.assertEqual(getter({"customer_id": 1}, {}), 1)
+        self.assertEqual(getter(delivery), 2)
+
+    def test_callable_none(self):
+        """When given a callable or None, it should be returned as is."""
+        function = mock.MagicMock()
+
+        self.assertIs(ordering_key_getter(function), function)
+        self.assertIsNone(ordering_key_getter(None))
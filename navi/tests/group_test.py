@@ -0,0 +1,268 @@
+"""Test cases for navi.group"""
+from unittest import TestCase, mock
+
+from navi import config
+from navi.group import NaviListenerGroup
+from navi.listener import NaviListener, listen
+
+
+class TestNaviListenerGroup(TestCase):
+    """Test cases for NaviListenerGroup"""
+
+    def setUp(self):
+        """Initializes a NaviListenerGroup with mocked connections and ioloop."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.group = NaviListenerGroup(channels_per_connection=2)
+        self.group.logger = mock.MagicMock()
+        self.group._ioloop = mock.MagicMock()
+        self.connections = []
+
+        def init_connection(parameters, entry):
+            connection = mock.MagicMock(is_closed=False, is_closing=False)
+            self.connections.append((connection, entry))
+
+            return connection
+
+        self.group._init_connection = mock.MagicMock(side_effect=init_connection)
+
+    def _listener(self, index: int) -> NaviListener:
+        listener = mock.MagicMock(spec=NaviListener)
+        listener._queue_name = f"queue_{index}"
+        listener._reconnect = True
+        listener._connection_parameters = NaviListener(
+            queue_name=f"queue_{index}", routing_key="key", callback=print
+        )._connection_parameters
+
+        return listener
+
+    def test_attach(self):
+        """
+        When listeners are attached, they should share connections up to
+        `channels_per_connection`, and be connected once their connection opens.
+        """
+        listeners = [self._listener(index) for index in range(3)]
+
+        for listener in listeners:
+            self.group._attach(listener)
+
+        self.assertEqual(self.group.connection_count, 2)
+        listeners[0].on_connected.assert_not_called()
+
+        connection, entry = self.connections[0]
+        self.group._on_connected(entry, connection)
+
+        listeners[0].on_connected.assert_called_once_with(connection)
+        listeners[1].on_connected.assert_called_once_with(connection)
+        listeners[2].on_connected.assert_not_called()
+
+    def test_attach_open_connection(self):
+        """When a listener is attached to an open connection, it should be connected right away."""
+        self.group._attach(self._listener(0))
+        connection, entry = self.connections[0]
+        self.group._on_connected(entry, connection)
+        listener = self._listener(1)
+
+        self.group._attach(listener)
+
+        listener.on_connected.assert_called_once_with(connection)
+        self.assertEqual(self.group.connection_count, 1)
+
+    def test_add(self):
+        """
+        When a listener is added to a group that isn't started, it should be kept pending, and
+        attached on the ioloop thread otherwise.
+        """
+        listener = self._listener(0)
+        ioloop = self.group._ioloop
+        self.group._ioloop = None
+
+        self.group.add(listener)
+
+        self.assertEqual(self.group.listeners, [listener])
+
+        self.group._ioloop = ioloop
+        self.group.add(listener)
+
+        ioloop.add_callback_threadsafe.assert_called_once()
+
+    def test_close(self):
+        """When the group is closed, every connection should be closed, then the ioloop stopped."""
+        for index in range(3):
+            self.group._attach(self._listener(index))
+
+        self.group._close()
+
+        for connection, entry in self.connections:
+            connection.close.assert_called_once()
+            self.group._ioloop.stop.assert_not_called()
+            self.group._on_connection_closed(entry, connection, Exception())
+
+        self.group._ioloop.stop.assert_called_once()
+        self.assertEqual(self.group.connection_count, 0)
+
+    def test_connection_error(self):
+        """When a connection can't be opened, the error should be logged."""
+        self.group._attach(self._listener(0))
+        connection, entry = self.connections[0]
+
+        self.group._on_connection_error(entry, connection, Exception())
+
+        self.assertEqual(self.group.logger.error.call_count, 2)
+
+    def test_drain(self):
+        """When the group is stopped, its listeners should be drained, then its connections
+        closed."""
+        listeners = [self._listener(index) for index in range(2)]
+
+        for listener in listeners:
+            listener._stop_event = mock.MagicMock()
+            self.group._attach(listener)
+
+        connection, _ = self.connections[0]
+        self.group._drain(None)
+
+        self.assertTrue(self.group._stopping)
+        listeners[0]._stop_event.set.assert_called_once()
+        on_drained = listeners[0]._drain.call_args[0][1]
+        on_drained()
+        connection.close.assert_not_called()
+
+        listeners[1]._drain.call_args[0][1]()
+        connection.close.assert_called_once()
+
+    def test_invalid_channels_per_connection(self):
+        """When `channels_per_connection` is lower than 1, a ValueError should be raised."""
+        with self.assertRaises(ValueError):
+            NaviListenerGroup(channels_per_connection=0)
+
+
+class TestListenGroup(TestCase):
+    """Test cases for the listener.listen function with a group."""
+
+    @mock.patch.object(NaviListener, "listen")
+    def test_listen_group(self, listen_mock):
+        """When `listen` is called with a group, the listener should be added to it."""
+        group = mock.MagicMock()
+
+        listen(queue_name="queue", routing_key="key", callback=print, group=group)
+
+        (listener,), _ = group.add.call_args
+        self.assertEqual(listener._queue_name, "queue")
+        listen_mock.assert_not_called()
+
+
+class TestNaviListenerGroupReconnect(TestCase):
+    """Test cases for NaviListenerGroup's reconnection."""
+
+    def setUp(self):
+        """Initializes a NaviListenerGroup with a mocked connection and ioloop."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.group = NaviListenerGroup()
+        self.group.logger = mock.MagicMock()
+        self.group._ioloop = mock.MagicMock()
+        self.group._init_connection = mock.MagicMock()
+        self.listener = NaviListener(queue_name="queue", routing_key="key", callback=print)
+        self.listener.on_connected = mock.MagicMock()
+        self.group._attach(self.listener)
+        self.entry = self.group._connections[0]
+        self.group._on_connected(self.entry, self.entry.connection)
+
+    def test_reconnect(self):
+        """
+        When a connection of the group is lost, it should be reopened after the backoff's delay,
+        and its listeners connected again.
+        """
+        self.group._on_connection_closed(self.entry, self.entry.connection, Exception("gone"))
+
+        self.assertEqual(self.listener.state, "disconnected")
+        _, reconnect = self.group._ioloop.call_later.call_args[0]
+        reconnect()
+
+        self.assertEqual(self.group._init_connection.call_count, 2)
+        self.group._on_connected(self.entry, self.entry.connection)
+        self.assertEqual(self.listener.on_connected.call_count, 2)
+        self.assertEqual(self.entry.backoff.attempts, 0)
+
+    def test_reconnect_disabled(self):
+        """When a connection of the group is lost, its listeners created with `reconnect=False`
+        should be closed, and the connection dropped if none is left."""
+        self.listener._reconnect = False
+
+        self.group._on_connection_closed(self.entry, self.entry.connection, Exception("gone"))
+
+        self.assertEqual(self.listener.state, "closed")
+        self.group._ioloop.call_later.assert_not_called()
+        self.assertEqual(self.group.connection_count, 0)
+
+    def test_reconnect_fails_over(self):
+        """When a connection of the group is lost, its listeners should fail over to their next
+        broker node, those moving to another node than the connection's being attached to a
+        connection of their own."""
+        with mock.patch.object(config, "NAVI_BROKER_NODES", ("other",)):
+            listener = NaviListener(queue_name="other", routing_key="key", callback=print)
+            pinned = NaviListener(queue_name="pinned", routing_key="key", callback=print, node=0)
+
+        for other in (listener, pinned):
+            other.on_connected = mock.MagicMock()
+            self.group._attach(other)
+
+        self.group._on_connection_closed(self.entry, self.entry.connection, Exception("gone"))
+        _, reconnect = self.group._ioloop.call_later.call_args[0]
+        reconnect()
+
+        self.assertEqual(self.entry.listeners, [self.listener, pinned])
+        hosts = [call[0][0].host for call in self.group._init_connection.call_args_list]
+        self.assertEqual(hosts, ["test", "test", "other"])
+        self.assertEqual(self.group._connections[-1].listeners, [listener])
+
+    def test_reconnect_stopping(self):
+        """When the group is stopping, lost connections shouldn't be reopened."""
+        self.entry.connection.is_closed = self.entry.connection.is_closing = False
+        self.group._close()
+        self.group._on_connection_closed(self.entry, self.entry.connection, Exception("closed"))
+
+        self.group._ioloop.call_later.assert_not_called()
+        self.group._ioloop.stop.assert_called_once()
+
+    def test_attach_drops_dead_connection(self):
+        """When a listener is attached while a connection is closed for good, the closed one should
+        be dropped, and a new connection opened for the listener.
+        """
+        self.entry.is_open = False
+        self.entry.connection.is_closed = True
+        listener = NaviListener(queue_name="other", routing_key="key", callback=print)
+
+        self.group._attach(listener)
+
+        self.assertEqual(self.group.connection_count, 1)
+        self.assertIsNot(self.group._connections[0], self.entry)
+        self.assertEqual(self.group._connections[0].listeners, [listener])
+
+    def test_attach_reconnecting_connection(self):
+        """When a listener is attached while a connection waits to be reopened, it should share
+        it, and be connected once it's reopened.
+        """
+        self.entry.connection.is_closed = True
+        self.group._on_connection_closed(self.entry, self.entry.connection, Exception("gone"))
+        listener = NaviListener(queue_name="other", routing_key="key", callback=print)
+        listener.on_connected = mock.MagicMock()
+
+        self.group._attach(listener)
+
+        self.assertEqual(self.entry.listeners, [self.listener, listener])
+        listener.on_connected.assert_not_called()
+
+    def test_reconnect_without_listeners(self):
+        """When a connection left without listeners should be reopened, it should be dropped."""
+        self.group._on_connection_closed(self.entry, self.entry.connection, Exception("gone"))
+        self.entry.listeners.clear()
+        _, reconnect = self.group._ioloop.call_later.call_args[0]
+
+        reconnect()
+
+        self.assertEqual(self.group.connection_count, 0)
+        self.assertEqual(self.group._init_connection.call_count, 1)
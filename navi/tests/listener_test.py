@@ -1,13 +1,19 @@
 """Test cases for navi.listener"""
 
+import threading
+import zlib
 from unittest import TestCase, mock
 
-from pika import BaseConnection, ConnectionParameters, PlainCredentials
+from pika import BaseConnection, BasicProperties, ConnectionParameters, PlainCredentials
 from pika.channel import Channel
 from pika.exceptions import AMQPError
 
 from navi import config
-from navi.listener import NaviListener, listen
+from navi.acks import NaviAcker
+from navi.dedup import NaviMemoryDedupCache
+from navi.delivery import NaviDelivery
+from navi.exceptions import NaviInitException
+from navi.listener import NaviListener, listen, listen_on_nodes
 
 
 class TestNaviListener(TestCase):
@@ -93,6 +99,7 @@ class TestNaviListener(TestCase):
         """
         connection = mock.MagicMock(spec=BaseConnection)
         init_connection_mock.return_value = connection
+        self.listener._reconnect = False
 
         self.listener._listen()
 
@@ -108,6 +115,7 @@ class TestNaviListener(TestCase):
         the connection is not set, then `connection.close` shouldn't be called.
         """
         init_connection_mock.side_effect = AMQPError()
+        self.listener._reconnect = False
 
         self.listener._listen()
 
@@ -123,6 +131,7 @@ class TestNaviListener(TestCase):
         self.listener._connection_parameters = mock.MagicMock()
         connection = init_connection_mock.return_value
         connection.ioloop.start.side_effect = (AMQPError(), True)
+        self.listener._reconnect = False
 
         self.listener._listen()
 
@@ -154,43 +163,280 @@ class TestNaviListener(TestCase):
             routing_key=self.listener._routing_key,
         )
 
-    @mock.patch("navi.listener.json.loads")
-    def test_handle_delivery(self, json_loads_mock):
+    @mock.patch("navi.listener.decode_body")
+    def test_handle_delivery(self, decode_body_mock):
         """
-        When the listener's `handle_delivery` is called, if no error raises on json dumping,
+        When the listener's `handle_delivery` is called, if no error raises on decoding,
         `_callback` should be called.
         """
         channel = mock.MagicMock()
         method = mock.MagicMock()
         properties = mock.MagicMock()
         body = mock.MagicMock()
-        json_loads_mock.return_value = {}
+        decode_body_mock.return_value = {}
 
         self.listener.handle_delivery(channel, method, properties, body)
 
         self.listener._callback.assert_called_once()
 
-    @mock.patch("navi.listener.json.loads")
-    def test_handle_delivery_failure(self, json_loads_mock):
+    @mock.patch("navi.listener.decode_body")
+    def test_handle_delivery_failure(self, decode_body_mock):
         """
-        When the listener's `handle_delivery` is called, if an error raises on json dumping or
+        When the listener's `handle_delivery` is called, if an error raises on decoding or
         calling `_callback`, then the error should be caught and `logger.error` be called.
         """
         channel = mock.MagicMock()
         method = mock.MagicMock()
         properties = mock.MagicMock()
         body = mock.MagicMock()
-        json_loads_mock.return_value = {}
+        decode_body_mock.return_value = {}
         self.listener._callback.side_effect = Exception()
 
         self.listener.handle_delivery(channel, method, properties, body)
 
         self.listener.logger.error.assert_called_once()
 
+    def test_handle_delivery_metrics(self):
+        """
+        When the listener's `handle_delivery` is called, the delivery, its callback's outcome and
+        duration, and its end-to-end latency should be recorded in the listener's metrics.
+        """
+        metrics = self.listener._metrics = mock.MagicMock()
+        self.listener._callback.side_effect = Exception()
+        properties = BasicProperties(headers={"published_at": 1.0})
+
+        self.listener.handle_delivery(mock.MagicMock(), mock.MagicMock(), properties, b"{}")
+
+        metrics.on_delivery.assert_called_once_with({"published_at": 1.0})
+        metrics.on_done.assert_called_once_with(metrics.on_delivery.return_value, False)
+
+        self.listener.handle_delivery(mock.MagicMock(), mock.MagicMock(), properties, b"invalid")
+
+        metrics.on_decode_error.assert_called_once()
+        metrics.on_done.assert_called_once()
+
+    def test_handle_delivery_dedup(self):
+        """
+        When the listener has a deduplication cache, a message should be handled until its callback
+        succeeds, and acked without calling the callback once it did.
+        """
+        self.listener._dedup = NaviMemoryDedupCache()
+        acker = self.listener._acker = mock.MagicMock()
+        self.listener._callback.side_effect = [Exception(), None, None]
+        properties = BasicProperties(headers={"message_id": "1"})
+
+        for delivery_tag in (1, 2, 3):
+            self.listener.handle_delivery(
+                mock.MagicMock(), mock.MagicMock(delivery_tag=delivery_tag), properties, b"{}"
+            )
+
+        self.assertEqual(self.listener._callback.call_count, 2)
+        acker.nack.assert_called_once_with(1, requeue=False)
+        self.assertEqual(acker.ack.call_args_list, [mock.call(2), mock.call(3)])
+        self.assertEqual((self.listener._dedup.hits, self.listener._dedup.misses), (1, 2))
+
+    def test_handle_delivery_content_type(self):
+        """
+        When the listener's `handle_delivery` is called, the body should be decoded with the codec
+        registered for the message's content type.
+        """
+        properties = BasicProperties(content_type="application/octet-stream", headers={})
+
+        self.listener.handle_delivery(mock.MagicMock(), mock.MagicMock(), properties, b"raw")
+
+        self.listener._callback.assert_called_once_with(mock.ANY, b"raw")
+
+    def test_handle_delivery_compressed(self):
+        """
+        When the listener's `handle_delivery` is called with a compressed message, the body should
+        be decompressed before being decoded.
+        """
+        properties = BasicProperties(
+            content_type="application/json", content_encoding="zlib", headers={}
+        )
+
+        self.listener.handle_delivery(
+            mock.MagicMock(), mock.MagicMock(), properties, zlib.compress(b'{"hello": "world"}')
+        )
+
+        self.listener._callback.assert_called_once_with(mock.ANY, {"hello": "world"})
+
+    @mock.patch("navi.listener.decode_body")
+    def test_handle_delivery_lazy(self, decode_body_mock):
+        """
+        When the listener's `handle_delivery` is called in lazy delivery mode, `_callback` should
+        be called with a single NaviDelivery, and the body shouldn't be decoded.
+        """
+        self.listener._lazy_delivery = True
+        properties = BasicProperties(headers={"message_id": "id"})
+
+        self.listener.handle_delivery(mock.MagicMock(), mock.MagicMock(), properties, b"{}")
+
+        (delivery,), _ = self.listener._callback.call_args
+        self.assertTrue(isinstance(delivery, NaviDelivery))
+        self.assertEqual(delivery.headers["queue_name"], "test_queue")
+        decode_body_mock.assert_not_called()
+
+    def test_on_connected_executor(self):
+        """
+        When `on_connected` is called on a listener with an executor, a NaviDispatcher should be
+        created, scheduling completions on the connection's ioloop.
+        """
+        self.listener._executor = mock.MagicMock()
+        connection = mock.MagicMock()
+
+        self.listener.on_connected(connection)
+
+        self.assertEqual(
+            self.listener._dispatcher._schedule, connection.ioloop.add_callback_threadsafe
+        )
+
+    def test_handle_delivery_executor(self):
+        """
+        When the listener's `handle_delivery` is called with a dispatcher, the callback should be
+        submitted to it with the message's ordering key, and errors logged once it's done.
+        """
+        self.listener._dispatcher = mock.MagicMock()
+        self.listener._get_ordering_key = lambda headers, _: headers["customer_id"]
+        properties = BasicProperties(headers={"customer_id": 7, "message_id": "id"})
+
+        self.listener.handle_delivery(mock.MagicMock(), mock.MagicMock(), properties, b"{}")
+
+        key, callback, arguments, on_done = self.listener._dispatcher.submit.call_args[0]
+        self.assertEqual(key, 7)
+        self.assertIs(callback, self.listener._callback)
+        self.assertEqual(arguments[1], {})
+
+        on_done(mock.MagicMock(exception=mock.MagicMock(return_value=Exception())))
+        self.listener.logger.error.assert_called_once()
+
+    def test_on_channel_open_manual_ack(self):
+        """
+        When `on_channel_open` is called on a listener with a prefetch count in manual ack mode,
+        the channel's QoS should be set, a NaviAcker created, and messages consumed without
+        auto ack.
+        """
+        self.listener._prefetch_count = 50
+        self.listener._manual_ack = True
+        channel = mock.MagicMock(spec=Channel)
+
+        self.listener.on_channel_open(channel)
+        self.listener.on_queue_declared(mock.MagicMock())
+
+        channel.basic_qos.assert_called_once_with(prefetch_size=0, prefetch_count=50)
+        self.assertIsNotNone(self.listener._acker)
+        channel.basic_consume.assert_called_once_with(
+            self.listener._queue_name, self.listener.handle_delivery, auto_ack=False
+        )
+
+    def test_handle_delivery_manual_ack(self):
+        """
+        When the listener's `handle_delivery` is called in manual ack mode, the message should be
+        acked if the callback succeeds, and nacked if it fails.
+        """
+        self.listener._acker = mock.MagicMock()
+        properties = BasicProperties(headers={})
+
+        def deliver(delivery_tag, body):
+            method = mock.MagicMock(delivery_tag=delivery_tag)
+            self.listener.handle_delivery(mock.MagicMock(), method, properties, body)
+
+        deliver(1, b"{}")
+        self.listener._callback.side_effect = Exception()
+        deliver(2, b"{}")
+        deliver(3, b"{")
+
+        self.assertEqual(
+            self.listener._acker.method_calls,
+            [
+                mock.call.track(1),
+                mock.call.ack(1),
+                mock.call.track(2),
+                mock.call.nack(2, requeue=False),
+                mock.call.track(3),
+                mock.call.nack(3, requeue=False),
+            ],
+        )
+
+
+    def test_handle_delivery_stopping(self):
+        """
+        When the listener's `handle_delivery` is called while it's stopping in manual ack mode,
+        the message should be requeued without calling the callback.
+        """
+        self.listener._acker = mock.MagicMock()
+        self.listener._stop_event.set()
+        method = mock.MagicMock(delivery_tag=1)
+
+        self.listener.handle_delivery(mock.MagicMock(), method, BasicProperties(), b"{}")
+
+        self.listener._callback.assert_not_called()
+        self.assertEqual(
+            self.listener._acker.method_calls,
+            [mock.call.track(1), mock.call.nack(1, requeue=True)],
+        )
+        self.assertEqual(self.listener.requeued, 1)
+
+    def test_drain(self):
+        """
+        When the listener is drained, its consumer should be cancelled, and `on_drained` called
+        once its callbacks in flight are done, after flushing its acks.
+        """
+        self.listener._channel = mock.MagicMock(is_open=True)
+        self.listener._consumer_tag = "ctag"
+        self.listener._connection = connection = mock.MagicMock(is_open=True)
+        self.listener._acker = mock.MagicMock()
+        self.listener._dispatcher = mock.MagicMock(in_flight=1, pending=0)
+        on_drained = mock.MagicMock()
+
+        self.listener._drain(None, on_drained)
+
+        self.listener._channel.basic_cancel.assert_called_once_with("ctag")
+        on_drained.assert_not_called()
+
+        self.listener._dispatcher.in_flight = 0
+        connection.ioloop.call_later.call_args[0][1]()
+
+        self.listener._acker.flush.assert_called_once()
+        on_drained.assert_called_once()
+        self.assertEqual(self.listener.abandoned, 0)
+
+    @mock.patch("navi.listener.time.monotonic", return_value=10)
+    def test_drain_timeout(self, monotonic):  # pylint:disable = unused-argument
+        """When the listener's callbacks in flight aren't done by the deadline, they should be
+        abandoned."""
+        self.listener._connection = mock.MagicMock(is_open=True)
+        self.listener._dispatcher = mock.MagicMock(in_flight=2, pending=1)
+        on_drained = mock.MagicMock()
+
+        self.listener._drain(5, on_drained)
+
+        on_drained.assert_called_once()
+        self.assertEqual(self.listener.abandoned, 3)
+        self.listener.logger.warning.assert_called_once()
+
 
 class TestListen(TestCase):
     """Test cases for the listener.listen function."""
 
+    @mock.patch.object(NaviListener, "listen")
+    def test_listen_on_nodes(self, listen_mock):
+        """When `listen_on_nodes` is called, a listener pinned to each broker node should be
+        started."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+
+        with mock.patch.object(config, "NAVI_BROKER_NODES", ("other",)):
+            listeners = listen_on_nodes(
+                queue_name="my_queue", routing_key="key", callback=mock.MagicMock()
+            )
+
+        self.assertEqual(
+            [listener._connection_parameters.host for listener in listeners], ["test", "other"]
+        )
+        self.assertEqual(listen_mock.call_count, 2)
+
     @mock.patch.object(NaviListener, "listen")
     @mock.patch.object(NaviListener, "_init_connection_params")
     def test_listen(self, init_connection_params_mock, listen_mock):
@@ -205,3 +451,185 @@ class TestListen(TestCase):
 
         init_connection_params_mock.assert_called_once()
         listen_mock.assert_called_once()
+
+
+class TestNaviListenerReconnect(TestCase):
+    """Test cases for NaviListener's reconnection."""
+
+    def setUp(self):
+        """Initializes a NaviListener with a state callback."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.listener = NaviListener(
+            queue_name="test_queue", routing_key="test_routing_key", callback=mock.MagicMock()
+        )
+        self.listener.logger = mock.MagicMock()
+        self.states = []
+        self.listener.add_state_callback(lambda listener, state: self.states.append(state))
+
+    @mock.patch.object(NaviListener, "_init_connection")
+    def test_listen_reconnect(self, init_connection_mock):
+        """
+        When the listener's connection is lost, a new one should be opened after the backoff's
+        delay, until the listener is stopped.
+        """
+        lost, stopped = mock.MagicMock(), mock.MagicMock()
+        stopped.ioloop.start.side_effect = lambda: self.listener.stop()
+        init_connection_mock.side_effect = (lost, stopped)
+        self.listener._backoff.next_delay = mock.MagicMock(return_value=0)
+
+        self.listener._listen()
+
+        lost.ioloop.start.assert_called_once()
+        stopped.ioloop.start.assert_called_once()
+        self.listener._backoff.next_delay.assert_called_once()
+        self.assertEqual(
+            self.states, ["connecting", "disconnected", "connecting", "disconnected", "closed"]
+        )
+
+    @mock.patch.object(NaviListener, "_init_connection")
+    def test_stop(self, init_connection_mock):
+        """
+        When `stop` is called on a running listener, its connection should be closed from the
+        ioloop thread, and its thread end without reconnecting.
+        """
+        started, closed = threading.Event(), threading.Event()
+        connection = init_connection_mock.return_value
+        connection.is_closing = connection.is_closed = False
+        connection.ioloop.start.side_effect = lambda: started.set() or closed.wait(5)
+        connection.close.side_effect = closed.set
+        self.listener._ioloop = mock.MagicMock()
+        self.listener._ioloop.add_callback_threadsafe.side_effect = lambda callback: callback()
+
+        self.listener.listen()
+        started.wait(5)
+
+        self.assertTrue(self.listener.stop(timeout=5))
+        connection.close.assert_called_once()
+        init_connection_mock.assert_called_once()
+        self.assertEqual(self.listener.state, "closed")
+
+    @mock.patch.object(NaviListener, "_init_connection")
+    def test_stop_backoff(self, init_connection_mock):
+        """When `stop` is called while the listener waits to reconnect, it should end right away."""
+        disconnected = threading.Event()
+        init_connection_mock.side_effect = AMQPError()
+        self.listener._backoff.next_delay = mock.MagicMock(return_value=60)
+        self.listener.add_state_callback(
+            lambda listener, state: state == "disconnected" and disconnected.set()
+        )
+
+        self.listener.listen()
+        disconnected.wait(5)
+
+        self.assertTrue(self.listener.stop(timeout=5))
+        init_connection_mock.assert_called_once()
+
+    @mock.patch.object(config, "NAVI_BROKER_NODES", ("other", "third:5673"))
+    @mock.patch.object(NaviListener, "_init_connection")
+    def test_listen_fails_over(self, init_connection_mock):
+        """When the listener's connection is lost, it should reconnect to the next broker node,
+        unless it's pinned to a node."""
+        lost, stopped = mock.MagicMock(), mock.MagicMock()
+        stopped.ioloop.start.side_effect = lambda: listener.stop()
+        init_connection_mock.side_effect = (lost, stopped)
+        listener = NaviListener(
+            queue_name="test_queue", routing_key="test_routing_key", callback=mock.MagicMock()
+        )
+        listener._backoff.next_delay = mock.MagicMock(return_value=0)
+
+        listener._listen()
+
+        hosts = [call[0][0].host for call in init_connection_mock.call_args_list]
+        self.assertEqual(hosts, ["test", "other"])
+
+        pinned = NaviListener(
+            queue_name="test_queue",
+            routing_key="test_routing_key",
+            callback=mock.MagicMock(),
+            node=2,
+        )
+        pinned._next_node()
+
+        self.assertEqual(pinned._connection_parameters.host, "third")
+        self.assertEqual(pinned._connection_parameters.port, 5673)
+        self.assertEqual(pinned._thread_name, "navi-test_queue@third:5673")
+
+        with self.assertRaises(NaviInitException):
+            NaviListener(
+                queue_name="test_queue",
+                routing_key="test_routing_key",
+                callback=mock.MagicMock(),
+                node=3,
+            )
+
+    def test_on_connected(self):
+        """When the listener connects, the backoff should be reset and its state set."""
+        self.listener._backoff.next_delay()
+        connection = mock.MagicMock()
+
+        self.listener.on_connected(connection)
+
+        self.assertEqual(self.listener._backoff.attempts, 0)
+        self.assertEqual(self.listener.state, "connected")
+        connection.add_on_connection_blocked_callback.assert_called_once_with(
+            self.listener.on_connection_blocked
+        )
+
+    def test_on_connection_closed(self):
+        """When the listener's connection is closed, its ioloop should be stopped."""
+        connection = mock.MagicMock()
+
+        self.listener.on_connection_closed(connection, Exception("gone"))
+
+        connection.ioloop.stop.assert_called_once()
+        self.assertEqual(self.states, ["disconnected"])
+
+    def test_on_connection_blocked(self):
+        """When the connection is blocked and unblocked, the listener's state should follow."""
+        self.listener.on_connection_blocked(mock.MagicMock(), mock.MagicMock())
+        self.listener.on_connection_unblocked(mock.MagicMock(), mock.MagicMock())
+
+        self.assertEqual(self.states, ["blocked", "connected"])
+
+    def test_on_channel_closed(self):
+        """
+        When the listener's channel is closed while its connection is open, a new channel should
+        be opened on it after the backoff's delay.
+        """
+        connection = mock.MagicMock(is_open=True)
+        channel = mock.MagicMock()
+        self.listener._connection = connection
+        self.listener._channel = channel
+
+        self.listener.on_channel_closed(channel, Exception("deleted"))
+
+        _, reopen = connection.ioloop.call_later.call_args[0]
+        reopen()
+        connection.channel.assert_called_once_with(on_open_callback=self.listener.on_channel_open)
+
+    def test_on_channel_closed_resets_acker(self):
+        """When the listener's channel is closed in manual ack mode, its unacked deliveries should
+        be forgotten, so they're not acked on the next channel.
+        """
+        channel = mock.MagicMock(is_open=True)
+        self.listener._channel = channel
+        self.listener._acker = NaviAcker(channel, batch_size=10)
+        self.listener._acker.track(1)
+        self.listener._acker.ack(1)
+        self.listener._stop_event.set()
+
+        self.listener.on_channel_closed(channel, Exception("closed"))
+
+        self.assertEqual(self.listener._acker.waiting, 0)
+        self.listener._acker.flush()
+        channel.basic_ack.assert_not_called()
+
+    def test_state_callback_error(self):
+        """When a state callback raises, the error should be logged."""
+        self.listener.add_state_callback(mock.MagicMock(side_effect=Exception()))
+
+        self.listener._set_state("connecting")
+
+        self.listener.logger.error.assert_called_once()
@@ -0,0 +1,376 @@
+"""Test cases for navi.memory"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+from pika.exceptions import ChannelClosedByBroker, ChannelWrongStateError
+
+from navi import config
+from navi.listener import NaviListener
+from navi.memory import (
+    DIRECT_REPLY_TO,
+    MemoryBlockingConnection,
+    MemoryConnection,
+    MemoryIOLoop,
+    NaviMemoryBroker,
+    get_broker,
+    topic_matches,
+)
+from navi.publisher import NaviPublisher
+
+
+def run_pending(ioloop: MemoryIOLoop):
+    """Runs the callbacks scheduled on `ioloop` so far, and those they schedule."""
+    ioloop.add_callback_threadsafe(ioloop.stop)
+    ioloop.start()
+
+
+class TestTopicMatches(TestCase):
+    """Test cases for the memory.topic_matches function."""
+
+    def test_matches(self):
+        """`*` should match exactly one word, and `#` zero or more words."""
+        cases = [
+            ("orders.created", "orders.created", True),
+            ("orders.created", "orders.deleted", False),
+            ("orders.*", "orders.created", True),
+            ("orders.*", "orders", False),
+            ("orders.*", "orders.created.eu", False),
+            ("orders.#", "orders", True),
+            ("orders.#", "orders.created.eu", True),
+            ("#.eu", "orders.created.eu", True),
+            ("*.created.#", "orders.created", True),
+            ("#", "", True),
+            ("orders.#.eu", "orders.eu", True),
+            ("orders.#.eu", "orders.created.us", False),
+        ]
+
+        for pattern, routing_key, expected in cases:
+            with self.subTest(pattern=pattern, routing_key=routing_key):
+                self.assertEqual(topic_matches(pattern, routing_key), expected)
+
+
+class TestNaviMemoryBroker(TestCase):
+    """Test cases for NaviMemoryBroker"""
+
+    def setUp(self):
+        """Initializes a NaviMemoryBroker, and a blocking connection's channel to it."""
+        self.broker = NaviMemoryBroker()
+        self.channel = MemoryBlockingConnection(self.broker).channel()
+
+    def declare(self, queue: str, exchange: str, routing_key: str):
+        self.channel.queue_declare(queue=queue)
+        self.channel.queue_bind(queue=queue, exchange=exchange, routing_key=routing_key)
+
+    def test_direct_routing(self):
+        """Direct exchanges should route messages to the queues bound with their routing key."""
+        self.declare("created", "amq.direct", "orders.created")
+        self.declare("deleted", "amq.direct", "orders.deleted")
+
+        self.assertEqual(self.broker.publish("amq.direct", "orders.created", b"1"), 1)
+        self.assertEqual(self.broker.publish("amq.direct", "orders.unknown", b"2"), 0)
+
+        self.assertEqual(self.broker.queue_size("created"), 1)
+        self.assertEqual(self.broker.queue_size("deleted"), 0)
+
+    def test_fanout_routing(self):
+        """Fanout exchanges should route messages to every bound queue."""
+        self.declare("first", "amq.fanout", "")
+        self.declare("second", "amq.fanout", "ignored")
+
+        self.assertEqual(self.broker.publish("amq.fanout", "anything", b"1"), 2)
+
+    def test_topic_routing(self):
+        """Topic exchanges should route messages to the queues bound with a matching pattern."""
+        self.declare("all", "amq.topic", "orders.#")
+        self.declare("eu", "amq.topic", "*.*.eu")
+
+        self.broker.publish("amq.topic", "orders.created.eu", b"1")
+        self.broker.publish("amq.topic", "orders.created.us", b"2")
+
+        self.assertEqual(self.broker.queue_size("all"), 2)
+        self.assertEqual(self.broker.queue_size("eu"), 1)
+
+    def test_default_exchange(self):
+        """The default exchange should route messages to the queue named as their routing key."""
+        self.channel.queue_declare(queue="orders")
+
+        self.channel.basic_publish(exchange="", routing_key="orders", body=b"1")
+
+        self.assertEqual(self.broker.queue_size("orders"), 1)
+
+    def test_exchange_errors(self):
+        """Redeclaring an exchange with another type, or publishing to a missing one, should close
+        the channel with the broker's error."""
+        self.channel.exchange_declare(exchange="orders", exchange_type="fanout")
+
+        with self.assertRaises(ChannelClosedByBroker) as context:
+            self.channel.exchange_declare(exchange="orders", exchange_type="topic")
+
+        self.assertEqual(context.exception.reply_code, 406)
+
+        with self.assertRaises(ChannelWrongStateError):
+            self.channel.basic_publish(exchange="orders", routing_key="", body=b"1")
+
+        channel = MemoryBlockingConnection(self.broker).channel()
+
+        with self.assertRaises(ChannelClosedByBroker) as context:
+            channel.basic_publish(exchange="missing", routing_key="", body=b"1")
+
+        self.assertEqual(context.exception.reply_code, 404)
+
+    def test_exclusive_queue(self):
+        """Exclusive queues should be locked to their connection, and deleted when it closes."""
+        connection = MemoryBlockingConnection(self.broker)
+        connection.channel().queue_declare(queue="exclusive", exclusive=True)
+
+        with self.assertRaises(ChannelClosedByBroker) as context:
+            self.channel.queue_declare(queue="exclusive")
+
+        self.assertEqual(context.exception.reply_code, 405)
+
+        connection.close()
+
+        self.assertNotIn("exclusive", self.broker.queue_names())
+
+
+class TestMemoryConsumers(TestCase):
+    """Test cases for consuming from a NaviMemoryBroker, through a MemoryConnection."""
+
+    def setUp(self):
+        """Initializes a NaviMemoryBroker with a queue, and an open MemoryConnection's channel."""
+        self.broker = NaviMemoryBroker()
+        self.ioloop = MemoryIOLoop()
+        self.connection = MemoryConnection(self.broker, self.ioloop)
+        run_pending(self.ioloop)
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue="orders")
+        self.deliveries = []
+
+    def on_message(self, channel, method, properties, body):  # pylint:disable = unused-argument
+        self.deliveries.append((method.delivery_tag, method.redelivered, body))
+
+    def publish(self, count: int):
+        for index in range(count):
+            self.broker.publish("", "orders", str(index).encode())
+
+    def test_prefetch(self):
+        """Consumers should get no more unacked messages than their channel's prefetch count."""
+        self.channel.basic_qos(prefetch_count=2)
+        self.channel.basic_consume("orders", self.on_message)
+        self.publish(5)
+        run_pending(self.ioloop)
+
+        self.assertEqual([body for _, _, body in self.deliveries], [b"0", b"1"])
+
+        self.channel.basic_ack(delivery_tag=2, multiple=True)
+        run_pending(self.ioloop)
+
+        self.assertEqual([body for _, _, body in self.deliveries], [b"0", b"1", b"2", b"3"])
+        self.assertEqual(self.broker.queue_size("orders"), 1)
+
+    def test_nack_requeue(self):
+        """Nacked messages should be redelivered in order, flagged as redelivered, unless they're
+        not requeued."""
+        self.channel.basic_qos(prefetch_count=3)
+        self.channel.basic_consume("orders", self.on_message)
+        self.publish(3)
+        run_pending(self.ioloop)
+
+        self.channel.basic_nack(delivery_tag=1, requeue=False)
+        self.channel.basic_nack(delivery_tag=3, multiple=True, requeue=True)
+        run_pending(self.ioloop)
+
+        self.assertEqual(self.deliveries[3:], [(4, True, b"1"), (5, True, b"2")])
+
+    def test_round_robin(self):
+        """Messages should be spread across a queue's consumers, round robin."""
+        other = []
+        self.channel.basic_consume("orders", self.on_message, auto_ack=True)
+        self.connection.channel().basic_consume(
+            "orders", lambda *args: other.append(args[3]), auto_ack=True
+        )
+        self.publish(4)
+        run_pending(self.ioloop)
+
+        self.assertEqual([body for _, _, body in self.deliveries], [b"0", b"2"])
+        self.assertEqual(other, [b"1", b"3"])
+
+    def test_unknown_delivery_tag(self):
+        """Acking an unknown delivery tag should close the channel with a 406 error, and requeue
+        its unacked messages."""
+        closed = mock.MagicMock()
+        self.channel.add_on_close_callback(closed)
+        self.channel.basic_consume("orders", self.on_message)
+        self.publish(1)
+        run_pending(self.ioloop)
+
+        self.channel.basic_ack(delivery_tag=42)
+        run_pending(self.ioloop)
+
+        self.assertTrue(self.channel.is_closed)
+        self.assertEqual(closed.call_args[0][1].reply_code, 406)
+        self.assertEqual(self.broker.queue_size("orders"), 1)
+
+    def test_direct_reply_to(self):
+        """Messages published with a direct reply-to should carry the name of their channel's
+        reply pseudo-queue, whose replies reach its consumer until it's cancelled."""
+        requests = []
+        self.channel.basic_consume(
+            "orders", lambda *args: requests.append(args[2]), auto_ack=True
+        )
+        tag = self.channel.basic_consume(DIRECT_REPLY_TO, self.on_message, auto_ack=True)
+        properties = BasicProperties(reply_to=DIRECT_REPLY_TO, correlation_id="1")
+        self.channel.basic_publish("", "orders", b"request", properties)
+        run_pending(self.ioloop)
+
+        reply_to = requests[0].reply_to
+        self.assertTrue(reply_to.startswith(f"{DIRECT_REPLY_TO}."))
+        self.assertEqual(properties.reply_to, DIRECT_REPLY_TO)
+
+        self.broker.publish("", reply_to, b"reply", BasicProperties(correlation_id="1"))
+        run_pending(self.ioloop)
+        self.assertEqual([body for _, _, body in self.deliveries], [b"reply"])
+
+        self.channel.basic_cancel(tag)
+        self.assertEqual(self.broker.publish("", reply_to, b"late"), 0)
+
+    def test_direct_reply_to_errors(self):
+        """Direct reply-to should need a reply consumer, in auto ack mode."""
+        self.channel.basic_publish(
+            "", "orders", b"request", BasicProperties(reply_to=DIRECT_REPLY_TO)
+        )
+        self.assertTrue(self.channel.is_closing)
+
+        channel = self.connection.channel()
+        channel.basic_consume(DIRECT_REPLY_TO, self.on_message)
+        self.assertTrue(channel.is_closing)
+        run_pending(self.ioloop)
+
+    def test_close_connections(self):
+        """Closing the broker's connections should call their close callbacks with the reason."""
+        on_close = mock.MagicMock()
+        connection = MemoryConnection(self.broker, self.ioloop, on_close_callback=on_close)
+        run_pending(self.ioloop)
+
+        self.broker.close_connections()
+        run_pending(self.ioloop)
+
+        self.assertTrue(connection.is_closed)
+        self.assertEqual(on_close.call_args[0][1].reply_code, 320)
+
+
+class TestMemoryTransport(TestCase):
+    """Test cases for publishing to, and listening at, the in-memory broker through the memory
+    transport."""
+
+    def setUp(self):
+        """Configures Navi to use the memory transport."""
+        config.init_config(
+            broker_host="memory",
+            broker_port=5672,
+            username="guest",
+            password="guest",
+            transport="memory",
+        )
+        self.addCleanup(get_broker().reset)
+        self.addCleanup(setattr, config, "NAVI_TRANSPORT", "pika")
+
+    def test_publish_and_listen(self):
+        """Messages published with a NaviPublisher should be delivered to a NaviListener bound to
+        their routing key, and acked."""
+        received = []
+        done = threading.Event()
+
+        def callback(info, message):  # pylint:disable = unused-argument
+            received.append(message)
+
+            if len(received) == 3:
+                done.set()
+
+        listener = NaviListener(
+            queue_name="memory_orders",
+            routing_key="orders.*",
+            callback=callback,
+            manual_ack=True,
+            prefetch_count=10,
+        )
+        listener.listen()
+        self.addCleanup(listener.stop, 5)
+
+        publisher = NaviPublisher(routing_key="orders.created")
+
+        while "memory_orders" not in get_broker().queue_names():
+            threading.Event().wait(0.01)
+
+        self.assertEqual(
+            publisher.publish_many([{"id": 1}, {"id": 2}, {"id": 3}]),
+            [mock.ANY, mock.ANY, mock.ANY],
+        )
+        NaviPublisher(routing_key="users.created").publish({"id": 4})
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(received, [{"id": 1}, {"id": 2}, {"id": 3}])
+        self.assertTrue(listener.stop(5))
+        self.assertNotIn("memory_orders", get_broker().queue_names())
+
+    def test_drain(self):
+        """When a listener is stopped, the callbacks in flight should complete, and their messages
+        be acked, before its connection is closed."""
+        received = []
+        started, release = threading.Event(), threading.Event()
+
+        def callback(info, message):  # pylint:disable = unused-argument
+            started.set()
+            release.wait(5)
+            received.append(message)
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        listener = NaviListener(
+            queue_name="memory_drain",
+            routing_key="orders.*",
+            callback=callback,
+            manual_ack=True,
+            prefetch_count=10,
+            executor=executor,
+        )
+        listener.listen()
+        self.addCleanup(listener.stop, 5)
+
+        while "memory_drain" not in get_broker().queue_names():
+            threading.Event().wait(0.01)
+
+        NaviPublisher(routing_key="orders.created").publish_many([{"id": 1}, {"id": 2}])
+        self.assertTrue(started.wait(5))
+
+        # Both messages are handed to the executor before stopping, or the second one is requeued.
+        while listener._dispatcher.in_flight + listener._dispatcher.pending < 2:
+            threading.Event().wait(0.01)
+
+        stopping = threading.Thread(target=listener.stop, args=(5,))
+        stopping.start()
+        threading.Event().wait(0.1)
+        self.assertEqual(received, [])
+
+        release.set()
+        stopping.join(5)
+
+        self.assertEqual(received, [{"id": 1}, {"id": 2}])
+        self.assertEqual((listener.drained, listener.abandoned), (2, 0))
+        self.assertEqual(listener.state, "closed")
+
+    def test_properties(self):
+        """Messages should be delivered with the properties they were published with."""
+        broker = get_broker()
+        channel = MemoryBlockingConnection(broker).channel()
+        channel.queue_declare(queue="memory_properties")
+        channel.queue_bind(queue="memory_properties", exchange="amq.topic", routing_key="#")
+
+        NaviPublisher(routing_key="orders.created").publish({"id": 1})
+
+        message = broker._get_queue("memory_properties").messages[0]  # pylint:disable = W0212
+        self.assertIsInstance(message.properties, BasicProperties)
+        self.assertEqual(message.properties.content_type, "application/json")
+        self.assertEqual(message.routing_key, "orders.created")
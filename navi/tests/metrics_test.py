@@ -0,0 +1,182 @@
+"""Test cases for navi.metrics"""
+import time
+import urllib.request
+from unittest import TestCase, mock
+
+from navi import config
+from navi.metrics import (
+    CONTENT_TYPE,
+    NaviGauge,
+    NaviListenerMetrics,
+    NaviMetricsRegistry,
+    PUBLISH_FAILED,
+    PUBLISH_LATENCY,
+    PUBLISHED,
+    record_publish,
+    start_metrics_server,
+)
+
+
+class TestNaviMetricsRegistry(TestCase):
+    """Test cases for NaviMetricsRegistry"""
+
+    def setUp(self):
+        """Initializes an empty NaviMetricsRegistry."""
+        self.registry = NaviMetricsRegistry()
+
+    def test_counter(self):
+        """Counters should count by label values, and refuse to be decremented."""
+        counter = self.registry.counter("messages_total", "Messages.", ("queue",))
+
+        counter.labels("orders").inc()
+        counter.labels("orders").inc(2)
+        counter.labels("users").inc()
+
+        values = self.registry.snapshot()["messages_total"]["values"]
+        self.assertEqual(
+            values,
+            [
+                {"labels": {"queue": "orders"}, "value": 3},
+                {"labels": {"queue": "users"}, "value": 1},
+            ],
+        )
+
+        with self.assertRaises(ValueError):
+            counter.labels("orders").inc(-1)
+
+    def test_get_or_create(self):
+        """Asking for a registered metric should return it, unless it's of another type."""
+        counter = self.registry.counter("messages_total", "Messages.")
+
+        self.assertIs(self.registry.counter("messages_total", "Messages."), counter)
+
+        with self.assertRaises(ValueError):
+            self.registry.gauge("messages_total", "Messages.")
+
+    def test_labels_mismatch(self):
+        """Using a metric with a wrong number of label values should raise a ValueError."""
+        counter = self.registry.counter("messages_total", "Messages.", ("queue",))
+
+        with self.assertRaises(ValueError):
+            counter.labels("orders", "extra")
+
+    def test_histogram(self):
+        """Histograms should count observations by bucket, cumulatively, with their sum."""
+        histogram = self.registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+
+        value = self.registry.snapshot()["latency_seconds"]["values"][0]["value"]
+        self.assertEqual(value["count"], 4)
+        self.assertAlmostEqual(value["sum"], 5.65)
+        self.assertEqual(value["buckets"], {"0.1": 2, "1.0": 3, "+Inf": 4})
+
+    def test_prometheus(self):
+        """Metrics should be exposed in the Prometheus text format, with escaped label values."""
+        self.registry.counter("messages_total", "Messages.", ("queue",)).labels('a"b').inc()
+        self.registry.histogram("latency_seconds", "Latency.", buckets=(1,)).observe(0.5)
+
+        text = self.registry.to_prometheus()
+
+        self.assertIn("# HELP messages_total Messages.\n# TYPE messages_total counter\n", text)
+        self.assertIn('messages_total{queue="a\\"b"} 1.0\n', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 1.0\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 1.0\n', text)
+        self.assertIn("latency_seconds_sum 0.5\nlatency_seconds_count 1.0\n", text)
+
+    def test_collector(self):
+        """Metrics built by a registered collector should be read with the registry's."""
+        def collect():
+            gauge = NaviGauge("backlog", "Backlog.")
+            gauge.set(7)
+
+            return [gauge]
+
+        self.registry.register_collector(collect)
+
+        self.assertEqual(self.registry.snapshot()["backlog"]["values"][0]["value"], 7)
+        self.assertIn("backlog 7.0", self.registry.to_prometheus())
+
+
+class TestNaviListenerMetrics(TestCase):
+    """Test cases for NaviListenerMetrics"""
+
+    def setUp(self):
+        """Initializes a NaviListenerMetrics for a queue only used by these tests."""
+        self.metrics = NaviListenerMetrics(f"metrics-test-{id(self)}")
+
+    def test_delivery(self):
+        """A delivery should be counted and in flight until its callback is done, and its
+        end-to-end latency computed from its `published_at` header.
+        """
+        delivered_at = self.metrics.on_delivery({"published_at": time.time() - 2})
+
+        self.assertEqual(self.metrics.delivered.value, 1)
+        self.assertEqual(self.metrics.in_flight.value, 1)
+        self.assertEqual(self.metrics.latency.count, 1)
+        self.assertGreaterEqual(self.metrics.latency.sum, 2)
+
+        self.metrics.on_done(delivered_at, False)
+
+        self.assertEqual(self.metrics.in_flight.value, 0)
+        self.assertEqual(self.metrics.callback_errors.value, 1)
+        self.assertEqual(self.metrics.callback_duration.count, 1)
+
+    def test_delivery_without_timestamp(self):
+        """When the `published_at` header is missing or not a timestamp, no latency should be
+        recorded.
+        """
+        self.metrics.on_delivery({})
+        self.metrics.on_delivery({"published_at": "2020-01-01 00:00:00"})
+
+        self.assertEqual(self.metrics.delivered.value, 2)
+        self.assertEqual(self.metrics.latency.count, 0)
+
+    def test_decode_error(self):
+        """A message that can't be decoded should be counted, and no longer in flight."""
+        self.metrics.on_delivery({})
+        self.metrics.on_decode_error()
+
+        self.assertEqual(self.metrics.decode_errors.value, 1)
+        self.assertEqual(self.metrics.in_flight.value, 0)
+
+
+class TestRecordPublish(TestCase):
+    """Test cases for the metrics.record_publish function."""
+
+    def test_record(self):
+        """Published and failed messages should be counted, and the publish latency observed."""
+        exchange = f"metrics-test-{id(self)}"
+
+        record_publish(exchange, 3, 1, 0.2)
+        record_publish(exchange, 0, 1)
+
+        self.assertEqual(PUBLISHED.labels(exchange).value, 3)
+        self.assertEqual(PUBLISH_FAILED.labels(exchange).value, 2)
+        self.assertEqual(PUBLISH_LATENCY.labels(exchange).count, 1)
+
+    @mock.patch.object(config, "NAVI_METRICS", False)
+    def test_disabled(self):
+        """When metrics are disabled, nothing should be recorded."""
+        exchange = f"metrics-test-{id(self)}"
+
+        record_publish(exchange, 3, 1, 0.2)
+
+        self.assertEqual(PUBLISHED.labels(exchange).value, 0)
+
+
+class TestStartMetricsServer(TestCase):
+    """Test cases for the metrics.start_metrics_server function."""
+
+    def test_serve(self):
+        """The server should serve the metrics at /metrics, in the Prometheus text format."""
+        server = start_metrics_server(0, "127.0.0.1")
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+
+        with urllib.request.urlopen(url, timeout=5) as response:
+            self.assertEqual(response.headers["Content-Type"], CONTENT_TYPE)
+            self.assertIn(b"# TYPE navi_messages_published_total counter", response.read())
@@ -0,0 +1,172 @@
+"""Test cases for navi.nodes"""
+from unittest import TestCase, mock
+
+from pika import ConnectionParameters
+from pika.exceptions import AMQPError
+
+from navi import config
+from navi.nodes import (
+    NaviNodePool,
+    NaviNodeSet,
+    configured_nodes,
+    get_node_pool,
+    parse_node,
+)
+from navi.pool import NaviConnectionPool, close_pools
+
+
+def node_pools(count: int):
+    """Builds `count` NaviConnectionPools to distinct hosts, with mocked connection factories."""
+    return [
+        NaviConnectionPool(ConnectionParameters(host=f"node{index}"), mock.MagicMock())
+        for index in range(count)
+    ]
+
+
+class TestNaviNodeSet(TestCase):
+    """Test cases for NaviNodeSet"""
+
+    def test_round_robin(self):
+        """With the round robin strategy, each node should be tried first in turn."""
+        nodes = NaviNodeSet(node_pools(3))
+
+        self.assertEqual([nodes.candidates()[0] for _ in range(6)], [0, 1, 2, 0, 1, 2])
+
+    def test_least_loaded(self):
+        """With the least loaded strategy, the node with the fewest publishes in progress should
+        be tried first."""
+        nodes = NaviNodeSet(node_pools(3), strategy="least_loaded")
+
+        with nodes.use(0), nodes.use(1), nodes.use(1):
+            self.assertEqual(nodes.candidates()[0], 2)
+            self.assertEqual(nodes.candidates()[-1], 1)
+
+    def test_consistent_hash(self):
+        """With the consistent hash strategy, a key should always map to the same node, and adding
+        a node should only remap a share of the keys."""
+        pools = node_pools(4)
+        nodes = NaviNodeSet(pools[:3], strategy="consistent_hash")
+        grown = NaviNodeSet(pools, strategy="consistent_hash")
+        keys = [f"key.{index}" for index in range(1000)]
+
+        mapped = [nodes.node_for_key(key) for key in keys]
+        remapped = [grown.node_for_key(key) for key in keys]
+
+        self.assertEqual(mapped, [nodes.node_for_key(key) for key in keys])
+        self.assertEqual(set(mapped), {0, 1, 2})
+        self.assertLess(sum(old != new for old, new in zip(mapped, remapped)), 400)
+        self.assertTrue(all(old == new for old, new in zip(mapped, remapped) if new != 3))
+        self.assertEqual(nodes.candidates(1), [1, 2, 0])
+
+    def test_mark_failed(self):
+        """A failed node should be tried last until its retry interval passes."""
+        nodes = NaviNodeSet(node_pools(3), retry_interval=60)
+        nodes.logger = mock.MagicMock()
+
+        with self.assertRaises(AMQPError), nodes.use(0):
+            raise AMQPError()
+
+        self.assertEqual([nodes.candidates()[-1] for _ in range(3)], [0, 0, 0])
+
+        nodes.forget()
+
+        self.assertIn(0, [nodes.candidates()[0] for _ in range(3)])
+
+    def test_unknown_strategy(self):
+        """An unknown strategy should raise a ValueError."""
+        with self.assertRaises(ValueError):
+            NaviNodeSet(node_pools(2), strategy="random")
+
+
+class TestNaviNodePool(TestCase):
+    """Test cases for NaviNodePool"""
+
+    def setUp(self):
+        """Initializes a NaviNodePool over 2 nodes, the first one failing to connect."""
+        self.pools = node_pools(2)
+        self.pools[0]._connection_factory.side_effect = AMQPError()
+        self.nodes = NaviNodeSet(self.pools)
+        self.nodes.logger = mock.MagicMock()
+        self.pool = NaviNodePool(self.nodes)
+
+    def test_channel_fails_over(self):
+        """When a node's connection can't be opened, the channel should be opened on the next one,
+        and the failed node skipped afterwards."""
+        with self.pool.channel() as channel:
+            pass
+
+        self.assertIs(channel, self.pools[1]._connection_factory.return_value.channel.return_value)
+
+        with self.pool.confirm_channel():
+            pass
+
+        self.pools[0]._connection_factory.assert_called_once()
+        self.assertEqual(self.nodes.candidates(), [1, 0])
+
+    def test_channel_all_failed(self):
+        """When no node's connection can be opened, the last error should be raised."""
+        self.pools[1]._connection_factory.side_effect = AMQPError()
+
+        with self.assertRaises(AMQPError), self.pool.channel():
+            pass
+
+    def test_channel_error_in_use(self):
+        """When an AMQPError is raised while a channel is in use, its node should be marked as
+        failed, and the error re-raised."""
+        self.pools[0]._connection_factory.side_effect = None
+
+        with self.assertRaises(AMQPError), self.pool.channel():
+            raise AMQPError()
+
+        self.assertEqual(self.nodes.candidates(), [1, 0])
+
+
+class TestGetNodePool(TestCase):
+    """Test cases for the nodes.get_node_pool function."""
+
+    def tearDown(self):
+        """Closes the process-wide pools."""
+        close_pools()
+
+    def test_single_node(self):
+        """With a single node, its NaviConnectionPool should be returned."""
+        pool = get_node_pool([ConnectionParameters(host="single")])
+
+        self.assertIsInstance(pool, NaviConnectionPool)
+
+    def test_shared(self):
+        """With several nodes, the same NaviNodePool should be returned for the same nodes, and a
+        NaviNodePool per node with the consistent hash strategy."""
+        parameters = [ConnectionParameters(host="first"), ConnectionParameters(host="second")]
+        pool = get_node_pool(parameters, "key")
+
+        self.assertIsInstance(pool, NaviNodePool)
+        self.assertIs(pool, get_node_pool(parameters, "other.key"))
+
+        with mock.patch.object(config, "NAVI_NODE_STRATEGY", "consistent_hash"):
+            pools = {get_node_pool(parameters, f"key.{index}") for index in range(100)}
+
+        self.assertEqual(len(pools), 2)
+        self.assertNotIn(pool, pools)
+
+
+class TestNodesFunctions(TestCase):
+    """Test cases for the nodes module's functions."""
+
+    def test_parse_node(self):
+        """Nodes without a port should get the default one."""
+        self.assertEqual(parse_node("rabbit", 5672), ("rabbit", 5672))
+        self.assertEqual(parse_node("rabbit:5673", 5672), ("rabbit", 5673))
+
+    def test_configured_nodes(self):
+        """The broker host and port should be the first node."""
+        config.init_config(
+            broker_host="test",
+            broker_port=1234,
+            username="guest",
+            password="guest",
+            broker_nodes=["other", "b:1"],
+        )
+        self.addCleanup(setattr, config, "NAVI_BROKER_NODES", None)
+
+        self.assertEqual(configured_nodes(), [("test", 1234), ("other", 1234), ("b", 1)])
@@ -0,0 +1,267 @@
+"""Test cases for navi.outbox"""
+import os
+import tempfile
+import unittest
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+
+from navi import config
+from navi.confirms import PublishResult
+from navi.exceptions import NaviOutboxException
+from navi.outbox import (
+    NaviOutbox, NaviOutboxReplayer, close_outboxes, collect_metrics, get_outbox,
+    store_unconfirmed
+)
+
+
+class TestNaviOutbox(TestCase):
+    """Test cases for NaviOutbox"""
+
+    def setUp(self):
+        """Initializes a NaviOutbox in a temporary directory, with small segments."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.outbox = NaviOutbox(self.directory.name, segment_size=256)
+        self.addCleanup(self.outbox.close)
+
+    def _append(self, count: int, start: int = 0):
+        for index in range(start, start + count):
+            self.outbox.append(
+                "amq.topic",
+                "topic",
+                f"key.{index}",
+                f'{{"index": {index}}}',
+                BasicProperties(content_type="application/json", headers={"message_id": index}),
+            )
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory.name) if name.endswith(".seg"))
+
+    def test_append_peek(self):
+        """When messages are appended, `peek` should return them in order, with their properties,
+        without removing them.
+        """
+        self._append(3)
+
+        records = self.outbox.peek(2)
+
+        self.assertEqual([record.routing_key for record in records], ["key.0", "key.1"])
+        self.assertEqual(records[1].body, b'{"index": 1}')
+        self.assertEqual(records[1].exchange, "amq.topic")
+        self.assertEqual(records[1].properties.content_type, "application/json")
+        self.assertEqual(records[1].properties.headers, {"message_id": 1})
+        self.assertEqual(len(self.outbox), 3)
+
+    def test_segments(self):
+        """When a segment is full, a new one should be created, and removed once replayed."""
+        self._append(6)
+
+        self.assertGreater(len(self._segments()), 1)
+        self.assertEqual(
+            [record.routing_key for record in self.outbox.peek(10)],
+            [f"key.{index}" for index in range(6)],
+        )
+
+        self.outbox.commit(5)
+
+        self.assertEqual(len(self._segments()), 1)
+        self.assertEqual([record.routing_key for record in self.outbox.peek(10)], ["key.5"])
+
+    def test_large_message(self):
+        """When a message doesn't fit in a segment, it should get a segment of its own."""
+        self.outbox.append("amq.topic", "topic", "key", b"x" * 1024, BasicProperties())
+
+        self.assertEqual(self.outbox.peek(1)[0].body, b"x" * 1024)
+
+    def test_reopen(self):
+        """When an outbox is reopened, the messages not replayed should be kept, in order."""
+        self._append(4)
+        self.outbox.commit(1)
+        self.outbox.close()
+
+        outbox = NaviOutbox(self.directory.name, segment_size=256)
+        self.addCleanup(outbox.close)
+
+        self.assertEqual(outbox.backlog, 3)
+        self.assertEqual(outbox.peek(1)[0].routing_key, "key.1")
+        outbox.append("amq.topic", "topic", "key.4", b"{}", BasicProperties())
+        self.assertEqual(outbox.peek(10)[-1].routing_key, "key.4")
+
+    def test_torn_record(self):
+        """When a segment ends with a corrupted record, like one torn by a crash, the records
+        before it should be kept, and the corrupted one ignored.
+        """
+        self._append(2)
+        self.outbox.close()
+        path = os.path.join(self.directory.name, self._segments()[0])
+
+        with open(path, "r+b") as segment:
+            data = bytearray(segment.read())
+            data[data.rindex(b"key.1")] ^= 0xFF
+            segment.seek(0)
+            segment.write(data)
+
+        outbox = NaviOutbox(self.directory.name, segment_size=256)
+        self.addCleanup(outbox.close)
+
+        self.assertEqual([record.routing_key for record in outbox.peek(10)], ["key.0"])
+
+    def test_wait(self):
+        """When the outbox is empty, `wait` should time out, and return right away otherwise."""
+        self.assertFalse(self.outbox.wait(0.01))
+
+        self._append(1)
+
+        self.assertTrue(self.outbox.wait(0.01))
+
+
+    def test_locked(self):
+        """An outbox directory shouldn't be opened while another outbox uses it, until it's
+        closed."""
+        with self.assertRaises(NaviOutboxException):
+            NaviOutbox(self.directory.name)
+
+        self.outbox.close()
+        NaviOutbox(self.directory.name).close()
+
+
+class TestNaviOutboxReplayer(TestCase):
+    """Test cases for NaviOutboxReplayer"""
+
+    def setUp(self):
+        """Initializes a NaviOutboxReplayer over a mocked outbox and pool."""
+        self.outbox = mock.MagicMock()
+        self.outbox.peek.return_value = [
+            mock.MagicMock(exchange="amq.topic", exchange_type="topic", routing_key=f"key.{index}")
+            for index in range(3)
+        ]
+        self.replayer = NaviOutboxReplayer(self.outbox, mock.MagicMock(), batch_size=3)
+        self.replayer.logger = mock.MagicMock()
+
+    @mock.patch("navi.outbox.publish_confirmed")
+    def test_replay(self, publish_confirmed_mock):
+        """When every replayed message is confirmed, they should be removed from the outbox."""
+        publish_confirmed_mock.return_value = [PublishResult(acked=True)] * 3
+
+        self.assertEqual(self.replayer.replay(), 3)
+
+        self.outbox.commit.assert_called_once_with(3)
+        self.assertEqual(self.replayer.replayed, 3)
+        self.assertGreater(self.replayer.stats()["replay_rate"], 0)
+
+    @mock.patch("navi.outbox.publish_confirmed")
+    def test_replay_unconfirmed(self, publish_confirmed_mock):
+        """When a replayed message isn't confirmed, only the messages before it should be removed,
+        so the outbox is replayed in order.
+        """
+        publish_confirmed_mock.return_value = [
+            PublishResult(acked=True), PublishResult(error="nacked"), PublishResult(acked=True)
+        ]
+
+        self.assertEqual(self.replayer.replay(), -1)
+
+        self.outbox.commit.assert_called_once_with(1)
+        self.assertEqual(self.replayer.failed_batches, 1)
+
+    @mock.patch("navi.outbox.publish_confirmed")
+    def test_replay_exchanges(self, publish_confirmed_mock):
+        """When the oldest messages go to different exchanges, a batch should only hold messages
+        of the first one.
+        """
+        self.outbox.peek.return_value[2].exchange = "other"
+        publish_confirmed_mock.return_value = [PublishResult(acked=True)] * 2
+
+        self.replayer.replay()
+
+        self.assertEqual(len(publish_confirmed_mock.call_args.args[3]), 2)
+        self.outbox.commit.assert_called_once_with(2)
+
+
+class TestStoreUnconfirmed(TestCase):
+    """Test cases for the outbox.store_unconfirmed function."""
+
+    def setUp(self):
+        """Creates a temporary outbox directory, and a mocked pool."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(close_outboxes)
+        self.pool = mock.MagicMock(key=("localhost", 5672, "/", "guest"))
+
+    @mock.patch.object(config, "NAVI_OUTBOX_DIR", None)
+    def test_disabled(self):
+        """When no outbox directory is set, nothing should be stored."""
+        stored = store_unconfirmed(self.pool, "amq.topic", "topic", [("key", b"{}", None)])
+
+        self.assertEqual(stored, 0)
+
+    def test_store(self):
+        """When an outbox directory is set, the unconfirmed messages should be stored in the
+        broker's outbox, and their results marked as stored.
+        """
+        results = [PublishResult(acked=True), PublishResult(error="lost")]
+        messages = [("first", b"1", BasicProperties()), ("second", b"2", BasicProperties())]
+
+        with mock.patch.object(config, "NAVI_OUTBOX_DIR", self.directory.name), \
+                mock.patch.object(NaviOutboxReplayer, "start"):
+            stored = store_unconfirmed(self.pool, "amq.topic", "topic", messages, results)
+
+        self.assertEqual(stored, 1)
+        self.assertEqual([result.stored for result in results], [False, True])
+        self.assertEqual(os.listdir(self.directory.name), ["localhost_5672___guest"])
+
+
+    def test_store_shared_directory(self):
+        """When the broker's outbox directory is used by another process, the next free slot
+        should be used."""
+        taken = NaviOutbox(os.path.join(self.directory.name, "localhost_5672___guest"))
+        self.addCleanup(taken.close)
+
+        with mock.patch.object(config, "NAVI_OUTBOX_DIR", self.directory.name), \
+                mock.patch.object(NaviOutboxReplayer, "start"):
+            store_unconfirmed(self.pool, "amq.topic", "topic", [("key", b"{}", BasicProperties())])
+
+        self.assertEqual(taken.backlog, 0)
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            ["localhost_5672___guest", "localhost_5672___guest.1"],
+        )
+
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Needs os.fork.")
+    def test_fork(self):
+        """A forked child process should open its own outbox, in another slot than its parent's."""
+        with mock.patch.object(config, "NAVI_OUTBOX_DIR", self.directory.name), \
+                mock.patch.object(NaviOutboxReplayer, "start"):
+            parent = get_outbox(self.pool)
+            pid = os.fork()
+
+            if not pid:  # pragma: no cover
+                child = get_outbox(self.pool)
+                os._exit(0 if child.directory == parent.directory + ".1" else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+
+class TestCollectMetrics(TestCase):
+    """Test cases for the outbox.collect_metrics function."""
+
+    @mock.patch("navi.outbox.get_replayer_stats")
+    def test_collect(self, get_replayer_stats_mock):
+        """Each outbox's stats should be exposed as metrics labelled by its directory."""
+        get_replayer_stats_mock.return_value = {
+            "/outbox": {
+                "backlog": 3, "backlog_bytes": 120, "replayed": 10, "failed_batches": 1,
+                "replay_rate": 50.0,
+            }
+        }
+
+        metrics = {metric.name: metric.snapshot() for metric in collect_metrics()}
+
+        self.assertEqual(
+            metrics["navi_outbox_backlog_messages"]["values"],
+            [{"labels": {"directory": "/outbox"}, "value": 3}],
+        )
+        self.assertEqual(metrics["navi_outbox_replayed_total"]["type"], "counter")
+        self.assertEqual(metrics["navi_outbox_replay_rate"]["values"][0]["value"], 50.0)
@@ -0,0 +1,145 @@
+"""Test cases for navi.pool"""
+import threading
+from unittest import TestCase, mock
+
+from pika import ConnectionParameters
+from pika.exceptions import AMQPError
+
+from navi.pool import NaviConnectionPool, close_pools, get_pool
+
+
+class TestNaviConnectionPool(TestCase):
+    """Test cases for NaviConnectionPool"""
+
+    def setUp(self):
+        """Initializes a NaviConnectionPool with a mocked connection factory."""
+        self.connection_factory = mock.MagicMock()
+        self.pool = NaviConnectionPool(
+            mock.MagicMock(spec=ConnectionParameters), connection_factory=self.connection_factory
+        )
+
+    def test_channel_reused(self):
+        """When `channel` is used twice from the same thread, a single connection should be opened
+        and the same channel should be yielded.
+        """
+        with self.pool.channel() as first:
+            pass
+
+        with self.pool.channel() as second:
+            pass
+
+        self.connection_factory.assert_called_once()
+        self.assertIs(first, second)
+
+    def test_channel_per_thread(self):
+        """When `channel` is used from two threads, each of them should get its own connection."""
+        self.connection_factory.side_effect = lambda params: mock.MagicMock()
+        channels = []
+
+        def use_channel():
+            with self.pool.channel() as channel:
+                channels.append(channel)
+
+        thread = threading.Thread(target=use_channel)
+        thread.start()
+        thread.join()
+        use_channel()
+
+        self.assertEqual(self.connection_factory.call_count, 2)
+        self.assertIsNot(channels[0], channels[1])
+
+    def test_channel_declares_exchange_once(self):
+        """When `channel` is called with an exchange, it should be declared only the first time."""
+        with self.pool.channel("exchange", "topic") as channel:
+            pass
+
+        with self.pool.channel("exchange", "topic"):
+            pass
+
+        channel.exchange_declare.assert_called_once_with(
+            exchange="exchange", exchange_type="topic", durable=True
+        )
+
+    def test_channel_closed_connection_replaced(self):
+        """When the pooled connection is found closed, a new one should be opened."""
+        with self.pool.channel():
+            pass
+
+        self.connection_factory.return_value.is_open = False
+
+        with self.pool.channel():
+            pass
+
+        self.assertEqual(self.connection_factory.call_count, 2)
+
+    def test_channel_dead_connection_replaced(self):
+        """When processing the pooled connection's pending events finds it dead, a new one should
+        be opened before the channel is yielded.
+        """
+        dead, new = mock.MagicMock(), mock.MagicMock()
+        self.connection_factory.side_effect = [dead, new]
+
+        with self.pool.channel():
+            pass
+
+        dead.process_data_events.side_effect = AMQPError("Stream connection lost")
+
+        with self.pool.channel() as channel:
+            pass
+
+        dead.process_data_events.assert_called_once_with(time_limit=0)
+        self.assertIs(channel, new.channel.return_value)
+
+    def test_channel_error_discards_connection(self):
+        """When an AMQPError is raised while using the channel, the connection should be closed
+        and discarded, and the error re-raised.
+        """
+        connection = self.connection_factory.return_value
+
+        with self.assertRaises(AMQPError):
+            with self.pool.channel():
+                raise AMQPError()
+
+        connection.close.assert_called_once()
+        self.assertEqual(len(self.pool), 0)
+
+    def test_close(self):
+        """When `close` is called, every pooled connection should be closed."""
+        with self.pool.channel():
+            pass
+
+        self.pool.close()
+
+        self.connection_factory.return_value.close.assert_called_once()
+        self.assertEqual(len(self.pool), 0)
+
+    def test_forget(self):
+        """When `forget` is called, as in a forked child process, every pooled connection should be
+        forgotten without being closed, so the next use opens a new one."""
+        with self.pool.channel():
+            pass
+
+        self.pool.forget()
+
+        self.connection_factory.return_value.close.assert_not_called()
+        self.assertEqual(len(self.pool), 0)
+
+        with self.pool.channel():
+            pass
+
+        self.assertEqual(self.connection_factory.call_count, 2)
+
+
+class TestGetPool(TestCase):
+    """Test cases for the pool.get_pool function."""
+
+    def tearDown(self):
+        """Closes the process-wide pools."""
+        close_pools()
+
+    def test_get_pool_shared(self):
+        """When `get_pool` is called twice for the same broker, the same pool should be returned."""
+        parameters = ConnectionParameters(host="test", port=1234)
+
+        self.assertIs(get_pool(parameters), get_pool(ConnectionParameters(host="test", port=1234)))
+        self.assertIsNot(get_pool(parameters), get_pool(ConnectionParameters(host="other")))
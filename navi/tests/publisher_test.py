@@ -1,11 +1,15 @@
 """Test cases for navi.publisher"""
+import zlib
 from unittest import TestCase, mock
 
-from pika import BasicProperties, BlockingConnection, ConnectionParameters
+from pika import BlockingConnection, ConnectionParameters
 from pika.exceptions import AMQPError
 
 from navi import config
-from navi.publisher import NaviPublisher, publish
+from navi.compression import get_compressor
+from navi.confirms import PublishResult
+from navi.pool import NaviConnectionPool
+from navi.publisher import NaviPublisher, get_publisher, publish, publish_many, _PUBLISHERS
 
 
 class TestNaviPublisher(TestCase):
@@ -18,30 +22,29 @@ class TestNaviPublisher(TestCase):
         )
         self.publisher = NaviPublisher(routing_key="test_routing_key")
         self.publisher.logger = mock.MagicMock()
+        self.connection_factory = mock.MagicMock()
+        self.publisher._pool = NaviConnectionPool(
+            self.publisher._connection_parameters, connection_factory=self.connection_factory
+        )
 
-    @mock.patch("navi.publisher.socket")
-    @mock.patch("navi.publisher.datetime")
-    @mock.patch("navi.publisher.uuid4")
-    def test__build_message_properties(self, uuid4_mock, datetime_mock, socket_mock):
+    @mock.patch("navi.publisher.get_envelope_factory")
+    def test__build_message_properties(self, get_envelope_factory_mock):
         """
-        When `NaviPublisher._build_message_properties` is called, a BasicProperties object should be
-        created, containing a headers dict.
+        When `NaviPublisher._build_message_properties` is called, the BasicProperties object should
+        be built by the process-wide NaviEnvelopeFactory.
         """
         properties = self.publisher._build_message_properties()
 
-        uuid4_mock.assert_called_once()
-        datetime_mock.utcnow.assert_called_once()
-        socket_mock.getfqdn.assert_called_once()
-        self.assertTrue(
-            isinstance(properties, BasicProperties),
-            msg=f"Expected: {BasicProperties}, obtained: {type(properties)}",
-        )
-        self.assertTrue(any(properties.headers), msg="Missing headers!")
+        get_envelope_factory_mock.return_value.build.assert_called_once()
+        self.assertIs(properties, get_envelope_factory_mock.return_value.build.return_value)
 
     @mock.patch.object(NaviPublisher, "_publish_message")
-    @mock.patch("navi.publisher.json")
-    def test_publish_json_dumps_error(self, json_mock, publish_message_mock):
-        json_mock.dumps.side_effect = TypeError()
+    def test_publish_encode_error(self, publish_message_mock):
+        """When the message can't be encoded, logger.error should be called, and the message not
+        published.
+        """
+        self.publisher._codec = mock.MagicMock()
+        self.publisher._codec.encode.side_effect = TypeError()
         message = {"hello": "world"}
 
         self.publisher.publish(message)
@@ -49,11 +52,13 @@ class TestNaviPublisher(TestCase):
         self.publisher.logger.error.assert_called_once()
         publish_message_mock.assert_not_called()
 
-    @mock.patch.object(NaviPublisher, "_init_connection")
     @mock.patch.object(NaviPublisher, "_build_message_properties")
-    def test_publish_message(self, build_message_properties_mock, init_connection_mock):
+    def test_publish_message(self, build_message_properties_mock):
+        """When `_publish_message` is called, the message should be published through the pooled
+        channel, and the connection should be kept open for the next message.
+        """
         message_properties = build_message_properties_mock.return_value
-        connection = init_connection_mock.return_value
+        connection = self.connection_factory.return_value
         channel = connection.channel.return_value
         body = "{'hello': 'world'}"
 
@@ -68,32 +73,37 @@ class TestNaviPublisher(TestCase):
             properties=message_properties,
             body=body,
         )
-        connection.close.assert_called_once()
+        connection.close.assert_not_called()
         self.publisher.logger.error.assert_not_called()
 
-    @mock.patch.object(NaviPublisher, "_init_connection")
     @mock.patch.object(NaviPublisher, "_build_message_properties")
-    def test_publish_message_amqp_error_connection_set(
-        self, build_message_properties_mock, init_connection_mock
-    ):
+    def test_publish_message_reuses_connection(self, build_message_properties_mock):
+        """When `_publish_message` is called several times, a single connection should be opened,
+        and the exchange should be declared only once.
+        """
+        channel = self.connection_factory.return_value.channel.return_value
+
+        self.publisher._publish_message("{}")
+        self.publisher._publish_message("{}")
+
+        self.connection_factory.assert_called_once()
+        channel.exchange_declare.assert_called_once()
+        self.assertEqual(channel.basic_publish.call_count, 2)
+
+    @mock.patch.object(config, "NAVI_PUBLISH_RETRIES", 0)
+    @mock.patch.object(NaviPublisher, "_build_message_properties")
+    def test_publish_message_amqp_error_connection_set(self, build_message_properties_mock):
         """If an AMQPError is raised when `_publish_message` is called, and the connection is set,
         then it should be closed and logger.error should be called.
-        
-        Args:
-            build_message_properties_mock ([type]): [description]
-            init_connection_mock ([type]): [description]
         """
         message_properties = build_message_properties_mock.return_value
-        connection = init_connection_mock.return_value
+        connection = self.connection_factory.return_value
         channel = connection.channel.return_value
         body = "{'hello': 'world'}"
         channel.basic_publish.side_effect = AMQPError()
 
         self.publisher._publish_message(body)
 
-        channel.exchange_declare.assert_called_once_with(
-            exchange=config.NAVI_EXCHANGE, exchange_type=config.NAVI_EXCHANGE_TYPE, durable=True,
-        )
         channel.basic_publish.assert_called_once_with(
             exchange=config.NAVI_EXCHANGE,
             routing_key=self.publisher._routing_key,
@@ -102,31 +112,185 @@ class TestNaviPublisher(TestCase):
         )
         connection.close.assert_called_once()
         self.publisher.logger.error.assert_called_once()
+        self.assertEqual(len(self.publisher._pool), 0)
+        self.assertEqual(self.publisher.state, "disconnected")
 
-    @mock.patch.object(NaviPublisher, "_init_connection")
+    @mock.patch.object(config, "NAVI_PUBLISH_RETRIES", 0)
+    @mock.patch("navi.publisher.store_unconfirmed")
     @mock.patch.object(NaviPublisher, "_build_message_properties")
-    def test_publish_message_connection_error(
-        self, build_message_properties_mock, init_connection_mock
-    ):
+    def test_publish_message_outbox(self, build_message_properties_mock, store_unconfirmed_mock):
+        """When a message can't be published, it should be handed to the outbox."""
+        channel = self.connection_factory.return_value.channel.return_value
+        channel.basic_publish.side_effect = AMQPError()
+
+        self.publisher._publish_message("{}")
+
+        store_unconfirmed_mock.assert_called_once_with(
+            self.publisher._pool,
+            config.NAVI_EXCHANGE,
+            config.NAVI_EXCHANGE_TYPE,
+            [(self.publisher._routing_key, "{}", build_message_properties_mock.return_value)],
+        )
+
+    @mock.patch("navi.reconnect.time.sleep")
+    @mock.patch.object(NaviPublisher, "_build_message_properties")
+    def test_publish_message_retry(self, build_message_properties_mock, sleep_mock):
+        """If an AMQPError is raised when `_publish_message` is called, the message should be
+        published again on a new connection, after the backoff's delay.
+        """
+        first, second = mock.MagicMock(), mock.MagicMock()
+        self.connection_factory.side_effect = (first, second)
+        first.channel.return_value.basic_publish.side_effect = AMQPError()
+        states = []
+        self.publisher.add_state_callback(lambda publisher, state: states.append(state))
+
+        self.publisher._publish_message("{}")
+
+        first.close.assert_called_once()
+        second.channel.return_value.basic_publish.assert_called_once()
+        sleep_mock.assert_called_once()
+        self.publisher.logger.error.assert_not_called()
+        self.assertEqual(states, ["disconnected", "connecting", "connected"])
+
+    @mock.patch.object(config, "NAVI_PUBLISH_RETRIES", 0)
+    @mock.patch.object(NaviPublisher, "_build_message_properties")
+    def test_publish_message_connection_error(self, build_message_properties_mock):
         """If an AMQPError is raised when `_publish_message` is called, and the connection is not
         set, then it shouldn't be closed and logger.error should be called.
-        
-        Args:
-            build_message_properties_mock ([type]): [description]
-            init_connection_mock ([type]): [description]
         """
-        message_properties = build_message_properties_mock.return_value
-        init_connection_mock.side_effect = AMQPError()
+        self.connection_factory.side_effect = AMQPError()
         body = "{'hello': 'world'}"
 
         self.publisher._publish_message(body)
 
         self.publisher.logger.error.assert_called_once()
 
+    @mock.patch("navi.publisher.get_background_publisher")
+    @mock.patch.object(NaviPublisher, "_build_message_properties")
+    def test_publish_message_background(
+            self, build_message_properties_mock, get_background_publisher_mock
+    ):
+        """When `_publish_message` is called in background mode, the message should be enqueued
+        instead of being published right away.
+        """
+        self.publisher._background = True
+
+        self.publisher._publish_message("{}")
+
+        get_background_publisher_mock.return_value.enqueue.assert_called_once_with(
+            self.publisher._routing_key, "{}", build_message_properties_mock.return_value
+        )
+        self.connection_factory.assert_not_called()
+
+    @mock.patch("navi.transport.NaviConfirmChannel")
+    def test_publish_many(self, confirm_channel_mock):
+        """When `publish_many` is called, every message should be published through the confirm
+        channel, and the confirmations should be waited for once.
+        """
+        confirm_channel = confirm_channel_mock.return_value
+        confirm_channel.publish.side_effect = lambda **kwargs: PublishResult(acked=True)
+
+        results = self.publisher.publish_many([{"hello": "world"}, {"bye": "world"}])
+
+        self.assertEqual(confirm_channel.publish.call_count, 2)
+        confirm_channel.wait.assert_called_once()
+        self.assertEqual([result.acked for result in results], [True, True])
+
+    @mock.patch("navi.publisher.record_publish")
+    @mock.patch("navi.transport.NaviConfirmChannel")
+    def test_publish_many_metrics(self, confirm_channel_mock, record_publish_mock):
+        """When `publish_many` is called, the confirmed and failed messages should be recorded in
+        the metrics, with the publish latency.
+        """
+        confirm_channel = confirm_channel_mock.return_value
+        confirm_channel.publish.side_effect = lambda **kwargs: PublishResult(acked=True)
+
+        self.publisher.publish_many([{"hello": "world"}, {"invalid": object()}])
+
+        exchange, published, failed, duration = record_publish_mock.call_args.args
+        self.assertEqual((exchange, published, failed), (config.NAVI_EXCHANGE, 1, 1))
+        self.assertGreaterEqual(duration, 0)
+
+    @mock.patch("navi.transport.NaviConfirmChannel")
+    def test_publish_many_compressed(self, confirm_channel_mock):
+        """When the publisher has a compressor, only the messages larger than the threshold should
+        be compressed, and stamped with its name as their content encoding.
+        """
+        confirm_channel = confirm_channel_mock.return_value
+        confirm_channel.publish.side_effect = lambda **kwargs: PublishResult(acked=True)
+        self.publisher._compressor = get_compressor("zlib")
+        self.publisher._compression_threshold = 64
+
+        self.publisher.publish_many([{"small": 1}, {"large": "x" * 1024}])
+
+        small, large = [call.kwargs for call in confirm_channel.publish.call_args_list]
+        self.assertIsNone(small["properties"].content_encoding)
+        self.assertEqual(small["body"], b'{"small":1}')
+        self.assertEqual(large["properties"].content_encoding, "zlib")
+        self.assertEqual(zlib.decompress(large["body"]), b'{"large":"' + b"x" * 1024 + b'"}')
+
+    @mock.patch("navi.transport.NaviConfirmChannel")
+    def test_publish_many_invalid_body(self, confirm_channel_mock):
+        """When `publish_many` is called with a message that can't be serialized, it should be
+        reported as failed, and the rest of messages should still be published.
+        """
+        confirm_channel = confirm_channel_mock.return_value
+        confirm_channel.publish.side_effect = lambda **kwargs: PublishResult(acked=True)
+
+        results = self.publisher.publish_many([{"invalid": object()}, {"hello": "world"}])
+
+        confirm_channel.publish.assert_called_once()
+        self.assertEqual([result.acked for result in results], [False, True])
+        self.assertIsNotNone(results[0].error)
+
+    @mock.patch.object(config, "NAVI_PUBLISH_RETRIES", 0)
+    @mock.patch("navi.transport.NaviConfirmChannel")
+    def test_publish_many_amqp_error(self, confirm_channel_mock):
+        """When an AMQPError is raised by `publish_many`, the outstanding and remaining messages
+        should be reported as failed, and logger.error should be called.
+        """
+        confirm_channel = confirm_channel_mock.return_value
+        confirm_channel.publish.side_effect = AMQPError()
+
+        results = self.publisher.publish_many([{"hello": "world"}, {"bye": "world"}])
+
+        confirm_channel.fail.assert_called_once()
+        self.assertEqual(len(results), 2)
+        self.assertFalse(any(result.acked for result in results))
+        self.publisher.logger.error.assert_called_once()
+
+    @mock.patch("navi.reconnect.time.sleep")
+    @mock.patch("navi.transport.NaviConfirmChannel")
+    def test_publish_many_retry(self, confirm_channel_mock, sleep_mock):
+        """When an AMQPError is raised by `publish_many`, the unconfirmed messages should be
+        republished on a new connection, and the confirmed ones not.
+        """
+        confirm_channel = confirm_channel_mock.return_value
+        confirm_channel.publish.side_effect = (
+            PublishResult(acked=True),
+            AMQPError(),
+            PublishResult(acked=True),
+            PublishResult(acked=True),
+        )
+
+        results = self.publisher.publish_many([{"id": 1}, {"id": 2}, {"id": 3}])
+
+        self.assertEqual(
+            [call[1]["body"] for call in confirm_channel.publish.call_args_list],
+            [self.publisher._codec.encode({"id": index}) for index in (1, 2, 2, 3)],
+        )
+        self.assertEqual([result.acked for result in results], [True, True, True])
+        self.assertEqual(self.connection_factory.call_count, 2)
+        sleep_mock.assert_called_once()
+
 
 class TestPublish(TestCase):
     """Test cases for the publisher.publish function."""
 
+    def setUp(self):
+        """Clears the cached publishers."""
+        _PUBLISHERS.clear()
+
     @mock.patch.object(NaviPublisher, "publish")
     @mock.patch.object(NaviPublisher, "_init_connection_params")
     def test_publish(self, init_connection_params_mock, publish_mock):
@@ -139,3 +303,71 @@ class TestPublish(TestCase):
 
         init_connection_params_mock.assert_called_once()
         publish_mock.assert_called_once()
+
+    @mock.patch.object(NaviPublisher, "_init_connection_params")
+    def test_get_publisher_cached(self, init_connection_params_mock):
+        """When `get_publisher` is called twice with the same routing key, the same NaviPublisher
+        should be returned.
+        """
+        first = get_publisher("some.routing.key")
+        second = get_publisher("some.routing.key")
+
+        self.assertIs(first, second)
+        init_connection_params_mock.assert_called_once()
+
+    @mock.patch.object(NaviPublisher, "_init_connection_params")
+    def test_get_publisher_config_changed(self, init_connection_params_mock):
+        """When the codec or the publishing mode are changed by `init_config`, `get_publisher`
+        should return a new NaviPublisher using them.
+        """
+        first = get_publisher("some.routing.key")
+
+        with mock.patch.object(config, "NAVI_CODEC", "raw"):
+            second = get_publisher("some.routing.key")
+
+        with mock.patch.object(config, "NAVI_BACKGROUND_PUBLISHING", True):
+            third = get_publisher("some.routing.key")
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second._codec.content_type, "application/octet-stream")
+        self.assertTrue(third._background)
+
+    @mock.patch.object(NaviPublisher, "_init_connection_params")
+    def test_get_publisher_transport_changed(self, init_connection_params_mock):
+        """When the transport is changed by `init_config`, `get_publisher` should return a new
+        NaviPublisher using it."""
+        first = get_publisher("some.routing.key")
+
+        with mock.patch.object(config, "NAVI_TRANSPORT", "memory"):
+            second = get_publisher("some.routing.key")
+
+        self.assertIsNot(first, second)
+        self.assertEqual(first._transport.name, "pika")
+        self.assertEqual(second._transport.name, "memory")
+
+    @mock.patch("navi.publisher.MAX_CACHED_PUBLISHERS", 2)
+    @mock.patch.object(NaviPublisher, "_init_connection_params")
+    def test_get_publisher_bounded(self, init_connection_params_mock):
+        """When more than `MAX_CACHED_PUBLISHERS` publishers are cached, the least recently used
+        one should be evicted.
+        """
+        first = get_publisher("first")
+        get_publisher("second")
+        get_publisher("first")
+        get_publisher("third")
+
+        self.assertEqual(len(_PUBLISHERS), 2)
+        self.assertIs(get_publisher("first"), first)
+        self.assertNotIn("second", [key[0] for key in _PUBLISHERS])
+
+    @mock.patch.object(NaviPublisher, "publish_many")
+    @mock.patch.object(NaviPublisher, "_init_connection_params")
+    def test_publish_many(self, init_connection_params_mock, publish_many_mock):
+        """When `publisher.publish_many` is called, the cached NaviPublisher's `publish_many` method
+        should be called with the messages.
+        """
+        messages = [{"hello": "world"}]
+
+        publish_many(routing_key="some.routing.key", messages=messages)
+
+        publish_many_mock.assert_called_once_with(messages)
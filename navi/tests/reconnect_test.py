@@ -0,0 +1,31 @@
+"""Test cases for navi.reconnect"""
+from unittest import TestCase, mock
+
+from navi.reconnect import NaviBackoff
+
+
+class TestNaviBackoff(TestCase):
+    """Test cases for NaviBackoff"""
+
+    @mock.patch("navi.reconnect.random.uniform", side_effect=lambda low, high: high)
+    def test_next_delay(self, uniform_mock):
+        """The max delay should grow exponentially, capped at `max_delay`."""
+        backoff = NaviBackoff(initial_delay=0.5, max_delay=3, multiplier=2)
+
+        delays = [backoff.next_delay() for _ in range(5)]
+
+        self.assertEqual(delays, [0.5, 1, 2, 3, 3])
+        self.assertEqual(uniform_mock.call_args[0][0], 0)
+        self.assertEqual(backoff.attempts, 5)
+
+    def test_reset(self):
+        """When reset, the delays should start over, and never overflow."""
+        backoff = NaviBackoff(initial_delay=1, max_delay=10)
+
+        for _ in range(2000):
+            self.assertLessEqual(backoff.next_delay(), 10)
+
+        backoff.reset()
+
+        self.assertLessEqual(backoff.next_delay(), 1)
+        self.assertEqual(backoff.attempts, 1)
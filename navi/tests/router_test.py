@@ -0,0 +1,238 @@
+"""Test cases for navi.router"""
+import itertools
+import threading
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+from pika.channel import Channel
+
+from navi import config
+from navi.group import NaviListenerGroup
+from navi.memory import get_broker, topic_matches
+from navi.metrics import NaviListenerMetrics
+from navi.publisher import NaviPublisher
+from navi.router import NaviRouter, NaviTopicTrie, dispatch, listen_router
+
+
+class TestNaviTopicTrie(TestCase):
+    """Test cases for NaviTopicTrie"""
+
+    def test_matches_like_topic_exchange(self):
+        """The trie should match routing keys exactly like an AMQP topic exchange."""
+        patterns = [
+            "#", "*", "a", "a.b", "a.*", "*.b", "a.#", "#.b", "a.#.c", "*.#", "#.*", "a.*.#",
+            "#.b.#", "a.b.c", "*.*.*", "#.#",
+        ]
+        trie = NaviTopicTrie()
+
+        for pattern in patterns:
+            trie.add(pattern, pattern)
+
+        words = ["a", "b", "c"]
+        keys = ["", *(
+            ".".join(key) for size in range(1, 5) for key in itertools.product(words, repeat=size)
+        )]
+
+        for key in keys:
+            with self.subTest(key=key):
+                self.assertEqual(
+                    trie.match(key),
+                    tuple(pattern for pattern in patterns if topic_matches(pattern, key)),
+                )
+
+    def test_match_order_and_duplicates(self):
+        """Values should be returned once, in the order their patterns were added, and matches
+        should be recomputed once a pattern is added."""
+        trie = NaviTopicTrie()
+        first, second = object(), object()
+        trie.add("orders.#", first)
+        trie.add("orders.created", second)
+        trie.add("*.created", first)
+
+        self.assertEqual(trie.match("orders.created"), (first, second))
+        self.assertEqual(trie.match("users.created"), (first,))
+        self.assertEqual(trie.match("users.deleted"), ())
+
+        trie.add("users.*", second)
+
+        self.assertEqual(trie.match("users.deleted"), (second,))
+        self.assertEqual(trie.patterns, ["orders.#", "orders.created", "*.created", "users.*"])
+        self.assertEqual(len(trie), 4)
+
+
+class TestNaviRouter(TestCase):
+    """Test cases for NaviRouter"""
+
+    def setUp(self):
+        """Initializes a NaviRouter with two routes."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.orders = mock.MagicMock()
+        self.created = mock.MagicMock()
+        self.router = NaviRouter(
+            queue_name="test_router",
+            routes={"orders.*": self.orders, "*.created": [self.created]},
+        )
+        self.router.logger = mock.MagicMock()
+
+    def deliver(self, routing_key: str, delivery_tag: int = 1):
+        """Delivers an empty JSON message with `routing_key` to the router."""
+        method = mock.MagicMock(routing_key=routing_key, delivery_tag=delivery_tag)
+        self.router.handle_delivery(mock.MagicMock(), method, BasicProperties(headers={}), b"{}")
+
+    def test_on_channel_open(self):
+        """The router's queue should be bound with every routed pattern."""
+        channel = mock.MagicMock(spec=Channel)
+        channel.is_open = True
+
+        self.router.on_channel_open(channel)
+
+        self.assertEqual(
+            [call[1]["routing_key"] for call in channel.queue_bind.call_args_list],
+            ["orders.*", "*.created"],
+        )
+
+    def test_route_while_listening(self):
+        """A pattern routed while the router is listening should be bound on its channel."""
+        self.router._connection = mock.MagicMock()
+        self.router._connection.ioloop.add_callback_threadsafe.side_effect = lambda cb: cb()
+        self.router._channel = mock.MagicMock()
+
+        @self.router.route("users.#")
+        def on_user(info, message):  # pylint:disable = unused-argument
+            pass
+
+        self.router.route("users.#", mock.MagicMock())
+
+        self.router._channel.queue_bind.assert_called_once_with(
+            exchange=config.NAVI_EXCHANGE, queue="test_router", routing_key="users.#"
+        )
+        self.assertEqual(self.router.patterns, ["orders.*", "*.created", "users.#"])
+
+    def test_handle_delivery(self):
+        """Deliveries should be dispatched to the callbacks whose pattern matches their routing
+        key, and skipped if none does."""
+        self.deliver("orders.created")
+        self.deliver("orders.deleted")
+        self.deliver("users.created")
+        self.deliver("users.deleted")
+
+        self.assertEqual(self.orders.call_count, 2)
+        self.assertEqual(self.created.call_count, 2)
+
+    def test_handle_delivery_metrics(self):
+        """Deliveries skipped for lack of a matching route should not be left in flight."""
+        self.router._metrics = NaviListenerMetrics(f"router-test-{id(self)}")
+
+        self.deliver("orders.created")
+        self.deliver("users.deleted")
+
+        self.assertEqual(self.router._metrics.delivered.value, 1)
+        self.assertEqual(self.router._metrics.in_flight.value, 0)
+
+    def test_handle_delivery_error(self):
+        """When a callback fails, the others should still be called, and the delivery nacked."""
+        self.router._acker = mock.MagicMock()
+        self.orders.side_effect = Exception()
+
+        with self.assertLogs("navi", "ERROR"):
+            self.deliver("orders.created", 1)
+
+        self.deliver("users.deleted", 2)
+
+        self.created.assert_called_once()
+        self.assertEqual(
+            self.router._acker.method_calls,
+            [
+                mock.call.track(1),
+                mock.call.nack(1, requeue=False),
+                mock.call.track(2),
+                mock.call.ack(2),
+            ],
+        )
+
+    def test_dispatch(self):
+        """`dispatch` should call every callback, then raise the first error."""
+        first, second, third = mock.MagicMock(), mock.MagicMock(), mock.MagicMock()
+        first.side_effect, second.side_effect = ValueError(), KeyError()
+
+        with self.assertLogs("navi", "ERROR"), self.assertRaises(ValueError):
+            dispatch((first, second, third), "info", "message")
+
+        third.assert_called_once_with("info", "message")
+
+
+class TestListenRouter(TestCase):
+    """Test cases for routing messages published to the in-memory broker."""
+
+    def setUp(self):
+        """Configures Navi to use the memory transport."""
+        config.init_config(
+            broker_host="memory",
+            broker_port=5672,
+            username="guest",
+            password="guest",
+            transport="memory",
+        )
+        self.addCleanup(get_broker().reset)
+        self.addCleanup(setattr, config, "NAVI_TRANSPORT", "pika")
+
+    def test_listen_router(self):
+        """Messages published with any routed routing key should be dispatched by a single
+        queue's router."""
+        received = []
+        done = threading.Event()
+
+        def callback(name):
+            def handle(info, message):  # pylint:disable = unused-argument
+                received.append((name, message["id"]))
+
+                if len(received) == 3:
+                    done.set()
+
+            return handle
+
+        router = listen_router(
+            queue_name="memory_router",
+            routes={"orders.*": callback("orders"), "users.#": callback("users")},
+        )
+        self.addCleanup(router.stop, 5)
+
+        while "memory_router" not in get_broker().queue_names():
+            threading.Event().wait(0.01)
+
+        NaviPublisher(routing_key="orders.created").publish({"id": 1})
+        NaviPublisher(routing_key="payments.created").publish({"id": 2})
+        NaviPublisher(routing_key="users.1.deleted").publish({"id": 3})
+        NaviPublisher(routing_key="orders.deleted").publish({"id": 4})
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(received, [("orders", 1), ("users", 3), ("orders", 4)])
+        self.assertEqual(get_broker().queue_names(), ["memory_router"])
+
+    def test_route_in_group(self):
+        """A pattern routed while a grouped router is listening should be bound on its channel."""
+        received = threading.Event()
+        group = NaviListenerGroup()
+        self.addCleanup(group.stop, 5)
+        router = listen_router(
+            queue_name="memory_group_router", routes={"orders.*": mock.MagicMock()}, group=group
+        )
+        group.start()
+
+        while "memory_group_router" not in get_broker().queue_names():
+            threading.Event().wait(0.01)
+
+        router.route("users.#", lambda info, message: received.set())
+        publisher = NaviPublisher(routing_key="users.1.deleted")
+
+        # The pattern is bound on the group's ioloop thread, so messages published before it is
+        # are dropped.
+        for _ in range(100):
+            publisher.publish({"id": 1})
+
+            if received.wait(0.05):
+                break
+
+        self.assertTrue(received.is_set())
@@ -0,0 +1,167 @@
+"""Test cases for navi.rpc"""
+import asyncio
+import json
+import threading
+from concurrent import futures
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+
+from navi import config
+from navi.exceptions import NaviRpcException
+from navi.memory import get_broker
+from navi.rpc import (
+    ERROR_HEADER,
+    NaviRpcClient,
+    NaviRpcServer,
+    call,
+    call_async,
+    close_reply_consumers,
+    get_reply_consumer,
+    serve,
+)
+from navi.transport import DIRECT_REPLY_TO
+
+
+class TestNaviRpcServer(TestCase):
+    """Test cases for NaviRpcServer"""
+
+    def setUp(self):
+        """Initializes a NaviRpcServer, connected to a mocked connection and channel."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.callback = mock.MagicMock(return_value={"total": 3})
+        self.server = NaviRpcServer(
+            queue_name="test_rpc", routing_key="orders.total", callback=self.callback
+        )
+        self.server.logger = mock.MagicMock()
+        self.server._connection = mock.MagicMock()
+        self.server._connection.ioloop.add_callback_threadsafe.side_effect = lambda cb: cb()
+        self.server._channel = mock.MagicMock()
+
+    def deliver(self, properties: BasicProperties, body: bytes = b'{"id": 1}'):
+        method = mock.MagicMock(routing_key="orders.total", delivery_tag=1)
+        self.server.handle_delivery(mock.MagicMock(), method, properties, body)
+
+    def test_reply(self):
+        """The callback's return value should be published to the request's reply to, with its
+        correlation id."""
+        self.deliver(BasicProperties(headers={"a": 1}, reply_to="reply", correlation_id="42"))
+
+        info, message = self.callback.call_args[0]
+        self.assertEqual(message, {"id": 1})
+        self.assertEqual(info["a"], 1)
+        self.assertEqual(info["queue_name"], "test_rpc")
+
+        kwargs = self.server._channel.basic_publish.call_args[1]
+        self.assertEqual(kwargs["exchange"], "")
+        self.assertEqual(kwargs["routing_key"], "reply")
+        self.assertEqual(json.loads(kwargs["body"]), {"total": 3})
+        self.assertEqual(kwargs["properties"].correlation_id, "42")
+        self.assertNotIn(ERROR_HEADER, kwargs["properties"].headers)
+
+    def test_reply_error(self):
+        """The callback's error should be replied, and the request failed."""
+        self.callback.side_effect = KeyError("id")
+
+        self.deliver(BasicProperties(reply_to="reply", correlation_id="42"))
+
+        properties = self.server._channel.basic_publish.call_args[1]["properties"]
+        self.assertEqual(properties.headers[ERROR_HEADER], "KeyError: 'id'")
+        self.server.logger.error.assert_called_once()
+
+    def test_no_reply_to(self):
+        """Requests without a reply to should be handled without replying."""
+        self.deliver(BasicProperties())
+
+        self.callback.assert_called_once()
+        self.server._channel.basic_publish.assert_not_called()
+
+
+class TestRpc(TestCase):
+    """Test cases for RPC calls through the in-memory broker."""
+
+    def setUp(self):
+        """Configures Navi to use the memory transport, and serves a procedure."""
+        config.init_config(
+            broker_host="memory",
+            broker_port=5672,
+            username="guest",
+            password="guest",
+            transport="memory",
+        )
+        self.addCleanup(get_broker().reset)
+        self.addCleanup(setattr, config, "NAVI_TRANSPORT", "pika")
+        self.addCleanup(close_reply_consumers)
+
+        def add(info, message):  # pylint:disable = unused-argument
+            if message["b"] is None:
+                raise ValueError("b is missing")
+
+            return message["a"] + message["b"]
+
+        server = serve(queue_name="memory_rpc", routing_key="math.add", callback=add)
+        self.addCleanup(server.stop, 5)
+
+        while "memory_rpc" not in get_broker().queue_names():
+            threading.Event().wait(0.01)
+
+    def test_call(self):
+        """Calls should return their reply, or raise the server's error."""
+        self.assertEqual(call("math.add", {"a": 1, "b": 2}, timeout=5), 3)
+
+        with self.assertRaises(NaviRpcException) as context:
+            call("math.add", {"a": 1, "b": None}, timeout=5)
+
+        self.assertEqual(str(context.exception), "ValueError: b is missing")
+
+    def test_concurrent_calls(self):
+        """Concurrent calls should be multiplexed over a single reply consumer, each one getting
+        its own reply."""
+        client = NaviRpcClient(routing_key="math.add", timeout=5)
+        calls = [client.call_future({"a": index, "b": index}) for index in range(100)]
+
+        self.assertEqual([future.result(5) for future in calls], [2 * i for i in range(100)])
+        self.assertEqual(
+            [name for name in get_broker().queue_names() if name.startswith(DIRECT_REPLY_TO)],
+            [get_reply_consumer(client._connection_parameters)._channel.reply_queue],
+        )
+        self.assertEqual(len(client._consumer), 0)
+
+    def test_call_async(self):
+        """Calls should be awaitable from asyncio code."""
+        async def main():
+            return await asyncio.gather(
+                call_async("math.add", {"a": 1, "b": 1}, timeout=5),
+                call_async("math.add", {"a": 2, "b": 2}, timeout=5),
+            )
+
+        self.assertEqual(asyncio.run(main()), [2, 4])
+
+    def test_timeout(self):
+        """Calls without a reply should time out, and be forgotten."""
+        client = NaviRpcClient(routing_key="math.unknown")
+
+        with self.assertRaises(futures.TimeoutError):
+            client.call({"a": 1}, timeout=0.05)
+
+        self.assertEqual(len(client._consumer), 0)
+
+    def test_stop(self):
+        """Stopping the reply consumer should fail the calls in flight, cancel their timeouts,
+        and fail later calls at once."""
+        client = NaviRpcClient(routing_key="math.unknown")
+        future = client.call_future({"a": 1}, timeout=60)
+
+        while not client._consumer._timers:
+            threading.Event().wait(0.01)
+
+        self.assertTrue(client._consumer.stop(5))
+        self.assertIsNotNone(future.exception(5))
+        self.assertEqual(client._consumer._timers, {})
+
+        with self.assertRaises(NaviRpcException):
+            client.call({"a": 1}, timeout=5)
+
+        self.assertEqual(len(client._consumer), 0)
@@ -0,0 +1,274 @@
+"""Test cases for navi.scheduler"""
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import TestCase, mock
+
+from pika import BasicProperties
+
+from navi import config
+from navi.confirms import PublishResult
+from navi.exceptions import NaviSchedulerException
+from navi.memory import get_broker
+from navi.publisher import NaviPublisher
+from navi.scheduler import (
+    NaviScheduler,
+    NaviTimerStore,
+    NaviTimerWheel,
+    _open_free_slot,
+    cancel,
+    close_schedulers,
+    get_scheduler,
+    publish_delay,
+)
+
+
+class TestNaviTimerWheel(TestCase):
+    """Test cases for NaviTimerWheel"""
+
+    def test_expiry(self):
+        """Items should expire on their due tick, never before, across every level and the
+        overflow."""
+        wheel = NaviTimerWheel(tick=1, slot_bits=2, levels=2, start=0)
+        rng = random.Random(42)
+        due = {index: rng.randint(0, 60) + rng.random() for index in range(300)}
+
+        for index, when in due.items():
+            wheel.add(when, index)
+
+        expired = {}
+
+        for now in range(64):
+            for index in wheel.advance(now):
+                expired[index] = now
+
+        self.assertEqual(len(wheel), 0)
+        self.assertEqual(expired, {index: int(when) + 1 for index, when in due.items()})
+
+    def test_add_while_advancing(self):
+        """Items added once the wheel turned should expire on their due tick."""
+        wheel = NaviTimerWheel(tick=1, slot_bits=2, levels=2, start=0)
+        wheel.advance(37)
+        wheel.add(37, "now")
+        wheel.add(40, "soon")
+        wheel.add(100, "later")
+
+        self.assertEqual(wheel.advance(37), ["now"])
+        self.assertEqual(wheel.advance(39), [])
+        self.assertEqual(wheel.advance(40), ["soon"])
+        self.assertEqual(wheel.advance(99), [])
+        self.assertEqual(wheel.advance(100), ["later"])
+
+    def test_cancel(self):
+        """Cancelled items should never expire."""
+        wheel = NaviTimerWheel(tick=1, start=0)
+        timer_id = wheel.add(5, "cancelled")
+        wheel.add(5, "kept")
+
+        self.assertEqual(wheel.cancel(timer_id), "cancelled")
+        self.assertIsNone(wheel.cancel(timer_id))
+        self.assertEqual(wheel.advance(10), ["kept"])
+
+
+@mock.patch("navi.scheduler.store_unconfirmed")
+@mock.patch("navi.scheduler.publish_confirmed")
+class TestNaviScheduler(TestCase):
+    """Test cases for NaviScheduler"""
+
+    def setUp(self):
+        """Creates a directory for the timer stores."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.pool = mock.MagicMock()
+
+    def scheduler(self, store: NaviTimerStore = None, **kwargs) -> NaviScheduler:
+        """Builds a started NaviScheduler, stopped at cleanup."""
+        scheduler = NaviScheduler(self.pool, store, tick=0.01, **kwargs)
+        scheduler.start()
+        self.addCleanup(scheduler.stop, 5)
+
+        return scheduler
+
+    @staticmethod
+    def wait_for(condition, timeout: float = 5):
+        """Waits up to `timeout` seconds for `condition` to be met."""
+        deadline = time.monotonic() + timeout
+
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def test_schedule(self, publish_confirmed, store_unconfirmed):
+        """Due messages should be published in batches, in due order, and cancelled ones not at
+        all."""
+        publish_confirmed.side_effect = lambda pool, exchange, exchange_type, messages, **kwargs: [
+            PublishResult(acked=True) for _ in messages
+        ]
+        scheduler = self.scheduler(batch_size=2)
+        properties = BasicProperties()
+
+        for index in range(3):
+            scheduler.schedule("first", f"{index}", properties, delay=0.05)
+
+        scheduler.schedule("second", b"3", properties, publish_at=time.time() + 0.1)
+        cancelled = scheduler.schedule("cancelled", b"4", properties, delay=0.05)
+
+        self.assertTrue(scheduler.cancel(cancelled))
+        self.assertFalse(scheduler.cancel(cancelled))
+        self.wait_for(lambda: scheduler.published == 4)
+
+        batches = [
+            [body for _, body, _ in call[0][3]] for call in publish_confirmed.call_args_list
+        ]
+        self.assertEqual(batches, [[b"0", b"1"], [b"2"], [b"3"]])
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(store_unconfirmed.call_count, 3)
+
+    def test_retry(self, publish_confirmed, store_unconfirmed):  # pylint:disable = W0613
+        """Messages whose publish raises should be scheduled again after a backoff."""
+        publish_confirmed.side_effect = [RuntimeError(), [PublishResult(acked=True)]]
+        scheduler = self.scheduler()
+        scheduler._backoff.next_delay = mock.MagicMock(return_value=0.01)
+        scheduler.logger = mock.MagicMock()
+
+        scheduler.schedule("key", b"body", BasicProperties(), delay=0)
+        self.wait_for(lambda: scheduler.published == 1)
+
+        self.assertEqual(publish_confirmed.call_count, 2)
+        scheduler.logger.error.assert_called_once()
+
+    def test_store(self, publish_confirmed, store_unconfirmed):  # pylint:disable = W0613
+        """Pending messages should be stored, restored by a new scheduler, and removed once
+        published."""
+        publish_confirmed.side_effect = lambda pool, exchange, exchange_type, messages, **kwargs: [
+            PublishResult(acked=True) for _ in messages
+        ]
+        path = os.path.join(self.directory, "timers.sqlite")
+        store = NaviTimerStore(path)
+        scheduler = NaviScheduler(self.pool, store)
+        properties = BasicProperties(message_id="id", headers={"a": 1})
+        scheduler.schedule("later", b"later", properties, delay=3600)
+        scheduler.schedule("past", b"past", properties, delay=0.05)
+        scheduler.schedule("cancelled", b"cancelled", properties, delay=0.05)
+        self.assertTrue(scheduler.cancel(max(scheduler._timer_ids)))
+        store.close()
+
+        store = NaviTimerStore(path)
+        self.addCleanup(store.close)
+        restored = self.scheduler(store)
+        self.wait_for(lambda: restored.published == 1)
+
+        published = publish_confirmed.call_args[0][3]
+        self.assertEqual(published[0][:2], ("past", b"past"))
+        self.assertEqual(published[0][2].message_id, "id")
+        self.assertEqual(published[0][2].headers, {"a": 1})
+        self.assertEqual(len(restored), 1)
+        self.assertEqual([record.routing_key for _, _, record in store.load()], ["later"])
+
+    def test_store_locked(self, publish_confirmed, store_unconfirmed):  # pylint:disable = W0613
+        """A timer store's file shouldn't be opened while another store uses it, until it's
+        closed, the next free slot being used instead."""
+        prefix = os.path.join(self.directory, "timers")
+        store = _open_free_slot(prefix)
+
+        with self.assertRaises(NaviSchedulerException):
+            NaviTimerStore(store.path)
+
+        other = _open_free_slot(prefix)
+        self.addCleanup(other.close)
+        self.assertEqual(other.path, f"{prefix}.1.sqlite")
+
+        store.close()
+        NaviTimerStore(store.path).close()
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Needs os.fork.")
+    def test_fork(self, publish_confirmed, store_unconfirmed):  # pylint:disable = W0613
+        """A forked child process should open its own timer store, in another slot than its
+        parent's."""
+        self.pool.key = ("test", 1234)
+        self.addCleanup(close_schedulers)
+
+        with mock.patch.object(config, "NAVI_SCHEDULER_DIR", self.directory), \
+                mock.patch.object(NaviScheduler, "start"):
+            parent = get_scheduler(self.pool)._store
+            pid = os.fork()
+
+            if not pid:  # pragma: no cover
+                child = get_scheduler(self.pool)._store
+                os._exit(0 if child.path == parent.path.replace(".sqlite", ".1.sqlite") else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+    def test_publish_delay(self, publish_confirmed, store_unconfirmed):  # pylint:disable = W0613
+        """Delays should be computed from `delay` or `publish_at`, a past time being due now."""
+        now = time.time()
+
+        self.assertEqual(publish_delay(delay=5), 5)
+        self.assertEqual(publish_delay(publish_at=now - 10), 0)
+        self.assertAlmostEqual(publish_delay(publish_at=now + 60), 60, delta=1)
+        self.assertAlmostEqual(
+            publish_delay(publish_at=datetime.datetime.now() + datetime.timedelta(seconds=60)),
+            60,
+            delta=1,
+        )
+
+        with self.assertRaises(ValueError):
+            publish_delay()
+
+        with self.assertRaises(ValueError):
+            publish_delay(delay=1, publish_at=now)
+
+
+class TestScheduledPublish(TestCase):
+    """Test cases for publishing delayed messages to the in-memory broker."""
+
+    def setUp(self):
+        """Configures Navi to use the memory transport."""
+        config.init_config(
+            broker_host="memory",
+            broker_port=5672,
+            username="guest",
+            password="guest",
+            transport="memory",
+            scheduler_tick=0.01,
+        )
+        self.addCleanup(get_broker().reset)
+        self.addCleanup(setattr, config, "NAVI_TRANSPORT", "pika")
+        self.addCleanup(close_schedulers)
+
+    def test_publish_delay(self):
+        """Delayed messages should reach their queue once due, and not before, unless they're
+        cancelled."""
+        broker = get_broker()
+        publisher = NaviPublisher(routing_key="orders.created")
+
+        with publisher._pool.channel() as channel:
+            channel.queue_declare(queue="memory_delayed")
+            channel.queue_bind(
+                queue="memory_delayed", exchange=config.NAVI_EXCHANGE, routing_key="orders.*"
+            )
+
+        started = time.monotonic()
+        publisher.publish({"id": 1}, delay=0.2)
+        publisher.publish({"id": 2}, publish_at=time.time() + 0.1)
+        timer_id = publisher.publish({"id": 3}, delay=0.1)
+
+        self.assertTrue(cancel(timer_id))
+        self.assertEqual(broker.queue_size("memory_delayed"), 0)
+
+        while broker.queue_size("memory_delayed") < 2 and time.monotonic() - started < 5:
+            threading.Event().wait(0.01)
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(broker.queue_size("memory_delayed"), 2)
+
+        with self.assertRaises(ValueError):
+            publisher.publish({"id": 3}, delay=1, publish_at=time.time())
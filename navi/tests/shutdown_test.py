@@ -0,0 +1,49 @@
+"""Test cases for navi.shutdown"""
+from unittest import TestCase, mock
+
+from navi.shutdown import shutdown, stop_listeners
+
+
+class TestShutdown(TestCase):
+    """Test cases for shutdown and stop_listeners"""
+
+    @mock.patch("navi.shutdown.flush", return_value=True)
+    @mock.patch("navi.shutdown.running_groups")
+    @mock.patch("navi.shutdown.running_listeners")
+    def test_stop_listeners(self, running_listeners, running_groups, flush):
+        """Every running group and listener should be stopped, and background publishers drained."""
+        group = mock.MagicMock(listeners=[])
+        running_groups.side_effect = [[group], []]
+        listeners = [
+            mock.MagicMock(drained=0, requeued=0, abandoned=0),
+            mock.MagicMock(drained=0, requeued=0, abandoned=0),
+        ]
+        listeners[0].stop.return_value = True
+        listeners[1].stop.return_value = False
+        running_listeners.return_value = listeners
+
+        self.assertFalse(stop_listeners(5))
+
+        group.stop.assert_called_once()
+        self.assertLessEqual(group.stop.call_args[0][0], 5)
+        listeners[0].stop.assert_called_once()
+        listeners[1].stop.assert_called_once()
+        flush.assert_called_once()
+
+    @mock.patch("navi.shutdown.flush", return_value=True)
+    @mock.patch("navi.shutdown.running_groups")
+    @mock.patch("navi.shutdown.running_listeners")
+    def test_shutdown(self, running_listeners, running_groups, flush):  # pylint:disable = W0613
+        """The messages drained, requeued and abandoned by every listener, grouped ones included,
+        should be reported."""
+        grouped = mock.MagicMock(drained=3, requeued=1, abandoned=0)
+        running_groups.side_effect = [[mock.MagicMock(listeners=[grouped])], []]
+        listener = mock.MagicMock(drained=2, requeued=0, abandoned=1)
+        listener.stop.return_value = True
+        running_listeners.return_value = [listener]
+
+        report = shutdown(5)
+
+        self.assertEqual(
+            (report.drained, report.requeued, report.abandoned, report.stopped), (5, 1, 1, True)
+        )
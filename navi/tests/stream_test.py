@@ -0,0 +1,206 @@
+"""Test cases for navi.stream"""
+import io
+import json
+import os
+import threading
+from unittest import TestCase, mock
+
+from navi import config
+from navi.confirms import PublishResult
+from navi.exceptions import NaviInitException, NaviStreamException
+from navi.listener import NaviListener, listen
+from navi.memory import get_broker
+from navi.publisher import NaviPublisher, publish_stream
+from navi.stream import NaviStreamAssembler, iter_chunks
+
+
+def chunk(stream_id: str, seq: int, last: bool = False) -> dict:
+    """Builds the headers of a stream's chunk."""
+    return {"stream_id": stream_id, "stream_seq": seq, "stream_last": last}
+
+
+class TestIterChunks(TestCase):
+    """Test cases for the stream.iter_chunks function."""
+
+    def test_file(self):
+        """File objects should be read `chunk_size` bytes at a time, the last chunk flagged."""
+        self.assertEqual(
+            list(iter_chunks(io.BytesIO(b"abcdefg"), 3)),
+            [(b"abc", False), (b"def", False), (b"g", True)],
+        )
+
+    def test_iterable(self):
+        """Iterables' chunks should be yielded as bytes, as they are."""
+        self.assertEqual(list(iter_chunks(["ab", b"c"], 1)), [(b"ab", False), (b"c", True)])
+
+    def test_empty(self):
+        """Empty sources should yield a single empty last chunk."""
+        self.assertEqual(list(iter_chunks(io.BytesIO(), 3)), [(b"", True)])
+        self.assertEqual(list(iter_chunks([], 3)), [(b"", True)])
+
+
+class TestNaviStreamAssembler(TestCase):
+    """Test cases for NaviStreamAssembler"""
+
+    def test_interleaved_streams(self):
+        """Interleaved streams should be reassembled separately, duplicated chunks skipped."""
+        assembler = NaviStreamAssembler()
+
+        self.assertIsNone(assembler.add(chunk("a", 0), b"a0"))
+        self.assertIsNone(assembler.add(chunk("b", 0), b"b0"))
+        self.assertIsNone(assembler.add(chunk("a", 0), b"a0"))
+        self.assertIsNone(assembler.add(chunk("a", 1), b"a1"))
+        self.assertEqual(len(assembler), 2)
+
+        with assembler.add(chunk("a", 2, last=True), b"a2") as stream:
+            self.assertEqual(stream.read(), b"a0a1a2")
+
+        self.assertEqual(len(assembler), 1)
+
+    def test_spill_to_disk(self):
+        """Streams larger than the spool threshold should be spilled to a temporary file."""
+        assembler = NaviStreamAssembler(spool_threshold=4)
+        assembler.add(chunk("a", 0), b"abc")
+        assembler.add(chunk("a", 1), b"def")
+
+        with assembler.add(chunk("a", 2, last=True), b"g") as stream:
+            self.assertTrue(stream._rolled)
+            self.assertEqual(stream.read(), b"abcdefg")
+
+    def test_missing_chunk(self):
+        """A missing chunk should drop its stream."""
+        assembler = NaviStreamAssembler()
+        assembler.add(chunk("a", 0), b"a0")
+
+        with self.assertRaises(NaviStreamException):
+            assembler.add(chunk("a", 2), b"a2")
+
+        with self.assertRaises(NaviStreamException):
+            assembler.add(chunk("b", 1), b"b1")
+
+        self.assertEqual(len(assembler), 0)
+
+    @mock.patch("navi.stream.time.monotonic")
+    def test_expiry(self, monotonic):
+        """Streams without a chunk for `timeout` seconds should be dropped."""
+        monotonic.return_value = 0
+        assembler = NaviStreamAssembler(timeout=10)
+        assembler.add(chunk("a", 0), b"a0")
+
+        monotonic.return_value = 11
+        assembler.add(chunk("b", 0), b"b0")
+
+        self.assertEqual(len(assembler), 1)
+        self.assertEqual(assembler.expired, 1)
+
+
+@mock.patch("navi.publisher.publish_confirmed")
+class TestPublishStream(TestCase):
+    """Test cases for NaviPublisher.publish_stream"""
+
+    def setUp(self):
+        """Initializes a NaviPublisher."""
+        config.init_config(
+            broker_host="test", broker_port="1234", username="guest", password="guest"
+        )
+        self.publisher = NaviPublisher(routing_key="documents")
+
+    def test_windows(self, publish_confirmed):
+        """Chunks should be published in order, in confirmed windows, with their headers."""
+        publish_confirmed.side_effect = lambda pool, exchange, exchange_type, messages, **kw: [
+            PublishResult(acked=True) for _ in messages
+        ]
+
+        stream_id = self.publisher.publish_stream(
+            io.BytesIO(b"abcdefg"), "application/json", chunk_size=2, window=3
+        )
+
+        windows = [call[0][3] for call in publish_confirmed.call_args_list]
+        self.assertEqual([len(window) for window in windows], [3, 1])
+        chunks = [message for window in windows for message in window]
+        self.assertEqual([body for _, body, _ in chunks], [b"ab", b"cd", b"ef", b"g"])
+        headers = [properties.headers for _, _, properties in chunks]
+        self.assertEqual({header["stream_id"] for header in headers}, {stream_id})
+        self.assertEqual([header["stream_seq"] for header in headers], [0, 1, 2, 3])
+        self.assertEqual(
+            [header["stream_last"] for header in headers], [False, False, False, True]
+        )
+        self.assertEqual(headers[0]["stream_content_type"], "application/json")
+
+    def test_unconfirmed(self, publish_confirmed):
+        """A chunk not confirmed should abort the stream."""
+        publish_confirmed.return_value = [PublishResult(acked=False, error="nacked")]
+
+        with self.assertRaises(NaviStreamException):
+            self.publisher.publish_stream([b"a", b"b"], window=1)
+
+        publish_confirmed.assert_called_once()
+
+
+class TestStreaming(TestCase):
+    """Test cases for streaming payloads through the in-memory broker."""
+
+    def setUp(self):
+        """Configures Navi to use the memory transport."""
+        config.init_config(
+            broker_host="memory",
+            broker_port=5672,
+            username="guest",
+            password="guest",
+            transport="memory",
+            stream_chunk_size=1024,
+            stream_spool_threshold=4096,
+        )
+        self.addCleanup(get_broker().reset)
+        self.addCleanup(setattr, config, "NAVI_TRANSPORT", "pika")
+
+    def test_streaming_listener(self):
+        """Streams should be reassembled, and other messages wrapped as files, and every delivery
+        done with once handled."""
+        received = []
+        done = threading.Event()
+
+        def callback(info, stream):
+            received.append((info.get("stream_content_type"), stream.read()))
+
+            if len(received) == 2:
+                done.set()
+
+        listener = listen(
+            queue_name="memory_stream",
+            routing_key="documents",
+            callback=callback,
+            streaming=True,
+            prefetch_count=2,
+            manual_ack=True,
+            ack_batch_size=1,
+        )
+        self.addCleanup(listener.stop, 5)
+
+        while "memory_stream" not in get_broker().queue_names():
+            threading.Event().wait(0.01)
+
+        payload = os.urandom(10000)
+        publish_stream("documents", io.BytesIO(payload), "application/octet-stream")
+        NaviPublisher(routing_key="documents").publish({"id": 1})
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(received[0], ("application/octet-stream", payload))
+        self.assertEqual((received[1][0], json.loads(received[1][1])), (None, {"id": 1}))
+
+        # Chunks spooled without calling the callback shouldn't be left in flight.
+        for _ in range(100):
+            if listener._metrics.in_flight.value == 0:
+                break
+
+            threading.Event().wait(0.01)
+
+        self.assertEqual(listener._metrics.in_flight.value, 0)
+        self.assertEqual(listener._metrics.delivered.value, 11)
+
+    def test_lazy_streaming(self):
+        """Streaming and lazy delivery shouldn't be combined."""
+        with self.assertRaises(NaviInitException):
+            NaviListener(
+                queue_name="q", routing_key="k", callback=print, streaming=True, lazy_delivery=True
+            )
@@ -0,0 +1,63 @@
+"""Test cases for navi.transport"""
+from unittest import TestCase, mock
+
+from pika import ConnectionParameters
+
+from navi import config
+from navi.exceptions import NaviTransportException
+from navi.memory import MemoryBlockingConnection, MemoryConfirmChannel, NaviMemoryBroker
+from navi.pool import get_pool
+from navi.transport import MemoryTransport, PikaTransport, get_transport, register_transport
+
+
+class TestGetTransport(TestCase):
+    """Test cases for the transport.get_transport function."""
+
+    def test_by_name(self):
+        """Registered transports should be returned by their name, defaulting to the configured
+        one, and instances returned as is."""
+        transport = MemoryTransport(NaviMemoryBroker())
+
+        self.assertIsInstance(get_transport("pika"), PikaTransport)
+        self.assertIsInstance(get_transport("memory"), MemoryTransport)
+        self.assertIs(get_transport(transport), transport)
+
+        with mock.patch.object(config, "NAVI_TRANSPORT", "memory"):
+            self.assertIsInstance(get_transport(), MemoryTransport)
+
+    def test_unknown(self):
+        """Asking for an unregistered transport should raise a NaviTransportException."""
+        with self.assertRaises(NaviTransportException):
+            get_transport("unknown")
+
+    def test_register(self):
+        """A registered transport should replace the one registered with the same name."""
+        default = get_transport("memory")
+        self.addCleanup(register_transport, default)
+        transport = MemoryTransport(NaviMemoryBroker())
+
+        register_transport(transport)
+
+        self.assertIs(get_transport("memory"), transport)
+
+
+class TestMemoryTransport(TestCase):
+    """Test cases for MemoryTransport"""
+
+    def test_pool(self):
+        """Pools should be shared by transport, and open the transport's connections and confirm
+        channels."""
+        parameters = ConnectionParameters(host="transport-test")
+        transport = MemoryTransport(NaviMemoryBroker())
+
+        pool = get_pool(parameters, transport=transport)
+        self.addCleanup(pool.close)
+
+        self.assertIsNot(pool, get_pool(parameters, transport="pika"))
+        self.assertIs(pool, get_pool(parameters, transport=transport))
+
+        with pool.confirm_channel() as channel:
+            self.assertIsInstance(channel, MemoryConfirmChannel)
+
+        with pool.channel() as channel:
+            self.assertIsInstance(channel.connection, MemoryBlockingConnection)
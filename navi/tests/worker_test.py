@@ -0,0 +1,117 @@
+"""Test cases for navi.worker"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+from navi.__main__ import main
+from navi.exceptions import NaviInitException
+from navi.worker import (
+    WORKER_RESTARTS,
+    NaviWorkerSupervisor,
+    check_target,
+    load_target,
+)
+
+LOADED = []
+
+
+def crash():
+    """A worker target exiting right away."""
+    os._exit(3)  # pylint:disable = protected-access
+
+
+def idle():
+    """A worker target declaring nothing, recording its worker's pid."""
+    LOADED.append(os.getpid())
+    directory = os.environ.get("NAVI_WORKER_TEST_DIR")
+
+    if directory:
+        with open(os.path.join(directory, str(os.getpid())), "w"):
+            pass
+
+
+def run_until(supervisor: NaviWorkerSupervisor, condition, timeout: float = 10):
+    """Runs `supervisor` until `condition` is met, or `timeout` seconds passed."""
+    def stop():
+        deadline = time.monotonic() + timeout
+
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        supervisor.stop()
+
+    threading.Thread(target=stop, daemon=True).start()
+    supervisor.run()
+
+
+class TestNaviWorkerSupervisor(TestCase):
+    """Test cases for NaviWorkerSupervisor"""
+
+    def test_restart(self):
+        """Workers that exit should be restarted, and their restarts counted."""
+        restarts = WORKER_RESTARTS.labels("1")
+        expected = restarts.value + 2
+        supervisor = NaviWorkerSupervisor(
+            "navi.tests.worker_test:crash",
+            workers=1,
+            restart_initial_delay=0.01,
+            restart_max_delay=0.01,
+        )
+
+        run_until(supervisor, lambda: restarts.value >= expected)
+
+        self.assertGreaterEqual(restarts.value, expected)
+
+    def test_graceful_stop(self):
+        """Stopping the supervisor should stop every worker gracefully."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        supervisor = NaviWorkerSupervisor("navi.tests.worker_test:idle", workers=2, stop_timeout=5)
+
+        with mock.patch.dict(os.environ, {"NAVI_WORKER_TEST_DIR": directory}):
+            run_until(supervisor, lambda: len(os.listdir(directory)) == 2)
+
+        self.assertEqual(len(os.listdir(directory)), 2)
+        self.assertEqual([worker.process.exitcode for worker in supervisor.workers], [0, 0])
+        self.assertEqual(LOADED, [])
+
+    def test_invalid(self):
+        """A missing target module, or less than one worker, should raise a NaviInitException."""
+        with self.assertRaises(NaviInitException):
+            NaviWorkerSupervisor("navi.tests.missing_module")
+
+        with self.assertRaises(NaviInitException):
+            NaviWorkerSupervisor("navi.tests.worker_test:idle", workers=0)
+
+
+class TestWorkerFunctions(TestCase):
+    """Test cases for the worker module's functions."""
+
+    def test_check_target(self):
+        """Targets whose module exists should pass, without importing it."""
+        check_target("navi.tests.worker_test:idle")
+        check_target("json")
+
+        with self.assertRaises(NaviInitException):
+            check_target("missing_package.module")
+
+    def test_load_target(self):
+        """Loading a `module:function` target should call the function."""
+        self.addCleanup(LOADED.clear)
+
+        load_target("navi.tests.worker_test:idle")
+
+        self.assertEqual(LOADED, [os.getpid()])
+
+    @mock.patch("navi.__main__.logging.basicConfig")
+    @mock.patch("navi.__main__.run_workers")
+    def test_cli(self, run_workers, basic_config):  # pylint:disable = unused-argument
+        """`navi worker` should run the workers with the given options."""
+        main(["worker", "myapp.listeners", "--workers", "4", "--metrics-port", "9100"])
+
+        run_workers.assert_called_once_with(
+            "myapp.listeners", workers=4, stop_timeout=30, metrics_port=9100
+        )
@@ -0,0 +1,197 @@
+"""Navi's transport module.
+
+A transport opens the connections, channels and ioloops publishers and listeners use, so the
+broker they talk to can be swapped. The transport is selected by its name through `init_config`.
+
+The following transports are registered by default:
+    pika: Connects to an AMQP broker, such as RabbitMQ, through pika. The default.
+    memory: Connects to the process-wide in-memory broker of `navi.memory`, for tests and
+        throughput tests without a broker.
+
+Every transport supports RabbitMQ's direct reply-to, through the `DIRECT_REPLY_TO` pseudo-queue.
+"""
+
+from typing import Callable, Dict, Union
+
+from pika import BlockingConnection, ConnectionParameters, SelectConnection
+from pika.adapters.select_connection import IOLoop
+
+from navi import config
+from navi.confirms import NaviConfirmChannel
+from navi.exceptions import NaviTransportException
+from navi.memory import DIRECT_REPLY_TO  # pylint:disable = unused-import
+from navi.memory import (
+    MemoryBlockingConnection,
+    MemoryConfirmChannel,
+    MemoryConnection,
+    MemoryIOLoop,
+    NaviMemoryBroker,
+    get_broker,
+)
+
+
+class NaviTransport:
+    """Base class for Navi transports.
+
+    Subclasses must set the `name` attribute, used to select them, and implement every method,
+    returning objects with the API of the pika ones they replace.
+    """
+
+    name: str
+
+    def create_ioloop(self):
+        """Returns a new ioloop, to run a listener's connections on."""
+        raise NotImplementedError()
+
+    def blocking_connection(self, connection_parameters: ConnectionParameters):
+        """Opens a connection with the API of pika's BlockingConnection, to publish through.
+
+        Args:
+            connection_parameters: The ConnectionParameters instance to be used to connect.
+        """
+        raise NotImplementedError()
+
+    def select_connection(
+            self,
+            connection_parameters: ConnectionParameters,
+            on_open_callback: Callable,
+            on_open_error_callback: Callable,
+            on_close_callback: Callable,
+            ioloop,
+    ):
+        """Opens a connection with the API of pika's SelectConnection, to consume through.
+
+        Args:
+            connection_parameters: The ConnectionParameters instance to be used to connect.
+            on_open_callback: Called with the connection once it's open.
+            on_open_error_callback: Called with the connection and the error if it can't be opened.
+            on_close_callback: Called with the connection and the reason once it's closed.
+            ioloop: The ioloop, created by `create_ioloop`, to run the connection on.
+        """
+        raise NotImplementedError()
+
+    def confirm_channel(self, channel):
+        """Puts a channel opened through a `blocking_connection` in publisher confirms mode.
+
+        Returns:
+            A channel with the API of NaviConfirmChannel.
+        """
+        raise NotImplementedError()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name})"
+
+
+class PikaTransport(NaviTransport):
+    """A transport connecting to an AMQP broker through pika."""
+
+    name = "pika"
+
+    def create_ioloop(self) -> IOLoop:
+        return IOLoop()
+
+    def blocking_connection(
+            self, connection_parameters: ConnectionParameters
+    ) -> BlockingConnection:
+        return BlockingConnection(connection_parameters)
+
+    def select_connection(
+            self,
+            connection_parameters: ConnectionParameters,
+            on_open_callback: Callable,
+            on_open_error_callback: Callable,
+            on_close_callback: Callable,
+            ioloop: IOLoop,
+    ) -> SelectConnection:
+        return SelectConnection(
+            parameters=connection_parameters,
+            on_open_callback=on_open_callback,
+            on_open_error_callback=on_open_error_callback,
+            on_close_callback=on_close_callback,
+            custom_ioloop=ioloop,
+        )
+
+    def confirm_channel(self, channel) -> NaviConfirmChannel:
+        return NaviConfirmChannel(channel)
+
+
+class MemoryTransport(NaviTransport):
+    """A transport connecting to an in-memory broker. Connection parameters are ignored."""
+
+    name = "memory"
+
+    def __init__(self, broker: NaviMemoryBroker = None):
+        """Initializes a MemoryTransport.
+
+        Args:
+            broker: The broker to connect to. Defaults to the process-wide one.
+        """
+        self.broker = broker or get_broker()
+
+    def create_ioloop(self) -> MemoryIOLoop:
+        return MemoryIOLoop()
+
+    def blocking_connection(
+            self, connection_parameters: ConnectionParameters
+    ) -> MemoryBlockingConnection:  # pylint:disable = unused-argument
+        return MemoryBlockingConnection(self.broker)
+
+    def select_connection(
+            self,
+            connection_parameters: ConnectionParameters,
+            on_open_callback: Callable,
+            on_open_error_callback: Callable,
+            on_close_callback: Callable,
+            ioloop: MemoryIOLoop,
+    ) -> MemoryConnection:  # pylint:disable = unused-argument
+        return MemoryConnection(
+            self.broker, ioloop, on_open_callback, on_open_error_callback, on_close_callback
+        )
+
+    def confirm_channel(self, channel) -> MemoryConfirmChannel:
+        return MemoryConfirmChannel(channel)
+
+
+_TRANSPORTS: Dict[str, NaviTransport] = {}
+
+
+def register_transport(transport: NaviTransport):
+    """Registers a transport, to be selected by its name.
+
+    Registering a transport with the name of an already registered one replaces it.
+
+    Args:
+        transport: The transport instance to register.
+    """
+    _TRANSPORTS[transport.name] = transport
+
+
+def get_transport(transport: Union[str, NaviTransport] = None) -> NaviTransport:
+    """Returns a registered transport by its name.
+
+    Args:
+        transport: The transport's name, or a NaviTransport instance, that is returned as is.
+            Defaults to the configured transport.
+
+    Returns:
+        The NaviTransport instance.
+
+    Raises:
+        NaviTransportException: When no transport is registered with that name.
+    """
+    if isinstance(transport, NaviTransport):
+        return transport
+
+    name = transport or config.NAVI_TRANSPORT
+
+    try:
+        return _TRANSPORTS[name]
+
+    except KeyError:
+        raise NaviTransportException(
+            f"Unknown transport '{name}'. Registered transports: {sorted(_TRANSPORTS)}."
+        ) from None
+
+
+register_transport(PikaTransport())
+register_transport(MemoryTransport())
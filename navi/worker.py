@@ -0,0 +1,346 @@
+"""Navi's worker module.
+
+Listeners are threads of a single process, so CPU-bound callbacks are serialized by the GIL.
+`run_workers`, and the `navi worker` command, run a module of listener declarations in N worker
+processes instead, each one with its own connections, so consuming scales with the CPU cores:
+
+    navi worker myapp.listeners --workers 4
+
+The target is a module that declares its listeners when imported, calling `navi.init_config` and
+`navi.listen`, or a `module:function` whose function declares them when called. It's only loaded
+in the workers, never in the supervising process.
+
+The supervising process restarts workers that exit, following a NaviBackoff, and handles signals:
+    SIGTERM, SIGINT: Stops the workers gracefully, waiting up to `stop_timeout` seconds for them to
+        drain their listeners and background publishers, with `navi.shutdown`, then kills them. A
+        second signal kills them right away.
+    SIGHUP: Restarts the workers gracefully, one at a time, to reload the target.
+
+Each worker records its own metrics. With a `metrics_port`, the supervising process serves its
+metrics, worker restarts included, at that port, and the n-th worker serves its own at
+`metrics_port + n`, counting from 1.
+"""
+
+import importlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+from typing import List, Optional
+
+from navi.exceptions import NaviInitException
+from navi.metrics import get_registry, start_metrics_server
+from navi.reconnect import NaviBackoff
+from navi.shutdown import stop_listeners
+
+WORKERS_ALIVE = get_registry().gauge("navi_workers_alive", "Worker processes running.")
+WORKER_RESTARTS = get_registry().counter(
+    "navi_worker_restarts_total", "Worker processes restarted after exiting.", ("worker",)
+)
+
+logger = logging.getLogger("navi")
+
+
+class NaviWorker:
+    """A supervised worker process slot.
+
+    Attributes:
+        index: The worker's number, counting from 1.
+        process: The worker's current process, None until it's started.
+        started_at: The monotonic time the current process was started at.
+        restart_at: The monotonic time the process should be restarted at, once it exited.
+        backoff: The NaviBackoff spacing out restarts of a worker exiting over and over.
+    """
+
+    def __init__(self, index: int, backoff: NaviBackoff):
+        self.index = index
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restart_at: Optional[float] = None
+        self.backoff = backoff
+
+    @property
+    def is_alive(self) -> bool:
+        """Whether the worker's current process is running."""
+        return self.process is not None and self.process.is_alive()
+
+
+class NaviWorkerSupervisor:
+    """Runs a target in several worker processes, restarting them when they exit, until stopped.
+
+    `run` must be called from the main thread, as it handles the process' signals.
+    """
+
+    def __init__(
+            self,
+            target: str,
+            workers: int = None,
+            stop_timeout: float = 30,
+            metrics_port: int = None,
+            restart_initial_delay: float = 0.5,
+            restart_max_delay: float = 30,
+            min_uptime: float = 10,
+            start_method: str = None,
+    ):  # pylint:disable = R0913
+        """Initializes a NaviWorkerSupervisor.
+
+        Args:
+            target: The `module` or `module:function` declaring the listeners to run.
+            workers: The number of worker processes. Defaults to the number of CPU cores.
+            stop_timeout: The max number of seconds to wait for the workers to stop gracefully.
+                Defaults to 30.
+            metrics_port: The port the supervisor serves its metrics at, the workers serving
+                theirs at the following ports. Optional. Defaults to None, for no metrics server.
+            restart_initial_delay: The max number of seconds to wait before restarting a worker
+                that exited. It doubles each time it exits again shortly after. Defaults to 0.5.
+            restart_max_delay: The max number of seconds to wait before restarting a worker.
+                Defaults to 30.
+            min_uptime: The min number of seconds a worker must run for its exit not to be
+                considered a crash loop, resetting its restart delay. Defaults to 10.
+            start_method: The multiprocessing start method. Defaults to "fork" where available,
+                and the platform's default otherwise.
+
+        Raises:
+            NaviInitException: When the target's module can't be found, or `workers` is below 1.
+        """
+        workers = (os.cpu_count() or 1) if workers is None else workers
+
+        if workers < 1:
+            raise NaviInitException("Need at least 1 worker.")
+
+        check_target(target)
+
+        if start_method is None and "fork" in multiprocessing.get_all_start_methods():
+            start_method = "fork"
+
+        self._target = target
+        self._stop_timeout = stop_timeout
+        self._metrics_port = metrics_port
+        self._min_uptime = min_uptime
+        self._context = multiprocessing.get_context(start_method)
+        self._workers = [
+            NaviWorker(index, NaviBackoff(restart_initial_delay, restart_max_delay))
+            for index in range(1, workers + 1)
+        ]
+        self._stop_event = threading.Event()
+        self._reload_event = threading.Event()
+        self._kill = False
+
+    @property
+    def workers(self) -> List[NaviWorker]:
+        """A copy of the supervised worker slots, in their order."""
+        return list(self._workers)
+
+    def run(self):
+        """Starts the workers, and supervises them until `stop` is called, or the process gets a
+        SIGTERM or SIGINT. Then stops them, gracefully, for up to `stop_timeout` seconds."""
+        handlers = self._handle_signals()
+
+        if self._metrics_port is not None:
+            start_metrics_server(self._metrics_port)
+
+        logger.info("Starting %d workers for %s...", len(self._workers), self._target)
+
+        try:
+            for worker in self._workers:
+                self._start(worker)
+
+            while not self._stop_event.is_set():
+                if self._reload_event.is_set():
+                    self._reload_event.clear()
+                    self._reload()
+
+                self._supervise()
+                WORKERS_ALIVE.set(len([worker for worker in self._workers if worker.is_alive]))
+                wait([worker.process.sentinel for worker in self._workers if worker.is_alive], 0.5)
+
+        finally:
+            self._stop_workers()
+            WORKERS_ALIVE.set(0)
+
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def stop(self):
+        """Stops supervising the workers, making `run` stop them. Safe to call from any thread."""
+        self._stop_event.set()
+
+    def reload(self):
+        """Restarts the workers gracefully, one at a time. Safe to call from any thread."""
+        self._reload_event.set()
+
+    def _handle_signals(self) -> dict:
+        """Installs the supervisor's signal handlers, returning the previous ones."""
+        handlers = {
+            signal.SIGTERM: self._on_stop_signal,
+            signal.SIGINT: self._on_stop_signal,
+        }
+
+        if hasattr(signal, "SIGHUP"):
+            handlers[signal.SIGHUP] = lambda signum, frame: self.reload()
+
+        return {signum: signal.signal(signum, handler) for signum, handler in handlers.items()}
+
+    def _on_stop_signal(self, signum: int, frame):  # pylint:disable = unused-argument
+        if self._stop_event.is_set():
+            logger.warning("Got signal %d while stopping. Killing the workers.", signum)
+            self._kill = True
+
+        self.stop()
+
+    def _start(self, worker: NaviWorker):
+        worker.process = self._context.Process(
+            target=_run_worker,
+            args=(self._target, worker.index, self._stop_timeout, self._metrics_port),
+            name=f"navi-worker-{worker.index}",
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        logger.info("Started worker %d (pid %d).", worker.index, worker.process.pid)
+
+    def _supervise(self):
+        """Schedules the restart of the workers that exited, and restarts those that are due."""
+        now = time.monotonic()
+
+        for worker in self._workers:
+            if worker.restart_at is None and not worker.is_alive:
+                self._on_exit(worker, now)
+
+            if worker.restart_at is not None and worker.restart_at <= now:
+                WORKER_RESTARTS.labels(str(worker.index)).inc()
+                self._start(worker)
+
+    def _on_exit(self, worker: NaviWorker, now: float):
+        worker.process.join()
+
+        if now - worker.started_at >= self._min_uptime:
+            worker.backoff.reset()
+
+        delay = worker.backoff.next_delay()
+        worker.restart_at = now + delay
+        logger.warning(
+            "Worker %d (pid %d) exited with code %s. Restarting in %.2fs.",
+            worker.index,
+            worker.process.pid,
+            worker.process.exitcode,
+            delay,
+        )
+
+    def _reload(self):
+        """Restarts the running workers, waiting for each one to be stopped before the next."""
+        logger.info("Restarting workers...")
+
+        for worker in self._workers:
+            if self._stop_event.is_set():
+                return
+
+            if worker.is_alive:
+                self._terminate([worker])
+                worker.process.join()
+                self._start(worker)
+
+    def _stop_workers(self):
+        """Stops every worker, killing those that aren't stopped after `stop_timeout` seconds."""
+        running = [worker for worker in self._workers if worker.is_alive]
+        logger.info("Stopping %d workers...", len(running))
+        self._terminate(running)
+        deadline = time.monotonic() + self._stop_timeout
+
+        for worker in running:
+            while worker.is_alive and not self._kill and time.monotonic() < deadline:
+                worker.process.join(min(0.5, max(deadline - time.monotonic(), 0)))
+
+            if worker.is_alive:
+                logger.warning("Worker %d didn't stop on time. Killing it.", worker.index)
+                worker.process.kill()
+                worker.process.join()
+
+    @staticmethod
+    def _terminate(workers: List[NaviWorker]):
+        for worker in workers:
+            if worker.is_alive:
+                worker.process.terminate()
+
+
+def check_target(target: str):
+    """Checks that a worker target's module can be found, without importing it.
+
+    Raises:
+        NaviInitException: When it can't be found.
+    """
+    module_name = target.partition(":")[0]
+
+    try:
+        spec = importlib.util.find_spec(module_name)
+
+    except (ImportError, ValueError):
+        spec = None
+
+    if spec is None:
+        raise NaviInitException(f"Worker target module '{module_name}' not found.")
+
+
+def load_target(target: str):
+    """Imports a worker target's module, and calls its function, if it's a `module:function`."""
+    module_name, _, function_name = target.partition(":")
+    module = importlib.import_module(module_name)
+
+    if function_name:
+        getattr(module, function_name)()
+
+
+def _run_worker(target: str, index: int, stop_timeout: float, metrics_port: Optional[int]):
+    """A worker process' entry point: loads the target, and runs until it gets a SIGTERM or
+    SIGINT, then stops its listeners."""
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    if metrics_port is not None:
+        start_metrics_server(metrics_port + index)
+
+    try:
+        load_target(target)
+
+    except Exception:  # pylint:disable = W0703
+        logger.exception("Worker %d couldn't load %s.", index, target)
+        sys.exit(1)
+
+    while not stop_event.wait(1):
+        pass
+
+    logger.info("Stopping worker %d...", index)
+
+    if not stop_listeners(stop_timeout):
+        logger.warning("Worker %d didn't stop its listeners on time.", index)
+
+
+def run_workers(
+        target: str,
+        workers: int = None,
+        stop_timeout: float = 30,
+        metrics_port: int = None,
+        **kwargs,
+):
+    """Runs a module of listener declarations in `workers` processes, restarting them when they
+    exit, until the process gets a SIGTERM or SIGINT. Must be called from the main thread.
+
+    Args:
+        target: The `module` or `module:function` declaring the listeners to run.
+        workers: The number of worker processes. Defaults to the number of CPU cores.
+        stop_timeout: The max number of seconds to wait for the workers to stop gracefully.
+            Defaults to 30.
+        metrics_port: The port the supervisor serves its metrics at, the workers serving theirs at
+            the following ports. Optional.
+        **kwargs: Other NaviWorkerSupervisor arguments.
+    """
+    NaviWorkerSupervisor(target, workers, stop_timeout, metrics_port, **kwargs).run()
@@ -45,8 +45,17 @@ CLASSIFIERS = [
 
 SCRIPTS = []
 
+ENTRY_POINTS = {
+    "console_scripts": ["navi = navi.__main__:main"],
+}
+
 DEPENDENCIES = read('requirements.txt').split()
 
+EXTRAS_REQUIRE = {
+    "orjson": ["orjson"],
+    "msgpack": ["msgpack"],
+}
+
 PACKAGE_DATA = {}
 DATA_FILES = []
 
@@ -64,8 +73,10 @@ SETUP_PARAMS = dict(
     package_data=PACKAGE_DATA,
     license=LICENSE,
     scripts=SCRIPTS,
+    entry_points=ENTRY_POINTS,
     data_files=DATA_FILES,
     install_requires=DEPENDENCIES,
+    extras_require=EXTRAS_REQUIRE,
     classifiers=CLASSIFIERS,
     python_requires='>=3.7',
 )